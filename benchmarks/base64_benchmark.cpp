@@ -0,0 +1,125 @@
+// Throughput of the binary array decoding used by the mzML/mzXML readers.
+// Compares decoding into an intermediate byte buffer and interpreting the
+// values one at a time, against the bulk Base64::decode_array path.
+#include <zlib.h>
+#include <chrono>
+#include <cstdint>
+#include <cstring>
+#include <iostream>
+#include <random>
+#include <string>
+#include <vector>
+
+#include "utils/base64.hpp"
+#include "utils/compression.hpp"
+
+static std::string encode_base64(const std::vector<uint8_t> &data) {
+    static const char alphabet[] =
+        "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/";
+    std::string output;
+    output.reserve((data.size() + 2) / 3 * 4);
+    for (size_t i = 0; i < data.size(); i += 3) {
+        uint32_t block = data[i] << 16;
+        if (i + 1 < data.size()) {
+            block |= data[i + 1] << 8;
+        }
+        if (i + 2 < data.size()) {
+            block |= data[i + 2];
+        }
+        output.push_back(alphabet[(block >> 18) & 63]);
+        output.push_back(alphabet[(block >> 12) & 63]);
+        output.push_back(i + 1 < data.size() ? alphabet[(block >> 6) & 63]
+                                             : '=');
+        output.push_back(i + 2 < data.size() ? alphabet[block & 63] : '=');
+    }
+    return output;
+}
+
+static std::string encode_array(const std::vector<double> &values,
+                                int precision, bool compressed) {
+    std::vector<uint8_t> bytes(values.size() * precision / 8);
+    for (size_t i = 0; i < values.size(); ++i) {
+        if (precision == 64) {
+            std::memcpy(&bytes[i * 8], &values[i], 8);
+        } else {
+            float value = values[i];
+            std::memcpy(&bytes[i * 4], &value, 4);
+        }
+    }
+    if (compressed) {
+        uLongf compressed_size = compressBound(bytes.size());
+        std::vector<uint8_t> compressed_bytes(compressed_size);
+        compress(compressed_bytes.data(), &compressed_size, bytes.data(),
+                 bytes.size());
+        compressed_bytes.resize(compressed_size);
+        bytes = compressed_bytes;
+    }
+    return encode_base64(bytes);
+}
+
+// The decoding path used by the readers before Base64::decode_array.
+static void decode_per_element(const std::string &input, int precision,
+                               bool compressed, std::vector<double> &output) {
+    std::vector<uint8_t> binary_data;
+    Base64::decode_base64(input, binary_data);
+    if (compressed) {
+        std::vector<uint8_t> decompressed_data;
+        Compression::inflate(binary_data, decompressed_data, 0);
+        binary_data = decompressed_data;
+    }
+    size_t num_points = binary_data.size() / (precision / 8);
+    output = std::vector<double>(num_points);
+    size_t offset = 0;
+    for (size_t i = 0; i < num_points; ++i) {
+        if (precision == 32) {
+            output[i] = Base64::interpret_float(binary_data, offset, true);
+            offset += 4;
+        } else {
+            output[i] = Base64::interpret_double(binary_data, offset, true);
+            offset += 8;
+        }
+    }
+}
+
+template <typename Function>
+static double throughput(const std::string &input, size_t repetitions,
+                         Function decode) {
+    auto start = std::chrono::steady_clock::now();
+    for (size_t i = 0; i < repetitions; ++i) {
+        decode();
+    }
+    std::chrono::duration<double> elapsed =
+        std::chrono::steady_clock::now() - start;
+    return input.size() * repetitions / elapsed.count() / (1 << 20);
+}
+
+int main() {
+    // Typical profile spectrum size.
+    const size_t num_points = 50000;
+    const size_t repetitions = 200;
+    std::mt19937 generator(42);
+    std::uniform_real_distribution<double> distribution(200.0, 2000.0);
+    std::vector<double> values(num_points);
+    for (auto &value : values) {
+        value = distribution(generator);
+    }
+
+    std::cout << "precision compressed per_element(MB/s) bulk(MB/s)"
+              << std::endl;
+    for (int precision : {32, 64}) {
+        for (bool compressed : {false, true}) {
+            auto input = encode_array(values, precision, compressed);
+            std::vector<double> output;
+            double per_element = throughput(input, repetitions, [&]() {
+                decode_per_element(input, precision, compressed, output);
+            });
+            double bulk = throughput(input, repetitions, [&]() {
+                Base64::decode_array(input, precision, true, compressed,
+                                     output);
+            });
+            std::cout << precision << " " << compressed << " " << per_element
+                      << " " << bulk << std::endl;
+        }
+    }
+    return 0;
+}
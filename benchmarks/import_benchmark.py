@@ -0,0 +1,52 @@
+# Time taken to import pastaq in a new interpreter, as paid by every worker
+# process, and by the first use of the plotting and table building functions,
+# which are imported lazily. Also reports which of the heavy dependencies are
+# loaded by the import.
+#
+# Usage: python benchmarks/import_benchmark.py [num_runs]
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ['matplotlib', 'matplotlib.pyplot', 'pandas', 'seaborn']
+
+STATEMENTS = [
+    ('import pastaq', 'import pastaq'),
+    ('tables', 'import pastaq; pastaq.to_dataframe'),
+    ('plots', 'import pastaq; pastaq.plot_mesh'),
+]
+
+
+def time_statement(statement):
+    code = (
+        'import sys, time\n'
+        'start = time.perf_counter()\n'
+        '{}\n'
+        'elapsed = time.perf_counter() - start\n'
+        'print(elapsed)\n'
+        'print(",".join(m for m in {!r} if m in sys.modules))\n'
+    ).format(statement, HEAVY_MODULES)
+    output = subprocess.check_output([sys.executable, '-c', code], text=True)
+    elapsed, modules = output.splitlines()[-2:]
+    return float(elapsed), modules
+
+
+def main():
+    num_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    for name, statement in STATEMENTS:
+        # Discard the first run, which includes populating the disk cache.
+        time_statement(statement)
+        times = []
+        for _ in range(num_runs):
+            elapsed, modules = time_statement(statement)
+            times.append(elapsed)
+        print('{:<16} median {:8.1f} ms  min {:8.1f} ms  loaded: {}'.format(
+            name,
+            statistics.median(times) * 1000,
+            min(times) * 1000,
+            modules or 'none',
+        ))
+
+
+if __name__ == '__main__':
+    main()
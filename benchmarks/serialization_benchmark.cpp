@@ -0,0 +1,280 @@
+// Throughput of the binary serialization of peaks, grids and peak clusters.
+// Compares writing and reading the values one element at a time, as the
+// serializers did before the bulk Serialization::read/write_array functions,
+// against the current serializers.
+#include <chrono>
+#include <iostream>
+#include <random>
+#include <sstream>
+#include <string>
+#include <vector>
+
+#include "centroid/centroid_serialize.hpp"
+#include "grid/grid_serialize.hpp"
+#include "metamatch/metamatch_serialize.hpp"
+#include "utils/serialization.hpp"
+
+static void write_doubles(std::ostream &stream,
+                          const std::vector<double> &values) {
+    Serialization::write_uint64(stream, values.size());
+    for (const auto &value : values) {
+        Serialization::write_double(stream, value);
+    }
+}
+
+static void read_doubles(std::istream &stream, std::vector<double> *values) {
+    uint64_t size = 0;
+    Serialization::read_uint64(stream, &size);
+    *values = std::vector<double>(size);
+    for (auto &value : *values) {
+        Serialization::read_double(stream, &value);
+    }
+}
+
+static void write_peaks_per_element(std::ostream &stream,
+                                    const std::vector<Centroid::Peak> &peaks) {
+    Serialization::write_uint64(stream, peaks.size());
+    for (const auto &peak : peaks) {
+        Serialization::write_uint64(stream, peak.id);
+        Serialization::write_double(stream, peak.local_max_mz);
+        Serialization::write_double(stream, peak.local_max_rt);
+        Serialization::write_double(stream, peak.local_max_height);
+        Serialization::write_double(stream, peak.rt_delta);
+        Serialization::write_double(stream, peak.roi_min_mz);
+        Serialization::write_double(stream, peak.roi_max_mz);
+        Serialization::write_double(stream, peak.roi_min_rt);
+        Serialization::write_double(stream, peak.roi_max_rt);
+        Serialization::write_double(stream, peak.raw_roi_mean_mz);
+        Serialization::write_double(stream, peak.raw_roi_mean_rt);
+        Serialization::write_double(stream, peak.raw_roi_sigma_mz);
+        Serialization::write_double(stream, peak.raw_roi_sigma_rt);
+        Serialization::write_double(stream, peak.raw_roi_skewness_mz);
+        Serialization::write_double(stream, peak.raw_roi_skewness_rt);
+        Serialization::write_double(stream, peak.raw_roi_kurtosis_mz);
+        Serialization::write_double(stream, peak.raw_roi_kurtosis_rt);
+        Serialization::write_double(stream, peak.raw_roi_max_height);
+        Serialization::write_double(stream, peak.raw_roi_total_intensity);
+        Serialization::write_uint64(stream, peak.raw_roi_num_points);
+        Serialization::write_uint64(stream, peak.raw_roi_num_scans);
+        Serialization::write_double(stream, peak.fitted_height);
+        Serialization::write_double(stream, peak.fitted_mz);
+        Serialization::write_double(stream, peak.fitted_rt);
+        Serialization::write_double(stream, peak.fitted_sigma_mz);
+        Serialization::write_double(stream, peak.fitted_sigma_rt);
+        Serialization::write_double(stream, peak.fitted_volume);
+    }
+}
+
+static void read_peaks_per_element(std::istream &stream,
+                                   std::vector<Centroid::Peak> *peaks) {
+    uint64_t size = 0;
+    Serialization::read_uint64(stream, &size);
+    *peaks = std::vector<Centroid::Peak>(size);
+    for (auto &peak : *peaks) {
+        Serialization::read_uint64(stream, &peak.id);
+        Serialization::read_double(stream, &peak.local_max_mz);
+        Serialization::read_double(stream, &peak.local_max_rt);
+        Serialization::read_double(stream, &peak.local_max_height);
+        Serialization::read_double(stream, &peak.rt_delta);
+        Serialization::read_double(stream, &peak.roi_min_mz);
+        Serialization::read_double(stream, &peak.roi_max_mz);
+        Serialization::read_double(stream, &peak.roi_min_rt);
+        Serialization::read_double(stream, &peak.roi_max_rt);
+        Serialization::read_double(stream, &peak.raw_roi_mean_mz);
+        Serialization::read_double(stream, &peak.raw_roi_mean_rt);
+        Serialization::read_double(stream, &peak.raw_roi_sigma_mz);
+        Serialization::read_double(stream, &peak.raw_roi_sigma_rt);
+        Serialization::read_double(stream, &peak.raw_roi_skewness_mz);
+        Serialization::read_double(stream, &peak.raw_roi_skewness_rt);
+        Serialization::read_double(stream, &peak.raw_roi_kurtosis_mz);
+        Serialization::read_double(stream, &peak.raw_roi_kurtosis_rt);
+        Serialization::read_double(stream, &peak.raw_roi_max_height);
+        Serialization::read_double(stream, &peak.raw_roi_total_intensity);
+        Serialization::read_uint64(stream, &peak.raw_roi_num_points);
+        Serialization::read_uint64(stream, &peak.raw_roi_num_scans);
+        Serialization::read_double(stream, &peak.fitted_height);
+        Serialization::read_double(stream, &peak.fitted_mz);
+        Serialization::read_double(stream, &peak.fitted_rt);
+        Serialization::read_double(stream, &peak.fitted_sigma_mz);
+        Serialization::read_double(stream, &peak.fitted_sigma_rt);
+        Serialization::read_double(stream, &peak.fitted_volume);
+    }
+}
+
+static void write_grid_per_element(std::ostream &stream,
+                                   const Grid::Grid &grid) {
+    Serialization::write_uint64(stream, grid.n);
+    Serialization::write_uint64(stream, grid.m);
+    Serialization::write_uint64(stream, grid.k);
+    Serialization::write_uint64(stream, grid.t);
+    Serialization::write_uint8(stream, grid.instrument_type);
+    Serialization::write_double(stream, grid.reference_mz);
+    Serialization::write_double(stream, grid.fwhm_mz);
+    Serialization::write_double(stream, grid.fwhm_rt);
+    Serialization::write_double(stream, grid.min_mz);
+    Serialization::write_double(stream, grid.max_mz);
+    Serialization::write_double(stream, grid.min_rt);
+    Serialization::write_double(stream, grid.max_rt);
+    for (const auto &value : grid.data) {
+        Serialization::write_double(stream, value);
+    }
+    for (const auto &value : grid.bins_mz) {
+        Serialization::write_double(stream, value);
+    }
+    for (const auto &value : grid.bins_rt) {
+        Serialization::write_double(stream, value);
+    }
+}
+
+static void read_grid_per_element(std::istream &stream, Grid::Grid *grid) {
+    Serialization::read_uint64(stream, &grid->n);
+    Serialization::read_uint64(stream, &grid->m);
+    Serialization::read_uint64(stream, &grid->k);
+    Serialization::read_uint64(stream, &grid->t);
+    uint8_t instrument_type = 0;
+    Serialization::read_uint8(stream, &instrument_type);
+    Serialization::read_double(stream, &grid->reference_mz);
+    Serialization::read_double(stream, &grid->fwhm_mz);
+    Serialization::read_double(stream, &grid->fwhm_rt);
+    Serialization::read_double(stream, &grid->min_mz);
+    Serialization::read_double(stream, &grid->max_mz);
+    Serialization::read_double(stream, &grid->min_rt);
+    Serialization::read_double(stream, &grid->max_rt);
+    grid->data = std::vector<double>(grid->n * grid->m);
+    grid->bins_mz = std::vector<double>(grid->n);
+    grid->bins_rt = std::vector<double>(grid->m);
+    for (auto &value : grid->data) {
+        Serialization::read_double(stream, &value);
+    }
+    for (auto &value : grid->bins_mz) {
+        Serialization::read_double(stream, &value);
+    }
+    for (auto &value : grid->bins_rt) {
+        Serialization::read_double(stream, &value);
+    }
+}
+
+static void write_clusters_per_element(
+    std::ostream &stream, const std::vector<MetaMatch::PeakCluster> &clusters) {
+    Serialization::write_uint64(stream, clusters.size());
+    for (const auto &cluster : clusters) {
+        Serialization::write_uint64(stream, cluster.id);
+        Serialization::write_double(stream, cluster.mz);
+        Serialization::write_double(stream, cluster.rt);
+        Serialization::write_double(stream, cluster.avg_height);
+        Serialization::write_double(stream, cluster.avg_volume);
+        write_doubles(stream, cluster.heights);
+        write_doubles(stream, cluster.volumes);
+        Serialization::write_uint64(stream, cluster.peak_ids.size());
+        for (const auto &peak_id : cluster.peak_ids) {
+            Serialization::write_uint64(stream, peak_id.file_id);
+            Serialization::write_uint64(stream, peak_id.peak_id);
+        }
+    }
+}
+
+static void read_clusters_per_element(
+    std::istream &stream, std::vector<MetaMatch::PeakCluster> *clusters) {
+    uint64_t size = 0;
+    Serialization::read_uint64(stream, &size);
+    *clusters = std::vector<MetaMatch::PeakCluster>(size);
+    for (auto &cluster : *clusters) {
+        Serialization::read_uint64(stream, &cluster.id);
+        Serialization::read_double(stream, &cluster.mz);
+        Serialization::read_double(stream, &cluster.rt);
+        Serialization::read_double(stream, &cluster.avg_height);
+        Serialization::read_double(stream, &cluster.avg_volume);
+        read_doubles(stream, &cluster.heights);
+        read_doubles(stream, &cluster.volumes);
+        uint64_t num_peak_ids = 0;
+        Serialization::read_uint64(stream, &num_peak_ids);
+        cluster.peak_ids = std::vector<MetaMatch::PeakId>(num_peak_ids);
+        for (auto &peak_id : cluster.peak_ids) {
+            Serialization::read_uint64(stream, &peak_id.file_id);
+            Serialization::read_uint64(stream, &peak_id.peak_id);
+        }
+    }
+}
+
+// Measures the write and read throughput in MB/s of the given functions.
+template <typename T, typename Write, typename Read>
+static void benchmark(const std::string &name, const T &value,
+                      size_t repetitions, Write write, Read read) {
+    std::string data;
+    auto start = std::chrono::steady_clock::now();
+    for (size_t i = 0; i < repetitions; ++i) {
+        std::ostringstream stream;
+        write(stream, value);
+        data = stream.str();
+    }
+    std::chrono::duration<double> write_time =
+        std::chrono::steady_clock::now() - start;
+
+    start = std::chrono::steady_clock::now();
+    for (size_t i = 0; i < repetitions; ++i) {
+        std::istringstream stream(data);
+        T read_value;
+        read(stream, &read_value);
+    }
+    std::chrono::duration<double> read_time =
+        std::chrono::steady_clock::now() - start;
+
+    double megabytes = data.size() * repetitions / double(1 << 20);
+    std::cout << name << " " << megabytes / write_time.count() << " "
+              << megabytes / read_time.count() << std::endl;
+}
+
+int main() {
+    const size_t repetitions = 10;
+    std::mt19937 generator(42);
+    std::uniform_real_distribution<double> distribution(0.0, 1000.0);
+
+    std::vector<Centroid::Peak> peaks(200000);
+    for (size_t i = 0; i < peaks.size(); ++i) {
+        peaks[i] = {};
+        peaks[i].id = i;
+        peaks[i].fitted_mz = distribution(generator);
+        peaks[i].fitted_rt = distribution(generator);
+        peaks[i].fitted_height = distribution(generator);
+    }
+
+    Grid::Grid grid = {};
+    grid.n = 2000;
+    grid.m = 1000;
+    grid.data = std::vector<double>(grid.n * grid.m);
+    grid.bins_mz = std::vector<double>(grid.n);
+    grid.bins_rt = std::vector<double>(grid.m);
+    for (auto &value : grid.data) {
+        value = distribution(generator);
+    }
+
+    // Peak clusters across 50 files.
+    std::vector<MetaMatch::PeakCluster> clusters(50000);
+    for (size_t i = 0; i < clusters.size(); ++i) {
+        auto &cluster = clusters[i];
+        cluster = {};
+        cluster.id = i;
+        for (size_t j = 0; j < 50; ++j) {
+            cluster.heights.push_back(distribution(generator));
+            cluster.volumes.push_back(distribution(generator));
+            cluster.peak_ids.push_back({j, i});
+        }
+    }
+
+    std::cout << "data write(MB/s) read(MB/s)" << std::endl;
+    benchmark("peaks_per_element", peaks, repetitions,
+              write_peaks_per_element, read_peaks_per_element);
+    benchmark("peaks_bulk", peaks, repetitions,
+              Centroid::Serialize::write_peaks,
+              Centroid::Serialize::read_peaks);
+    benchmark("grid_per_element", grid, repetitions, write_grid_per_element,
+              read_grid_per_element);
+    benchmark("grid_bulk", grid, repetitions, Grid::Serialize::write_grid,
+              Grid::Serialize::read_grid);
+    benchmark("clusters_per_element", clusters, repetitions,
+              write_clusters_per_element, read_clusters_per_element);
+    benchmark("clusters_bulk", clusters, repetitions,
+              MetaMatch::Serialize::write_peak_clusters,
+              MetaMatch::Serialize::read_peak_clusters);
+    return 0;
+}
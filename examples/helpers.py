@@ -424,7 +424,7 @@ def plot_meshRawPeaks(mesh, lcmsData, peaks, localMax=[], size=(15,10)):
     rawData =[[], [], []] # RT, mz, Intensity
     for i in range(0,len(lcmsData.scans),1):
         rawData[0] = rawData[0] + [lcmsData.scans[i].retention_time] * (lcmsData.scans[i].num_points)
-        rawData[1] = rawData[1] + lcmsData.scans[i].mz
+        rawData[1] = rawData[1] + lcmsData.scans[i].mz.tolist()
         rawData[2] = rawData[2] + [math.sqrt(x) for x in lcmsData.scans[i].intensity]
     # print(f"Length of vectors for the raw data scatter plot: {len(rawData[0])} for retention time, {len(rawData[1])} for m/z, {len(rawData[2])} for intensity.") # comment out to check the number of elemnts in mz, rt and intensity for the scatter plot
     
@@ -34,8 +34,10 @@ void log_itg(const std::string& msg) {
     log_file.flush();
 } */
 
-std::vector<Centroid::LocalMax> Centroid::find_local_maxima(
-    const Grid::Grid &grid) {
+// Find the local maxima on the grid data, stored with the precision of T.
+template <typename T>
+static std::vector<Centroid::LocalMax> find_local_maxima(
+    const Grid::Grid &grid, const std::vector<T> &data) {
     std::vector<Centroid::LocalMax> points;
     // FIXME: This is performed in O(n^2), but using the divide and conquer
     // strategy we might achieve O(n * log(n)) or lower.
@@ -60,11 +62,11 @@ std::vector<Centroid::LocalMax> Centroid::find_local_maxima(
             // ----------------------------------------------
             // |              | bottom_value |              |
             // ----------------------------------------------
-            double value = grid.data[index];
-            double right_value = grid.data[index + 1];
-            double left_value = grid.data[index - 1];
-            double top_value = grid.data[index - grid.n];
-            double bottom_value = grid.data[index + grid.n];
+            T value = data[index];
+            T right_value = data[index + 1];
+            T left_value = data[index - 1];
+            T top_value = data[index - grid.n];
+            T bottom_value = data[index + grid.n];
 
             if ((value != 0) && (value > left_value) && (value > right_value) &&
                 (value > top_value) && (value > bottom_value)) {
@@ -76,6 +78,14 @@ std::vector<Centroid::LocalMax> Centroid::find_local_maxima(
     return points;
 }
 
+std::vector<Centroid::LocalMax> Centroid::find_local_maxima(
+    const Grid::Grid &grid) {
+    if (grid.precision == Grid::Precision::FLOAT) {
+        return ::find_local_maxima(grid, grid.data_float);
+    }
+    return ::find_local_maxima(grid, grid.data);
+}
+
 std::optional<Centroid::Peak> Centroid::build_peak(
     const RawData::RawData &raw_data, const LocalMax &local_max) {
     Centroid::Peak peak = {};
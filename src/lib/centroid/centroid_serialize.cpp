@@ -1,78 +1,124 @@
+#include <algorithm>
+
 #include "centroid/centroid_serialize.hpp"
 #include "utils/serialization.hpp"
 
+// All the serialized fields of a peak are 8 bytes long, so that peaks are
+// stored as records of uint64 values and can be moved to/from the stream in
+// bulk.
+static constexpr size_t peak_record_size = 27;
+
+static void peak_to_record(const Centroid::Peak &peak, uint64_t *record) {
+    record[0] = peak.id;
+    record[1] = Serialization::double_to_bits(peak.local_max_mz);
+    record[2] = Serialization::double_to_bits(peak.local_max_rt);
+    record[3] = Serialization::double_to_bits(peak.local_max_height);
+    record[4] = Serialization::double_to_bits(peak.rt_delta);
+    record[5] = Serialization::double_to_bits(peak.roi_min_mz);
+    record[6] = Serialization::double_to_bits(peak.roi_max_mz);
+    record[7] = Serialization::double_to_bits(peak.roi_min_rt);
+    record[8] = Serialization::double_to_bits(peak.roi_max_rt);
+    record[9] = Serialization::double_to_bits(peak.raw_roi_mean_mz);
+    record[10] = Serialization::double_to_bits(peak.raw_roi_mean_rt);
+    record[11] = Serialization::double_to_bits(peak.raw_roi_sigma_mz);
+    record[12] = Serialization::double_to_bits(peak.raw_roi_sigma_rt);
+    record[13] = Serialization::double_to_bits(peak.raw_roi_skewness_mz);
+    record[14] = Serialization::double_to_bits(peak.raw_roi_skewness_rt);
+    record[15] = Serialization::double_to_bits(peak.raw_roi_kurtosis_mz);
+    record[16] = Serialization::double_to_bits(peak.raw_roi_kurtosis_rt);
+    record[17] = Serialization::double_to_bits(peak.raw_roi_max_height);
+    record[18] = Serialization::double_to_bits(peak.raw_roi_total_intensity);
+    record[19] = peak.raw_roi_num_points;
+    record[20] = peak.raw_roi_num_scans;
+    record[21] = Serialization::double_to_bits(peak.fitted_height);
+    record[22] = Serialization::double_to_bits(peak.fitted_mz);
+    record[23] = Serialization::double_to_bits(peak.fitted_rt);
+    record[24] = Serialization::double_to_bits(peak.fitted_sigma_mz);
+    record[25] = Serialization::double_to_bits(peak.fitted_sigma_rt);
+    record[26] = Serialization::double_to_bits(peak.fitted_volume);
+}
+
+static void record_to_peak(const uint64_t *record, Centroid::Peak *peak) {
+    peak->id = record[0];
+    peak->local_max_mz = Serialization::bits_to_double(record[1]);
+    peak->local_max_rt = Serialization::bits_to_double(record[2]);
+    peak->local_max_height = Serialization::bits_to_double(record[3]);
+    peak->rt_delta = Serialization::bits_to_double(record[4]);
+    peak->roi_min_mz = Serialization::bits_to_double(record[5]);
+    peak->roi_max_mz = Serialization::bits_to_double(record[6]);
+    peak->roi_min_rt = Serialization::bits_to_double(record[7]);
+    peak->roi_max_rt = Serialization::bits_to_double(record[8]);
+    peak->raw_roi_mean_mz = Serialization::bits_to_double(record[9]);
+    peak->raw_roi_mean_rt = Serialization::bits_to_double(record[10]);
+    peak->raw_roi_sigma_mz = Serialization::bits_to_double(record[11]);
+    peak->raw_roi_sigma_rt = Serialization::bits_to_double(record[12]);
+    peak->raw_roi_skewness_mz = Serialization::bits_to_double(record[13]);
+    peak->raw_roi_skewness_rt = Serialization::bits_to_double(record[14]);
+    peak->raw_roi_kurtosis_mz = Serialization::bits_to_double(record[15]);
+    peak->raw_roi_kurtosis_rt = Serialization::bits_to_double(record[16]);
+    peak->raw_roi_max_height = Serialization::bits_to_double(record[17]);
+    peak->raw_roi_total_intensity = Serialization::bits_to_double(record[18]);
+    peak->raw_roi_num_points = record[19];
+    peak->raw_roi_num_scans = record[20];
+    peak->fitted_height = Serialization::bits_to_double(record[21]);
+    peak->fitted_mz = Serialization::bits_to_double(record[22]);
+    peak->fitted_rt = Serialization::bits_to_double(record[23]);
+    peak->fitted_sigma_mz = Serialization::bits_to_double(record[24]);
+    peak->fitted_sigma_rt = Serialization::bits_to_double(record[25]);
+    peak->fitted_volume = Serialization::bits_to_double(record[26]);
+}
+
+// Maximum number of peaks converted at once by read/write_peaks, which bounds
+// the size of the intermediate buffer.
+static constexpr size_t peak_chunk_size = 4096;
+
 bool Centroid::Serialize::read_peak(std::istream &stream,
                                     Centroid::Peak *peak) {
-    Serialization::read_uint64(stream, &peak->id);
-    Serialization::read_double(stream, &peak->local_max_mz);
-    Serialization::read_double(stream, &peak->local_max_rt);
-    Serialization::read_double(stream, &peak->local_max_height);
-    Serialization::read_double(stream, &peak->rt_delta);
-    Serialization::read_double(stream, &peak->roi_min_mz);
-    Serialization::read_double(stream, &peak->roi_max_mz);
-    Serialization::read_double(stream, &peak->roi_min_rt);
-    Serialization::read_double(stream, &peak->roi_max_rt);
-    Serialization::read_double(stream, &peak->raw_roi_mean_mz);
-    Serialization::read_double(stream, &peak->raw_roi_mean_rt);
-    Serialization::read_double(stream, &peak->raw_roi_sigma_mz);
-    Serialization::read_double(stream, &peak->raw_roi_sigma_rt);
-    Serialization::read_double(stream, &peak->raw_roi_skewness_mz);
-    Serialization::read_double(stream, &peak->raw_roi_skewness_rt);
-    Serialization::read_double(stream, &peak->raw_roi_kurtosis_mz);
-    Serialization::read_double(stream, &peak->raw_roi_kurtosis_rt);
-    Serialization::read_double(stream, &peak->raw_roi_max_height);
-    Serialization::read_double(stream, &peak->raw_roi_total_intensity);
-    Serialization::read_uint64(stream, &peak->raw_roi_num_points);
-    Serialization::read_uint64(stream, &peak->raw_roi_num_scans);
-    Serialization::read_double(stream, &peak->fitted_height);
-    Serialization::read_double(stream, &peak->fitted_mz);
-    Serialization::read_double(stream, &peak->fitted_rt);
-    Serialization::read_double(stream, &peak->fitted_sigma_mz);
-    Serialization::read_double(stream, &peak->fitted_sigma_rt);
-    Serialization::read_double(stream, &peak->fitted_volume);
+    uint64_t record[peak_record_size];
+    Serialization::read_array(stream, record, peak_record_size);
+    record_to_peak(record, peak);
     return stream.good();
 }
 
 bool Centroid::Serialize::write_peak(std::ostream &stream,
                                      const Centroid::Peak &peak) {
-    Serialization::write_uint64(stream, peak.id);
-    Serialization::write_double(stream, peak.local_max_mz);
-    Serialization::write_double(stream, peak.local_max_rt);
-    Serialization::write_double(stream, peak.local_max_height);
-    Serialization::write_double(stream, peak.rt_delta);
-    Serialization::write_double(stream, peak.roi_min_mz);
-    Serialization::write_double(stream, peak.roi_max_mz);
-    Serialization::write_double(stream, peak.roi_min_rt);
-    Serialization::write_double(stream, peak.roi_max_rt);
-    Serialization::write_double(stream, peak.raw_roi_mean_mz);
-    Serialization::write_double(stream, peak.raw_roi_mean_rt);
-    Serialization::write_double(stream, peak.raw_roi_sigma_mz);
-    Serialization::write_double(stream, peak.raw_roi_sigma_rt);
-    Serialization::write_double(stream, peak.raw_roi_skewness_mz);
-    Serialization::write_double(stream, peak.raw_roi_skewness_rt);
-    Serialization::write_double(stream, peak.raw_roi_kurtosis_mz);
-    Serialization::write_double(stream, peak.raw_roi_kurtosis_rt);
-    Serialization::write_double(stream, peak.raw_roi_max_height);
-    Serialization::write_double(stream, peak.raw_roi_total_intensity);
-    Serialization::write_uint64(stream, peak.raw_roi_num_points);
-    Serialization::write_uint64(stream, peak.raw_roi_num_scans);
-    Serialization::write_double(stream, peak.fitted_height);
-    Serialization::write_double(stream, peak.fitted_mz);
-    Serialization::write_double(stream, peak.fitted_rt);
-    Serialization::write_double(stream, peak.fitted_sigma_mz);
-    Serialization::write_double(stream, peak.fitted_sigma_rt);
-    Serialization::write_double(stream, peak.fitted_volume);
-    return stream.good();
+    uint64_t record[peak_record_size];
+    peak_to_record(peak, record);
+    return Serialization::write_array(stream, record, peak_record_size);
 }
 
 bool Centroid::Serialize::read_peaks(std::istream &stream,
                                      std::vector<Centroid::Peak> *peaks) {
-    return Serialization::read_vector<Centroid::Peak>(
-        stream, peaks, Centroid::Serialize::read_peak);
+    uint64_t num_peaks = 0;
+    if (!Serialization::read_uint64(stream, &num_peaks)) {
+        return false;
+    }
+    *peaks = std::vector<Centroid::Peak>(num_peaks);
+    std::vector<uint64_t> records(
+        std::min<uint64_t>(num_peaks, peak_chunk_size) * peak_record_size);
+    for (size_t i = 0; i < num_peaks; i += peak_chunk_size) {
+        size_t n = std::min<uint64_t>(peak_chunk_size, num_peaks - i);
+        Serialization::read_array(stream, records.data(),
+                                  n * peak_record_size);
+        for (size_t j = 0; j < n; ++j) {
+            record_to_peak(&records[j * peak_record_size], &(*peaks)[i + j]);
+        }
+    }
+    return stream.good();
 }
 
 bool Centroid::Serialize::write_peaks(
     std::ostream &stream, const std::vector<Centroid::Peak> &peaks) {
-    return Serialization::write_vector<Centroid::Peak>(
-        stream, peaks, Centroid::Serialize::write_peak);
+    Serialization::write_uint64(stream, peaks.size());
+    std::vector<uint64_t> records(
+        std::min(peaks.size(), peak_chunk_size) * peak_record_size);
+    for (size_t i = 0; i < peaks.size(); i += peak_chunk_size) {
+        size_t n = std::min(peak_chunk_size, peaks.size() - i);
+        for (size_t j = 0; j < n; ++j) {
+            peak_to_record(peaks[i + j], &records[j * peak_record_size]);
+        }
+        Serialization::write_array(stream, records.data(),
+                                   n * peak_record_size);
+    }
+    return stream.good();
 }
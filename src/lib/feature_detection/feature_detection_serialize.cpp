@@ -19,8 +19,7 @@ bool FeatureDetection::Serialize::read_feature(std::istream &stream,
     Serialization::read_double(stream, &feature->monoisotopic_height);
     Serialization::read_double(stream, &feature->monoisotopic_volume);
     Serialization::read_int8(stream, &feature->charge_state);
-    Serialization::read_vector<uint64_t>(stream, &feature->peak_ids,
-                                         Serialization::read_uint64);
+    Serialization::read_vector(stream, &feature->peak_ids);
     return stream.good();
 }
 
@@ -42,8 +41,7 @@ bool FeatureDetection::Serialize::write_feature(std::ostream &stream,
     Serialization::write_double(stream, feature.monoisotopic_height);
     Serialization::write_double(stream, feature.monoisotopic_volume);
     Serialization::write_int8(stream, feature.charge_state);
-    Serialization::write_vector<uint64_t>(stream, feature.peak_ids,
-                                          Serialization::write_uint64);
+    Serialization::write_vector(stream, feature.peak_ids);
     return stream.good();
 }
 
@@ -1,5 +1,6 @@
 #include <cassert>
 #include <cmath>
+#include <utility>
 
 #include "grid/grid.hpp"
 #include "utils/serialization.hpp"
@@ -70,72 +71,28 @@ double Grid::mz_at(const Grid &grid, uint64_t i) {
     }
 }
 
+double Grid::value_at(const Grid &grid, uint64_t index) {
+    if (grid.precision == Precision::FLOAT) {
+        return grid.data_float[index];
+    }
+    return grid.data[index];
+}
+
 double Grid::rt_at(const Grid &grid, uint64_t j) {
     double delta_rt = (grid.max_rt - grid.min_rt) / (grid.m - 1);
     return grid.min_rt + delta_rt * j;
 }
 
-Grid::Grid Grid::_resample(const RawData::RawData &raw_data,
-                          const ResampleParams &params) {
-    // Initialize the Grid.
-    Grid grid;
-    grid.k = params.num_samples_mz;
-    grid.t = params.num_samples_rt;
-    grid.reference_mz = raw_data.reference_mz;
-    grid.fwhm_mz = raw_data.reference_mz / raw_data.resolution_ms1;
-    grid.fwhm_rt = raw_data.fwhm_rt;
-    grid.instrument_type = raw_data.instrument_type;
-    grid.min_mz = raw_data.min_mz;
-    grid.max_mz = raw_data.max_mz;
-    grid.min_rt = raw_data.min_rt;
-    grid.max_rt = raw_data.max_rt;
-
-    // Calculate the necessary dimensions for the Grid.
-    uint64_t n = x_index(grid, raw_data.max_mz) + 1;
-    uint64_t m = y_index(grid, raw_data.max_rt) + 1;
-    grid.n = n;
-    grid.m = m;
-    grid.data = std::vector<double>(n * m);
-    grid.bins_mz = std::vector<double>(n);
-    grid.bins_rt = std::vector<double>(m);
-
-    // Generate bins_mz.
-    for (size_t i = 0; i < n; ++i) {
-        grid.bins_mz[i] = mz_at(grid, i);
-    }
-
-    // Generate bins_rt.
-    for (size_t j = 0; j < m; ++j) {
-        grid.bins_rt[j] = rt_at(grid, j);
-    }
-
-    // Pre-calculate the smoothing sigma values for all bins of the grid.
-    double sigma_rt = RawData::fwhm_to_sigma(raw_data.fwhm_rt) *
-                      params.smoothing_coef_rt / std::sqrt(2);
-    auto sigma_mz_vec = std::vector<double>(n);
-    for (size_t i = 0; i < n; ++i) {
-        sigma_mz_vec[i] = RawData::fwhm_to_sigma(RawData::theoretical_fwhm(
-                              raw_data, grid.bins_mz[i])) *
-                          params.smoothing_coef_mz / std::sqrt(2);
-    }
-
-    // Pre-calculate the kernel half widths for rt and mz.
-    //
-    // Since sigma_rt is constant, the size of the kernel will be the same
-    // for the entire rt range. The same applies for mz, as we are using a
-    // warped grid that keeps the number of sampling points constant across the
-    // entire m/z range.
-    double delta_rt = grid.fwhm_rt / params.num_samples_rt;
-    double delta_mz = grid.fwhm_mz / params.num_samples_mz;
-    double sigma_mz_ref = RawData::fwhm_to_sigma(grid.fwhm_mz) * params.smoothing_coef_mz/ std::sqrt(2);
-    uint64_t rt_kernel_hw = 7 * sigma_rt / delta_rt; // size of rt kernel, 7 sigma as it still gets some values at 6sigma for a peak with 10^9
-    uint64_t mz_kernel_hw = 7 * sigma_mz_ref / delta_mz; // size of mz kernel, 7 sigma as it still gets some values at 6sigma for a peak with 10^9
-        if (rt_kernel_hw <= 4) {
-        rt_kernel_hw = 5;
-    }
-    if (mz_kernel_hw <= 4) {
-        mz_kernel_hw = 5;
-    }
+// Splats the raw data points into the grid and smooths the result with the
+// given kernel sizes. The grid data is stored and accumulated with the
+// precision of T.
+template <typename T>
+static std::vector<T> resample_data(const RawData::RawData &raw_data,
+                                    const Grid::Grid &grid, double sigma_rt,
+                                    const std::vector<double> &sigma_mz_vec,
+                                    uint64_t rt_kernel_hw,
+                                    uint64_t mz_kernel_hw) {
+    auto data = std::vector<T>(grid.n * grid.m);
 
     // Gaussian splatting. First pass.
     {
@@ -144,7 +101,7 @@ Grid::Grid Grid::_resample(const RawData::RawData &raw_data,
             double current_rt = scan.retention_time;
 
             // Find the bin for the current retention time.
-            size_t index_rt = y_index(grid, current_rt);
+            size_t index_rt = Grid::y_index(grid, current_rt);
 
             // Find the min/max indexes for the rt kernel.
             size_t j_min = 0;
@@ -161,7 +118,7 @@ Grid::Grid Grid::_resample(const RawData::RawData &raw_data,
                 double current_mz = scan.mz[k];
 
                 // Find the bin for the current mz.
-                size_t index_mz = x_index(grid, current_mz);
+                size_t index_mz = Grid::x_index(grid, current_mz);
 
                 double sigma_mz = sigma_mz_vec[index_mz];
 
@@ -197,7 +154,7 @@ Grid::Grid Grid::_resample(const RawData::RawData &raw_data,
 
                 for (size_t j = j_min; j <= j_max; ++j) {
                     for (size_t i = i_min; i <= i_max; ++i) {
-                        grid.data[i + j * n] += (weights[(i-i_min) + (j-j_min) * kernelWidth] / weight_sum) * current_intensity;
+                        data[i + j * grid.n] += (weights[(i-i_min) + (j-j_min) * kernelWidth] / weight_sum) * current_intensity;
                     }
                 }
             }
@@ -210,7 +167,7 @@ Grid::Grid Grid::_resample(const RawData::RawData &raw_data,
     // faster performance by applying two 1D kernel convolutions instead. This
     // is specially noticeable on the full image.
     {
-        auto smoothed_data = std::vector<double>(grid.n * grid.m);
+        auto smoothed_data = std::vector<T>(grid.n * grid.m);
 
         // Retention time smoothing.
         for (size_t j = 0; j < grid.m; ++j) {
@@ -230,16 +187,16 @@ Grid::Grid Grid::_resample(const RawData::RawData &raw_data,
                     double a = (current_rt - grid.bins_rt[k]) / sigma_rt;
                     double weight = std::exp(-0.5 * (a * a));
                     sum_weights += weight;
-                    sum_weighted_values += weight * grid.data[i + k * grid.n];
+                    sum_weighted_values += weight * data[i + k * grid.n];
                 }
                 smoothed_data[i + j * grid.n] =
                     sum_weighted_values / sum_weights;
             }
         }
-        grid.data = smoothed_data;
+        data = std::move(smoothed_data);
     }
     {
-        auto smoothed_data = std::vector<double>(grid.n * grid.m);
+        auto smoothed_data = std::vector<T>(grid.n * grid.m);
 
         // mz smoothing.
         //
@@ -264,13 +221,87 @@ Grid::Grid Grid::_resample(const RawData::RawData &raw_data,
                     double a = (current_mz - grid.bins_mz[k]) / sigma_mz;
                     double weight = std::exp(-0.5 * (a * a));
                     sum_weights += weight;
-                    sum_weighted_values += weight * grid.data[k + j * grid.n];
+                    sum_weighted_values += weight * data[k + j * grid.n];
                 }
                 smoothed_data[i + j * grid.n] =
                     sum_weighted_values / sum_weights;
             }
         }
-        grid.data = smoothed_data;
+        data = std::move(smoothed_data);
+    }
+    return data;
+}
+
+Grid::Grid Grid::_resample(const RawData::RawData &raw_data,
+                          const ResampleParams &params) {
+    // Initialize the Grid.
+    Grid grid;
+    grid.k = params.num_samples_mz;
+    grid.t = params.num_samples_rt;
+    grid.reference_mz = raw_data.reference_mz;
+    grid.fwhm_mz = raw_data.reference_mz / raw_data.resolution_ms1;
+    grid.fwhm_rt = raw_data.fwhm_rt;
+    grid.instrument_type = raw_data.instrument_type;
+    grid.min_mz = raw_data.min_mz;
+    grid.max_mz = raw_data.max_mz;
+    grid.min_rt = raw_data.min_rt;
+    grid.max_rt = raw_data.max_rt;
+
+    // Calculate the necessary dimensions for the Grid.
+    uint64_t n = x_index(grid, raw_data.max_mz) + 1;
+    uint64_t m = y_index(grid, raw_data.max_rt) + 1;
+    grid.n = n;
+    grid.m = m;
+    grid.bins_mz = std::vector<double>(n);
+    grid.bins_rt = std::vector<double>(m);
+
+    // Generate bins_mz.
+    for (size_t i = 0; i < n; ++i) {
+        grid.bins_mz[i] = mz_at(grid, i);
+    }
+
+    // Generate bins_rt.
+    for (size_t j = 0; j < m; ++j) {
+        grid.bins_rt[j] = rt_at(grid, j);
+    }
+
+    // Pre-calculate the smoothing sigma values for all bins of the grid.
+    double sigma_rt = RawData::fwhm_to_sigma(raw_data.fwhm_rt) *
+                      params.smoothing_coef_rt / std::sqrt(2);
+    auto sigma_mz_vec = std::vector<double>(n);
+    for (size_t i = 0; i < n; ++i) {
+        sigma_mz_vec[i] = RawData::fwhm_to_sigma(RawData::theoretical_fwhm(
+                              raw_data, grid.bins_mz[i])) *
+                          params.smoothing_coef_mz / std::sqrt(2);
+    }
+
+    // Pre-calculate the kernel half widths for rt and mz.
+    //
+    // Since sigma_rt is constant, the size of the kernel will be the same
+    // for the entire rt range. The same applies for mz, as we are using a
+    // warped grid that keeps the number of sampling points constant across the
+    // entire m/z range.
+    double delta_rt = grid.fwhm_rt / params.num_samples_rt;
+    double delta_mz = grid.fwhm_mz / params.num_samples_mz;
+    double sigma_mz_ref = RawData::fwhm_to_sigma(grid.fwhm_mz) * params.smoothing_coef_mz/ std::sqrt(2);
+    uint64_t rt_kernel_hw = 7 * sigma_rt / delta_rt; // size of rt kernel, 7 sigma as it still gets some values at 6sigma for a peak with 10^9
+    uint64_t mz_kernel_hw = 7 * sigma_mz_ref / delta_mz; // size of mz kernel, 7 sigma as it still gets some values at 6sigma for a peak with 10^9
+        if (rt_kernel_hw <= 4) {
+        rt_kernel_hw = 5;
+    }
+    if (mz_kernel_hw <= 4) {
+        mz_kernel_hw = 5;
+    }
+
+    grid.precision = params.precision;
+    if (grid.precision == Precision::FLOAT) {
+        grid.data_float = resample_data<float>(raw_data, grid, sigma_rt,
+                                               sigma_mz_vec, rt_kernel_hw,
+                                               mz_kernel_hw);
+    } else {
+        grid.data = resample_data<double>(raw_data, grid, sigma_rt,
+                                          sigma_mz_vec, rt_kernel_hw,
+                                          mz_kernel_hw);
     }
     return grid;
 }
@@ -298,7 +329,12 @@ Grid::Grid Grid::subset(Grid grid, double min_mz, double max_mz, double min_rt,
     new_grid.max_rt = grid.bins_mz[max_rt_idx];
 
     // Initialize new grid memory.
-    new_grid.data = std::vector<double>(new_grid.n * new_grid.m);
+    new_grid.precision = grid.precision;
+    if (new_grid.precision == Precision::FLOAT) {
+        new_grid.data_float = std::vector<float>(new_grid.n * new_grid.m);
+    } else {
+        new_grid.data = std::vector<double>(new_grid.n * new_grid.m);
+    }
 
     // Initialize bins.
     new_grid.bins_mz = std::vector<double>(new_grid.n);
@@ -318,7 +354,13 @@ Grid::Grid Grid::subset(Grid grid, double min_mz, double max_mz, double min_rt,
         for (size_t i = 0; i < new_grid.n; i++) {
             size_t mz_idx = min_mz_idx + i;
             size_t rt_idx = min_rt_idx + j;
-            new_grid.data[i + j * new_grid.n] = grid.data[mz_idx + rt_idx * grid.n];
+            size_t index = i + j * new_grid.n;
+            size_t grid_index = mz_idx + rt_idx * grid.n;
+            if (new_grid.precision == Precision::FLOAT) {
+                new_grid.data_float[index] = grid.data_float[grid_index];
+            } else {
+                new_grid.data[index] = grid.data[grid_index];
+            }
         }
     }
 
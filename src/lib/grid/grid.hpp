@@ -8,6 +8,11 @@
 
 namespace Grid {
 
+// Floating point precision used to store and compute the grid data.
+namespace Precision {
+enum Type : uint8_t { DOUBLE = 0, FLOAT = 1 };
+}  // namespace Precision
+
 struct Grid {
     // Represent the grid dimensions in index coordinates:
     //   n: Number of sampling points in mz.
@@ -21,13 +26,16 @@ struct Grid {
 
     // The Grid data is stored as an array, and the mz and rt corresponding to
     // each bin is memoized for quick indexing when searching.
-    // TODO(alex): Not sure that these should be doubles anymore, it uses
-    // a significant amount of memory and is storing smoothed data, which
-    // already alters the precision of the initial measurements. The issue is
-    // that the resampling procedure involves the summation of many numbers on
-    // several grid points, which might significantly alter results. More
-    // testing is needed.
+    //
+    // Storing the smoothed data with double precision uses a significant
+    // amount of memory. Grids with single precision keep the data in
+    // `data_float` instead, and `data` is left empty. The resampling
+    // procedure still accumulates the weighted sums with double precision,
+    // but the summation of the splatted points on each grid point is
+    // performed with the precision of the grid.
+    Precision::Type precision = Precision::DOUBLE;
     std::vector<double> data;
+    std::vector<float> data_float;
     std::vector<double> bins_mz;
     std::vector<double> bins_rt;
 
@@ -58,9 +66,14 @@ struct ResampleParams {
     uint64_t num_samples_rt;
     double smoothing_coef_mz;
     double smoothing_coef_rt;
+    Precision::Type precision = Precision::DOUBLE;
 };
 Grid _resample(const RawData::RawData &raw_data, const ResampleParams &params);
 
+// Get the value of the grid data at the given index regardless of the precision
+// of the grid.
+double value_at(const Grid &grid, uint64_t index);
+
 // Calculate the index i/j for the given mz/rt on the grid. This calculation is
 // performed in linear time.
 uint64_t x_index(const Grid &grid, double mz);
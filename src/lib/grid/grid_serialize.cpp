@@ -1,13 +1,22 @@
+#include <algorithm>
+#include <cstring>
+#include <fstream>
+#include <sstream>
+
 #include "grid/grid_serialize.hpp"
+#include "utils/container.hpp"
 #include "utils/serialization.hpp"
 
-bool Grid::Serialize::read_grid(std::istream &stream, Grid *grid) {
-    Serialization::read_uint64(stream, &grid->n);
+// Dimensions and parameters of the grid, shared by all formats. The number of
+// mz bins `n` is read separately, since in the legacy format it is found in
+// place of the magic number.
+static bool read_grid_parameters(std::istream &stream, Grid::Grid *grid) {
     Serialization::read_uint64(stream, &grid->m);
     Serialization::read_uint64(stream, &grid->k);
     Serialization::read_uint64(stream, &grid->t);
     uint8_t instrument_type = 0;
     Serialization::read_uint8(stream, &instrument_type);
+    grid->instrument_type = static_cast<Instrument::Type>(instrument_type);
     Serialization::read_double(stream, &grid->reference_mz);
     Serialization::read_double(stream, &grid->fwhm_mz);
     Serialization::read_double(stream, &grid->fwhm_rt);
@@ -15,22 +24,11 @@ bool Grid::Serialize::read_grid(std::istream &stream, Grid *grid) {
     Serialization::read_double(stream, &grid->max_mz);
     Serialization::read_double(stream, &grid->min_rt);
     Serialization::read_double(stream, &grid->max_rt);
-    grid->data = std::vector<double>(grid->n * grid->m);
-    grid->bins_mz = std::vector<double>(grid->n);
-    grid->bins_rt = std::vector<double>(grid->m);
-    for (size_t i = 0; i < (grid->n * grid->m); ++i) {
-        Serialization::read_double(stream, &grid->data[i]);
-    }
-    for (size_t i = 0; i < grid->n; ++i) {
-        Serialization::read_double(stream, &grid->bins_mz[i]);
-    }
-    for (size_t i = 0; i < grid->m; ++i) {
-        Serialization::read_double(stream, &grid->bins_rt[i]);
-    }
     return stream.good();
 }
 
-bool Grid::Serialize::write_grid(std::ostream &stream, const Grid &grid) {
+static void write_grid_parameters(std::ostream &stream,
+                                  const Grid::Grid &grid) {
     Serialization::write_uint64(stream, grid.n);
     Serialization::write_uint64(stream, grid.m);
     Serialization::write_uint64(stream, grid.k);
@@ -43,14 +41,438 @@ bool Grid::Serialize::write_grid(std::ostream &stream, const Grid &grid) {
     Serialization::write_double(stream, grid.max_mz);
     Serialization::write_double(stream, grid.min_rt);
     Serialization::write_double(stream, grid.max_rt);
-    for (size_t i = 0; i < (grid.n * grid.m); ++i) {
-        Serialization::write_double(stream, grid.data[i]);
+}
+
+static bool read_precision(std::istream &stream, uint64_t max_version,
+                           Grid::Grid *grid) {
+    uint64_t version = 0;
+    uint8_t precision = 0;
+    Serialization::read_uint64(stream, &version);
+    Serialization::read_uint8(stream, &precision);
+    if (!stream.good() || version > max_version ||
+        precision > Grid::Precision::FLOAT) {
+        return false;
+    }
+    grid->precision = static_cast<Grid::Precision::Type>(precision);
+    return true;
+}
+
+// The grid data vector matching the precision of T.
+template <typename T>
+static std::vector<T> &grid_data(Grid::Grid &grid);
+template <>
+std::vector<double> &grid_data(Grid::Grid &grid) {
+    return grid.data;
+}
+template <>
+std::vector<float> &grid_data(Grid::Grid &grid) {
+    return grid.data_float;
+}
+
+// Rectangular range of grid bins, [i_min, i_max) in mz and [j_min, j_max) in
+// rt.
+struct Region {
+    uint64_t i_min;
+    uint64_t i_max;
+    uint64_t j_min;
+    uint64_t j_max;
+};
+
+// Copy the values of the source region that fall inside the destination
+// region. The values of each region are stored in the same order as the grid
+// data.
+template <typename T>
+static void copy_region(const std::vector<T> &source,
+                        const Region &source_region, std::vector<T> &dest,
+                        const Region &dest_region) {
+    uint64_t i_min = std::max(source_region.i_min, dest_region.i_min);
+    uint64_t i_max = std::min(source_region.i_max, dest_region.i_max);
+    uint64_t j_min = std::max(source_region.j_min, dest_region.j_min);
+    uint64_t j_max = std::min(source_region.j_max, dest_region.j_max);
+    uint64_t source_n = source_region.i_max - source_region.i_min;
+    uint64_t dest_n = dest_region.i_max - dest_region.i_min;
+    for (uint64_t j = j_min; j < j_max; ++j) {
+        for (uint64_t i = i_min; i < i_max; ++i) {
+            dest[(i - dest_region.i_min) + (j - dest_region.j_min) * dest_n] =
+                source[(i - source_region.i_min) +
+                       (j - source_region.j_min) * source_n];
+        }
+    }
+}
+
+// Initialize the dimensions and bins of a grid covering the given region of
+// another one. The data is left empty.
+static Grid::Grid region_grid(const Grid::Grid &grid, const Region &region) {
+    Grid::Grid new_grid = grid;
+    new_grid.data = std::vector<double>();
+    new_grid.data_float = std::vector<float>();
+    new_grid.n = region.i_max - region.i_min;
+    new_grid.m = region.j_max - region.j_min;
+    new_grid.bins_mz = std::vector<double>(grid.bins_mz.begin() + region.i_min,
+                                           grid.bins_mz.begin() + region.i_max);
+    new_grid.bins_rt = std::vector<double>(grid.bins_rt.begin() + region.j_min,
+                                           grid.bins_rt.begin() + region.j_max);
+    if (new_grid.n > 0 && new_grid.m > 0) {
+        new_grid.min_mz = new_grid.bins_mz.front();
+        new_grid.max_mz = new_grid.bins_mz.back();
+        new_grid.min_rt = new_grid.bins_rt.front();
+        new_grid.max_rt = new_grid.bins_rt.back();
+    }
+    return new_grid;
+}
+
+// Table of the tiles stored in a tiled grid file.
+struct GridTiles {
+    uint64_t tile_size;
+    double threshold;
+    Compression::Codec::Type codec;
+    std::vector<uint64_t> indexes;
+    std::vector<uint64_t> offsets;
+};
+
+static uint64_t num_tiles_mz(const Grid::Grid &grid, uint64_t tile_size) {
+    return (grid.n + tile_size - 1) / tile_size;
+}
+
+static Region tile_region(const Grid::Grid &grid, uint64_t tile_size,
+                          uint64_t index) {
+    uint64_t ti = index % num_tiles_mz(grid, tile_size);
+    uint64_t tj = index / num_tiles_mz(grid, tile_size);
+    return {ti * tile_size, std::min((ti + 1) * tile_size, grid.n),
+            tj * tile_size, std::min((tj + 1) * tile_size, grid.m)};
+}
+
+// Reads the header of a tiled grid after its magic number, up to the first
+// tile. The grid data is left empty.
+static bool read_tiled_header(std::istream &stream, Grid::Grid *grid,
+                              GridTiles *tiles) {
+    if (!read_precision(stream, Grid::Serialize::tiled_version, grid)) {
+        return false;
+    }
+    Serialization::read_uint64(stream, &grid->n);
+    if (!read_grid_parameters(stream, grid)) {
+        return false;
+    }
+    grid->data = std::vector<double>();
+    grid->data_float = std::vector<float>();
+    grid->bins_mz = std::vector<double>(grid->n);
+    grid->bins_rt = std::vector<double>(grid->m);
+    Serialization::read_array(stream, grid->bins_mz.data(), grid->n);
+    Serialization::read_array(stream, grid->bins_rt.data(), grid->m);
+    uint8_t codec = 0;
+    uint64_t num_tiles = 0;
+    Serialization::read_uint64(stream, &tiles->tile_size);
+    Serialization::read_double(stream, &tiles->threshold);
+    Serialization::read_uint8(stream, &codec);
+    Serialization::read_uint64(stream, &num_tiles);
+    tiles->codec = static_cast<Compression::Codec::Type>(codec);
+    if (!stream.good() || tiles->tile_size == 0 ||
+        codec > Compression::Codec::ZLIB) {
+        return false;
+    }
+    uint64_t max_tiles = num_tiles_mz(*grid, tiles->tile_size) *
+                         ((grid->m + tiles->tile_size - 1) / tiles->tile_size);
+    if (num_tiles > max_tiles) {
+        return false;
+    }
+    tiles->indexes = std::vector<uint64_t>(num_tiles);
+    tiles->offsets = std::vector<uint64_t>(num_tiles + 1);
+    Serialization::read_array(stream, tiles->indexes.data(), num_tiles);
+    Serialization::read_array(stream, tiles->offsets.data(), num_tiles + 1);
+    if (!stream.good() || tiles->offsets[0] != 0) {
+        return false;
+    }
+    for (size_t k = 0; k < num_tiles; ++k) {
+        if (tiles->indexes[k] >= max_tiles ||
+            (k > 0 && tiles->indexes[k - 1] >= tiles->indexes[k]) ||
+            tiles->offsets[k] > tiles->offsets[k + 1]) {
+            return false;
+        }
     }
-    for (size_t i = 0; i < grid.n; ++i) {
-        Serialization::write_double(stream, grid.bins_mz[i]);
+    return true;
+}
+
+// Reads the tile k at the current position of the stream and decompresses its
+// values.
+template <typename T>
+static bool read_tile(std::istream &stream, const Grid::Grid &grid,
+                      const GridTiles &tiles, size_t k,
+                      std::vector<T> *values) {
+    Region region = tile_region(grid, tiles.tile_size, tiles.indexes[k]);
+    uint64_t num_values =
+        (region.i_max - region.i_min) * (region.j_max - region.j_min);
+    uint64_t size = tiles.offsets[k + 1] - tiles.offsets[k];
+    std::vector<uint8_t> compressed(size);
+    stream.read(reinterpret_cast<char *>(compressed.data()), size);
+    std::string data(num_values * sizeof(T), '\0');
+    if (!stream.good() ||
+        !Compression::decompress_block(
+            compressed.data(), size, tiles.codec,
+            reinterpret_cast<uint8_t *>(data.data()), data.size())) {
+        return false;
     }
-    for (size_t i = 0; i < grid.m; ++i) {
-        Serialization::write_double(stream, grid.bins_rt[i]);
+    std::istringstream tile_stream(std::move(data));
+    *values = std::vector<T>(num_values);
+    return Serialization::read_array(tile_stream, values->data(), num_values);
+}
+
+// Read the tiles of the grid that overlap with the given region into a dense
+// grid covering it.
+template <typename T>
+static bool read_tiles(std::istream &stream, const Grid::Grid &grid,
+                       const GridTiles &tiles, const Region &region,
+                       std::streamoff tiles_position, Grid::Grid *new_grid) {
+    auto &data = grid_data<T>(*new_grid);
+    data = std::vector<T>(new_grid->n * new_grid->m);
+    std::vector<T> values;
+    for (size_t k = 0; k < tiles.indexes.size(); ++k) {
+        Region tile = tile_region(grid, tiles.tile_size, tiles.indexes[k]);
+        if (tile.i_max <= region.i_min || tile.i_min >= region.i_max ||
+            tile.j_max <= region.j_min || tile.j_min >= region.j_max) {
+            continue;
+        }
+        if (tiles_position >= 0) {
+            stream.seekg(tiles_position + tiles.offsets[k]);
+        }
+        if (!read_tile(stream, grid, tiles, k, &values)) {
+            return false;
+        }
+        copy_region(values, tile, data, region);
     }
+    return true;
+}
+
+// Reads a dense grid after its magic number, or after the number of mz bins
+// for the legacy format.
+template <typename T>
+static bool read_dense_data(std::istream &stream, Grid::Grid *grid) {
+    auto &data = grid_data<T>(*grid);
+    data = std::vector<T>(grid->n * grid->m);
+    grid->bins_mz = std::vector<double>(grid->n);
+    grid->bins_rt = std::vector<double>(grid->m);
+    Serialization::read_array(stream, data.data(), data.size());
+    Serialization::read_array(stream, grid->bins_mz.data(), grid->n);
+    Serialization::read_array(stream, grid->bins_rt.data(), grid->m);
     return stream.good();
 }
+
+bool Grid::Serialize::read_grid(std::istream &stream, Grid *grid) {
+    // Grids written by older versions don't have the magic number and start
+    // directly with the dimensions of the grid, always stored with double
+    // precision.
+    char magic[8];
+    stream.read(magic, sizeof(magic));
+    if (!stream.good()) {
+        return false;
+    }
+    grid->precision = Precision::DOUBLE;
+    grid->data = std::vector<double>();
+    grid->data_float = std::vector<float>();
+    if (std::memcmp(magic, tiled_magic, 8) == 0) {
+        GridTiles tiles;
+        if (!read_tiled_header(stream, grid, &tiles)) {
+            return false;
+        }
+        Region region = {0, grid->n, 0, grid->m};
+        if (grid->precision == Precision::FLOAT) {
+            return read_tiles<float>(stream, *grid, tiles, region, -1, grid);
+        }
+        return read_tiles<double>(stream, *grid, tiles, region, -1, grid);
+    }
+    if (std::memcmp(magic, grid_magic, 8) == 0) {
+        if (!read_precision(stream, grid_version, grid)) {
+            return false;
+        }
+        Serialization::read_uint64(stream, &grid->n);
+    } else {
+        grid->n = 0;
+        for (size_t i = 0; i < 8; ++i) {
+            grid->n |= static_cast<uint64_t>(static_cast<uint8_t>(magic[i]))
+                       << (8 * i);
+        }
+    }
+    if (!read_grid_parameters(stream, grid)) {
+        return false;
+    }
+    if (grid->precision == Precision::FLOAT) {
+        return read_dense_data<float>(stream, grid);
+    }
+    return read_dense_data<double>(stream, grid);
+}
+
+bool Grid::Serialize::write_grid(std::ostream &stream, const Grid &grid) {
+    stream.write(grid_magic, 8);
+    Serialization::write_uint64(stream, grid_version);
+    Serialization::write_uint8(stream, grid.precision);
+    write_grid_parameters(stream, grid);
+    if (grid.precision == Precision::FLOAT) {
+        Serialization::write_array(stream, grid.data_float.data(),
+                                   grid.n * grid.m);
+    } else {
+        Serialization::write_array(stream, grid.data.data(), grid.n * grid.m);
+    }
+    Serialization::write_array(stream, grid.bins_mz.data(), grid.n);
+    Serialization::write_array(stream, grid.bins_rt.data(), grid.m);
+    return stream.good();
+}
+
+// Split the grid data in tiles, and compress the ones with non zero values.
+// The table of tiles precedes them, so the tiles are compressed before
+// writing.
+template <typename T>
+static bool compress_tiles(const Grid::Grid &grid, const std::vector<T> &data,
+                           uint64_t tile_size, double threshold,
+                           Compression::Codec::Type codec, int level,
+                           GridTiles *tiles,
+                           std::vector<std::vector<uint8_t>> *compressed) {
+    uint64_t num_tiles = num_tiles_mz(grid, tile_size) *
+                         ((grid.m + tile_size - 1) / tile_size);
+    Region grid_region = {0, grid.n, 0, grid.m};
+    std::vector<T> values;
+    for (uint64_t index = 0; index < num_tiles; ++index) {
+        Region region = tile_region(grid, tile_size, index);
+        values = std::vector<T>((region.i_max - region.i_min) *
+                                (region.j_max - region.j_min));
+        copy_region(data, grid_region, values, region);
+        bool empty = true;
+        for (auto &value : values) {
+            if (value < threshold) {
+                value = 0;
+            }
+            if (value != 0) {
+                empty = false;
+            }
+        }
+        if (empty) {
+            continue;
+        }
+        std::ostringstream tile_stream;
+        Serialization::write_array(tile_stream, values.data(), values.size());
+        std::string tile_data = tile_stream.str();
+        compressed->emplace_back();
+        if (!Compression::compress_block(
+                reinterpret_cast<const uint8_t *>(tile_data.data()),
+                tile_data.size(), codec, level, compressed->back())) {
+            return false;
+        }
+        tiles->indexes.push_back(index);
+        tiles->offsets.push_back(tiles->offsets.back() +
+                                 compressed->back().size());
+    }
+    return true;
+}
+
+bool Grid::Serialize::write_grid_tiled(std::ostream &stream, const Grid &grid,
+                                       uint64_t tile_size, double threshold,
+                                       Compression::Codec::Type codec,
+                                       int level) {
+    if (tile_size == 0) {
+        return false;
+    }
+    GridTiles tiles = {tile_size, threshold, codec, {}, {0}};
+    std::vector<std::vector<uint8_t>> compressed;
+    bool success =
+        grid.precision == Precision::FLOAT
+            ? compress_tiles(grid, grid.data_float, tile_size, threshold,
+                             codec, level, &tiles, &compressed)
+            : compress_tiles(grid, grid.data, tile_size, threshold, codec,
+                             level, &tiles, &compressed);
+    if (!success) {
+        return false;
+    }
+
+    stream.write(tiled_magic, 8);
+    Serialization::write_uint64(stream, tiled_version);
+    Serialization::write_uint8(stream, grid.precision);
+    write_grid_parameters(stream, grid);
+    Serialization::write_array(stream, grid.bins_mz.data(), grid.n);
+    Serialization::write_array(stream, grid.bins_rt.data(), grid.m);
+    Serialization::write_uint64(stream, tile_size);
+    Serialization::write_double(stream, threshold);
+    Serialization::write_uint8(stream, codec);
+    Serialization::write_uint64(stream, tiles.indexes.size());
+    Serialization::write_array(stream, tiles.indexes.data(),
+                               tiles.indexes.size());
+    Serialization::write_array(stream, tiles.offsets.data(),
+                               tiles.offsets.size());
+    for (const auto &tile : compressed) {
+        stream.write(reinterpret_cast<const char *>(tile.data()), tile.size());
+    }
+    return stream.good();
+}
+
+// The bins of the grid inside the mz and rt range.
+static Region range_region(const Grid::Grid &grid, double min_mz,
+                           double max_mz, double min_rt, double max_rt) {
+    const auto &bins_mz = grid.bins_mz;
+    const auto &bins_rt = grid.bins_rt;
+    Region region = {
+        static_cast<uint64_t>(
+            std::lower_bound(bins_mz.begin(), bins_mz.end(), min_mz) -
+            bins_mz.begin()),
+        static_cast<uint64_t>(
+            std::upper_bound(bins_mz.begin(), bins_mz.end(), max_mz) -
+            bins_mz.begin()),
+        static_cast<uint64_t>(
+            std::lower_bound(bins_rt.begin(), bins_rt.end(), min_rt) -
+            bins_rt.begin()),
+        static_cast<uint64_t>(
+            std::upper_bound(bins_rt.begin(), bins_rt.end(), max_rt) -
+            bins_rt.begin()),
+    };
+    region.i_max = std::max(region.i_min, region.i_max);
+    region.j_max = std::max(region.j_min, region.j_max);
+    return region;
+}
+
+bool Grid::Serialize::read_grid_range(const std::string &filename,
+                                      double min_mz, double max_mz,
+                                      double min_rt, double max_rt,
+                                      Grid *grid) {
+    std::ifstream stream;
+    Container::open_file(filename, stream);
+    char compression_header[Compression::header_size];
+    char magic[8];
+    stream.read(compression_header, Compression::header_size);
+    stream.read(magic, sizeof(magic));
+    Compression::Codec::Type codec;
+    Grid file_grid;
+    GridTiles tiles;
+    if (!stream.good() ||
+        !Compression::read_header(compression_header, &codec) ||
+        codec != Compression::Codec::NONE ||
+        std::memcmp(magic, tiled_magic, 8) != 0 ||
+        !read_tiled_header(stream, &file_grid, &tiles)) {
+        // Dense grids and files compressed as a whole have to be read
+        // completely.
+        Compression::InflateStream inflate_stream;
+        if (!Container::open_input(filename, inflate_stream) ||
+            !read_grid(inflate_stream, &file_grid)) {
+            return false;
+        }
+        Region region =
+            range_region(file_grid, min_mz, max_mz, min_rt, max_rt);
+        Region grid_region = {0, file_grid.n, 0, file_grid.m};
+        *grid = region_grid(file_grid, region);
+        if (grid->precision == Precision::FLOAT) {
+            grid->data_float = std::vector<float>(grid->n * grid->m);
+            copy_region(file_grid.data_float, grid_region, grid->data_float,
+                        region);
+        } else {
+            grid->data = std::vector<double>(grid->n * grid->m);
+            copy_region(file_grid.data, grid_region, grid->data, region);
+        }
+        return true;
+    }
+
+    std::streamoff tiles_position = stream.tellg();
+    Region region = range_region(file_grid, min_mz, max_mz, min_rt, max_rt);
+    *grid = region_grid(file_grid, region);
+    bool success =
+        grid->precision == Precision::FLOAT
+            ? read_tiles<float>(stream, file_grid, tiles, region,
+                                tiles_position, grid)
+            : read_tiles<double>(stream, file_grid, tiles, region,
+                                 tiles_position, grid);
+    return success && !stream.fail();
+}
@@ -1,18 +1,60 @@
 #ifndef GRID_GRIDSERIALIZE_HPP
 #define GRID_GRIDSERIALIZE_HPP
 
+#include <cstdint>
 #include <iostream>
+#include <string>
 
 #include "grid.hpp"
+#include "utils/compression.hpp"
 
 // This namespace groups the functions used to serialize Grid data structures
 // into a binary stream.
 namespace Grid::Serialize {
 
-// Grid::Grid
+// Grid::Grid. The grid starts with a magic number, the format version and the
+// precision of the data, followed by the dimensions and parameters of the
+// grid, the data and the mz/rt bins. Grids written by older versions without
+// the magic number can still be read.
+constexpr char grid_magic[] = "PASTAQGR";
+constexpr uint64_t grid_version = 1;
 bool read_grid(std::istream &stream, Grid *grid);
 bool write_grid(std::ostream &stream, const Grid &grid);
 
+// Grid::Grid in the tiled format. The data is split in square tiles of
+// `tile_size` bins, and only the tiles with non zero values are stored, each
+// compressed independently with the given codec. Values below the threshold
+// are set to zero before writing. The file starts with a magic number, the
+// format version, the precision and the same dimensions, parameters and bins
+// as the dense format, followed by:
+//
+//     tile_size                uint64
+//     threshold                double
+//     codec                    uint8
+//     num_tiles                uint64
+//     tile_indexes             num_tiles * uint64
+//     tile_offsets             (num_tiles + 1) * uint64
+//     tiles                    tile_offsets[num_tiles] bytes
+//
+// Tile (ti, tj) covers the bins [ti * tile_size, (ti + 1) * tile_size) in mz
+// and [tj * tile_size, (tj + 1) * tile_size) in rt, clipped to the grid, and
+// its index is `ti + tj * num_tiles_mz`. The indexes are sorted, and tile k
+// starts tile_offsets[k] bytes after the first tile. Once decompressed, it
+// contains the values of the tile in the same order as the grid data. Tiled
+// grids are read back into a dense grid with read_grid.
+constexpr char tiled_magic[] = "PASTAQGT";
+constexpr uint64_t tiled_version = 1;
+bool write_grid_tiled(std::ostream &stream, const Grid &grid,
+                      uint64_t tile_size, double threshold,
+                      Compression::Codec::Type codec, int level);
+
+// Read the part of the grid in the given file that covers the mz and rt
+// range as a dense grid. For files written in the tiled format without
+// compressing the whole file, only the tiles that cover the range are read.
+// Other grid files are read completely before extracting the range.
+bool read_grid_range(const std::string &filename, double min_mz,
+                     double max_mz, double min_rt, double max_rt, Grid *grid);
+
 }  // namespace Grid::Serialize
 
 #endif /* GRID_GRIDSERIALIZE_HPP */
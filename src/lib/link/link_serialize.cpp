@@ -1,47 +1,68 @@
 #include "link/link_serialize.hpp"
 #include "utils/serialization.hpp"
 
-bool Link::Serialize::read_linked_msms(std::istream &stream,
-                                       Link::LinkedMsms *link) {
-    Serialization::read_uint64(stream, &link->entity_id);
-    Serialization::read_uint64(stream, &link->msms_id);
-    Serialization::read_uint64(stream, &link->scan_index);
-    Serialization::read_double(stream, &link->distance);
-    return stream.good();
+// The fields of the links are all 8 bytes long, so that the link tables are
+// stored as records of uint64 values and can be moved to/from the stream in
+// bulk.
+static constexpr size_t linked_msms_record_size = 4;
+static constexpr size_t linked_psm_record_size = 3;
+
+static void linked_msms_to_record(const Link::LinkedMsms &link,
+                                  uint64_t *record) {
+    record[0] = link.entity_id;
+    record[1] = link.msms_id;
+    record[2] = link.scan_index;
+    record[3] = Serialization::double_to_bits(link.distance);
 }
 
-bool Link::Serialize::write_linked_msms(std::ostream &stream,
-                                        const Link::LinkedMsms &link) {
-    Serialization::write_uint64(stream, link.entity_id);
-    Serialization::write_uint64(stream, link.msms_id);
-    Serialization::write_uint64(stream, link.scan_index);
-    Serialization::write_double(stream, link.distance);
-    return stream.good();
+static void record_to_linked_msms(const uint64_t *record,
+                                  Link::LinkedMsms *link) {
+    link->entity_id = record[0];
+    link->msms_id = record[1];
+    link->scan_index = record[2];
+    link->distance = Serialization::bits_to_double(record[3]);
 }
 
-bool read_linked_psm(std::istream &stream,
-                     Link::LinkedPsm *link) {
-    Serialization::read_uint64(stream, &link->peak_id);
-    Serialization::read_uint64(stream, &link->psm_index);
-    Serialization::read_double(stream, &link->distance);
-    return stream.good();
+static void linked_psm_to_record(const Link::LinkedPsm &link,
+                                 uint64_t *record) {
+    record[0] = link.peak_id;
+    record[1] = link.psm_index;
+    record[2] = Serialization::double_to_bits(link.distance);
+}
+
+static void record_to_linked_psm(const uint64_t *record,
+                                 Link::LinkedPsm *link) {
+    link->peak_id = record[0];
+    link->psm_index = record[1];
+    link->distance = Serialization::bits_to_double(record[2]);
 }
 
-bool write_linked_psm(std::ostream &stream,
-                      const Link::LinkedPsm &link) {
-    Serialization::write_uint64(stream, link.peak_id);
-    Serialization::write_uint64(stream, link.psm_index);
-    Serialization::write_double(stream, link.distance);
+bool Link::Serialize::read_linked_msms(std::istream &stream,
+                                       Link::LinkedMsms *link) {
+    uint64_t record[linked_msms_record_size];
+    Serialization::read_array(stream, record, linked_msms_record_size);
+    record_to_linked_msms(record, link);
     return stream.good();
 }
 
+bool Link::Serialize::write_linked_msms(std::ostream &stream,
+                                        const Link::LinkedMsms &link) {
+    uint64_t record[linked_msms_record_size];
+    linked_msms_to_record(link, record);
+    return Serialization::write_array(stream, record,
+                                      linked_msms_record_size);
+}
+
 bool Link::Serialize::read_linked_msms_table(
     std::istream &stream, std::vector<Link::LinkedMsms> *links) {
     uint64_t num_rows = 0;
     Serialization::read_uint64(stream, &num_rows);
+    std::vector<uint64_t> records(num_rows * linked_msms_record_size);
+    Serialization::read_array(stream, records.data(), records.size());
     *links = std::vector<Link::LinkedMsms>(num_rows);
     for (size_t i = 0; i < num_rows; ++i) {
-        Link::Serialize::read_linked_msms(stream, &(*links)[i]);
+        record_to_linked_msms(&records[i * linked_msms_record_size],
+                              &(*links)[i]);
     }
     return stream.good();
 }
@@ -49,20 +70,24 @@ bool Link::Serialize::read_linked_msms_table(
 bool Link::Serialize::write_linked_msms_table(
     std::ostream &stream, const std::vector<Link::LinkedMsms> &links) {
     uint64_t num_rows = links.size();
-    Serialization::write_uint64(stream, num_rows);
+    std::vector<uint64_t> records(num_rows * linked_msms_record_size);
     for (size_t i = 0; i < num_rows; ++i) {
-        Link::Serialize::write_linked_msms(stream, links[i]);
+        linked_msms_to_record(links[i], &records[i * linked_msms_record_size]);
     }
-    return stream.good();
+    Serialization::write_uint64(stream, num_rows);
+    return Serialization::write_array(stream, records.data(), records.size());
 }
 
 bool Link::Serialize::read_linked_psm_table(
     std::istream &stream, std::vector<Link::LinkedPsm> *links) {
     uint64_t num_rows = 0;
     Serialization::read_uint64(stream, &num_rows);
+    std::vector<uint64_t> records(num_rows * linked_psm_record_size);
+    Serialization::read_array(stream, records.data(), records.size());
     *links = std::vector<Link::LinkedPsm>(num_rows);
     for (size_t i = 0; i < num_rows; ++i) {
-        read_linked_psm(stream, &(*links)[i]);
+        record_to_linked_psm(&records[i * linked_psm_record_size],
+                             &(*links)[i]);
     }
     return stream.good();
 }
@@ -70,10 +95,10 @@ bool Link::Serialize::read_linked_psm_table(
 bool Link::Serialize::write_linked_psm_table(
     std::ostream &stream, const std::vector<Link::LinkedPsm> &links) {
     uint64_t num_rows = links.size();
-    Serialization::write_uint64(stream, num_rows);
+    std::vector<uint64_t> records(num_rows * linked_psm_record_size);
     for (size_t i = 0; i < num_rows; ++i) {
-        write_linked_psm(stream, links[i]);
+        linked_psm_to_record(links[i], &records[i * linked_psm_record_size]);
     }
-    return stream.good();
+    Serialization::write_uint64(stream, num_rows);
+    return Serialization::write_array(stream, records.data(), records.size());
 }
-
@@ -1,16 +1,30 @@
 #include "metamatch/metamatch_serialize.hpp"
 #include "utils/serialization.hpp"
 
-bool read_peak_id(std::istream &stream, MetaMatch::PeakId *peak_id) {
-    Serialization::read_uint64(stream, &peak_id->file_id);
-    Serialization::read_uint64(stream, &peak_id->peak_id);
+// The ids are stored as consecutive (file_id, peak_id) pairs of uint64 values,
+// preceded by the number of pairs.
+bool read_peak_ids(std::istream &stream,
+                   std::vector<MetaMatch::PeakId> *peak_ids) {
+    uint64_t num_ids = 0;
+    Serialization::read_uint64(stream, &num_ids);
+    std::vector<uint64_t> values(2 * num_ids);
+    Serialization::read_array(stream, values.data(), values.size());
+    *peak_ids = std::vector<MetaMatch::PeakId>(num_ids);
+    for (size_t i = 0; i < num_ids; ++i) {
+        (*peak_ids)[i] = {values[2 * i], values[2 * i + 1]};
+    }
     return stream.good();
 }
 
-bool write_peak_id(std::ostream &stream, const MetaMatch::PeakId &peak_id) {
-    Serialization::write_uint64(stream, peak_id.file_id);
-    Serialization::write_uint64(stream, peak_id.peak_id);
-    return stream.good();
+bool write_peak_ids(std::ostream &stream,
+                    const std::vector<MetaMatch::PeakId> &peak_ids) {
+    std::vector<uint64_t> values(2 * peak_ids.size());
+    for (size_t i = 0; i < peak_ids.size(); ++i) {
+        values[2 * i] = peak_ids[i].file_id;
+        values[2 * i + 1] = peak_ids[i].peak_id;
+    }
+    Serialization::write_uint64(stream, peak_ids.size());
+    return Serialization::write_array(stream, values.data(), values.size());
 }
 
 bool read_peak_cluster(std::istream &stream, MetaMatch::PeakCluster *cluster) {
@@ -20,13 +34,10 @@ bool read_peak_cluster(std::istream &stream, MetaMatch::PeakCluster *cluster) {
     Serialization::read_double(stream, &cluster->avg_height);
     Serialization::read_double(stream, &cluster->avg_volume);
 
-    Serialization::read_vector<double>(stream, &cluster->heights,
-                                       Serialization::read_double);
-    Serialization::read_vector<double>(stream, &cluster->volumes,
-                                       Serialization::read_double);
+    Serialization::read_vector(stream, &cluster->heights);
+    Serialization::read_vector(stream, &cluster->volumes);
 
-    Serialization::read_vector<MetaMatch::PeakId>(stream, &cluster->peak_ids,
-                                          read_peak_id);
+    read_peak_ids(stream, &cluster->peak_ids);
     return stream.good();
 }
 
@@ -38,12 +49,10 @@ bool write_peak_cluster(
     Serialization::write_double(stream, cluster.avg_height);
     Serialization::write_double(stream, cluster.avg_volume);
 
-    Serialization::write_vector<double>(stream, cluster.heights,
-                                        Serialization::write_double);
-    Serialization::write_vector<double>(stream, cluster.volumes,
-                                        Serialization::write_double);
+    Serialization::write_vector(stream, cluster.heights);
+    Serialization::write_vector(stream, cluster.volumes);
 
-    Serialization::write_vector<MetaMatch::PeakId>(stream, cluster.peak_ids, write_peak_id);
+    write_peak_ids(stream, cluster.peak_ids);
     return stream.good();
 }
 
@@ -60,16 +69,30 @@ bool MetaMatch::Serialize::write_peak_clusters(
     return stream.good();
 }
 
-bool read_feature_id(std::istream &stream, MetaMatch::FeatureId *feature_id) {
-    Serialization::read_uint64(stream, &feature_id->file_id);
-    Serialization::read_uint64(stream, &feature_id->feature_id);
+// The ids are stored as consecutive (file_id, feature_id) pairs of uint64
+// values, preceded by the number of pairs.
+bool read_feature_ids(std::istream &stream,
+                      std::vector<MetaMatch::FeatureId> *feature_ids) {
+    uint64_t num_ids = 0;
+    Serialization::read_uint64(stream, &num_ids);
+    std::vector<uint64_t> values(2 * num_ids);
+    Serialization::read_array(stream, values.data(), values.size());
+    *feature_ids = std::vector<MetaMatch::FeatureId>(num_ids);
+    for (size_t i = 0; i < num_ids; ++i) {
+        (*feature_ids)[i] = {values[2 * i], values[2 * i + 1]};
+    }
     return stream.good();
 }
 
-bool write_feature_id(std::ostream &stream, const MetaMatch::FeatureId &feature_id) {
-    Serialization::write_uint64(stream, feature_id.file_id);
-    Serialization::write_uint64(stream, feature_id.feature_id);
-    return stream.good();
+bool write_feature_ids(std::ostream &stream,
+                       const std::vector<MetaMatch::FeatureId> &feature_ids) {
+    std::vector<uint64_t> values(2 * feature_ids.size());
+    for (size_t i = 0; i < feature_ids.size(); ++i) {
+        values[2 * i] = feature_ids[i].file_id;
+        values[2 * i + 1] = feature_ids[i].feature_id;
+    }
+    Serialization::write_uint64(stream, feature_ids.size());
+    return Serialization::write_array(stream, values.data(), values.size());
 }
 
 bool read_feature_cluster(std::istream &stream, MetaMatch::FeatureCluster *cluster) {
@@ -84,21 +107,14 @@ bool read_feature_cluster(std::istream &stream, MetaMatch::FeatureCluster *clust
     Serialization::read_double(stream, &cluster->avg_monoisotopic_volume);
     Serialization::read_double(stream, &cluster->avg_max_volume);
 
-    Serialization::read_vector<double>(stream, &cluster->total_heights,
-                                       Serialization::read_double);
-    Serialization::read_vector<double>(stream, &cluster->monoisotopic_heights,
-                                       Serialization::read_double);
-    Serialization::read_vector<double>(stream, &cluster->max_heights,
-                                       Serialization::read_double);
-    Serialization::read_vector<double>(stream, &cluster->total_volumes,
-                                       Serialization::read_double);
-    Serialization::read_vector<double>(stream, &cluster->monoisotopic_volumes,
-                                       Serialization::read_double);
-    Serialization::read_vector<double>(stream, &cluster->max_volumes,
-                                       Serialization::read_double);
-
-    Serialization::read_vector<MetaMatch::FeatureId>(stream, &cluster->feature_ids,
-                                          read_feature_id);
+    Serialization::read_vector(stream, &cluster->total_heights);
+    Serialization::read_vector(stream, &cluster->monoisotopic_heights);
+    Serialization::read_vector(stream, &cluster->max_heights);
+    Serialization::read_vector(stream, &cluster->total_volumes);
+    Serialization::read_vector(stream, &cluster->monoisotopic_volumes);
+    Serialization::read_vector(stream, &cluster->max_volumes);
+
+    read_feature_ids(stream, &cluster->feature_ids);
     return stream.good();
 }
 
@@ -115,20 +131,14 @@ bool write_feature_cluster(
     Serialization::write_double(stream, cluster.avg_monoisotopic_volume);
     Serialization::write_double(stream, cluster.avg_max_volume);
 
-    Serialization::write_vector<double>(stream, cluster.total_heights,
-                                        Serialization::write_double);
-    Serialization::write_vector<double>(stream, cluster.monoisotopic_heights,
-                                        Serialization::write_double);
-    Serialization::write_vector<double>(stream, cluster.max_heights,
-                                        Serialization::write_double);
-    Serialization::write_vector<double>(stream, cluster.total_volumes,
-                                        Serialization::write_double);
-    Serialization::write_vector<double>(stream, cluster.monoisotopic_volumes,
-                                        Serialization::write_double);
-    Serialization::write_vector<double>(stream, cluster.max_volumes,
-                                        Serialization::write_double);
-
-    Serialization::write_vector<MetaMatch::FeatureId>(stream, cluster.feature_ids, write_feature_id);
+    Serialization::write_vector(stream, cluster.total_heights);
+    Serialization::write_vector(stream, cluster.monoisotopic_heights);
+    Serialization::write_vector(stream, cluster.max_heights);
+    Serialization::write_vector(stream, cluster.total_volumes);
+    Serialization::write_vector(stream, cluster.monoisotopic_volumes);
+    Serialization::write_vector(stream, cluster.max_volumes);
+
+    write_feature_ids(stream, cluster.feature_ids);
     return stream.good();
 }
 
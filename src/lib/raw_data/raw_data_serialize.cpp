@@ -1,4 +1,11 @@
+#include <algorithm>
+#include <cstring>
+#include <fstream>
+#include <sstream>
+
 #include "raw_data_serialize.hpp"
+#include "utils/compression.hpp"
+#include "utils/container.hpp"
 #include "utils/serialization.hpp"
 
 bool RawData::Serialize::read_precursor_info(
@@ -31,11 +38,14 @@ bool RawData::Serialize::read_scan(std::istream &stream, Scan *scan) {
     Serialization::read_uint64(stream, &scan->ms_level);
     Serialization::read_uint64(stream, &scan->num_points);
     Serialization::read_double(stream, &scan->retention_time);
+    // The mz and intensity values are interleaved in the stream.
+    std::vector<double> points(2 * scan->num_points);
+    Serialization::read_array(stream, points.data(), points.size());
     scan->mz = std::vector<double>(scan->num_points);
     scan->intensity = std::vector<double>(scan->num_points);
     for (size_t i = 0; i < scan->num_points; ++i) {
-        Serialization::read_double(stream, &scan->mz[i]);
-        Serialization::read_double(stream, &scan->intensity[i]);
+        scan->mz[i] = points[2 * i];
+        scan->intensity[i] = points[2 * i + 1];
     }
     uint8_t polarity = polarity;
     Serialization::read_uint8(stream, &polarity);
@@ -51,10 +61,12 @@ bool RawData::Serialize::write_scan(std::ostream &stream, const Scan &scan) {
     Serialization::write_uint64(stream, scan.ms_level);
     Serialization::write_uint64(stream, scan.num_points);
     Serialization::write_double(stream, scan.retention_time);
+    std::vector<double> points(2 * scan.num_points);
     for (size_t i = 0; i < scan.num_points; ++i) {
-        Serialization::write_double(stream, scan.mz[i]);
-        Serialization::write_double(stream, scan.intensity[i]);
+        points[2 * i] = scan.mz[i];
+        points[2 * i + 1] = scan.intensity[i];
     }
+    Serialization::write_array(stream, points.data(), points.size());
     Serialization::write_uint8(stream, scan.polarity);
     Serialization::write_double(stream, scan.max_intensity);
     Serialization::write_double(stream, scan.total_intensity);
@@ -106,6 +118,579 @@ bool RawData::Serialize::write_raw_data(std::ostream &stream,
     return stream.good();
 }
 
+// Size in bytes of the fixed part of the columnar header: magic, version,
+// num_scans, num_points and metadata_size.
+static constexpr uint64_t columnar_header_size = 40;
+
+struct ColumnarHeader {
+    uint64_t version;
+    uint64_t num_scans;
+    uint64_t num_points;
+    uint64_t metadata_size;
+};
+
+// Number of zero bytes written after the metadata so that the arrays start at
+// a multiple of 8 bytes from the beginning of the file.
+static uint64_t columnar_padding(uint64_t metadata_size) {
+    return (8 - (columnar_header_size + metadata_size) % 8) % 8;
+}
+
+static bool read_columnar_header(std::istream &stream,
+                                 ColumnarHeader *header) {
+    char magic[8];
+    stream.read(magic, sizeof(magic));
+    if (!stream.good() ||
+        std::memcmp(magic, RawData::Serialize::columnar_magic, 8) != 0) {
+        return false;
+    }
+    Serialization::read_uint64(stream, &header->version);
+    Serialization::read_uint64(stream, &header->num_scans);
+    Serialization::read_uint64(stream, &header->num_points);
+    Serialization::read_uint64(stream, &header->metadata_size);
+    return stream.good() &&
+           header->version <= RawData::Serialize::columnar_version;
+}
+
+static void write_columnar_metadata(std::ostream &stream,
+                                    const RawData::RawData &raw_data) {
+    Serialization::write_uint8(stream, raw_data.instrument_type);
+    Serialization::write_double(stream, raw_data.min_mz);
+    Serialization::write_double(stream, raw_data.max_mz);
+    Serialization::write_double(stream, raw_data.min_rt);
+    Serialization::write_double(stream, raw_data.max_rt);
+    Serialization::write_double(stream, raw_data.resolution_ms1);
+    Serialization::write_double(stream, raw_data.resolution_msn);
+    Serialization::write_double(stream, raw_data.reference_mz);
+    Serialization::write_double(stream, raw_data.fwhm_rt);
+    Serialization::write_bool(stream, raw_data.centroid);
+    for (size_t i = 0; i < raw_data.scans.size(); ++i) {
+        const auto &scan = raw_data.scans[i];
+        Serialization::write_uint64(stream, scan.scan_number);
+        Serialization::write_uint64(stream, scan.ms_level);
+        Serialization::write_double(stream, scan.retention_time);
+        Serialization::write_uint8(stream, scan.polarity);
+        Serialization::write_double(stream, scan.max_intensity);
+        Serialization::write_double(stream, scan.total_intensity);
+        Serialization::write_bool(stream, scan.centroid);
+        RawData::Serialize::write_precursor_info(stream,
+                                                 scan.precursor_information);
+        Serialization::write_double(stream, raw_data.retention_times[i]);
+    }
+}
+
+// Reads the metadata block into raw_data. The mz and intensity vectors of the
+// scans are left empty.
+static bool read_columnar_metadata(const std::string &metadata,
+                                   uint64_t num_scans,
+                                   RawData::RawData *raw_data) {
+    std::istringstream stream(metadata);
+    uint8_t instrument_type = 0;
+    Serialization::read_uint8(stream, &instrument_type);
+    raw_data->instrument_type = static_cast<Instrument::Type>(instrument_type);
+    Serialization::read_double(stream, &raw_data->min_mz);
+    Serialization::read_double(stream, &raw_data->max_mz);
+    Serialization::read_double(stream, &raw_data->min_rt);
+    Serialization::read_double(stream, &raw_data->max_rt);
+    Serialization::read_double(stream, &raw_data->resolution_ms1);
+    Serialization::read_double(stream, &raw_data->resolution_msn);
+    Serialization::read_double(stream, &raw_data->reference_mz);
+    Serialization::read_double(stream, &raw_data->fwhm_rt);
+    Serialization::read_bool(stream, &raw_data->centroid);
+    if (!stream.good() || num_scans > metadata.size()) {
+        return false;
+    }
+    raw_data->scans = std::vector<RawData::Scan>(num_scans);
+    raw_data->retention_times = std::vector<double>(num_scans);
+    for (size_t i = 0; i < num_scans; ++i) {
+        auto &scan = raw_data->scans[i];
+        Serialization::read_uint64(stream, &scan.scan_number);
+        Serialization::read_uint64(stream, &scan.ms_level);
+        Serialization::read_double(stream, &scan.retention_time);
+        uint8_t polarity = 0;
+        Serialization::read_uint8(stream, &polarity);
+        scan.polarity = static_cast<Polarity::Type>(polarity);
+        Serialization::read_double(stream, &scan.max_intensity);
+        Serialization::read_double(stream, &scan.total_intensity);
+        Serialization::read_bool(stream, &scan.centroid);
+        RawData::Serialize::read_precursor_info(stream,
+                                                &scan.precursor_information);
+        Serialization::read_double(stream, &raw_data->retention_times[i]);
+        scan.num_points = 0;
+    }
+    return !stream.fail();
+}
+
+// The offsets must start at zero and be sorted up to the total number of
+// points.
+static bool valid_offsets(const uint64_t *offsets, uint64_t num_scans,
+                          uint64_t num_points) {
+    if (offsets[0] != 0 || offsets[num_scans] != num_points) {
+        return false;
+    }
+    for (size_t i = 0; i < num_scans; ++i) {
+        if (offsets[i] > offsets[i + 1]) {
+            return false;
+        }
+    }
+    return true;
+}
+
+// Table of the independently compressed blocks of scans. Block b holds the
+// scans in the [scans[b], scans[b + 1]) range and starts offsets[b] bytes
+// after the first block.
+struct ColumnarBlocks {
+    Compression::Codec::Type codec;
+    std::vector<uint64_t> scans;
+    std::vector<uint64_t> offsets;
+};
+
+// Reads the codec of the points and, if they are compressed, the table of
+// blocks. Files of version 1 only have the uncompressed arrays.
+static bool read_columnar_blocks(std::istream &stream,
+                                 const ColumnarHeader &header,
+                                 ColumnarBlocks *blocks) {
+    blocks->codec = Compression::Codec::NONE;
+    if (header.version < 2) {
+        return true;
+    }
+    uint64_t codec = 0;
+    Serialization::read_uint64(stream, &codec);
+    blocks->codec = static_cast<Compression::Codec::Type>(codec);
+    if (!stream.good() || codec > Compression::Codec::ZLIB) {
+        return false;
+    }
+    if (blocks->codec == Compression::Codec::NONE) {
+        return true;
+    }
+    uint64_t num_blocks = 0;
+    Serialization::read_uint64(stream, &num_blocks);
+    if (!stream.good() || num_blocks > header.num_scans) {
+        return false;
+    }
+    blocks->scans = std::vector<uint64_t>(num_blocks + 1);
+    blocks->offsets = std::vector<uint64_t>(num_blocks + 1);
+    Serialization::read_array(stream, blocks->scans.data(), num_blocks + 1);
+    Serialization::read_array(stream, blocks->offsets.data(), num_blocks + 1);
+    if (!stream.good() || blocks->scans[0] != 0 ||
+        blocks->scans[num_blocks] != header.num_scans ||
+        blocks->offsets[0] != 0) {
+        return false;
+    }
+    for (size_t i = 0; i < num_blocks; ++i) {
+        if (blocks->scans[i] >= blocks->scans[i + 1] ||
+            blocks->offsets[i] > blocks->offsets[i + 1]) {
+            return false;
+        }
+    }
+    return true;
+}
+
+// Reads the block at the current position of the stream and decompresses the
+// points of its scans into raw_data. The decompressed block contains the mz
+// of all points of its scans followed by their intensity.
+static bool read_columnar_block(std::istream &stream,
+                                const ColumnarBlocks &blocks, size_t block,
+                                const std::vector<uint64_t> &offsets,
+                                RawData::RawData *raw_data) {
+    uint64_t first_scan = blocks.scans[block];
+    uint64_t last_scan = blocks.scans[block + 1];
+    uint64_t num_points = offsets[last_scan] - offsets[first_scan];
+    uint64_t size = blocks.offsets[block + 1] - blocks.offsets[block];
+    std::vector<uint8_t> compressed(size);
+    stream.read(reinterpret_cast<char *>(compressed.data()), size);
+    std::string data(num_points * 2 * sizeof(double), '\0');
+    if (!stream.good() ||
+        (num_points > 0 &&
+         !Compression::decompress_block(
+             compressed.data(), size, blocks.codec,
+             reinterpret_cast<uint8_t *>(data.data()), data.size()))) {
+        return false;
+    }
+    std::istringstream block_stream(std::move(data));
+    for (size_t i = first_scan; i < last_scan; ++i) {
+        auto &scan = raw_data->scans[i];
+        scan.num_points = offsets[i + 1] - offsets[i];
+        scan.mz = std::vector<double>(scan.num_points);
+        Serialization::read_array(block_stream, scan.mz.data(),
+                                  scan.num_points);
+    }
+    for (size_t i = first_scan; i < last_scan; ++i) {
+        auto &scan = raw_data->scans[i];
+        scan.intensity = std::vector<double>(scan.num_points);
+        Serialization::read_array(block_stream, scan.intensity.data(),
+                                  scan.num_points);
+    }
+    return !block_stream.fail();
+}
+
+bool RawData::Serialize::read_raw_data_columnar(std::istream &stream,
+                                                RawData *raw_data) {
+    ColumnarHeader header;
+    if (!read_columnar_header(stream, &header)) {
+        return false;
+    }
+    std::string metadata(header.metadata_size, '\0');
+    stream.read(metadata.data(), metadata.size());
+    if (!stream.good() ||
+        !read_columnar_metadata(metadata, header.num_scans, raw_data)) {
+        return false;
+    }
+    stream.ignore(columnar_padding(header.metadata_size));
+
+    std::vector<uint64_t> offsets(header.num_scans + 1);
+    Serialization::read_array(stream, offsets.data(), offsets.size());
+    ColumnarBlocks blocks;
+    if (!stream.good() ||
+        !valid_offsets(offsets.data(), header.num_scans, header.num_points) ||
+        !read_columnar_blocks(stream, header, &blocks)) {
+        return false;
+    }
+    if (blocks.codec != Compression::Codec::NONE) {
+        for (size_t i = 0; i + 1 < blocks.scans.size(); ++i) {
+            if (!read_columnar_block(stream, blocks, i, offsets, raw_data)) {
+                return false;
+            }
+        }
+        return true;
+    }
+    for (size_t i = 0; i < header.num_scans; ++i) {
+        auto &scan = raw_data->scans[i];
+        scan.num_points = offsets[i + 1] - offsets[i];
+        scan.mz = std::vector<double>(scan.num_points);
+        Serialization::read_array(stream, scan.mz.data(), scan.num_points);
+    }
+    for (auto &scan : raw_data->scans) {
+        scan.intensity = std::vector<double>(scan.num_points);
+        Serialization::read_array(stream, scan.intensity.data(),
+                                  scan.num_points);
+    }
+    return !stream.fail();
+}
+
+bool RawData::Serialize::write_raw_data_columnar(
+    std::ostream &stream, const RawData &raw_data,
+    Compression::Codec::Type codec, int level) {
+    std::ostringstream metadata_stream;
+    write_columnar_metadata(metadata_stream, raw_data);
+    std::string metadata = metadata_stream.str();
+    uint64_t num_points = 0;
+    for (const auto &scan : raw_data.scans) {
+        num_points += scan.mz.size();
+    }
+
+    stream.write(columnar_magic, 8);
+    Serialization::write_uint64(stream, columnar_version);
+    Serialization::write_uint64(stream, raw_data.scans.size());
+    Serialization::write_uint64(stream, num_points);
+    Serialization::write_uint64(stream, metadata.size());
+    stream.write(metadata.data(), metadata.size());
+    const uint8_t padding[8] = {};
+    Serialization::write_array(stream, padding,
+                               columnar_padding(metadata.size()));
+
+    std::vector<uint64_t> offsets(raw_data.scans.size() + 1);
+    for (size_t i = 0; i < raw_data.scans.size(); ++i) {
+        offsets[i + 1] = offsets[i] + raw_data.scans[i].mz.size();
+    }
+    Serialization::write_array(stream, offsets.data(), offsets.size());
+    Serialization::write_uint64(stream, codec);
+    if (codec == Compression::Codec::NONE) {
+        for (const auto &scan : raw_data.scans) {
+            Serialization::write_array(stream, scan.mz.data(), scan.mz.size());
+        }
+        for (const auto &scan : raw_data.scans) {
+            Serialization::write_array(stream, scan.intensity.data(),
+                                       scan.intensity.size());
+        }
+        return stream.good();
+    }
+
+    // Group consecutive scans into blocks of at least `columnar_block_size`
+    // points. The table of blocks precedes them, so the blocks are
+    // compressed before writing.
+    ColumnarBlocks blocks = {codec, {0}, {0}};
+    std::vector<std::vector<uint8_t>> compressed_blocks;
+    for (size_t i = 0; i < raw_data.scans.size(); ++i) {
+        uint64_t first_scan = blocks.scans.back();
+        if (i + 1 < raw_data.scans.size() &&
+            offsets[i + 1] - offsets[first_scan] < columnar_block_size) {
+            continue;
+        }
+        std::ostringstream block_stream;
+        for (size_t j = first_scan; j <= i; ++j) {
+            const auto &scan = raw_data.scans[j];
+            Serialization::write_array(block_stream, scan.mz.data(),
+                                       scan.mz.size());
+        }
+        for (size_t j = first_scan; j <= i; ++j) {
+            const auto &scan = raw_data.scans[j];
+            Serialization::write_array(block_stream, scan.intensity.data(),
+                                       scan.intensity.size());
+        }
+        std::string data = block_stream.str();
+        compressed_blocks.emplace_back();
+        if (!data.empty() &&
+            !Compression::compress_block(
+                reinterpret_cast<const uint8_t *>(data.data()), data.size(),
+                codec, level, compressed_blocks.back())) {
+            return false;
+        }
+        blocks.scans.push_back(i + 1);
+        blocks.offsets.push_back(blocks.offsets.back() +
+                                 compressed_blocks.back().size());
+    }
+    Serialization::write_uint64(stream, compressed_blocks.size());
+    Serialization::write_array(stream, blocks.scans.data(),
+                               blocks.scans.size());
+    Serialization::write_array(stream, blocks.offsets.data(),
+                               blocks.offsets.size());
+    for (const auto &block : compressed_blocks) {
+        stream.write(reinterpret_cast<const char *>(block.data()),
+                     block.size());
+    }
+    return stream.good();
+}
+
+// Remove the scans and points outside the given range. The scans left without
+// points are removed, and their max/total intensity is updated with the
+// remaining points.
+static void select_range(RawData::RawData *raw_data, double min_rt,
+                         double max_rt, double min_mz, double max_mz) {
+    std::vector<RawData::Scan> scans;
+    std::vector<double> retention_times;
+    for (auto &scan : raw_data->scans) {
+        if (scan.retention_time < min_rt || scan.retention_time > max_rt) {
+            continue;
+        }
+        size_t begin =
+            std::lower_bound(scan.mz.begin(), scan.mz.end(), min_mz) -
+            scan.mz.begin();
+        size_t end =
+            std::upper_bound(scan.mz.begin(), scan.mz.end(), max_mz) -
+            scan.mz.begin();
+        if (begin >= end) {
+            continue;
+        }
+        scan.mz = std::vector<double>(scan.mz.begin() + begin,
+                                      scan.mz.begin() + end);
+        scan.intensity = std::vector<double>(scan.intensity.begin() + begin,
+                                             scan.intensity.begin() + end);
+        scan.num_points = end - begin;
+        scan.max_intensity = 0;
+        scan.total_intensity = 0;
+        for (const auto &intensity : scan.intensity) {
+            scan.max_intensity = std::max(scan.max_intensity, intensity);
+            scan.total_intensity += intensity;
+        }
+        retention_times.push_back(scan.retention_time);
+        scans.push_back(std::move(scan));
+    }
+    raw_data->scans = std::move(scans);
+    raw_data->retention_times = std::move(retention_times);
+    raw_data->min_rt = std::max(raw_data->min_rt, min_rt);
+    raw_data->max_rt = std::min(raw_data->max_rt, max_rt);
+    raw_data->min_mz = std::max(raw_data->min_mz, min_mz);
+    raw_data->max_mz = std::min(raw_data->max_mz, max_mz);
+}
+
+bool RawData::Serialize::read_raw_data_range(const std::string &filename,
+                                             double min_rt, double max_rt,
+                                             double min_mz, double max_mz,
+                                             RawData *raw_data) {
+    std::ifstream stream;
+    Container::open_file(filename, stream);
+    char compression_header[Compression::header_size];
+    stream.read(compression_header, Compression::header_size);
+    Compression::Codec::Type codec;
+    ColumnarHeader header;
+    if (!stream.good() ||
+        !Compression::read_header(compression_header, &codec) ||
+        codec != Compression::Codec::NONE ||
+        !read_columnar_header(stream, &header)) {
+        // Files compressed as a whole and files in the legacy format have to
+        // be read completely.
+        bool columnar = is_columnar_file(filename);
+        Compression::InflateStream inflate_stream;
+        if (!Container::open_input(filename, inflate_stream) ||
+            !(columnar ? read_raw_data_columnar(inflate_stream, raw_data)
+                       : read_raw_data(inflate_stream, raw_data))) {
+            return false;
+        }
+        select_range(raw_data, min_rt, max_rt, min_mz, max_mz);
+        return true;
+    }
+
+    std::string metadata(header.metadata_size, '\0');
+    stream.read(metadata.data(), metadata.size());
+    if (!stream.good() ||
+        !read_columnar_metadata(metadata, header.num_scans, raw_data)) {
+        return false;
+    }
+    stream.ignore(columnar_padding(header.metadata_size));
+    std::vector<uint64_t> offsets(header.num_scans + 1);
+    Serialization::read_array(stream, offsets.data(), offsets.size());
+    ColumnarBlocks blocks;
+    if (!stream.good() ||
+        !valid_offsets(offsets.data(), header.num_scans, header.num_points) ||
+        !read_columnar_blocks(stream, header, &blocks)) {
+        return false;
+    }
+    std::streamoff data_position = stream.tellg();
+
+    // The retention times of the metadata, together with the offsets of the
+    // scans and the table of blocks, give the position in the file of the
+    // points of the scans in the retention time range.
+    const auto &retention_times = raw_data->retention_times;
+    uint64_t first_scan =
+        std::lower_bound(retention_times.begin(), retention_times.end(),
+                         min_rt) -
+        retention_times.begin();
+    uint64_t last_scan =
+        std::upper_bound(retention_times.begin(), retention_times.end(),
+                         max_rt) -
+        retention_times.begin();
+    if (first_scan < last_scan &&
+        blocks.codec == Compression::Codec::NONE) {
+        uint64_t begin = offsets[first_scan];
+        uint64_t num_points = offsets[last_scan] - begin;
+        std::vector<double> mz(num_points);
+        std::vector<double> intensity(num_points);
+        stream.seekg(data_position + begin * sizeof(double));
+        Serialization::read_array(stream, mz.data(), num_points);
+        stream.seekg(data_position +
+                     (header.num_points + begin) * sizeof(double));
+        Serialization::read_array(stream, intensity.data(), num_points);
+        if (!stream.good()) {
+            return false;
+        }
+        for (size_t i = first_scan; i < last_scan; ++i) {
+            auto &scan = raw_data->scans[i];
+            scan.num_points = offsets[i + 1] - offsets[i];
+            scan.mz = std::vector<double>(
+                mz.begin() + (offsets[i] - begin),
+                mz.begin() + (offsets[i + 1] - begin));
+            scan.intensity = std::vector<double>(
+                intensity.begin() + (offsets[i] - begin),
+                intensity.begin() + (offsets[i + 1] - begin));
+        }
+    } else if (first_scan < last_scan) {
+        size_t first_block =
+            std::upper_bound(blocks.scans.begin(), blocks.scans.end(),
+                             first_scan) -
+            blocks.scans.begin() - 1;
+        size_t last_block =
+            std::lower_bound(blocks.scans.begin(), blocks.scans.end(),
+                             last_scan) -
+            blocks.scans.begin();
+        for (size_t i = first_block; i < last_block; ++i) {
+            stream.seekg(data_position + blocks.offsets[i]);
+            if (!read_columnar_block(stream, blocks, i, offsets, raw_data)) {
+                return false;
+            }
+        }
+    }
+    select_range(raw_data, min_rt, max_rt, min_mz, max_mz);
+    return true;
+}
+
+bool RawData::Serialize::is_columnar_file(const std::string &filename) {
+    Compression::InflateStream stream;
+    Container::open_input(filename, stream);
+    char magic[8];
+    stream.read(magic, sizeof(magic));
+    return stream.good() && std::memcmp(magic, columnar_magic, 8) == 0;
+}
+
+bool RawData::MappedRawData::open(const std::string &filename) {
+    return open(filename, 0, UINT64_MAX);
+}
+
+bool RawData::MappedRawData::open(const std::string &filename,
+                                  uint64_t offset, uint64_t length) {
+    // The arrays are stored in little endian byte order, so they can only be
+    // used in place on little endian machines.
+    const uint16_t byte_order = 1;
+    if (*reinterpret_cast<const uint8_t *>(&byte_order) != 1) {
+        return false;
+    }
+    *this = MappedRawData();
+    if (offset % 8 != 0 || !file.open(filename) || offset > file.size()) {
+        return false;
+    }
+    length = std::min(length, file.size() - offset);
+    if (length < Compression::header_size + columnar_header_size) {
+        return false;
+    }
+
+    // Only uncompressed files can be used in place. The columnar data starts
+    // after the compression header, which keeps the arrays aligned.
+    Compression::Codec::Type codec;
+    if (!Compression::read_header(
+            reinterpret_cast<const char *>(file.data() + offset), &codec) ||
+        codec != Compression::Codec::NONE) {
+        return false;
+    }
+    const uint8_t *data = file.data() + offset + Compression::header_size;
+    uint64_t file_size = length - Compression::header_size;
+
+    std::istringstream header_stream(std::string(
+        reinterpret_cast<const char *>(data), columnar_header_size));
+    ColumnarHeader header;
+    if (!read_columnar_header(header_stream, &header) ||
+        header.metadata_size > file_size - columnar_header_size) {
+        return false;
+    }
+    // Version 2 files store the codec of the points after the offsets. Only
+    // the uncompressed arrays can be used in place.
+    uint64_t offsets_position = columnar_header_size + header.metadata_size +
+                                columnar_padding(header.metadata_size);
+    uint64_t num_offsets = header.num_scans + 1;
+    uint64_t codec_size = header.version < 2 ? 0 : 1;
+    uint64_t available =
+        (file_size - std::min(file_size, offsets_position)) / 8;
+    if (num_offsets + codec_size > available ||
+        header.num_points > (available - num_offsets - codec_size) / 2) {
+        return false;
+    }
+    auto offsets = reinterpret_cast<const uint64_t *>(data + offsets_position);
+    if (codec_size != 0 && offsets[num_offsets] != Compression::Codec::NONE) {
+        return false;
+    }
+
+    std::string metadata(
+        reinterpret_cast<const char *>(data + columnar_header_size),
+        header.metadata_size);
+    if (!read_columnar_metadata(metadata, header.num_scans, &metadata_)) {
+        return false;
+    }
+    if (!valid_offsets(offsets, header.num_scans, header.num_points)) {
+        return false;
+    }
+    offsets_ = offsets;
+    mz_ = reinterpret_cast<const double *>(offsets + num_offsets + codec_size);
+    intensity_ = mz_ + header.num_points;
+    for (size_t i = 0; i < size(); ++i) {
+        metadata_.scans[i].num_points = num_points(i);
+    }
+    return true;
+}
+
+RawData::Scan RawData::MappedRawData::scan(size_t i) const {
+    Scan scan = metadata_.scans[i];
+    scan.mz = std::vector<double>(mz(i), mz(i) + scan.num_points);
+    scan.intensity =
+        std::vector<double>(intensity(i), intensity(i) + scan.num_points);
+    return scan;
+}
+
+RawData::RawData RawData::MappedRawData::load() const {
+    RawData raw_data = metadata_;
+    for (size_t i = 0; i < size(); ++i) {
+        raw_data.scans[i] = scan(i);
+    }
+    return raw_data;
+}
+
 bool IdentData::Serialize::read_spectrum_match(std::istream &stream,
                                                SpectrumMatch *spectrum_match) {
     Serialization::read_string(stream, &spectrum_match->id);
@@ -2,8 +2,11 @@
 #define RAWDATA_RAWDATASERIALIZE_HPP
 
 #include <iostream>
+#include <string>
 
 #include "raw_data/raw_data.hpp"
+#include "utils/compression.hpp"
+#include "utils/mapped_file.hpp"
 
 // This namespace groups the functions used to serialize RawData data structures
 // into a binary stream.
@@ -23,8 +26,116 @@ bool write_precursor_info(std::ostream &stream,
 bool read_raw_data(std::istream &stream, RawData *raw_data);
 bool write_raw_data(std::ostream &stream, const RawData &raw_data);
 
+// RawData::RawData in the columnar format. The file starts with a magic
+// number and a version, followed by the scan metadata and the points of all
+// scans:
+//
+//     magic ("PASTAQRD")       8 bytes
+//     version                  uint64
+//     num_scans                uint64
+//     num_points               uint64
+//     metadata_size            uint64
+//     metadata                 metadata_size bytes
+//     padding                  zeros up to the next multiple of 8 bytes
+//     offsets                  (num_scans + 1) * uint64
+//     codec                    uint64 (not present in version 1)
+//
+// The points of scan i are the [offsets[i], offsets[i + 1]) range of the
+// points. If the codec is Compression::Codec::NONE, or in version 1 files, the
+// points of all scans are stored contiguously:
+//
+//     mz                       num_points * double
+//     intensity                num_points * double
+//
+// The arrays are aligned, so that files written with the
+// Compression::Codec::NONE codec for both the points and the file stream can
+// be memory mapped with MappedRawData.
+//
+// Otherwise, consecutive scans are grouped in blocks of at least
+// `columnar_block_size` points, which are compressed independently with the
+// given codec:
+//
+//     num_blocks               uint64
+//     block_scans              (num_blocks + 1) * uint64
+//     block_offsets            (num_blocks + 1) * uint64
+//     blocks                   block_offsets[num_blocks] bytes
+//
+// Block b holds the scans in the [block_scans[b], block_scans[b + 1]) range
+// and starts block_offsets[b] bytes after the first block. Once decompressed,
+// it contains the mz of the points of its scans followed by their intensity.
+constexpr char columnar_magic[] = "PASTAQRD";
+constexpr uint64_t columnar_version = 2;
+constexpr uint64_t columnar_block_size = 65536;
+bool read_raw_data_columnar(std::istream &stream, RawData *raw_data);
+bool write_raw_data_columnar(
+    std::ostream &stream, const RawData &raw_data,
+    Compression::Codec::Type codec = Compression::Codec::NONE,
+    int level = Z_DEFAULT_COMPRESSION);
+
+// Read only the scans and points of the given file inside the retention time
+// and mz range. The retention times of the scans in the metadata and the
+// offsets of their points are used as an index, so that only the points in
+// the retention time range are read and only the blocks that contain them are
+// decompressed. Files compressed as a whole or written in the legacy format
+// are read completely before selecting the range.
+bool read_raw_data_range(const std::string &filename, double min_rt,
+                         double max_rt, double min_mz, double max_mz,
+                         RawData *raw_data);
+
+// Check if the given file, compressed or not, is in the columnar format by
+// looking at its magic number.
+bool is_columnar_file(const std::string &filename);
+
 }  // namespace RawData::Serialize
 
+namespace RawData {
+
+// Read only view of an uncompressed RawData file written in the columnar
+// format. The file is memory mapped, and the mz and intensity arrays are
+// accessed in place without copying them. Only the scan metadata is read into
+// memory.
+class MappedRawData {
+    Mmap::MappedFile file;
+    // The scans of the metadata have empty mz and intensity vectors.
+    RawData metadata_;
+    const uint64_t *offsets_ = nullptr;
+    const double *mz_ = nullptr;
+    const double *intensity_ = nullptr;
+
+   public:
+    // Map the given file. Returns false if the file can't be mapped or if it
+    // is not a valid columnar file.
+    bool open(const std::string &filename);
+    // Map the `length` bytes of the file starting at `offset`, which must be
+    // aligned to 8 bytes, such as an uncompressed member of a container.
+    bool open(const std::string &filename, uint64_t offset, uint64_t length);
+
+    const RawData &metadata() const { return metadata_; }
+    size_t size() const { return metadata_.scans.size(); }
+    uint64_t num_points() const { return offsets_ ? offsets_[size()] : 0; }
+
+    // Contiguous arrays with the points of all scans and the offsets of each
+    // scan into them.
+    const uint64_t *offsets() const { return offsets_; }
+    const double *mz() const { return mz_; }
+    const double *intensity() const { return intensity_; }
+
+    // The points of the scan at index i.
+    uint64_t num_points(size_t i) const {
+        return offsets_[i + 1] - offsets_[i];
+    }
+    const double *mz(size_t i) const { return mz_ + offsets_[i]; }
+    const double *intensity(size_t i) const {
+        return intensity_ + offsets_[i];
+    }
+
+    // Copy the scan at index i or all scans into memory.
+    Scan scan(size_t i) const;
+    RawData load() const;
+};
+
+}  // namespace RawData
+
 // This namespace groups the functions used to serialize IdentData data
 // structures into a binary stream.
 namespace IdentData::Serialize {
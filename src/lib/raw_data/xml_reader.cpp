@@ -1,757 +1,1705 @@
-#include <zlib.h>
+#include <algorithm>
 #include <regex>
 #include <sstream>
 #include <cctype>
+#include <condition_variable>
+#include <exception>
 #include <fstream>
 #include <iostream>
+#include <limits>
+#include <memory>
+#include <mutex>
+#include <string_view>
+#include <thread>
 
 #include "utils/base64.hpp"
 #include "utils/compression.hpp"
+#include "utils/numpress.hpp"
+#include "utils/serialization.hpp"
 #include "xml_reader.hpp"
+#include "xml_tokenizer.hpp"
 
-bool triggerPeakLog{true};
+// A parsed scan along with the information from the file needed to store it
+// that is not part of RawData::Scan.
+struct ParsedScan {
+    RawData::Scan scan;
+    // FAIMS compensation voltage the scan was acquired with, if available.
+    std::optional<double> compensation_voltage;
+    // The precursor of this scan is the previous MS1 scan in the file, which
+    // can only be resolved once the scans are processed in order.
+    bool previous_ms1_precursor;
+    // The binary data of this scan could not be decoded.
+    bool decoding_error;
+    // Position of the opening tag of the scan in the input of the tokenizer.
+    uint64_t offset;
+    // Range of the mz values as reported in the scan metadata, if available.
+    std::optional<double> lowest_mz;
+    std::optional<double> highest_mz;
+};
+
+// Encoding of the binary data in an mzXML <peaks> tag.
+struct MzXmlPeaksFormat {
+    int precision;
+    bool little_endian;
+    bool compressed;
+};
+
+// Extracts the encoding of the binary data from the attributes of the <peaks>
+// tag. Returns std::nullopt if the tag is missing any required attributes.
+std::optional<MzXmlPeaksFormat> parse_mzxml_peaks_format(
+    const XmlTokenizer::Tag &peaks_tag) {
+    MzXmlPeaksFormat format = {};
+
+    // Extract the precision from the peaks tag.
+    auto precision_attribute = XmlTokenizer::attribute(peaks_tag, "precision");
+    if (!precision_attribute) {
+        return std::nullopt;
+    }
+    format.precision = XmlTokenizer::to_int(precision_attribute.value());
 
-void log_itg(const std::string& msg) {
-    const char* log_path = "/home/phorvatovich/development/pastaqTesting/PASTAQ/log.txt";
-    // Open in append mode so previous logs are preserved
-    if (msg == "reset") {
-        // Delete the log file and start fresh
-        std::remove(log_path);
+    // Extract the byteOrder from the peaks tag. This determines the endianness
+    // in which the data was stored. `network` == `big_endian`.
+    auto byte_order = XmlTokenizer::attribute(peaks_tag, "byteOrder");
+    if (!byte_order) {
+        return std::nullopt;
+    }
+    format.little_endian = byte_order.value() != "network";
+
+    // Extract the contentType/pairOrder from the peaks tag and exit if it is
+    // not `m/z-int`. In older versions of ProteoWizard, the conversion was not
+    // validated and the tag was incorrect. Here we are supporting both
+    // versions for compatibility but we are not trying to be exhaustive.
+    auto content_type_found =
+        XmlTokenizer::attribute(peaks_tag, "contentType").has_value();
+    auto pair_order_found =
+        XmlTokenizer::attribute(peaks_tag, "pairOrder").has_value();
+    if (!content_type_found && !pair_order_found) {
+        return std::nullopt;
     }
 
-    std::ofstream log_file(log_path, std::ios::app);
+    // Find whether or not the data is compressed.
+    format.compressed =
+        XmlTokenizer::attribute(peaks_tag, "compressionType") == "zlib";
+    return format;
+}
 
-    if (!log_file) {
-        std::cerr << "Error: Could not open log file." << std::endl;
-        return;
+// Decodes the contents of an mzXML <peaks> tag into the mz/intensity vectors of
+// the given scan, filtering the points outside the mz range or with zero
+// intensity. Returns false if the peaks could not be decoded.
+bool decode_mzxml_peaks(std::string_view data, const MzXmlPeaksFormat &format,
+                        size_t num_points, double min_mz, double max_mz,
+                        RawData::Scan &scan) {
+    // The peaks are stored as interleaved mz/intensity pairs.
+    std::vector<double> values;
+    if (!Base64::decode_array(data, format.precision, format.little_endian,
+                              format.compressed, values)) {
+        return false;
     }
 
-    log_file << msg << std::endl;
+    // Interpret raw data.
+    double intensity_sum = 0;
+    double max_intensity = 0;
+
+    scan.mz.resize(num_points);
+    scan.intensity.resize(num_points);
+    size_t scan_size = 0;
+
+    // Missing points are treated as empty and filtered out.
+    num_points = std::min(num_points, values.size() / 2);
+    for (size_t i = 0; i < num_points; ++i) {
+        double mz = values[2 * i];
+        double intensity = values[2 * i + 1];
 
-    // Optional: flush explicitly
-    log_file.flush();
+        // We don't need to extract the peaks when we are not inside the mz
+        // bounds or contain no value.
+        if (mz < min_mz || mz > max_mz || intensity == 0) {
+            continue;
+        }
+
+        if (intensity > max_intensity) {
+            max_intensity = intensity;
+        }
+        intensity_sum += intensity;
+
+        scan.mz[scan_size] = mz;
+        scan.intensity[scan_size] = intensity;
+        ++scan_size;
+    }
+    // Resize to number of elements that are actually included.
+    scan.mz.resize(scan_size);
+    scan.intensity.resize(scan_size);
+
+    // Shrink capacity
+    scan.mz.shrink_to_fit();
+    scan.intensity.shrink_to_fit();
+
+    scan.num_points = scan.mz.size();
+    scan.max_intensity = max_intensity;
+    scan.total_intensity = intensity_sum;
+    return true;
 }
 
-RawData::Scan parse_mzxml_scan(std::istream &stream,
-                               std::optional<XmlReader::Tag> &tag,
-                               double min_mz, double max_mz, double min_rt,
-                               double max_rt, Polarity::Type polarity,
-                               size_t ms_level) {
-    RawData::Scan scan;
-    uint64_t precursor_id = 0;
+// Parses the mzXML scan for the given opening tag, including all child scans
+// nested inside of it. The scans matching the given filters are appended to
+// `scans` in the order they appear in the file. Child scans without an
+// explicit precursorScanNum take the scan number of their parent.
+//
+// If decode_peaks is false, the peaks are not decoded and the number of points
+// and intensity summaries are taken from the scan attributes instead.
+void parse_mzxml_scan(XmlTokenizer::Tokenizer &tokenizer,
+                      const XmlTokenizer::Tag &tag, double min_mz,
+                      double max_mz, double min_rt, double max_rt,
+                      Polarity::Type polarity,
+                      const std::vector<size_t> &ms_levels,
+                      uint64_t parent_scan_number,
+                      std::vector<ParsedScan> &scans,
+                      bool decode_peaks = true) {
+    ParsedScan parsed_scan = {};
+    auto &scan = parsed_scan.scan;
     scan.precursor_information.scan_number = 0;
-    auto scan_attributes = tag.value().attributes;
+    parsed_scan.offset = tokenizer.offset(tag.name) - 1;
+
+    // We only decode the peaks of the scans matching the filters, but we still
+    // need to read until the end of this scan, as there could be nested child
+    // scans that we are interested in.
+    bool selected = true;
+    size_t num_points = 0;
 
     // Find scan number.
-    if (scan_attributes.find("num") == scan_attributes.end()) {
-        return {};
+    if (auto num = XmlTokenizer::attribute(tag, "num")) {
+        scan.scan_number = XmlTokenizer::to_int(num.value());
+    } else {
+        selected = false;
     }
-    scan.scan_number = std::stoi(scan_attributes["num"]);
 
     // Find polarity.
-    if (scan_attributes.find("polarity") != scan_attributes.end()) {
-        if (scan_attributes["polarity"] == "+") {
+    if (auto scan_polarity = XmlTokenizer::attribute(tag, "polarity")) {
+        if (scan_polarity.value() == "+") {
             scan.polarity = Polarity::POSITIVE;
-        } else if (scan_attributes["polarity"] == "-") {
+        } else if (scan_polarity.value() == "-") {
             scan.polarity = Polarity::NEGATIVE;
         } else {
             scan.polarity = Polarity::BOTH;
         }
         if (polarity != Polarity::BOTH && scan.polarity != polarity) {
-            return {};
+            selected = false;
         }
     }
-    
-    if (scan_attributes.find("centroided") != scan_attributes.end()) {
-        if (scan_attributes["centroided"] == "1"){
-            scan.centroid = true;
-        }
+
+    if (XmlTokenizer::attribute(tag, "centroided") == "1") {
+        scan.centroid = true;
     }
 
-    // Find MS level.
-    if (scan_attributes.find("msLevel") == scan_attributes.end()) {
-        return {};
+    // FAIMS compensation voltage.
+    if (auto voltage = XmlTokenizer::attribute(tag, "compensationVoltage")) {
+        parsed_scan.compensation_voltage =
+            XmlTokenizer::to_double(voltage.value());
     }
-    size_t scan_ms_level = std::stoi(scan_attributes["msLevel"]);
-    scan.ms_level = scan_ms_level;
 
-    // Fill up the rest of the scan information.
-    if (scan_ms_level == ms_level) {
-        // Find the number of m/z-intensity pairs in the scan.
-        if (scan_attributes.find("peaksCount") == scan_attributes.end()) {
-            return {};
+    // Summary of the peaks, used when they are not decoded.
+    if (!decode_peaks) {
+        if (auto tic = XmlTokenizer::attribute(tag, "totIonCurrent")) {
+            scan.total_intensity = XmlTokenizer::to_double(tic.value());
+        }
+        if (auto bpi = XmlTokenizer::attribute(tag, "basePeakIntensity")) {
+            scan.max_intensity = XmlTokenizer::to_double(bpi.value());
+        }
+        if (auto low_mz = XmlTokenizer::attribute(tag, "lowMz")) {
+            parsed_scan.lowest_mz = XmlTokenizer::to_double(low_mz.value());
+        }
+        if (auto high_mz = XmlTokenizer::attribute(tag, "highMz")) {
+            parsed_scan.highest_mz = XmlTokenizer::to_double(high_mz.value());
         }
-        size_t num_points = std::stoi(scan_attributes["peaksCount"]);
+    }
 
-        // Extract the retention time.
-        if (scan_attributes.find("retentionTime") == scan_attributes.end()) {
-            // NOTE(alex): On the spec, the retention time attribute is
-            // optional, however, we do require it.
-            return {};
+    // Find MS level.
+    if (auto ms_level = XmlTokenizer::attribute(tag, "msLevel")) {
+        scan.ms_level = XmlTokenizer::to_int(ms_level.value());
+        if (std::find(ms_levels.begin(), ms_levels.end(), scan.ms_level) ==
+            ms_levels.end()) {
+            selected = false;
         }
+    } else {
+        selected = false;
+    }
+
+    // Find the number of m/z-intensity pairs in the scan.
+    if (auto peaks_count = XmlTokenizer::attribute(tag, "peaksCount")) {
+        num_points = XmlTokenizer::to_int(peaks_count.value());
+    } else {
+        selected = false;
+    }
 
+    // Extract the retention time.
+    auto retention_time_attribute =
+        XmlTokenizer::attribute(tag, "retentionTime");
+    if (!retention_time_attribute) {
+        // NOTE(alex): On the spec, the retention time attribute is
+        // optional, however, we do require it.
+        selected = false;
+    } else if (selected) {
         // The time is in xs:duration units. Here we are only accounting
         // for the data as stored in seconds, minutes and hours. It is
         // unlikely that we are going to need to parse the days, months
         // and years. For more information about the format see:
         //    https://www.ibm.com/support/knowledgecenter/en/ssw_ibm_i_72/rzasp/rzasp_xsduration.htm
-        std::regex rt_regex(
+        static const std::regex rt_regex(
             R"(P.*T(?:([[:digit:]]+)H)?(?:([[:digit:]]+)M)?(?:([[:digit:]]+\.?[[:digit:]]*)S))");
-        std::smatch matches;
-        if (!std::regex_search(scan_attributes["retentionTime"], matches,
-                               rt_regex) ||
+        auto retention_time_str = retention_time_attribute.value();
+        std::cmatch matches;
+        if (!std::regex_search(
+                retention_time_str.data(),
+                retention_time_str.data() + retention_time_str.size(),
+                matches, rt_regex) ||
             matches.size() != 4) {
-            return {};
+            selected = false;
+        } else {
+            double retention_time = std::stod(matches[3]);
+            if (matches[2] != "") {
+                retention_time += std::stod(matches[2]) * 60;
+            }
+            if (matches[1] != "") {
+                retention_time += std::stod(matches[1]) * 60 * 60;
+            }
+            scan.retention_time = retention_time;
+
+            // Check if we are on the desired region as defined by
+            // min_rt/max_rt.
+            if (retention_time < min_rt || retention_time > max_rt) {
+                selected = false;
+            }
         }
-        double retention_time = std::stod(matches[3]);
-        if (matches[2] != "") {
-            retention_time += std::stod(matches[2]) * 60;
+    }
+
+    if (tag.closed) {
+        return;
+    }
+
+    // We are interested in the contents of this scan tag: precursorMz, peaks
+    // and the nested child scans.
+    std::vector<ParsedScan> child_scans;
+    while (auto next_tag = tokenizer.next_tag()) {
+        if (next_tag.value().name == "scan" && next_tag.value().closed) {
+            break;
         }
-        if (matches[1] != "") {
-            retention_time += std::stod(matches[1]) * 60 * 60;
+        if (next_tag.value().name == "scan" && !next_tag.value().closed) {
+            parse_mzxml_scan(tokenizer, next_tag.value(), min_mz, max_mz,
+                             min_rt, max_rt, polarity, ms_levels,
+                             scan.scan_number, child_scans, decode_peaks);
+        }
+        if (selected && decode_peaks && next_tag.value().name == "peaks" &&
+            !next_tag.value().closed) {
+            // The attributes of the tag need to be parsed before reading the
+            // data, which could invalidate the tag.
+            auto format = parse_mzxml_peaks_format(next_tag.value());
+            auto data = tokenizer.read_data();
+            if (!format || !data ||
+                !decode_mzxml_peaks(data.value(), format.value(), num_points,
+                                    min_mz, max_mz, scan)) {
+                selected = false;
+            }
+        }
+        if (selected && next_tag.value().name == "precursorMz" &&
+            !next_tag.value().closed) {
+            const auto &precursor_tag = next_tag.value();
+            if (auto intensity = XmlTokenizer::attribute(
+                    precursor_tag, "precursorIntensity")) {
+                scan.precursor_information.intensity =
+                    XmlTokenizer::to_double(intensity.value());
+            }
+
+            if (auto window_wideness =
+                    XmlTokenizer::attribute(precursor_tag, "windowWideness")) {
+                scan.precursor_information.window_wideness =
+                    XmlTokenizer::to_double(window_wideness.value());
+            }
+
+            if (auto charge =
+                    XmlTokenizer::attribute(precursor_tag, "precursorCharge")) {
+                scan.precursor_information.charge =
+                    XmlTokenizer::to_int(charge.value());
+            }
+
+            auto activation_method =
+                XmlTokenizer::attribute(precursor_tag, "activationMethod");
+            if (activation_method == "CID") {
+                scan.precursor_information.activation_method =
+                    ActivationMethod::CID;
+            } else if (activation_method == "HCD") {
+                scan.precursor_information.activation_method =
+                    ActivationMethod::HCD;
+            } else {
+                scan.precursor_information.activation_method =
+                    ActivationMethod::UNKNOWN;
+            }
+
+            if (auto precursor_scan_number = XmlTokenizer::attribute(
+                    precursor_tag, "precursorScanNum")) {
+                scan.precursor_information.scan_number =
+                    XmlTokenizer::to_int(precursor_scan_number.value());
+            }
+
+            // Reading the data invalidates the tag.
+            auto data = tokenizer.read_data();
+            if (!data) {
+                selected = false;
+            } else {
+                scan.precursor_information.mz =
+                    XmlTokenizer::to_double(data.value());
+            }
         }
-        scan.retention_time = retention_time;
+    }
 
-        // Check if we are on the desired region as defined by
-        if (retention_time < min_rt) {
-            return {};
+    if (selected) {
+        if (scan.ms_level > 1 && scan.precursor_information.scan_number == 0) {
+            scan.precursor_information.scan_number = parent_scan_number;
         }
-        // Assuming linearity of the retention time on the mzXML file.
-        // TODO: We should stop searching for the next scan, since we are out of
-        // bounds.
-        if (retention_time > max_rt) {
-            return {};
+        if (!decode_peaks) {
+            scan.num_points = num_points;
         }
+        scans.push_back(std::move(parsed_scan));
+    }
+    for (auto &child_scan : child_scans) {
+        scans.push_back(std::move(child_scan));
+    }
+}
 
-        // Fetch the next tag. We are interested in the contents of this scan
-        // tag: precursorMz and peaks.
-        auto next_tag = XmlReader::read_tag(stream);
-        while (stream.good() && !stream.eof()) {
-            if (next_tag.value().name == "scan" && next_tag.value().closed) {
+// Initialize an empty RawData object with the given parameters.
+RawData::RawData empty_raw_data(Instrument::Type instrument_type,
+                                double resolution_ms1, double resolution_msn,
+                                double reference_mz) {
+    RawData::RawData raw_data = {};
+    raw_data.instrument_type = instrument_type;
+    raw_data.min_mz = std::numeric_limits<double>::infinity();
+    raw_data.max_mz = -std::numeric_limits<double>::infinity();
+    raw_data.min_rt = std::numeric_limits<double>::infinity();
+    raw_data.max_rt = -std::numeric_limits<double>::infinity();
+    raw_data.resolution_ms1 = resolution_ms1;
+    raw_data.resolution_msn = resolution_msn;
+    raw_data.reference_mz = reference_mz;
+    raw_data.fwhm_rt = 0;  // TODO(alex): Should this be passed as well?
+    raw_data.scans = {};
+    raw_data.retention_times = {};
+    raw_data.centroid = false;
+    return raw_data;
+}
+
+// Append the scan to the RawData, updating its mz/rt ranges. The scan must have
+// at least one point.
+void append_scan(RawData::RawData &raw_data, RawData::Scan &&scan) {
+    if (scan.retention_time < raw_data.min_rt) {
+        raw_data.min_rt = scan.retention_time;
+    }
+    if (scan.retention_time > raw_data.max_rt) {
+        raw_data.max_rt = scan.retention_time;
+    }
+    if (scan.mz[0] < raw_data.min_mz) {
+        raw_data.min_mz = scan.mz[0];
+    }
+    if (scan.mz[scan.mz.size() - 1] > raw_data.max_mz) {
+        raw_data.max_mz = scan.mz[scan.mz.size() - 1];
+    }
+    if (scan.centroid) {
+        raw_data.centroid = true;
+    }
+    raw_data.retention_times.push_back(scan.retention_time);
+    raw_data.scans.push_back(std::move(scan));
+}
+
+// Store the scans being read from a file into the corresponding RawData
+// outputs, as configured by the SplitParams.
+struct ScanOutputs {
+    RawData::RawData empty_raw_data;
+    XmlReader::SplitParams split_params;
+    Polarity::Type polarity;
+    std::vector<XmlReader::RawDataOutput> outputs;
+};
+
+ScanOutputs init_scan_outputs(Instrument::Type instrument_type,
+                              double resolution_ms1, double resolution_msn,
+                              double reference_mz, Polarity::Type polarity,
+                              const XmlReader::SplitParams &split_params) {
+    ScanOutputs scan_outputs = {};
+    scan_outputs.empty_raw_data = empty_raw_data(
+        instrument_type, resolution_ms1, resolution_msn, reference_mz);
+    scan_outputs.split_params = split_params;
+    scan_outputs.polarity = polarity;
+
+    // If the scans are only split by MS level, all outputs are known in
+    // advance, and will be returned even if they contain no scans.
+    if (!split_params.split_polarity &&
+        split_params.ion_mobility != IonMobility::FAIMS) {
+        for (const auto &ms_level : split_params.ms_levels) {
+            scan_outputs.outputs.push_back({ms_level, polarity,
+                                            IonMobility::UNKNOWN, 0.0,
+                                            scan_outputs.empty_raw_data});
+        }
+    }
+    return scan_outputs;
+}
+
+// Add the scan to the corresponding output, creating it if necessary. Scans
+// with no points are ignored.
+void add_scan(ScanOutputs &scan_outputs, RawData::Scan &&scan,
+              std::optional<double> compensation_voltage) {
+    if (scan.num_points == 0) {
+        return;
+    }
+    const auto &split_params = scan_outputs.split_params;
+    auto polarity = scan_outputs.polarity;
+    if (split_params.split_polarity) {
+        polarity = scan.polarity;
+    }
+    auto ion_mobility = IonMobility::UNKNOWN;
+    double voltage = 0.0;
+    if (split_params.ion_mobility == IonMobility::FAIMS &&
+        compensation_voltage) {
+        ion_mobility = IonMobility::FAIMS;
+        voltage = compensation_voltage.value();
+    }
+
+    XmlReader::RawDataOutput *output = nullptr;
+    for (auto &candidate : scan_outputs.outputs) {
+        if (candidate.ms_level == scan.ms_level &&
+            candidate.polarity == polarity &&
+            candidate.ion_mobility == ion_mobility &&
+            candidate.compensation_voltage == voltage) {
+            output = &candidate;
+            break;
+        }
+    }
+    if (output == nullptr) {
+        scan_outputs.outputs.push_back({scan.ms_level, polarity, ion_mobility,
+                                        voltage, scan_outputs.empty_raw_data});
+        output = &scan_outputs.outputs.back();
+    }
+
+    append_scan(output->raw_data, std::move(scan));
+}
+
+// Sort the outputs by MS level, polarity and compensation voltage.
+std::vector<XmlReader::RawDataOutput> sorted_outputs(
+    ScanOutputs &scan_outputs) {
+    auto outputs = std::move(scan_outputs.outputs);
+    std::stable_sort(outputs.begin(), outputs.end(),
+                     [](const auto &a, const auto &b) {
+                         return std::tie(a.ms_level, a.polarity,
+                                         a.compensation_voltage) <
+                                std::tie(b.ms_level, b.polarity,
+                                         b.compensation_voltage);
+                     });
+    return outputs;
+}
+
+// Parses the <name> elements of the input in parallel. The input is split
+// into batches of raw elements, which are parsed by a pool of worker threads
+// while the next batch is being read. The same workers are used for all
+// batches. The parsed scans are passed to `process` in the same order as they
+// appear in the file. Reading stops early if `process` returns false.
+template <typename ParseFunction, typename ProcessFunction>
+void parse_elements_parallel(XmlTokenizer::Tokenizer &tokenizer,
+                             std::string_view name,
+                             std::string_view parent_name,
+                             uint64_t num_threads, ParseFunction parse,
+                             ProcessFunction process) {
+    const size_t batch_size = 64 * num_threads;
+    auto read_batch = [&]() {
+        std::vector<std::string> batch;
+        while (batch.size() < batch_size) {
+            auto element = tokenizer.next_element(name, parent_name);
+            if (!element) {
                 break;
             }
-            // We are not interested in subscans here. Continue until we find
-            // the corresponding output.
-            // FIXME: This only works with ONE subscan! ms1->ms2, if we are in
-            // ms1 and our ms2 contain subscans, it will FAIL. We need to
-            // recursively check child scans.
-            if (next_tag.value().name == "scan" && !next_tag.value().closed) {
-                next_tag = XmlReader::read_tag(stream);
-                while (stream.good() && !stream.eof()) {
-                    if (next_tag.value().name == "scan" &&
-                        next_tag.value().closed) {
-                        break;
-                    }
-                    next_tag = XmlReader::read_tag(stream);
-                }
+            batch.emplace_back(element.value());
+        }
+        return batch;
+    };
+
+    // State shared with the workers. Each batch is started by increasing the
+    // generation, and the workers report back when they are done with it. The
+    // elements are distributed across threads in an interleaved fashion, and
+    // the results stored by element index to keep the order.
+    std::mutex mutex;
+    std::condition_variable start_condition;
+    std::condition_variable done_condition;
+    uint64_t generation = 0;
+    size_t num_done = 0;
+    bool stop = false;
+    const std::vector<std::string> *current_batch = nullptr;
+    std::vector<std::vector<ParsedScan>> parsed_scans;
+    std::vector<std::exception_ptr> errors(num_threads);
+
+    // Stops and joins the workers when leaving the function, including when
+    // an exception is thrown. The workers are always idle at that point.
+    struct Workers {
+        std::mutex &mutex;
+        std::condition_variable &start_condition;
+        bool &stop;
+        std::vector<std::thread> threads;
+        ~Workers() {
+            {
+                std::lock_guard<std::mutex> lock(mutex);
+                stop = true;
             }
-            if (next_tag.value().name == "peaks") {
-                auto peak_attributes = next_tag.value().attributes;
-
-                // Extract the precision from the peaks tag.
-                if (peak_attributes.find("precision") ==
-                    peak_attributes.end()) {
-                    return {};
-                }
-                int precision = std::stoi(peak_attributes["precision"]);
-
-                // Extract the byteOrder from the peaks tag. This determines
-                // the endianness in which the data was stored. `network` ==
-                // `big_endian`.
-                if (peak_attributes.find("byteOrder") ==
-                    peak_attributes.end()) {
-                    return {};
+            start_condition.notify_all();
+            for (auto &thread : threads) {
+                thread.join();
+            }
+        }
+    } workers{mutex, start_condition, stop, {}};
+    for (size_t i = 0; i < num_threads; ++i) {
+        workers.threads.emplace_back([&, i]() {
+            uint64_t worker_generation = 0;
+            while (true) {
+                {
+                    std::unique_lock<std::mutex> lock(mutex);
+                    start_condition.wait(lock, [&]() {
+                        return stop || generation != worker_generation;
+                    });
+                    if (stop) {
+                        return;
+                    }
+                    worker_generation = generation;
                 }
-                auto byte_order = peak_attributes["byteOrder"];
-                auto little_endian = byte_order != "network";
-
-                // Extract the contentType/pairOrder from the peaks tag and
-                // exit if it is not `m/z-int`. In older versions of
-                // ProteoWizard, the conversion was not validated and the
-                // tag was incorrect. Here we are supporting both versions
-                // for compatibility but we are not trying to be exhaustive.
-                auto content_type_found = peak_attributes.find("contentType") !=
-                                          peak_attributes.end();
-                auto pair_order_found =
-                    peak_attributes.find("pairOrder") != peak_attributes.end();
-                if (!content_type_found && !pair_order_found) {
-                    return {};
+                try {
+                    const auto &batch = *current_batch;
+                    for (size_t k = i; k < batch.size(); k += num_threads) {
+                        parsed_scans[k] = parse(batch[k]);
+                    }
+                } catch (...) {
+                    errors[i] = std::current_exception();
                 }
-                std::string pair_order;
-                if (content_type_found) {
-                    pair_order = peak_attributes["contentType"];
-                } else {
-                    pair_order = peak_attributes["pairOrder"];
+                {
+                    std::lock_guard<std::mutex> lock(mutex);
+                    ++num_done;
                 }
+                done_condition.notify_one();
+            }
+        });
+    }
 
-                // Find whether or not the data is compressed.
-                bool compressed = peak_attributes["compressionType"] == "zlib";
+    auto batch = read_batch();
+    while (!batch.empty()) {
+        parsed_scans.assign(batch.size(), {});
+        {
+            std::lock_guard<std::mutex> lock(mutex);
+            current_batch = &batch;
+            num_done = 0;
+            ++generation;
+        }
+        start_condition.notify_all();
+
+        // Read the next batch while the current one is being parsed. Errors
+        // are rethrown once the workers are done with the current batch.
+        std::vector<std::string> next_batch;
+        std::exception_ptr read_error;
+        try {
+            next_batch = read_batch();
+        } catch (...) {
+            read_error = std::current_exception();
+        }
 
-                // Extract the peaks from the data.
-                auto data = XmlReader::read_data(stream);
-                if (!data) {
-                    return {};
+        // Wait for the workers to finish.
+        {
+            std::unique_lock<std::mutex> lock(mutex);
+            done_condition.wait(lock,
+                                [&]() { return num_done == num_threads; });
+        }
+        if (read_error) {
+            std::rethrow_exception(read_error);
+        }
+        for (const auto &error : errors) {
+            if (error) {
+                std::rethrow_exception(error);
+            }
+        }
+        for (auto &scans : parsed_scans) {
+            for (auto &parsed_scan : scans) {
+                if (!process(parsed_scan)) {
+                    return;
                 }
+            }
+        }
+        batch = std::move(next_batch);
+    }
+}
 
-                // Decode base64-encoded string to raw data.
-                std::vector<uint8_t> raw_data;
-                Base64::decode_base64(data.value(), raw_data);
+// The number of threads used for parsing is limited by the available
+// concurrency.
+uint64_t num_parsing_threads(size_t max_threads) {
+    uint64_t num_threads = std::thread::hardware_concurrency();
+    if (num_threads > max_threads) {
+        num_threads = max_threads;
+    }
+    return num_threads;
+}
 
-                if (compressed) {
-                    // Calculate amount of bytes in decompressed data.
-                    size_t decompressed_len = num_points * 2 * (precision / 8);
-                    std::vector<uint8_t> decompressed_data;
+std::vector<XmlReader::RawDataOutput> XmlReader::read_mzxml_multi(
+    std::istream &stream, double min_mz, double max_mz, double min_rt,
+    double max_rt, Instrument::Type instrument_type, double resolution_ms1,
+    double resolution_msn, double reference_mz, Polarity::Type polarity,
+    const SplitParams &split_params, size_t max_threads) {
+    auto scan_outputs =
+        init_scan_outputs(instrument_type, resolution_ms1, resolution_msn,
+                          reference_mz, polarity, split_params);
+    auto process = [&scan_outputs](ParsedScan &parsed_scan) {
+        add_scan(scan_outputs, std::move(parsed_scan.scan),
+                 parsed_scan.compensation_voltage);
+        return true;
+    };
+    // TODO(alex): Can we automatically detect the instrument type and set
+    // resolution from the header?
+    XmlTokenizer::Tokenizer tokenizer(stream);
+    uint64_t num_threads = num_parsing_threads(max_threads);
+    if (num_threads > 1) {
+        auto parse = [&](const std::string &element) {
+            std::vector<ParsedScan> scans;
+            XmlTokenizer::Tokenizer element_tokenizer(element);
+            auto tag = element_tokenizer.next_tag();
+            if (tag && !tag.value().closed) {
+                parse_mzxml_scan(element_tokenizer, tag.value(), min_mz,
+                                 max_mz, min_rt, max_rt, polarity,
+                                 split_params.ms_levels, 0, scans);
+            }
+            return scans;
+        };
+        parse_elements_parallel(tokenizer, "scan", "msRun", num_threads, parse,
+                                process);
+        return sorted_outputs(scan_outputs);
+    }
 
-                    // Decompress data.
-                    int status = Compression::inflate(
-                        raw_data, decompressed_data, decompressed_len);
+    std::vector<ParsedScan> scans;
+    while (auto tag = tokenizer.next_tag()) {
+        if (tag.value().name == "msRun" && tag.value().closed) {
+            break;
+        }
+        if (tag.value().name == "scan" && !tag.value().closed) {
+            scans.clear();
+            parse_mzxml_scan(tokenizer, tag.value(), min_mz, max_mz, min_rt,
+                             max_rt, polarity, split_params.ms_levels, 0,
+                             scans);
+            for (auto &parsed_scan : scans) {
+                process(parsed_scan);
+            }
+        }
+    }
+    return sorted_outputs(scan_outputs);
+}
 
-                    // Check status after decompression.
-                    if (status != Z_OK) {
-                        return {};
-                    }
+std::optional<RawData::RawData> XmlReader::read_mzxml(
+    std::istream &stream, double min_mz, double max_mz, double min_rt,
+    double max_rt, Instrument::Type instrument_type, double resolution_ms1,
+    double resolution_msn, double reference_mz, Polarity::Type polarity,
+    size_t ms_level, size_t max_threads) {
+    auto outputs = read_mzxml_multi(
+        stream, min_mz, max_mz, min_rt, max_rt, instrument_type,
+        resolution_ms1, resolution_msn, reference_mz, polarity,
+        {{ms_level}, false, IonMobility::UNKNOWN}, max_threads);
+    return outputs[0].raw_data;
+}
 
-                    raw_data = decompressed_data;
-                }
+// Decodes an mzML binary data array compressed with MS-Numpress. The numpress
+// encoded bytes can be compressed with zlib as well.
+bool decode_numpress_array(std::string_view data, Numpress::Type numpress,
+                           bool compressed, std::vector<double> &output) {
+    std::vector<uint8_t> binary_data;
+    Base64::decode_base64(data, binary_data);
+    if (compressed) {
+        std::vector<uint8_t> decompressed_data;
+        if (binary_data.empty() ||
+            Compression::inflate(binary_data, decompressed_data, 0) != Z_OK) {
+            return false;
+        }
+        binary_data.swap(decompressed_data);
+    }
+    return Numpress::decode(numpress, binary_data.data(), binary_data.size(),
+                            output);
+}
 
-                // Interpret raw data.
-                double intensity_sum = 0;
-                double max_intensity = 0;
+// Parses the mzML spectrum for the given opening tag. Only the binary data of
+// the spectra matching the MS level and polarity filters is decoded. Spectra
+// outside the retention time range are returned without points.
+//
+// If decode_peaks is false, the binary data is not decoded and the number of
+// points and intensity summaries are taken from the spectrum metadata instead.
+ParsedScan parse_mzml_spectrum(XmlTokenizer::Tokenizer &tokenizer,
+                               const XmlTokenizer::Tag &tag, double min_mz,
+                               double max_mz, double min_rt, double max_rt,
+                               Polarity::Type polarity,
+                               const std::vector<size_t> &ms_levels,
+                               bool decode_peaks = true) {
+    using namespace XmlTokenizer;
+    ParsedScan parsed_scan = {};
+    auto &scan = parsed_scan.scan;
+    scan.precursor_information.scan_number = 0;
+    parsed_scan.offset = tokenizer.offset(tag.name) - 1;
+
+    // NOTE: In the mzML spec, the native scan number is described on the "id"
+    // attribute, and can contain more information than required for just an
+    // integer identifer. Moreover, it looks like, at least for Orbitrap data,
+    // the scan numbers are non-zero consecutive integers. For the sake of
+    // time, I'm just assuming here that this assumption is the same for all
+    // formats, but should probably find a more robust way of doing this.
+    scan.scan_number = to_int(attribute(tag, "index").value_or("")) + 1;
+    size_t array_length =
+        to_int(attribute(tag, "defaultArrayLength").value_or("0"));
+    std::vector<bool> filter_points;
+    std::vector<double> mzs;
+    std::vector<double> intensities;
+    while (auto tag = tokenizer.next_tag()) {
+        if (tag.value().name == "spectrum" && tag.value().closed) {
+            break;
+        }
 
-                scan.mz.resize(num_points);
-                scan.intensity.resize(num_points);
-                size_t scan_size = 0;
+        if (tag.value().name == "cvParam") {
+            auto accession = Accession::from_string(
+                attribute(tag.value(), "accession").value_or(""));
+            auto value = attribute(tag.value(), "value").value_or("");
 
-                size_t offset = 0;
-                for (size_t i = 0; i < num_points; ++i) {
-                    double mz = 0;
-                    double intensity = 0;
-                    // Interpret mz and intensity values.
-                    if (precision == 32) {
-                        mz = Base64::interpret_float(raw_data, offset,
-                                                     little_endian);
-                        offset += 4;
-                        intensity = Base64::interpret_float(raw_data, offset,
-                                                            little_endian);
-                        offset += 4;
-                    } else if (precision == 64) {
-                        mz = Base64::interpret_double(raw_data, offset,
-                                                      little_endian);
-                        offset += 8;
-                        intensity = Base64::interpret_double(raw_data, offset,
-                                                             little_endian);
-                        offset += 8;
-                    }
+            // This scan is ms_level 1
+            if (accession == Accession::MS1_SPECTRUM) {
+                scan.ms_level = 1;
+            }
 
-                    // We don't need to extract the peaks when we are not
-                    // inside the mz bounds or contain no value.
-                    if (mz < min_mz || mz > max_mz || intensity == 0) {
-                        continue;
-                    }
+            // MS level a multi-level MSn experiment.
+            if (accession == Accession::MS_LEVEL) {
+                scan.ms_level = to_int(value);
+            }
 
-                    if (intensity > max_intensity) {
-                        max_intensity = intensity;
-                    }
-                    intensity_sum += intensity;
+            // Polarity.
+            if (accession == Accession::POSITIVE_SCAN) {
+                scan.polarity = Polarity::POSITIVE;
+            }
+            if (accession == Accession::NEGATIVE_SCAN) {
+                scan.polarity = Polarity::NEGATIVE;
+            }
 
-                    scan.mz[scan_size] = mz;
-                    scan.intensity[scan_size] = intensity;
-                    ++scan_size;
+            // Retention time.
+            if (accession == Accession::SCAN_START_TIME) {
+                scan.retention_time = to_double(value);
+                // Retention time is store in seconds. Make sure it is the
+                // right unit. If the unit accession was "UO:0000010" it would
+                // be in seconds, so no action is required.
+                if (attribute(tag.value(), "unitAccession") == "UO:0000031") {
+                    scan.retention_time *= 60.0;
+                }
+                if (scan.retention_time < min_rt ||
+                    scan.retention_time > max_rt) {
+                    return parsed_scan;
                 }
-                // Resize to number of elements that are actually included.
-                scan.mz.resize(scan_size);
-                scan.intensity.resize(scan_size);
+            }
 
-                // Shrink capacity
-                scan.mz.shrink_to_fit();
-                scan.intensity.shrink_to_fit();
+            // FAIMS compensation voltage.
+            if (accession == Accession::FAIMS_COMPENSATION_VOLTAGE) {
+                parsed_scan.compensation_voltage = to_double(value);
+            }
 
-                scan.num_points = scan.mz.size();
-                scan.max_intensity = max_intensity;
-                scan.total_intensity = intensity_sum;
+            // Detect centroid based on MS:1000127 in the spectrum header.
+            if (accession == Accession::CENTROID_SPECTRUM) {
+                scan.centroid = true;
             }
-            if (next_tag.value().name == "precursorMz") {
-                auto precursor_attributes = next_tag.value().attributes;
-                if (precursor_attributes.find("precursorIntensity") !=
-                    precursor_attributes.end()) {
-                    scan.precursor_information.intensity =
-                        std::stod(precursor_attributes["precursorIntensity"]);
-                }
 
-                if (precursor_attributes.find("windowWideness") !=
-                    precursor_attributes.end()) {
-                    scan.precursor_information.window_wideness =
-                        std::stod(precursor_attributes["windowWideness"]);
+            // Summary of the peaks, used when they are not decoded.
+            if (!decode_peaks) {
+                if (accession == Accession::TOTAL_ION_CURRENT) {
+                    scan.total_intensity = to_double(value);
                 }
-
-                if (precursor_attributes.find("precursorCharge") !=
-                    precursor_attributes.end()) {
-                    scan.precursor_information.charge =
-                        std::stoi(precursor_attributes["precursorCharge"]);
+                if (accession == Accession::BASE_PEAK_INTENSITY) {
+                    scan.max_intensity = to_double(value);
+                }
+                if (accession == Accession::LOWEST_OBSERVED_MZ) {
+                    parsed_scan.lowest_mz = to_double(value);
                 }
+                if (accession == Accession::HIGHEST_OBSERVED_MZ) {
+                    parsed_scan.highest_mz = to_double(value);
+                }
+            }
+        }
 
-                if (precursor_attributes.find("activationMethod") !=
-                    precursor_attributes.end()) {
-                    if (precursor_attributes["activationMethod"] == "CID") {
-                        scan.precursor_information.activation_method =
-                            ActivationMethod::CID;
-                    } else if (precursor_attributes["activationMethod"] ==
-                               "HCD") {
+        if (tag.value().name == "precursor") {
+            if (!tag.value().attributes.empty()) {
+                auto spectrum_ref =
+                    attribute(tag.value(), "spectrumRef").value_or("");
+                // Find scan number.
+                size_t scan_idx = spectrum_ref.find("scan=") + 5;
+                scan.precursor_information.scan_number =
+                    to_int(spectrum_ref.substr(scan_idx));
+            } else {
+                parsed_scan.previous_ms1_precursor = true;
+            }
+
+            scan.precursor_information.charge = 0;
+            scan.precursor_information.mz = 0.0;
+            scan.precursor_information.window_wideness = 0.0;
+            scan.precursor_information.intensity = 0.0;
+            scan.precursor_information.activation_method =
+                ActivationMethod::UNKNOWN;
+            while (auto tag = tokenizer.next_tag()) {
+                if (tag.value().name == "precursor" && tag.value().closed) {
+                    break;
+                }
+                if (tag.value().name == "cvParam") {
+                    auto accession = Accession::from_string(
+                        attribute(tag.value(), "accession").value_or(""));
+                    auto value = attribute(tag.value(), "value").value_or("");
+                    // Isolation window.
+                    if (accession == Accession::ISOLATION_WINDOW_TARGET_MZ) {
+                        scan.precursor_information.mz = to_double(value);
+                    }
+                    if (accession == Accession::ISOLATION_WINDOW_LOWER_OFFSET ||
+                        accession == Accession::ISOLATION_WINDOW_UPPER_OFFSET) {
+                        scan.precursor_information.window_wideness +=
+                            to_double(value);
+                    }
+                    // Charge state.
+                    if (accession == Accession::CHARGE_STATE) {
+                        scan.precursor_information.charge = to_int(value);
+                    }
+                    if (accession == Accession::PEAK_INTENSITY) {
+                        scan.precursor_information.intensity =
+                            to_double(value);
+                    }
+                    // Activation method.
+                    if (accession == Accession::BEAM_TYPE_CID) {
                         scan.precursor_information.activation_method =
                             ActivationMethod::HCD;
-                    } else {
-                        scan.precursor_information.activation_method =
-                            ActivationMethod::UNKNOWN;
                     }
+                }
+            }
+        }
+
+        if (decode_peaks && tag.value().name == "binaryDataArray" &&
+            !tag.value().closed) {
+            // Skip decoding the data for spectra we are not interested in.
+            bool selected = std::find(ms_levels.begin(), ms_levels.end(),
+                                      scan.ms_level) != ms_levels.end();
+            // Spectra without polarity information are always selected.
+            if (polarity != Polarity::BOTH &&
+                scan.polarity != Polarity::UNKNOWN &&
+                scan.polarity != polarity) {
+                selected = false;
+            }
+
+            // precision can be: 64 or 32 (bits).
+            int precision = 0;
+            // Uncompressed: false, Zlib compression: true.
+            bool compressed = false;
+            // MS-Numpress compression, which can be combined with zlib.
+            Numpress::Type numpress = Numpress::NONE;
+            // mz: 0, intensity: 1
+            int type = -1;
+            std::optional<std::string_view> data;
+            while (auto tag = tokenizer.next_tag()) {
+                if (tag.value().name == "binaryDataArray" &&
+                    tag.value().closed) {
+                    break;
+                }
+                if (tag.value().name == "cvParam") {
+                    auto accession = Accession::from_string(
+                        attribute(tag.value(), "accession").value_or(""));
+                    // Precision.
+                    if (accession == Accession::FLOAT_64) {
+                        precision = 64;
+                    }
+                    if (accession == Accession::FLOAT_32) {
+                        precision = 32;
+                    }
+                    // Compression.
+                    if (accession == Accession::ZLIB_COMPRESSION) {
+                        compressed = true;
+                    }
+                    switch (accession) {
+                        case Accession::NUMPRESS_LINEAR_ZLIB:
+                            compressed = true;
+                            [[fallthrough]];
+                        case Accession::NUMPRESS_LINEAR:
+                            numpress = Numpress::LINEAR;
+                            break;
+                        case Accession::NUMPRESS_PIC_ZLIB:
+                            compressed = true;
+                            [[fallthrough]];
+                        case Accession::NUMPRESS_PIC:
+                            numpress = Numpress::PIC;
+                            break;
+                        case Accession::NUMPRESS_SLOF_ZLIB:
+                            compressed = true;
+                            [[fallthrough]];
+                        case Accession::NUMPRESS_SLOF:
+                            numpress = Numpress::SLOF;
+                            break;
+                        default:
+                            break;
+                    }
+                    // Type of vector.
+                    if (accession == Accession::MZ_ARRAY) {
+                        type = 0;
+                    }
+                    if (accession == Accession::INTENSITY_ARRAY) {
+                        type = 1;
+                    }
+                }
+                if (selected && tag.value().name == "binary" &&
+                    !tag.value().closed) {
+                    // The binary data needs to be decoded before reading the
+                    // next tag, which could invalidate the data view.
+                    data = tokenizer.read_data();
+                    break;
+                }
+            }
+            // Other binary arrays are ignored.
+            if (data && (type == 0 || type == 1)) {
+                // Decode the data straight into the mz/intensity vectors.
+                auto &values = type == 0 ? mzs : intensities;
+                bool decoded = false;
+                if (numpress != Numpress::NONE) {
+                    decoded = decode_numpress_array(data.value(), numpress,
+                                                    compressed, values);
                 } else {
-                    scan.precursor_information.activation_method =
-                        ActivationMethod::UNKNOWN;
+                    decoded = Base64::decode_array(data.value(), precision,
+                                                   true, compressed, values);
+                }
+                if (!decoded) {
+                    parsed_scan.decoding_error = true;
+                    return parsed_scan;
                 }
 
-                auto data = XmlReader::read_data(stream);
-                if (!data) {
-                    return {};
+                size_t num_points = values.size();
+                if (filter_points.empty()) {
+                    filter_points = std::vector<bool>(num_points, false);
+                }
+                for (size_t i = 0; i < num_points; ++i) {
+                    if (type == 0 &&
+                        (values[i] < min_mz || values[i] > max_mz)) {
+                        filter_points[i] = true;
+                    }
+                    if (type == 1 && values[i] == 0.0) {
+                        filter_points[i] = true;
+                    }
                 }
-                scan.precursor_information.mz = std::stod(data.value());
+            }
+        }
+    }
 
-                if (precursor_attributes.find("precursorScanNum") !=
-                    precursor_attributes.end()) {
-                    scan.precursor_information.scan_number =
-                        std::stoi(precursor_attributes["precursorScanNum"]);
+    if (!decode_peaks) {
+        bool selected = std::find(ms_levels.begin(), ms_levels.end(),
+                                  scan.ms_level) != ms_levels.end();
+        if (polarity != Polarity::BOTH && scan.polarity != Polarity::UNKNOWN &&
+            scan.polarity != polarity) {
+            selected = false;
+        }
+        if (selected) {
+            scan.num_points = array_length;
+        }
+        return parsed_scan;
+    }
+
+    // Filter mzs not in range and intensity == 0 scans and calculate
+    // max_intensity and total_intensity.
+    double intensity_sum = 0;
+    double max_intensity = 0;
+    for (size_t i = 0; i < filter_points.size(); ++i) {
+        if (filter_points[i]) {
+            continue;
+        }
+        scan.mz.push_back(mzs[i]);
+        scan.intensity.push_back(intensities[i]);
+        if (intensities[i] > max_intensity) {
+            max_intensity = intensities[i];
+        }
+        intensity_sum += intensities[i];
+    }
+    scan.num_points = scan.mz.size();
+    scan.max_intensity = max_intensity;
+    scan.total_intensity = intensity_sum;
+
+    // TODO: Assert that mz.size() == intenstiy.size()
+    return parsed_scan;
+}
+
+std::vector<XmlReader::RawDataOutput> XmlReader::_read_mzml_multi(
+    std::istream &stream, double min_mz, double max_mz, double min_rt,
+    double max_rt, Instrument::Type instrument_type, double resolution_ms1,
+    double resolution_msn, double reference_mz, Polarity::Type polarity,
+    const SplitParams &split_params, size_t max_threads) {
+    auto scan_outputs =
+        init_scan_outputs(instrument_type, resolution_ms1, resolution_msn,
+                          reference_mz, polarity, split_params);
+    const auto &ms_levels = split_params.ms_levels;
+    long previousMS1_scan_number{0};
+    // The spectra need to be processed in the same order as in the file, as
+    // the precursor of MSn spectra can be the previous MS1 spectrum. Spectra
+    // are stored in increasing retention time order, once we find a spectrum
+    // past max_rt we can stop reading the file.
+    auto process = [&](ParsedScan &parsed_scan) {
+        auto &scan = parsed_scan.scan;
+        if (parsed_scan.decoding_error) {
+            return false;
+        }
+        if (scan.ms_level == 1) {
+            previousMS1_scan_number = scan.scan_number;
+        }
+        if (scan.retention_time > max_rt) {
+            return false;
+        }
+        if (parsed_scan.previous_ms1_precursor) {
+            scan.precursor_information.scan_number = previousMS1_scan_number;
+        }
+        add_scan(scan_outputs, std::move(scan),
+                 parsed_scan.compensation_voltage);
+        return true;
+    };
+    // TODO(alex): Can we automatically detect the instrument type and set
+    // resolution from the header?
+    XmlTokenizer::Tokenizer tokenizer(stream);
+    uint64_t num_threads = num_parsing_threads(max_threads);
+    if (num_threads > 1) {
+        auto parse = [&](const std::string &element) {
+            std::vector<ParsedScan> scans;
+            XmlTokenizer::Tokenizer element_tokenizer(element);
+            auto tag = element_tokenizer.next_tag();
+            if (tag && !tag.value().closed) {
+                scans.push_back(parse_mzml_spectrum(
+                    element_tokenizer, tag.value(), min_mz, max_mz, min_rt,
+                    max_rt, polarity, ms_levels));
+            }
+            return scans;
+        };
+        parse_elements_parallel(tokenizer, "spectrum", "spectrumList",
+                                num_threads, parse, process);
+        return sorted_outputs(scan_outputs);
+    }
+
+    while (auto tag = tokenizer.next_tag()) {
+        if (tag.value().name == "spectrumList" && tag.value().closed) {
+            break;
+        }
+        if (tag.value().name == "spectrum" && !tag.value().closed) {
+            auto parsed_scan =
+                parse_mzml_spectrum(tokenizer, tag.value(), min_mz, max_mz,
+                                    min_rt, max_rt, polarity, ms_levels);
+            if (!process(parsed_scan)) {
+                break;
+            }
+        }
+    }
+
+    return sorted_outputs(scan_outputs);
+}
+
+std::optional<RawData::RawData> XmlReader::_read_mzml(
+    std::istream &stream, double min_mz, double max_mz, double min_rt,
+    double max_rt, Instrument::Type instrument_type, double resolution_ms1,
+    double resolution_msn, double reference_mz, Polarity::Type polarity,
+    size_t ms_level, size_t max_threads) {
+    auto outputs = _read_mzml_multi(
+        stream, min_mz, max_mz, min_rt, max_rt, instrument_type,
+        resolution_ms1, resolution_msn, reference_mz, polarity,
+        {{ms_level}, false, IonMobility::UNKNOWN}, max_threads);
+    return outputs[0].raw_data;
+}
+
+std::optional<XmlReader::SpectrumIndex> XmlReader::read_mzml_index(
+    std::istream &stream) {
+    stream.clear();
+    stream.seekg(0, std::ios::end);
+    auto file_size = static_cast<uint64_t>(stream.tellg());
+    if (!stream.good() || file_size == 0) {
+        return std::nullopt;
+    }
+
+    // The <indexListOffset> element is located right before the closing
+    // </indexedmzML> tag, so we only need to inspect the tail of the file.
+    uint64_t tail_size = std::min<uint64_t>(file_size, 4096);
+    std::string tail(tail_size, '\0');
+    stream.seekg(file_size - tail_size);
+    stream.read(&tail[0], tail_size);
+    if (!stream.good()) {
+        return std::nullopt;
+    }
+    const std::string offset_tag = "<indexListOffset>";
+    size_t offset_pos = tail.rfind(offset_tag);
+    if (offset_pos == std::string::npos) {
+        return std::nullopt;
+    }
+    uint64_t index_list_offset = 0;
+    try {
+        index_list_offset =
+            std::stoull(tail.substr(offset_pos + offset_tag.size()));
+    } catch (...) {
+        return std::nullopt;
+    }
+    if (index_list_offset >= file_size) {
+        return std::nullopt;
+    }
+
+    // Read the offsets from the spectrum index.
+    SpectrumIndex index = {};
+    index.file_size = file_size;
+    stream.seekg(index_list_offset);
+    XmlTokenizer::Tokenizer tokenizer(stream);
+    bool in_spectrum_index = false;
+    while (auto tag = tokenizer.next_tag()) {
+        if (tag.value().name == "indexList" && tag.value().closed) {
+            break;
+        }
+        if (tag.value().name == "index") {
+            if (tag.value().closed) {
+                if (in_spectrum_index) {
+                    break;
                 }
+                continue;
+            }
+            in_spectrum_index =
+                XmlTokenizer::attribute(tag.value(), "name") == "spectrum";
+        }
+        if (in_spectrum_index && tag.value().name == "offset" &&
+            !tag.value().closed) {
+            auto data = tokenizer.read_data();
+            if (!data) {
+                return std::nullopt;
+            }
+            try {
+                index.offsets.push_back(XmlTokenizer::to_int(data.value()));
+            } catch (...) {
+                return std::nullopt;
+            }
+        }
+    }
+    if (index.offsets.empty()) {
+        return std::nullopt;
+    }
+
+    // Some converters are known to write wrong offsets. Check that the index
+    // is pointing to actual spectra before trusting it.
+    for (const auto &offset : {index.offsets.front(), index.offsets.back()}) {
+        if (offset >= file_size) {
+            return std::nullopt;
+        }
+        stream.clear();
+        stream.seekg(offset);
+        std::string buffer(9, '\0');
+        stream.read(&buffer[0], buffer.size());
+        if (!stream.good() || buffer != "<spectrum") {
+            return std::nullopt;
+        }
+    }
+    stream.clear();
+    stream.seekg(0);
+    return index;
+}
+
+XmlReader::SpectrumIndex XmlReader::build_mzml_index(std::istream &stream) {
+    SpectrumIndex index = {};
+    stream.clear();
+    stream.seekg(0, std::ios::end);
+    index.file_size = static_cast<uint64_t>(stream.tellg());
+    stream.seekg(0);
+
+    // The file is read in large blocks, keeping the tail of the previous block
+    // to match tags that are split between two of them.
+    const std::string spectrum_tag = "<spectrum";
+    const std::string spectrum_list_end = "</spectrumList";
+    const size_t block_size = 1 << 20;
+    const size_t overlap = spectrum_list_end.size();
+    std::string buffer;
+    uint64_t buffer_offset = 0;
+    std::vector<char> block(block_size);
+    while (stream.good()) {
+        stream.read(block.data(), block_size);
+        auto num_read = static_cast<size_t>(stream.gcount());
+        if (num_read == 0) {
+            break;
+        }
+        buffer.append(block.data(), num_read);
+
+        // Only search positions where the full tag can be checked.
+        size_t search_end = buffer.size();
+        if (stream.good()) {
+            search_end = buffer.size() - overlap;
+        }
+        size_t pos = buffer.find('<');
+        while (pos != std::string::npos && pos < search_end) {
+            if (buffer.compare(pos, spectrum_list_end.size(),
+                               spectrum_list_end) == 0) {
+                stream.clear();
+                stream.seekg(0);
+                return index;
+            }
+            if (buffer.compare(pos, spectrum_tag.size(), spectrum_tag) == 0 &&
+                pos + spectrum_tag.size() < buffer.size() &&
+                std::isspace(buffer[pos + spectrum_tag.size()])) {
+                index.offsets.push_back(buffer_offset + pos);
             }
-            next_tag = XmlReader::read_tag(stream);
+            pos = buffer.find('<', pos + 1);
         }
-        return scan;
+        buffer_offset += search_end;
+        buffer.erase(0, search_end);
     }
+    stream.clear();
+    stream.seekg(0);
+    return index;
+}
 
-    // If we are interested in a scan with a mz_level != 1, we need to find the
-    // precursor to which it belongs.
-    if (scan_ms_level == ms_level - 1) {
-        precursor_id = scan.scan_number;
-        auto next_tag = XmlReader::read_tag(stream);
-        while (stream.good() && next_tag) {
-            if (next_tag.value().name == "scan" && next_tag.value().closed) {
-                break;
+bool XmlReader::read_spectrum_index(std::istream &stream,
+                                    SpectrumIndex *index) {
+    Serialization::read_uint64(stream, &index->file_size);
+    uint64_t num_offsets = 0;
+    Serialization::read_uint64(stream, &num_offsets);
+    index->offsets = std::vector<uint64_t>(num_offsets);
+    for (size_t i = 0; i < num_offsets; ++i) {
+        Serialization::read_uint64(stream, &index->offsets[i]);
+    }
+    return stream.good();
+}
+
+bool XmlReader::write_spectrum_index(std::ostream &stream,
+                                     const SpectrumIndex &index) {
+    Serialization::write_uint64(stream, index.file_size);
+    Serialization::write_uint64(stream, index.offsets.size());
+    for (const auto &offset : index.offsets) {
+        Serialization::write_uint64(stream, offset);
+    }
+    return stream.good();
+}
+
+// Reads the header of the spectrum starting at the given offset, returning its
+// retention time (in seconds) and MS level without decoding the binary data.
+std::optional<std::pair<double, size_t>> peek_mzml_spectrum(
+    std::istream &stream, uint64_t offset) {
+    using namespace XmlTokenizer;
+    stream.clear();
+    stream.seekg(offset);
+    // The spectrum header is small, there is no need to read a large block.
+    Tokenizer tokenizer(stream, 4096);
+    std::optional<double> retention_time;
+    size_t ms_level = 0;
+    while (auto tag = tokenizer.next_tag()) {
+        if ((tag.value().name == "spectrum" && tag.value().closed) ||
+            tag.value().name == "binaryDataArrayList") {
+            break;
+        }
+        if (tag.value().name == "cvParam") {
+            auto accession = Accession::from_string(
+                attribute(tag.value(), "accession").value_or(""));
+            auto value = attribute(tag.value(), "value").value_or("");
+            if (accession == Accession::MS1_SPECTRUM) {
+                ms_level = 1;
             }
-            if (next_tag.value().name == "scan" && !next_tag.value().closed) {
-                auto child_scan =
-                    parse_mzxml_scan(stream, next_tag, min_mz, max_mz, min_rt,
-                                     max_rt, polarity, ms_level);
-                child_scan.precursor_information.scan_number = precursor_id;
-                if (child_scan.precursor_information.scan_number !=
-                        precursor_id &&
-                    child_scan.precursor_information.scan_number == 0) {
-                    child_scan.precursor_information.scan_number = precursor_id;
+            if (accession == Accession::MS_LEVEL) {
+                ms_level = to_int(value);
+            }
+            if (accession == Accession::SCAN_START_TIME) {
+                retention_time = to_double(value);
+                if (attribute(tag.value(), "unitAccession") == "UO:0000031") {
+                    retention_time.value() *= 60.0;
                 }
-                return child_scan;
             }
-            next_tag = XmlReader::read_tag(stream);
+        }
+        if (retention_time && ms_level != 0) {
+            break;
+        }
+    }
+    if (!retention_time) {
+        return std::nullopt;
+    }
+    return std::pair<double, size_t>(retention_time.value(), ms_level);
+}
+
+void XmlReader::seek_mzml_spectrum(std::istream &stream,
+                                   const SpectrumIndex &index, double min_rt) {
+    // Binary search for the first spectrum with retention_time >= min_rt.
+    size_t first = 0;
+    size_t last = index.offsets.size();
+    while (first < last) {
+        size_t middle = first + (last - first) / 2;
+        auto header = peek_mzml_spectrum(stream, index.offsets[middle]);
+        if (!header) {
+            // Can't rely on the index, fallback to a sequential read.
+            first = 0;
+            break;
+        }
+        if (header.value().first < min_rt) {
+            first = middle + 1;
+        } else {
+            last = middle;
         }
     }
 
-    return {};
+    // The precursor of MSn spectra without spectrumRef is assumed to be the
+    // previous MS1 spectrum, so we start reading from there.
+    while (first > 0 && first < index.offsets.size()) {
+        auto header = peek_mzml_spectrum(stream, index.offsets[first]);
+        if (header && header.value().second == 1) {
+            break;
+        }
+        --first;
+    }
+
+    stream.clear();
+    if (first < index.offsets.size()) {
+        stream.seekg(index.offsets[first]);
+    } else {
+        // No spectra in the given range, skip to the end of the spectrumList.
+        stream.seekg(index.offsets.empty() ? 0 : index.offsets.back());
+    }
 }
 
-std::optional<RawData::RawData> XmlReader::read_mzxml(
-    std::istream &stream, double min_mz, double max_mz, double min_rt,
-    double max_rt, Instrument::Type instrument_type, double resolution_ms1,
+std::optional<RawData::RawData> XmlReader::_read_mzml_indexed(
+    std::istream &stream, const SpectrumIndex &index, double min_mz,
+    double max_mz, double min_rt, double max_rt,
+    Instrument::Type instrument_type, double resolution_ms1,
     double resolution_msn, double reference_mz, Polarity::Type polarity,
-    size_t ms_level) {
-    RawData::RawData raw_data = {};
-    raw_data.instrument_type = instrument_type;
-    raw_data.min_mz = std::numeric_limits<double>::infinity();
-    raw_data.max_mz = -std::numeric_limits<double>::infinity();
-    raw_data.min_rt = std::numeric_limits<double>::infinity();
-    raw_data.max_rt = -std::numeric_limits<double>::infinity();
-    raw_data.resolution_ms1 = resolution_ms1;
-    raw_data.resolution_msn = resolution_msn;
-    raw_data.reference_mz = reference_mz;
-    raw_data.fwhm_rt = 0;  // TODO(alex): Should this be passed as well?
-    raw_data.scans = {};
-    raw_data.retention_times = {};
-    raw_data.centroid = false;
-    // TODO(alex): Can we automatically detect the instrument type and set
-    // resolution from the header?
-    while (stream.good() && !stream.eof()) {
-        auto tag = XmlReader::read_tag(stream);
-        if (!tag) {
-            continue;
-        }
-        auto atts = tag.value().attributes;
+    size_t ms_level, size_t max_threads) {
+    seek_mzml_spectrum(stream, index, min_rt);
+    return _read_mzml(stream, min_mz, max_mz, min_rt, max_rt, instrument_type,
+                      resolution_ms1, resolution_msn, reference_mz, polarity,
+                      ms_level, max_threads);
+}
+
+// Append the metadata of a scan read without decoding its peaks. The mz range
+// of the RawData is estimated from the mz range reported for each scan.
+void append_scan_metadata(RawData::RawData &raw_data,
+                          std::vector<uint64_t> &offsets,
+                          ParsedScan &parsed_scan, uint64_t start_offset,
+                          double min_mz, double max_mz) {
+    auto &scan = parsed_scan.scan;
+    if (scan.num_points == 0) {
+        return;
+    }
+    if (scan.retention_time < raw_data.min_rt) {
+        raw_data.min_rt = scan.retention_time;
+    }
+    if (scan.retention_time > raw_data.max_rt) {
+        raw_data.max_rt = scan.retention_time;
+    }
+    if (parsed_scan.lowest_mz) {
+        raw_data.min_mz = std::min(
+            raw_data.min_mz, std::max(parsed_scan.lowest_mz.value(), min_mz));
+    }
+    if (parsed_scan.highest_mz) {
+        raw_data.max_mz = std::max(
+            raw_data.max_mz, std::min(parsed_scan.highest_mz.value(), max_mz));
+    }
+    if (scan.centroid) {
+        raw_data.centroid = true;
+    }
+    offsets.push_back(start_offset + parsed_scan.offset);
+    raw_data.retention_times.push_back(scan.retention_time);
+    raw_data.scans.push_back(std::move(scan));
+}
+
+// If the file doesn't report the mz range of the scans, use the mz range of the
+// filter instead.
+void finish_raw_data_metadata(RawData::RawData &raw_data, double min_mz,
+                              double max_mz) {
+    if (raw_data.scans.empty()) {
+        return;
+    }
+    if (raw_data.min_mz == std::numeric_limits<double>::infinity()) {
+        raw_data.min_mz = min_mz;
+    }
+    if (raw_data.max_mz == -std::numeric_limits<double>::infinity()) {
+        raw_data.max_mz = max_mz;
+    }
+}
 
+XmlReader::LazyRawData XmlReader::read_mzxml_lazy(
+    std::unique_ptr<std::istream> stream, double min_mz, double max_mz,
+    double min_rt, double max_rt, Instrument::Type instrument_type,
+    double resolution_ms1, double resolution_msn, double reference_mz,
+    Polarity::Type polarity, size_t ms_level, size_t max_cache_bytes) {
+    auto raw_data = empty_raw_data(instrument_type, resolution_ms1,
+                                   resolution_msn, reference_mz);
+    std::vector<uint64_t> offsets;
+    uint64_t start_offset = stream->tellg();
+    XmlTokenizer::Tokenizer tokenizer(*stream);
+    std::vector<ParsedScan> scans;
+    while (auto tag = tokenizer.next_tag()) {
         if (tag.value().name == "msRun" && tag.value().closed) {
             break;
         }
         if (tag.value().name == "scan" && !tag.value().closed) {
-            auto scan = parse_mzxml_scan(stream, tag, min_mz, max_mz, min_rt,
-                                         max_rt, polarity, ms_level);
-            if (scan.num_points != 0) {
-                raw_data.scans.push_back(scan);
-                raw_data.retention_times.push_back(scan.retention_time);
-                if (scan.retention_time < raw_data.min_rt) {
-                    raw_data.min_rt = scan.retention_time;
-                }
-                if (scan.retention_time > raw_data.max_rt) {
-                    raw_data.max_rt = scan.retention_time;
-                }
-                if (scan.mz[0] < raw_data.min_mz) {
-                    raw_data.min_mz = scan.mz[0];
-                }
-                if (scan.mz[scan.mz.size() - 1] > raw_data.max_mz) {
-                    raw_data.max_mz = scan.mz[scan.mz.size() - 1];
-                }
-                if (scan.centroid) {
-                    raw_data.centroid = true;
-                }
+            scans.clear();
+            parse_mzxml_scan(tokenizer, tag.value(), min_mz, max_mz, min_rt,
+                             max_rt, polarity, {ms_level}, 0, scans, false);
+            for (auto &parsed_scan : scans) {
+                append_scan_metadata(raw_data, offsets, parsed_scan,
+                                     start_offset, min_mz, max_mz);
             }
         }
     }
-    return raw_data;
+    finish_raw_data_metadata(raw_data, min_mz, max_mz);
+    return LazyRawData(std::move(stream), true, min_mz, max_mz,
+                       std::move(raw_data), std::move(offsets),
+                       max_cache_bytes);
 }
 
-std::optional<RawData::RawData> XmlReader::_read_mzml(
-    std::istream &stream, double min_mz, double max_mz, double min_rt,
-    double max_rt, Instrument::Type instrument_type, double resolution_ms1,
-    double resolution_msn, double reference_mz, Polarity::Type polarity,
-    size_t ms_level) {
-    RawData::RawData raw_data = {};
-    raw_data.instrument_type = instrument_type;
-    raw_data.min_mz = std::numeric_limits<double>::infinity();
-    raw_data.max_mz = -std::numeric_limits<double>::infinity();
-    raw_data.min_rt = std::numeric_limits<double>::infinity();
-    raw_data.max_rt = -std::numeric_limits<double>::infinity();
-    raw_data.resolution_ms1 = resolution_ms1;
-    raw_data.resolution_msn = resolution_msn;
-    raw_data.reference_mz = reference_mz;
-    raw_data.fwhm_rt = 0;  // TODO(alex): Should this be passed as well?
-    raw_data.scans = {};
-    raw_data.retention_times = {};
-    raw_data.centroid = false;
+XmlReader::LazyRawData XmlReader::_read_mzml_lazy(
+    std::unique_ptr<std::istream> stream, double min_mz, double max_mz,
+    double min_rt, double max_rt, Instrument::Type instrument_type,
+    double resolution_ms1, double resolution_msn, double reference_mz,
+    Polarity::Type polarity, size_t ms_level, size_t max_cache_bytes) {
+    auto raw_data = empty_raw_data(instrument_type, resolution_ms1,
+                                   resolution_msn, reference_mz);
+    std::vector<uint64_t> offsets;
+    uint64_t start_offset = stream->tellg();
+    XmlTokenizer::Tokenizer tokenizer(*stream);
     long previousMS1_scan_number{0};
-    log_itg("reset");
-    // TODO(alex): Can we automatically detect the instrument type and set
-    // resolution from the header?
-    while (stream.good() && !stream.eof()) {
-        auto tag = XmlReader::read_tag(stream);
-            if (!tag) {
-            continue;
-        }
+    while (auto tag = tokenizer.next_tag()) {
         if (tag.value().name == "spectrumList" && tag.value().closed) {
             break;
         }
-        RawData::Scan scan = {};
         if (tag.value().name == "spectrum" && !tag.value().closed) {
-            // Parse the contents and metadata of this spectrum.
-            scan.precursor_information.scan_number = 0;
-            auto scan_attributes = tag.value().attributes;
-
-            // NOTE: In the mzML spec, the native scan number is described on
-            // the "id" attribute, and can contain more information than
-            // required for just an integer identifer. Moreover, it looks like,
-            // at least for Orbitrap data, the scan numbers are non-zero
-            // consecutive integers. For the sake of time, I'm just assuming
-            // here that this assumption is the same for all formats, but should
-            // probably find a more robust way of doing this.
-            scan.scan_number = std::stoi(scan_attributes["index"]) + 1;
-            std::vector<bool> filter_points;
-            std::vector<double> mzs;
-            std::vector<double> intensities;
-            while (stream.good() && !stream.eof()) {
-                auto tag = XmlReader::read_tag(stream);
-                if (!tag) {
-                    break;
-                }
-                if (tag.value().name == "spectrum" && tag.value().closed) {
-                    break;
-                }
-
-                if (tag.value().name == "cvParam") {
-                    auto cv_attributes = tag.value().attributes;
-                    auto accession = cv_attributes["accession"];
-
-                    // This scan is ms_level 1
-                    if (accession == "MS:1000579") {
-                        scan.ms_level = 1;
-                        previousMS1_scan_number = scan.scan_number;
-                    }
-
-                    // MS level a multi-level MSn experiment.
-                    if (accession == "MS:1000511") {
-                        size_t scan_ms_level =
-                            std::stoi(cv_attributes["value"]);
-                        scan.ms_level = scan_ms_level;
-                        if (scan.ms_level == 1) {
-                            previousMS1_scan_number = scan.scan_number;
-                        }
-                    }
-
-                    // Polarity.
-                    if (accession == "MS:1000130") {
-                        if (polarity != Polarity::BOTH &&
-                            Polarity::POSITIVE != polarity) {
-                            continue;
-                        }
-                        scan.polarity = Polarity::POSITIVE;
-                    }
-                    if (accession == "MS:1000129") {
-                        if (polarity != Polarity::BOTH &&
-                            Polarity::NEGATIVE != polarity) {
-                            continue;
-                        }
-                        scan.polarity = Polarity::NEGATIVE;
-                    }
+            auto parsed_scan = parse_mzml_spectrum(
+                tokenizer, tag.value(), min_mz, max_mz, min_rt, max_rt,
+                polarity, {ms_level}, false);
+            auto &scan = parsed_scan.scan;
+            if (scan.ms_level == 1) {
+                previousMS1_scan_number = scan.scan_number;
+            }
+            if (scan.retention_time > max_rt) {
+                break;
+            }
+            if (parsed_scan.previous_ms1_precursor) {
+                scan.precursor_information.scan_number =
+                    previousMS1_scan_number;
+            }
+            append_scan_metadata(raw_data, offsets, parsed_scan, start_offset,
+                                 min_mz, max_mz);
+        }
+    }
+    finish_raw_data_metadata(raw_data, min_mz, max_mz);
+    return LazyRawData(std::move(stream), false, min_mz, max_mz,
+                       std::move(raw_data), std::move(offsets),
+                       max_cache_bytes);
+}
 
-                    // Retention time.
-                    if (accession == "MS:1000016") {
-                        scan.retention_time = std::stod(cv_attributes["value"]);
-                        // Retention time is store in seconds. Make sure it is
-                        // the right unit. If the unit accession was
-                        // "UO:0000010" it would be in seconds, so no action is
-                        // required.
-                        if (cv_attributes["unitAccession"] == "UO:0000031") {
-                            scan.retention_time *= 60.0;
-                        }
-                        if (scan.retention_time < min_rt ||
-                            scan.retention_time > max_rt) {
-                            scan = {};
-                            break;
-                        }
-                    }
+XmlReader::LazyRawData::LazyRawData(std::unique_ptr<std::istream> stream,
+                                    bool mzxml, double min_mz, double max_mz,
+                                    RawData::RawData &&raw_data,
+                                    std::vector<uint64_t> &&offsets,
+                                    size_t max_cache_bytes)
+    : stream(std::move(stream)),
+      mzxml(mzxml),
+      min_mz(min_mz),
+      max_mz(max_mz),
+      raw_data(std::move(raw_data)),
+      offsets(std::move(offsets)),
+      max_cache_bytes(max_cache_bytes),
+      cache_bytes(0),
+      mutex(std::make_unique<std::mutex>()) {}
+
+RawData::RawData &XmlReader::LazyRawData::metadata() { return raw_data; }
+
+const RawData::RawData &XmlReader::LazyRawData::metadata() const {
+    return raw_data;
+}
 
-                    //Detect centroid based on MS:1000127 in the spectrum header
-                    // if then is a change from centroid to profile then a flag should be raised. This is not yet implemented.
-                    if (accession == "MS:1000127") {
-                        raw_data.centroid = true;
-                    }
-                }
+size_t XmlReader::LazyRawData::size() const { return raw_data.scans.size(); }
+
+std::optional<RawData::Scan> XmlReader::LazyRawData::decode_scan(size_t i) {
+    const auto &metadata_scan = raw_data.scans[i];
+    stream->clear();
+    stream->seekg(offsets[i]);
+    // Scans are usually much smaller than the blocks used for reading the
+    // whole file.
+    XmlTokenizer::Tokenizer tokenizer(*stream, 1 << 16);
+    auto tag = tokenizer.next_tag();
+    if (!tag || tag.value().closed) {
+        return std::nullopt;
+    }
 
-                if (tag.value().name == "precursor") {
-                    if (tag.value().attributes.size()!=0){
-                        auto precursor_attributes = tag.value().attributes;
-                        std::string spectrumRef =
-                            precursor_attributes["spectrumRef"];
-                        // Find scan number.
-                        size_t scanIdx = spectrumRef.find("scan=") + 5;
-                        scan.precursor_information.scan_number =
-                            std::stoull(spectrumRef.substr(scanIdx));
-                    } else {
-                        scan.precursor_information.scan_number = previousMS1_scan_number;
-                    }
+    // The scan was already selected when reading the metadata, only the mz
+    // range filter is applied to the peaks.
+    double inf = std::numeric_limits<double>::infinity();
+    std::optional<ParsedScan> parsed_scan;
+    if (mzxml && tag.value().name == "scan") {
+        // Child scans nested inside of this scan are parsed as well.
+        std::vector<ParsedScan> scans;
+        parse_mzxml_scan(tokenizer, tag.value(), min_mz, max_mz, -inf, inf,
+                         Polarity::BOTH, {metadata_scan.ms_level}, 0, scans);
+        for (auto &scan : scans) {
+            if (scan.scan.scan_number == metadata_scan.scan_number) {
+                parsed_scan = std::move(scan);
+                break;
+            }
+        }
+    } else if (!mzxml && tag.value().name == "spectrum") {
+        parsed_scan = parse_mzml_spectrum(tokenizer, tag.value(), min_mz,
+                                          max_mz, -inf, inf, Polarity::BOTH,
+                                          {metadata_scan.ms_level});
+        if (parsed_scan.value().decoding_error) {
+            return std::nullopt;
+        }
+    }
+    if (!parsed_scan) {
+        return std::nullopt;
+    }
 
-                    scan.precursor_information.charge = 0;
-                    scan.precursor_information.mz = 0.0;
-                    scan.precursor_information.window_wideness = 0.0;
-                    scan.precursor_information.intensity = 0.0;
-                    scan.precursor_information.activation_method =
-                        ActivationMethod::UNKNOWN;
-                    while (stream.good() && !stream.eof()) {
-                        auto tag = XmlReader::read_tag(stream);
-                        if (!tag) {
-                            break;
-                        }
-                        if (tag.value().name == "precursor" &&
-                            tag.value().closed) {
-                            break;
-                        }
-                        if (tag.value().name == "cvParam") {
-                            auto cv_attributes = tag.value().attributes;
-                            auto accession = cv_attributes["accession"];
-                            // Isolation window.
-                            if (accession == "MS:1000827") {
-                                scan.precursor_information.mz =
-                                    std::stod(cv_attributes["value"]);
-                            }
-                            if (accession == "MS:1000828") {
-                                scan.precursor_information.window_wideness +=
-                                    std::stod(cv_attributes["value"]);
-                            }
-                            if (accession == "MS:1000829") {
-                                scan.precursor_information.window_wideness +=
-                                    std::stod(cv_attributes["value"]);
-                            }
-                            // Charge state.
-                            if (accession == "MS:1000041") {
-                                scan.precursor_information.charge =
-                                    std::stoi(cv_attributes["value"]);
-                            }
-                            if (accession == "MS:1000042") {
-                                scan.precursor_information.intensity =
-                                    std::stod(cv_attributes["value"]);
-                            }
-                            // Activation method.
-                            if (accession == "MS:1000422") {
-                                scan.precursor_information.activation_method =
-                                    ActivationMethod::HCD;
-                            }
-                        }
-                    }
-                }
+    auto scan = metadata_scan;
+    auto &decoded_scan = parsed_scan.value().scan;
+    scan.mz = std::move(decoded_scan.mz);
+    scan.intensity = std::move(decoded_scan.intensity);
+    scan.num_points = decoded_scan.num_points;
+    scan.max_intensity = decoded_scan.max_intensity;
+    scan.total_intensity = decoded_scan.total_intensity;
+    return scan;
+}
 
-                if (tag.value().name == "binaryDataArray") {
-                    // precision can be: 64 or 32 (bits).
-                    int precision = 0;
-                    // Uncompressed: false, Zlib compression: true.
-                    bool compressed = false;
-                    // mz: 0, intensity: 1
-                    int type = -1;
-                    std::optional<std::string> data;
-                    while (stream.good() && !stream.eof()) {
-                        auto tag = XmlReader::read_tag(stream);
-                        if (!tag) {
-                            break;
-                        }
-                        if (tag.value().name == "binaryDataArray" &&
-                            tag.value().closed) {
-                            break;
-                        }
-                        if (tag.value().name == "cvParam") {
-                            auto cv_attributes = tag.value().attributes;
-                            auto accession = cv_attributes["accession"];
-                            // Precision.
-                            if (accession == "MS:1000523") {
-                                precision = 64;
-                            }
-                            if (accession == "MS:1000521") {
-                                precision = 32;
-                            }
-                            // Compression.
-                            if (accession == "MS:1000574") {
-                                compressed = true;
-                            }
-                            // Type of vector.
-                            if (accession == "MS:1000514") {
-                                type = 0;
-                            }
-                            if (accession == "MS:1000515") {
-                                type = 1;
-                            }
-                        }
-                        if (tag.value().name == "binary" &&
-                            !tag.value().closed) {
-                            data = XmlReader::read_data(stream);
-                        }
-                    }
-                    if (data) {
-                        // decode data.
-                        std::vector<uint8_t> binary_data;
-                        Base64::decode_base64(data.value(), binary_data);
-                        if (compressed) {
-                            std::vector<uint8_t> decompressed_data;
-
-                            // Decompress data, set decompressed length to 0
-                            // (unknown).
-                            int status = Compression::inflate(
-                                binary_data, decompressed_data, 0);
-
-                            // Check status after decompression.
-                            if (status != Z_OK) {
-                                return raw_data;
-                            }
-
-                            binary_data = decompressed_data;
-                        }
+std::optional<RawData::Scan> XmlReader::LazyRawData::scan(size_t i) {
+    if (i >= raw_data.scans.size()) {
+        return std::nullopt;
+    }
+    std::lock_guard<std::mutex> lock(*mutex);
+    auto cached = cache_index.find(i);
+    if (cached != cache_index.end()) {
+        cache.splice(cache.begin(), cache, cached->second);
+        return cached->second->second;
+    }
 
-                        size_t num_points =
-                            binary_data.size() / (precision / 8);
+    auto scan = decode_scan(i);
+    if (!scan) {
+        return std::nullopt;
+    }
+    cache.emplace_front(i, scan.value());
+    cache_index[i] = cache.begin();
+    cache_bytes += (scan.value().mz.size() + scan.value().intensity.size()) *
+                   sizeof(double);
+    while (cache_bytes > max_cache_bytes && cache.size() > 1) {
+        const auto &evicted = cache.back();
+        cache_bytes -= (evicted.second.mz.size() +
+                        evicted.second.intensity.size()) *
+                       sizeof(double);
+        cache_index.erase(evicted.first);
+        cache.pop_back();
+    }
+    return scan;
+}
 
-                        if (type == 0) {  // mz
-                            mzs = std::vector<double>(num_points);
-                        }
-                        if (type == 1) {  // intensity
-                            intensities = std::vector<double>(num_points);
-                        }
-                        if (filter_points.empty()) {
-                            filter_points =
-                                std::vector<bool>(num_points, false);
-                        }
+std::optional<RawData::RawData> XmlReader::LazyRawData::load() {
+    // The scans with no points left after filtering are removed, and the mz
+    // range is calculated from the decoded peaks, as in read_mzxml/_read_mzml.
+    RawData::RawData output = raw_data;
+    output.min_mz = std::numeric_limits<double>::infinity();
+    output.max_mz = -std::numeric_limits<double>::infinity();
+    output.min_rt = std::numeric_limits<double>::infinity();
+    output.max_rt = -std::numeric_limits<double>::infinity();
+    output.centroid = false;
+    output.scans.clear();
+    output.retention_times.clear();
+    std::lock_guard<std::mutex> lock(*mutex);
+    for (size_t i = 0; i < raw_data.scans.size(); ++i) {
+        std::optional<RawData::Scan> scan;
+        auto cached = cache_index.find(i);
+        if (cached != cache_index.end()) {
+            scan = cached->second->second;
+        } else {
+            scan = decode_scan(i);
+        }
+        if (!scan) {
+            return std::nullopt;
+        }
+        if (scan.value().num_points == 0) {
+            continue;
+        }
+        append_scan(output, std::move(scan.value()));
+    }
+    return output;
+}
 
-                        // offset for interpretation.
-                        size_t offset = 0;
-                        for (size_t i = 0; i < num_points; ++i) {
-                            double value = 0;
-                            if (precision == 32) {
-                                value = Base64::interpret_float(binary_data,
-                                                                offset, true);
-                                offset += 4;
-                            } else if (precision == 64) {
-                                value = Base64::interpret_double(binary_data,
-                                                                 offset, true);
-                                offset += 8;
-                            }
-                            if (type == 0) {  // mz
-                                mzs[i] = value;
-                                if (value < min_mz || value > max_mz) {
-                                    filter_points[i] = true;
-                                }
-                            }
-                            if (type == 1) {  // intensity
-                                intensities[i] = value;
-                                if (value == 0.0) {
-                                    filter_points[i] = true;
-                                }
-                            }
-                        }
-                    }
-                }
-            }
+XmlReader::ScanReader::ScanReader(std::unique_ptr<std::istream> stream,
+                                  bool mzxml, double min_mz, double max_mz,
+                                  double min_rt, double max_rt,
+                                  Polarity::Type polarity, size_t ms_level)
+    : stream(std::move(stream)),
+      mzxml(mzxml),
+      min_mz(min_mz),
+      max_mz(max_mz),
+      min_rt(min_rt),
+      max_rt(max_rt),
+      polarity(polarity),
+      ms_level(ms_level),
+      previous_ms1_scan_number(0),
+      done(false) {
+    tokenizer = std::make_unique<XmlTokenizer::Tokenizer>(*this->stream);
+}
 
-            // Filter mzs not in range and intensity == 0 scans and calculate
-            // max_intensity and total_intensity.
-            double intensity_sum = 0;
-            double max_intensity = 0;
-            for (size_t i = 0; i < filter_points.size(); ++i) {
-                if (filter_points[i]) {
-                    continue;
-                }
-                scan.mz.push_back(mzs[i]);
-                scan.intensity.push_back(intensities[i]);
-                if (intensities[i] > max_intensity) {
-                    max_intensity = intensities[i];
+void XmlReader::ScanReader::read_element() {
+    auto tag = tokenizer->next_tag();
+    if (!tag) {
+        done = true;
+        return;
+    }
+    if (mzxml) {
+        if (tag.value().name == "msRun" && tag.value().closed) {
+            done = true;
+        }
+        if (tag.value().name == "scan" && !tag.value().closed) {
+            std::vector<ParsedScan> scans;
+            parse_mzxml_scan(*tokenizer, tag.value(), min_mz, max_mz, min_rt,
+                             max_rt, polarity, {ms_level}, 0, scans);
+            for (auto &parsed_scan : scans) {
+                if (parsed_scan.scan.num_points != 0) {
+                    pending.push_back(std::move(parsed_scan.scan));
                 }
-                intensity_sum += intensities[i];
-            }
-            scan.num_points = scan.mz.size();
-            scan.max_intensity = max_intensity;
-            scan.total_intensity = intensity_sum;
-
-            // TODO: Assert that mz.size() == intenstiy.size()
-            if (scan.ms_level == 0 || scan.ms_level != ms_level) {
-                scan = {};
             }
         }
+        return;
+    }
 
-        // Update RawData.
+    if (tag.value().name == "spectrumList" && tag.value().closed) {
+        done = true;
+    }
+    if (tag.value().name == "spectrum" && !tag.value().closed) {
+        // Spectra are stored in increasing retention time order, as in
+        // _read_mzml we can stop reading once we are past max_rt.
+        auto parsed_scan =
+            parse_mzml_spectrum(*tokenizer, tag.value(), min_mz, max_mz,
+                                min_rt, max_rt, polarity, {ms_level});
+        auto &scan = parsed_scan.scan;
+        if (parsed_scan.decoding_error) {
+            done = true;
+            return;
+        }
+        if (scan.ms_level == 1) {
+            previous_ms1_scan_number = scan.scan_number;
+        }
+        if (scan.retention_time > max_rt) {
+            done = true;
+            return;
+        }
+        if (parsed_scan.previous_ms1_precursor) {
+            scan.precursor_information.scan_number = previous_ms1_scan_number;
+        }
         if (scan.num_points != 0) {
-            std::string log_msg = std::string("Number of points: ") +
-                std::to_string(scan.num_points) + " Scan number: " +
-                std::to_string(scan.scan_number) + " RT: " +
-                std::to_string(scan.retention_time);
-            log_itg(log_msg);
-            if (scan.retention_time < min_rt) {
-                continue;
-            }
-            if (scan.retention_time > max_rt) {
-                break;
-            }
-            raw_data.scans.push_back(scan);
-            raw_data.retention_times.push_back(scan.retention_time);
-            if (scan.retention_time < raw_data.min_rt) {
-                raw_data.min_rt = scan.retention_time;
-            }
-            if (scan.retention_time > raw_data.max_rt) {
-                raw_data.max_rt = scan.retention_time;
-            }
-            if (scan.mz[0] < raw_data.min_mz) {
-                raw_data.min_mz = scan.mz[0];
-            }
-            if (scan.mz[scan.mz.size() - 1] > raw_data.max_mz) {
-                raw_data.max_mz = scan.mz[scan.mz.size() - 1];
-            }
+            pending.push_back(std::move(scan));
         }
     }
+}
 
-    return raw_data;
+std::optional<RawData::Scan> XmlReader::ScanReader::next() {
+    while (pending.empty() && !done) {
+        read_element();
+    }
+    if (pending.empty()) {
+        return std::nullopt;
+    }
+    auto scan = std::move(pending.front());
+    pending.pop_front();
+    return scan;
+}
+
+std::vector<RawData::Scan> XmlReader::ScanReader::next_batch(
+    size_t max_scans) {
+    std::vector<RawData::Scan> scans;
+    while (scans.size() < max_scans) {
+        auto scan = next();
+        if (!scan) {
+            break;
+        }
+        scans.push_back(std::move(scan.value()));
+    }
+    return scans;
 }
 
 std::optional<std::string> XmlReader::read_data(std::istream &stream) {
@@ -783,8 +1731,7 @@ std::optional<XmlReader::Tag> XmlReader::read_tag(std::istream &stream) {
     // Store the tag contents in a buffer for further processing.
     std::string buffer;
 
-    while (stream.good() && !stream.eof() && stream.get() != '<')
-        ;
+    stream.ignore(std::numeric_limits<std::streamsize>::max(), '<');
     std::getline(stream, buffer, '>');
 
     if (buffer.empty()) {
@@ -885,168 +1832,144 @@ std::optional<XmlReader::Tag> XmlReader::read_tag(std::istream &stream) {
     return tag;
 }
 
+// Parses the attributes of a <Modification> or <SubstitutionModification> tag.
+IdentData::PeptideModification parse_peptide_modification(
+    const XmlTokenizer::Tag &tag) {
+    using namespace XmlTokenizer;
+    auto modification = IdentData::PeptideModification{};
+    if (auto mass_delta = attribute(tag, "monoisotopicMassDelta")) {
+        modification.monoisotopic_mass_delta = to_double(mass_delta.value());
+    }
+    if (auto mass_delta = attribute(tag, "avgMassDelta")) {
+        modification.average_mass_delta = to_double(mass_delta.value());
+    }
+    if (auto residues = attribute(tag, "residues")) {
+        modification.residues = residues.value();
+    }
+    if (auto location = attribute(tag, "location")) {
+        modification.location = static_cast<int>(to_int(location.value()));
+    } else {
+        modification.location = -1;
+    }
+    return modification;
+}
+
 IdentData::IdentData XmlReader::read_mzidentml(std::istream &stream,
                                                bool ignore_decoy,
                                                bool require_threshold,
                                                bool max_rank_only,
                                                double min_mz, double max_mz,
                                                double min_rt, double max_rt) {
+    using namespace XmlTokenizer;
     IdentData::IdentData ident_data = {};
+    Tokenizer tokenizer(stream);
+    // The views of the tags are only valid until the next tag is read.
+    auto attribute_string = [](const XmlTokenizer::Tag &tag,
+                               std::string_view name) {
+        return std::string(attribute(tag, name).value_or(""));
+    };
 
     // Find the DBSequences, Peptides and PeptideEvidence in the
     // SequenceCollection tag.
-    while (stream.good() && !stream.eof()) {
-        auto tag = XmlReader::read_tag(stream);
-        if (!tag) {
-            continue;
-        }
+    while (auto tag = tokenizer.next_tag()) {
         if (tag.value().name == "SequenceCollection" && tag.value().closed) {
             break;
         }
         if (tag.value().name == "DBSequence") {
-            auto attributes = tag.value().attributes;
-            if (attributes.empty()) {
+            if (tag.value().attributes.empty()) {
                 continue;
             }
             IdentData::DBSequence db_sequence = {};
-            db_sequence.id = attributes["id"];
-            db_sequence.accession = attributes["accession"];
-            db_sequence.db_reference = attributes["searchDatabase_ref"];
+            db_sequence.id = attribute_string(tag.value(), "id");
+            db_sequence.accession = attribute_string(tag.value(), "accession");
+            db_sequence.db_reference =
+                attribute_string(tag.value(), "searchDatabase_ref");
             if (!tag.value().closed) {
                 // Check if the DBSequence contains the protein description as a
                 // cvParam tag.
-                while (stream.good() && !stream.eof()) {
-                    auto tag = XmlReader::read_tag(stream);
-                    if (!tag) {
-                        continue;
-                    }
+                while (auto tag = tokenizer.next_tag()) {
                     if (tag.value().name == "DBSequence" &&
                         tag.value().closed) {
                         break;
                     }
-                    auto attributes = tag.value().attributes;
                     if (tag.value().name == "cvParam" &&
-                        attributes["accession"] == "MS:1001088") {
-                        db_sequence.description = attributes["value"];
+                        Accession::from_string(
+                            attribute(tag.value(), "accession").value_or("")) ==
+                            Accession::PROTEIN_DESCRIPTION) {
+                        db_sequence.description =
+                            attribute_string(tag.value(), "value");
                     }
                 }
             }
-            ident_data.db_sequences.push_back(db_sequence);
+            ident_data.db_sequences.push_back(std::move(db_sequence));
         } else if (tag.value().name == "Peptide") {
             IdentData::Peptide peptide = {};
-            auto attributes = tag.value().attributes;
-            peptide.id = attributes["id"];
+            peptide.id = attribute_string(tag.value(), "id");
             // Find peptide sequence and modifications.
-            while (stream.good() && !stream.eof()) {
-                auto tag = XmlReader::read_tag(stream);
-                if (!tag) {
-                    continue;
-                }
+            while (auto tag = tokenizer.next_tag()) {
                 if (tag.value().name == "Peptide" && tag.value().closed) {
                     break;
                 }
                 if (tag.value().name == "PeptideSequence" &&
                     !tag.value().closed) {
-                    auto data = XmlReader::read_data(stream);
+                    auto data = tokenizer.read_data();
                     if (!data) {
                         return {};
-                        break;
                     }
                     peptide.sequence = data.value();
                 }
                 // Search peptide modifications.
                 if (tag.value().name == "Modification" && !tag.value().closed) {
                     // Save modification info.
-                    auto attributes = tag.value().attributes;
-                    auto modification = IdentData::PeptideModification{};
-                    if (attributes.find("monoisotopicMassDelta") !=
-                        attributes.end()) {
-                        modification.monoisotopic_mass_delta =
-                            std::stod(attributes["monoisotopicMassDelta"]);
-                    }
-                    if (attributes.find("avgMassDelta") != attributes.end()) {
-                        modification.average_mass_delta =
-                            std::stod(attributes["avgMassDelta"]);
-                    }
-                    if (attributes.find("residues") != attributes.end()) {
-                        modification.residues = attributes["residues"];
-                    }
-                    if (attributes.find("location") != attributes.end()) {
-                        modification.location =
-                            std::stoi(attributes["location"]);
-                    } else {
-                        modification.location = -1;
-                    }
+                    auto modification = parse_peptide_modification(tag.value());
                     // Find identification information for this modification.
-                    while (stream.good() && !stream.eof()) {
-                        auto tag = XmlReader::read_tag(stream);
-                        if (!tag) {
-                            continue;
-                        }
+                    while (auto tag = tokenizer.next_tag()) {
                         if (tag.value().name == "Modification" &&
                             tag.value().closed) {
                             peptide.modifications.push_back(modification);
                             break;
                         }
                         if (tag.value().name == "cvParam") {
-                            auto attributes = tag.value().attributes;
-                            modification.id.push_back(attributes["accession"] +
-                                                      "|" + attributes["name"]);
+                            modification.id.push_back(
+                                attribute_string(tag.value(), "accession") +
+                                "|" + attribute_string(tag.value(), "name"));
                         }
                     }
                     peptide.modifications.push_back(modification);
                 } else if (tag.value().name == "SubstitutionModification") {
                     // Save modification info.
-                    auto attributes = tag.value().attributes;
-                    auto modification = IdentData::PeptideModification{};
-                    if (attributes.find("monoisotopicMassDelta") !=
-                        attributes.end()) {
-                        modification.monoisotopic_mass_delta =
-                            std::stod(attributes["monoisotopicMassDelta"]);
-                    }
-                    if (attributes.find("avgMassDelta") != attributes.end()) {
-                        modification.average_mass_delta =
-                            std::stod(attributes["avgMassDelta"]);
-                    }
-                    if (attributes.find("residues") != attributes.end()) {
-                        modification.residues = attributes["residues"];
-                    }
-                    if (attributes.find("location") != attributes.end()) {
-                        modification.location =
-                            std::stoi(attributes["location"]);
-                    } else {
-                        modification.location = -1;
-                    }
+                    auto modification = parse_peptide_modification(tag.value());
                     modification.id.push_back(
-                        "SUBSTITUTION|" + attributes["originalResidue"] + "->" +
-                        attributes["replacementResidue"]);
+                        "SUBSTITUTION|" +
+                        attribute_string(tag.value(), "originalResidue") +
+                        "->" +
+                        attribute_string(tag.value(), "replacementResidue"));
                     peptide.modifications.push_back(modification);
                 }
             }
-            ident_data.peptides.push_back(peptide);
+            ident_data.peptides.push_back(std::move(peptide));
         } else if (tag.value().name == "PeptideEvidence") {
-            IdentData::PeptideEvidence peptide_evidence;
-            auto attributes = tag.value().attributes;
-            peptide_evidence.id = attributes["id"];
-            peptide_evidence.db_sequence_id = attributes["dBSequence_ref"];
-            peptide_evidence.peptide_id = attributes["peptide_ref"];
-            peptide_evidence.decoy = false;
-            if (attributes.find("isDecoy") != attributes.end()) {
-                peptide_evidence.decoy = attributes["isDecoy"] == "true";
-            }
-            if (ignore_decoy && peptide_evidence.decoy) {
+            // Decoys are discarded before copying any of the attributes.
+            bool decoy = attribute(tag.value(), "isDecoy") == "true";
+            if (ignore_decoy && decoy) {
                 continue;
             }
-            ident_data.peptide_evidence.push_back(peptide_evidence);
+            IdentData::PeptideEvidence peptide_evidence;
+            peptide_evidence.id = attribute_string(tag.value(), "id");
+            peptide_evidence.db_sequence_id =
+                attribute_string(tag.value(), "dBSequence_ref");
+            peptide_evidence.peptide_id =
+                attribute_string(tag.value(), "peptide_ref");
+            peptide_evidence.decoy = decoy;
+            ident_data.peptide_evidence.push_back(std::move(peptide_evidence));
         }
     }
 
-    // Find the PSMs for this data (SpectrumIdentificationResult).
-    while (stream.good() && !stream.eof()) {
-        auto tag = XmlReader::read_tag(stream);
-        if (!tag) {
-            continue;
-        }
+    // Find the PSMs for this data (SpectrumIdentificationResult). The filters
+    // are applied while reading each result, so that only the matches that
+    // can be selected are kept in memory.
+    std::vector<IdentData::SpectrumMatch> spectrum_matches;
+    while (auto tag = tokenizer.next_tag()) {
         if (tag.value().name == "SpectrumIdentificationList" &&
             tag.value().closed) {
             break;
@@ -1056,28 +1979,28 @@ IdentData::IdentData XmlReader::read_mzidentml(std::istream &stream,
             continue;
         }
 
-        // Record all SpectrumIdentificationItems for this result.
-        std::vector<IdentData::SpectrumMatch> spectrum_matches;
+        // Record the SpectrumIdentificationItems for this result. If only the
+        // maximum rank match is requested, only the best match so far is kept.
+        spectrum_matches.clear();
         double retention_time = 0.0;
-        while (stream.good() && !stream.eof()) {
-            tag = XmlReader::read_tag(stream);
-            if (!tag) {
-                continue;
-            }
+        while (auto tag = tokenizer.next_tag()) {
             if (tag.value().name == "SpectrumIdentificationResult" &&
                 tag.value().closed) {
                 break;
             }
-            auto attributes = tag.value().attributes;
 
             if (tag.value().name == "cvParam") {
                 // Retention time or scan start time.
-                if (attributes["accession"] == "MS:1000894" ||
-                    attributes["accession"] == "MS:1000016") {
-                    retention_time = std::stod(attributes["value"]);
+                auto accession = Accession::from_string(
+                    attribute(tag.value(), "accession").value_or(""));
+                if (accession == Accession::RETENTION_TIME ||
+                    accession == Accession::SCAN_START_TIME) {
+                    retention_time = to_double(
+                        attribute(tag.value(), "value").value_or(""));
                     // If the retention time is in minutes, we convert it back
                     // to seconds.
-                    if (attributes["unitAccession"] == "UO:0000031") {
+                    if (attribute(tag.value(), "unitAccession") ==
+                        "UO:0000031") {
                         retention_time *= 60.0;
                     }
                 }
@@ -1086,66 +2009,59 @@ IdentData::IdentData XmlReader::read_mzidentml(std::istream &stream,
             // Identification item.
             if (tag.value().name == "SpectrumIdentificationItem" &&
                 !tag.value().closed) {
-                IdentData::SpectrumMatch spectrum_match = {};
-                spectrum_match.id = attributes["id"];
-                spectrum_match.pass_threshold =
-                    attributes["passThreshold"] == "true";
-                if (require_threshold && !spectrum_match.pass_threshold) {
+                const auto &item_tag = tag.value();
+                bool pass_threshold =
+                    attribute(item_tag, "passThreshold") == "true";
+                if (require_threshold && !pass_threshold) {
                     continue;
                 }
-                spectrum_match.match_id = attributes["peptide_ref"];
-                spectrum_match.charge_state =
-                    std::stoi(attributes["chargeState"]);
-                spectrum_match.experimental_mz =
-                    std::stod(attributes["experimentalMassToCharge"]);
-                spectrum_match.retention_time = 0;
-                spectrum_match.rank = std::stoi(attributes["rank"]);
+                uint64_t rank =
+                    to_int(attribute(item_tag, "rank").value_or(""));
+                if (max_rank_only && !spectrum_matches.empty() &&
+                    rank >= spectrum_matches[0].rank) {
+                    continue;
+                }
+                IdentData::SpectrumMatch spectrum_match = {};
+                spectrum_match.pass_threshold = pass_threshold;
+                spectrum_match.charge_state = static_cast<int>(
+                    to_int(attribute(item_tag, "chargeState").value_or("")));
+                spectrum_match.experimental_mz = to_double(
+                    attribute(item_tag, "experimentalMassToCharge")
+                        .value_or(""));
+                spectrum_match.rank = rank;
                 // Might be optional according to the mzIdentML v1.2.0 spec.
-                if (attributes.find("calculatedMassToCharge") !=
-                    attributes.end()) {
+                if (auto theoretical_mz =
+                        attribute(item_tag, "calculatedMassToCharge")) {
                     spectrum_match.theoretical_mz =
-                        std::stod(attributes["calculatedMassToCharge"]);
+                        to_double(theoretical_mz.value());
                 } else {
                     spectrum_match.theoretical_mz = 0.0;
                 }
-
-                spectrum_matches.push_back(spectrum_match);
+                // The maximum rank match is selected before filtering by mz.
+                if (!max_rank_only &&
+                    (spectrum_match.experimental_mz < min_mz ||
+                     spectrum_match.experimental_mz > max_mz)) {
+                    continue;
+                }
+                spectrum_match.id = attribute_string(item_tag, "id");
+                spectrum_match.match_id =
+                    attribute_string(item_tag, "peptide_ref");
+                if (max_rank_only) {
+                    spectrum_matches.clear();
+                }
+                spectrum_matches.push_back(std::move(spectrum_match));
             }
         }
 
-        if (max_rank_only) {
-            if (spectrum_matches.empty()) {
-                continue;
-            }
-            IdentData::SpectrumMatch selected_spectrum = {};
-            // Update retention time on the provisional spectrum_matches list
-            // and find the maximum rank spectrum. The rank is in descending
-            // order of importance, thus rank 1 is the maximum, and bigger
-            // numbers are worse.
-            for (size_t i = 0; i < spectrum_matches.size(); ++i) {
-                auto &spectrum_match = spectrum_matches[i];
-                spectrum_match.retention_time = retention_time;
-                if (i == 0 || spectrum_match.rank < selected_spectrum.rank) {
-                    selected_spectrum = spectrum_match;
-                }
-            }
-            if (selected_spectrum.experimental_mz >= min_mz &&
-                selected_spectrum.experimental_mz <= max_mz &&
-                selected_spectrum.retention_time >= min_rt &&
-                selected_spectrum.retention_time <= max_rt) {
-                ident_data.spectrum_matches.push_back(selected_spectrum);
-            }
-        } else {
-            // Update retention time on the provisional spectrum_matches list
-            // and push each element to the list of PSM.
-            for (auto &spectrum_match : spectrum_matches) {
-                spectrum_match.retention_time = retention_time;
-                if (spectrum_match.experimental_mz >= min_mz &&
-                    spectrum_match.experimental_mz <= max_mz &&
-                    spectrum_match.retention_time >= min_rt &&
-                    spectrum_match.retention_time <= max_rt) {
-                    ident_data.spectrum_matches.push_back(spectrum_match);
-                }
+        if (retention_time < min_rt || retention_time > max_rt) {
+            continue;
+        }
+        for (auto &spectrum_match : spectrum_matches) {
+            spectrum_match.retention_time = retention_time;
+            if (spectrum_match.experimental_mz >= min_mz &&
+                spectrum_match.experimental_mz <= max_mz) {
+                ident_data.spectrum_matches.push_back(
+                    std::move(spectrum_match));
             }
         }
     }
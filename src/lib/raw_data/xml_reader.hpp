@@ -1,10 +1,18 @@
 #ifndef RAWDATA_XMLREADER_HPP
 #define RAWDATA_XMLREADER_HPP
 
+#include <deque>
+#include <istream>
+#include <list>
 #include <map>
+#include <memory>
+#include <mutex>
 #include <optional>
+#include <unordered_map>
+#include <vector>
 
 #include "raw_data/raw_data.hpp"
+#include "raw_data/xml_tokenizer.hpp"
 
 // XmlReader handles reading xml tags and the supported xml files. This is not
 // a generic module, it is tailored to read Grid::Point objects to use for
@@ -25,21 +33,216 @@ std::optional<Tag> read_tag(std::istream &stream);
 // necessary.
 std::optional<std::string> read_data(std::istream &stream);
 
+// Scans read from a raw data file can be split into multiple RawData outputs
+// in a single pass over the file.
+struct SplitParams {
+    // The MS levels to extract. Each MS level is stored in a separate output.
+    std::vector<size_t> ms_levels;
+    // Split the scans by their ionization polarity.
+    bool split_polarity;
+    // Split the scans by ion mobility. Only IonMobility::FAIMS is supported,
+    // in which case the scans are split by compensation voltage.
+    IonMobility::Type ion_mobility;
+};
+
+// One of the RawData outputs of a split read, alongside the values of the
+// properties that were used to select its scans. If the scans were not split
+// by polarity, this will be the polarity filter used for reading. Scans without
+// compensation voltage are stored with IonMobility::UNKNOWN.
+struct RawDataOutput {
+    uint64_t ms_level;
+    Polarity::Type polarity;
+    IonMobility::Type ion_mobility;
+    double compensation_voltage;
+    RawData::RawData raw_data;
+};
+
 // Read an entire mzxml file into the RawData::RawData data structure filtering
 // based on min/max mz/rt and polarity.
+//
+// If max_threads > 1, the scans are decoded in parallel by up to max_threads
+// worker threads, while the file is split into the raw scans to decode on the
+// calling thread. The scans are stored in the same order as in the file.
 std::optional<RawData::RawData> read_mzxml(
     std::istream &stream, double min_mz, double max_mz, double min_rt,
     double max_rt, Instrument::Type instrument_type, double resolution_ms1,
     double resolution_msn, double reference_mz, Polarity::Type polarity,
-    size_t ms_level);
+    size_t ms_level, size_t max_threads = 1);
 
 // Read an entire mzML file into the RawData::RawData data structure filtering
-// based on min/max mz/rt and polarity.
+// based on min/max mz/rt and polarity. The spectra are decoded in parallel as
+// in read_mzxml.
 std::optional<RawData::RawData> _read_mzml(
     std::istream &stream, double min_mz, double max_mz, double min_rt,
     double max_rt, Instrument::Type instrument_type, double resolution_ms1,
     double resolution_msn, double reference_mz, Polarity::Type polarity,
-    size_t ms_level);
+    size_t ms_level, size_t max_threads = 1);
+
+// Read an entire mzxml/mzML file in a single pass, splitting the scans into
+// multiple RawData outputs as configured in SplitParams. The outputs are sorted
+// by MS level, polarity and compensation voltage. When splitting only by MS
+// level, one output is returned for each of the requested MS levels, even if
+// no scans were found for it.
+std::vector<RawDataOutput> read_mzxml_multi(
+    std::istream &stream, double min_mz, double max_mz, double min_rt,
+    double max_rt, Instrument::Type instrument_type, double resolution_ms1,
+    double resolution_msn, double reference_mz, Polarity::Type polarity,
+    const SplitParams &split_params, size_t max_threads = 1);
+std::vector<RawDataOutput> _read_mzml_multi(
+    std::istream &stream, double min_mz, double max_mz, double min_rt,
+    double max_rt, Instrument::Type instrument_type, double resolution_ms1,
+    double resolution_msn, double reference_mz, Polarity::Type polarity,
+    const SplitParams &split_params, size_t max_threads = 1);
+
+// Byte offsets for the beginning of each <spectrum> element of an mzML file,
+// in the same order they appear in the spectrumList. The file size is stored
+// to detect stale sidecar index files.
+struct SpectrumIndex {
+    uint64_t file_size;
+    std::vector<uint64_t> offsets;
+};
+
+// Read the spectrum offsets from the <indexList> pointed to by the
+// <indexListOffset> element at the end of an indexed mzML file. Returns
+// std::nullopt if the file is not indexed or the index is inconsistent.
+std::optional<SpectrumIndex> read_mzml_index(std::istream &stream);
+
+// Build the spectrum offset index by scanning the raw bytes of the stream for
+// <spectrum> elements, without parsing the rest of the document.
+SpectrumIndex build_mzml_index(std::istream &stream);
+
+// Serialization of SpectrumIndex for use as a sidecar file.
+bool read_spectrum_index(std::istream &stream, SpectrumIndex *index);
+bool write_spectrum_index(std::ostream &stream, const SpectrumIndex &index);
+
+// Seek the stream to the first spectrum with retention time >= min_rt using the
+// given spectrum index, or to the preceding MS1 spectrum if it is an MSn one.
+void seek_mzml_spectrum(std::istream &stream, const SpectrumIndex &index,
+                        double min_rt);
+
+// Same as _read_mzml, but uses the given spectrum index to seek directly to the
+// first spectrum in the [min_rt, max_rt] range, stopping after the last one.
+// The retention time of each spectrum is assumed to be monotonically
+// increasing with the spectrum index.
+std::optional<RawData::RawData> _read_mzml_indexed(
+    std::istream &stream, const SpectrumIndex &index, double min_mz,
+    double max_mz, double min_rt, double max_rt,
+    Instrument::Type instrument_type, double resolution_ms1,
+    double resolution_msn, double reference_mz, Polarity::Type polarity,
+    size_t ms_level, size_t max_threads = 1);
+
+// RawData read from an mzXML/mzML file where the peaks of each scan are only
+// decoded when the scan is first accessed. When reading the file, only the
+// scan metadata is parsed, storing the position of each scan in the file. The
+// number of points and the intensity summaries of the metadata scans are the
+// ones reported in the file, before filtering the points by mz range or zero
+// intensity. The decoded scans are kept in a least recently used cache, which
+// is bounded by the memory used by their peaks.
+class LazyRawData {
+    // Input file, which must be seekable.
+    std::unique_ptr<std::istream> stream;
+    bool mzxml;
+    double min_mz;
+    double max_mz;
+
+    // The scans of the RawData have empty mz/intensity vectors.
+    RawData::RawData raw_data;
+    // Position in the stream of the opening tag of each scan.
+    std::vector<uint64_t> offsets;
+
+    // Decoded scans by index, sorted from most to least recently used. The
+    // most recently used scan is kept even if it exceeds max_cache_bytes.
+    using CacheEntry = std::pair<size_t, RawData::Scan>;
+    size_t max_cache_bytes;
+    size_t cache_bytes;
+    std::list<CacheEntry> cache;
+    std::unordered_map<size_t, std::list<CacheEntry>::iterator> cache_index;
+
+    // Scans can be decoded from several threads, which share the stream and
+    // the cache.
+    std::unique_ptr<std::mutex> mutex;
+
+   public:
+    LazyRawData(std::unique_ptr<std::istream> stream, bool mzxml,
+                double min_mz, double max_mz, RawData::RawData &&raw_data,
+                std::vector<uint64_t> &&offsets, size_t max_cache_bytes);
+
+    // The RawData with the metadata of all scans, without their peaks.
+    RawData::RawData &metadata();
+    const RawData::RawData &metadata() const;
+    size_t size() const;
+
+    // Returns the scan at the given index with its peaks decoded, reading it
+    // from the file if it is not in the cache. Returns std::nullopt if the
+    // index is out of range or the peaks could not be decoded.
+    std::optional<RawData::Scan> scan(size_t i);
+
+    // Decode the peaks of all scans into a regular RawData object. The decoded
+    // scans are not added to the cache.
+    std::optional<RawData::RawData> load();
+
+   private:
+    std::optional<RawData::Scan> decode_scan(size_t i);
+};
+
+// Read the scan metadata of an mzXML/mzML file for lazy decoding, with the same
+// filters as read_mzxml/_read_mzml. The stream is read from its current
+// position, which can be set with seek_mzml_spectrum for mzML files.
+LazyRawData read_mzxml_lazy(std::unique_ptr<std::istream> stream,
+                            double min_mz, double max_mz, double min_rt,
+                            double max_rt, Instrument::Type instrument_type,
+                            double resolution_ms1, double resolution_msn,
+                            double reference_mz, Polarity::Type polarity,
+                            size_t ms_level, size_t max_cache_bytes);
+LazyRawData _read_mzml_lazy(std::unique_ptr<std::istream> stream,
+                            double min_mz, double max_mz, double min_rt,
+                            double max_rt, Instrument::Type instrument_type,
+                            double resolution_ms1, double resolution_msn,
+                            double reference_mz, Polarity::Type polarity,
+                            size_t ms_level, size_t max_cache_bytes);
+
+// Reads the scans of an mzXML/mzML file one at a time while the file is being
+// parsed, applying the same filters as read_mzxml/_read_mzml. Only the scans
+// that were parsed but not yet returned are kept in memory.
+class ScanReader {
+    // The input stream is owned by the reader, as the tokenizer keeps a
+    // reference to it.
+    std::unique_ptr<std::istream> stream;
+    std::unique_ptr<XmlTokenizer::Tokenizer> tokenizer;
+    bool mzxml;
+    double min_mz;
+    double max_mz;
+    double min_rt;
+    double max_rt;
+    Polarity::Type polarity;
+    size_t ms_level;
+
+    // Scan number of the last MS1 scan, used as precursor for the mzML
+    // spectra without spectrumRef.
+    uint64_t previous_ms1_scan_number;
+    // Parsed scans not yet returned. Nested mzXML scans are parsed along with
+    // their parent scan.
+    std::deque<RawData::Scan> pending;
+    bool done;
+
+   public:
+    ScanReader(std::unique_ptr<std::istream> stream, bool mzxml, double min_mz,
+               double max_mz, double min_rt, double max_rt,
+               Polarity::Type polarity, size_t ms_level);
+
+    // Returns the next scan matching the filters. Returns std::nullopt when
+    // there are no more scans.
+    std::optional<RawData::Scan> next();
+
+    // Returns up to max_scans of the next scans. The batch is only empty when
+    // there are no more scans.
+    std::vector<RawData::Scan> next_batch(size_t max_scans);
+
+   private:
+    // Parse the next scan element into the pending scans, or find the end of
+    // the scan list.
+    void read_element();
+};
 
 // Read an entire mzIdentML file into a IdentData::IdentData data structure.
 IdentData::IdentData read_mzidentml(std::istream &stream, bool ignore_decoy,
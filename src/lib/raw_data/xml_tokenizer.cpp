@@ -0,0 +1,293 @@
+#include <algorithm>
+#include <cctype>
+#include <cstdlib>
+#include <stdexcept>
+#include <utility>
+
+#include "xml_tokenizer.hpp"
+
+std::optional<std::string_view> XmlTokenizer::attribute(
+    const Tag &tag, std::string_view name) {
+    auto text = tag.attributes;
+    size_t i = 0;
+    while (i < text.size()) {
+        // Find attribute name.
+        while (i < text.size() && std::isspace(text[i])) {
+            ++i;
+        }
+        size_t equal_sign = text.find('=', i);
+        if (equal_sign == std::string_view::npos) {
+            break;
+        }
+        size_t name_end = equal_sign;
+        while (name_end > i && std::isspace(text[name_end - 1])) {
+            --name_end;
+        }
+        auto attribute_name = text.substr(i, name_end - i);
+
+        // Find attribute value, which can be quoted with single or double
+        // quotes.
+        i = equal_sign + 1;
+        while (i < text.size() && std::isspace(text[i])) {
+            ++i;
+        }
+        // Malformed xml.
+        if (i == text.size() || (text[i] != '"' && text[i] != '\'')) {
+            break;
+        }
+        size_t value_end = text.find(text[i], i + 1);
+        if (value_end == std::string_view::npos) {
+            break;
+        }
+        if (attribute_name == name) {
+            return text.substr(i + 1, value_end - i - 1);
+        }
+        i = value_end + 1;
+    }
+    return std::nullopt;
+}
+
+// Numbers are short enough to be copied into a null terminated buffer on the
+// stack for the conversion.
+template <typename T, typename ConversionFunction>
+T parse_number(std::string_view str, ConversionFunction convert) {
+    char buffer[64];
+    size_t size = std::min(str.size(), sizeof(buffer) - 1);
+    std::copy(str.begin(), str.begin() + size, buffer);
+    buffer[size] = '\0';
+    char *end = nullptr;
+    T value = convert(buffer, &end);
+    if (end == buffer) {
+        throw std::invalid_argument("invalid numeric value: " +
+                                    std::string(str));
+    }
+    return value;
+}
+
+double XmlTokenizer::to_double(std::string_view str) {
+    return parse_number<double>(str, [](const char *buffer, char **end) {
+        return std::strtod(buffer, end);
+    });
+}
+
+int64_t XmlTokenizer::to_int(std::string_view str) {
+    return parse_number<int64_t>(str, [](const char *buffer, char **end) {
+        return std::strtoll(buffer, end, 10);
+    });
+}
+
+// Lookup table of the recognized accessions, sorted by accession number.
+static constexpr std::pair<uint32_t, XmlTokenizer::Accession::Type>
+    accession_table[] = {
+        {1000016, XmlTokenizer::Accession::SCAN_START_TIME},
+        {1000041, XmlTokenizer::Accession::CHARGE_STATE},
+        {1000042, XmlTokenizer::Accession::PEAK_INTENSITY},
+        {1000127, XmlTokenizer::Accession::CENTROID_SPECTRUM},
+        {1000129, XmlTokenizer::Accession::NEGATIVE_SCAN},
+        {1000130, XmlTokenizer::Accession::POSITIVE_SCAN},
+        {1000285, XmlTokenizer::Accession::TOTAL_ION_CURRENT},
+        {1000422, XmlTokenizer::Accession::BEAM_TYPE_CID},
+        {1000505, XmlTokenizer::Accession::BASE_PEAK_INTENSITY},
+        {1000511, XmlTokenizer::Accession::MS_LEVEL},
+        {1000514, XmlTokenizer::Accession::MZ_ARRAY},
+        {1000515, XmlTokenizer::Accession::INTENSITY_ARRAY},
+        {1000521, XmlTokenizer::Accession::FLOAT_32},
+        {1000523, XmlTokenizer::Accession::FLOAT_64},
+        {1000527, XmlTokenizer::Accession::HIGHEST_OBSERVED_MZ},
+        {1000528, XmlTokenizer::Accession::LOWEST_OBSERVED_MZ},
+        {1000574, XmlTokenizer::Accession::ZLIB_COMPRESSION},
+        {1000579, XmlTokenizer::Accession::MS1_SPECTRUM},
+        {1000827, XmlTokenizer::Accession::ISOLATION_WINDOW_TARGET_MZ},
+        {1000828, XmlTokenizer::Accession::ISOLATION_WINDOW_LOWER_OFFSET},
+        {1000829, XmlTokenizer::Accession::ISOLATION_WINDOW_UPPER_OFFSET},
+        {1000894, XmlTokenizer::Accession::RETENTION_TIME},
+        {1001088, XmlTokenizer::Accession::PROTEIN_DESCRIPTION},
+        {1001581, XmlTokenizer::Accession::FAIMS_COMPENSATION_VOLTAGE},
+        {1002312, XmlTokenizer::Accession::NUMPRESS_LINEAR},
+        {1002313, XmlTokenizer::Accession::NUMPRESS_PIC},
+        {1002314, XmlTokenizer::Accession::NUMPRESS_SLOF},
+        {1002746, XmlTokenizer::Accession::NUMPRESS_LINEAR_ZLIB},
+        {1002747, XmlTokenizer::Accession::NUMPRESS_PIC_ZLIB},
+        {1002748, XmlTokenizer::Accession::NUMPRESS_SLOF_ZLIB},
+};
+
+XmlTokenizer::Accession::Type XmlTokenizer::Accession::from_string(
+    std::string_view accession) {
+    // All recognized accessions are from the PSI-MS vocabulary, which have the
+    // form MS:XXXXXXX.
+    if (accession.size() != 10 || accession.substr(0, 3) != "MS:") {
+        return UNKNOWN;
+    }
+    uint32_t number = 0;
+    for (size_t i = 3; i < accession.size(); ++i) {
+        if (!std::isdigit(accession[i])) {
+            return UNKNOWN;
+        }
+        number = number * 10 + (accession[i] - '0');
+    }
+    auto entry = std::lower_bound(std::begin(accession_table),
+                                  std::end(accession_table), number,
+                                  [](const auto &entry, uint32_t number) {
+                                      return entry.first < number;
+                                  });
+    if (entry == std::end(accession_table) || entry->first != number) {
+        return UNKNOWN;
+    }
+    return entry->second;
+}
+
+XmlTokenizer::Tokenizer::Tokenizer(std::istream &stream, size_t block_size)
+    : stream(&stream),
+      block_size(block_size),
+      position(0),
+      tag_start(std::string_view::npos),
+      element_start(std::string_view::npos),
+      discarded(0) {}
+
+XmlTokenizer::Tokenizer::Tokenizer(std::string_view data)
+    : stream(nullptr),
+      block_size(0),
+      data(data),
+      position(0),
+      tag_start(std::string_view::npos),
+      element_start(std::string_view::npos),
+      discarded(0) {}
+
+bool XmlTokenizer::Tokenizer::fill() {
+    if (stream == nullptr || !stream->good()) {
+        return false;
+    }
+
+    // Discard the data that was already processed.
+    size_t keep = std::min({position, tag_start, element_start});
+    buffer.erase(0, keep);
+    discarded += keep;
+    position -= keep;
+    if (tag_start != std::string_view::npos) {
+        tag_start -= keep;
+    }
+    if (element_start != std::string_view::npos) {
+        element_start -= keep;
+    }
+
+    size_t size = buffer.size();
+    buffer.resize(size + block_size);
+    stream->read(&buffer[size], block_size);
+    buffer.resize(size + stream->gcount());
+    data = buffer;
+    return static_cast<size_t>(stream->gcount()) != 0;
+}
+
+std::optional<XmlTokenizer::Tag> XmlTokenizer::Tokenizer::next_tag() {
+    tag_start = std::string_view::npos;
+
+    // Find the limits of the tag, reading more blocks as necessary.
+    size_t start = data.find('<', position);
+    while (start == std::string_view::npos) {
+        position = data.size();
+        if (!fill()) {
+            return std::nullopt;
+        }
+        start = data.find('<', position);
+    }
+    tag_start = start;
+    size_t end = data.find('>', start + 1);
+    while (end == std::string_view::npos) {
+        size_t searched = data.size() - tag_start;
+        position = tag_start;
+        if (!fill()) {
+            position = data.size();
+            tag_start = std::string_view::npos;
+            return std::nullopt;
+        }
+        end = data.find('>', tag_start + searched);
+    }
+    position = end + 1;
+
+    auto contents = data.substr(tag_start + 1, end - tag_start - 1);
+    Tag tag = {};
+
+    // Check if this is a closing tag for a previous one.
+    if (!contents.empty() && contents[0] == '/') {
+        tag.closed = true;
+        contents.remove_prefix(1);
+    } else if (!contents.empty() && contents.back() == '/') {
+        tag.closed = true;
+        tag.self_closing = true;
+        contents.remove_suffix(1);
+    }
+
+    // Read tag name.
+    size_t name_end = 0;
+    while (name_end < contents.size() && !std::isspace(contents[name_end])) {
+        ++name_end;
+    }
+    tag.name = contents.substr(0, name_end);
+    tag.attributes = contents.substr(name_end);
+    return tag;
+}
+
+std::optional<std::string_view> XmlTokenizer::Tokenizer::read_data() {
+    size_t start = position;
+    size_t end = data.find('<', start);
+    while (end == std::string_view::npos) {
+        size_t searched = data.size() - start;
+        position = start;
+        if (!fill()) {
+            position = data.size();
+            return std::nullopt;
+        }
+        start = position;
+        end = data.find('<', start + searched);
+    }
+    position = end;
+
+    // Trim potential whitespace at the beginning of the data.
+    while (start < end && std::isspace(data[start])) {
+        ++start;
+    }
+    if (start == end) {
+        return std::nullopt;
+    }
+    return data.substr(start, end - start);
+}
+
+std::optional<std::string_view> XmlTokenizer::Tokenizer::next_element(
+    std::string_view name, std::string_view parent_name) {
+    element_start = std::string_view::npos;
+    size_t depth = 0;
+    while (true) {
+        auto tag = next_tag();
+        if (!tag) {
+            element_start = std::string_view::npos;
+            return std::nullopt;
+        }
+        bool closing = tag->closed && !tag->self_closing;
+        if (depth == 0) {
+            if (closing && tag->name == parent_name) {
+                return std::nullopt;
+            }
+            if (tag->name != name || closing) {
+                continue;
+            }
+            element_start = tag_start;
+        }
+        if (tag->name == name && !tag->closed) {
+            ++depth;
+        }
+        if (tag->name == name && closing) {
+            --depth;
+        }
+        if (depth == 0) {
+            // The element is kept in the buffer until the next call.
+            size_t start = element_start;
+            element_start = std::string_view::npos;
+            tag_start = std::string_view::npos;
+            return data.substr(start, position - start);
+        }
+    }
+}
+
+uint64_t XmlTokenizer::Tokenizer::offset(std::string_view view) const {
+    return discarded + (view.data() - data.data());
+}
@@ -0,0 +1,139 @@
+#ifndef RAWDATA_XMLTOKENIZER_HPP
+#define RAWDATA_XMLTOKENIZER_HPP
+
+#include <cstdint>
+#include <iostream>
+#include <optional>
+#include <string>
+#include <string_view>
+
+// XmlTokenizer splits Xml documents into tags and data without allocating
+// memory for each of them. Tags and data are returned as views into the
+// internal buffer of the Tokenizer, and the attributes are only parsed when
+// requested.
+namespace XmlTokenizer {
+
+// An Xml tag. The views point to the buffer of the Tokenizer that returned it
+// and are only valid until the next call to Tokenizer::next_tag.
+struct Tag {
+    std::string_view name;
+    // The unparsed attributes of the tag.
+    std::string_view attributes;
+    // Closing (</name>) and self-closing (<name/>) tags are both closed.
+    bool closed;
+    bool self_closing;
+};
+
+// Find the value of the attribute with the given name in the tag.
+std::optional<std::string_view> attribute(const Tag &tag,
+                                          std::string_view name);
+
+// Parse numeric values from the views, with the same semantics as
+// std::stod/std::stoll. An std::invalid_argument exception is thrown if no
+// conversion could be performed.
+double to_double(std::string_view str);
+int64_t to_int(std::string_view str);
+
+// The controlled vocabulary accessions recognized by the readers.
+namespace Accession {
+enum Type : uint8_t {
+    UNKNOWN = 0,
+    // Spectrum.
+    MS1_SPECTRUM,                // MS:1000579
+    MS_LEVEL,                    // MS:1000511
+    POSITIVE_SCAN,               // MS:1000130
+    NEGATIVE_SCAN,               // MS:1000129
+    SCAN_START_TIME,             // MS:1000016
+    CENTROID_SPECTRUM,           // MS:1000127
+    FAIMS_COMPENSATION_VOLTAGE,  // MS:1001581
+    TOTAL_ION_CURRENT,           // MS:1000285
+    BASE_PEAK_INTENSITY,         // MS:1000505
+    LOWEST_OBSERVED_MZ,          // MS:1000528
+    HIGHEST_OBSERVED_MZ,         // MS:1000527
+    // Precursor.
+    ISOLATION_WINDOW_TARGET_MZ,     // MS:1000827
+    ISOLATION_WINDOW_LOWER_OFFSET,  // MS:1000828
+    ISOLATION_WINDOW_UPPER_OFFSET,  // MS:1000829
+    CHARGE_STATE,                   // MS:1000041
+    PEAK_INTENSITY,                 // MS:1000042
+    BEAM_TYPE_CID,                  // MS:1000422
+    // Binary data arrays.
+    FLOAT_64,          // MS:1000523
+    FLOAT_32,          // MS:1000521
+    ZLIB_COMPRESSION,  // MS:1000574
+    MZ_ARRAY,          // MS:1000514
+    INTENSITY_ARRAY,   // MS:1000515
+    // MS-Numpress compression, optionally combined with zlib.
+    NUMPRESS_LINEAR,       // MS:1002312
+    NUMPRESS_PIC,          // MS:1002313
+    NUMPRESS_SLOF,         // MS:1002314
+    NUMPRESS_LINEAR_ZLIB,  // MS:1002746
+    NUMPRESS_PIC_ZLIB,     // MS:1002747
+    NUMPRESS_SLOF_ZLIB,    // MS:1002748
+    // Identifications.
+    PROTEIN_DESCRIPTION,  // MS:1001088
+    RETENTION_TIME,       // MS:1000894
+};
+
+// Find the accession type from a fixed lookup table. Accessions that are not
+// in the table are UNKNOWN.
+Type from_string(std::string_view accession);
+}  // namespace Accession
+
+// Tokenizer reads tags and data from an input stream in large blocks, or from
+// a buffer already in memory.
+class Tokenizer {
+    // Input stream. Set to nullptr when tokenizing a memory buffer.
+    std::istream *stream;
+    size_t block_size;
+
+    // Buffer holding the blocks read from the stream.
+    std::string buffer;
+    // The data being tokenized, either the buffer or the external memory.
+    std::string_view data;
+    // Current position in the data.
+    size_t position;
+    // Start of the tag being read by next_tag.
+    size_t tag_start;
+    // Start of the element being read by next_element.
+    size_t element_start;
+    // Number of bytes of the stream discarded from the buffer.
+    uint64_t discarded;
+
+   public:
+    // Tokenize the stream, reading it in blocks of the given size.
+    Tokenizer(std::istream &stream, size_t block_size = 1 << 20);
+    // Tokenize the given memory buffer, which must outlive the Tokenizer.
+    Tokenizer(std::string_view data);
+
+    // Reads the next tag. Returns std::nullopt at the end of the input.
+    std::optional<Tag> next_tag();
+
+    // Read data until the next tag is found, trimming whitespace at the
+    // beginning. The view is valid until the next call to the Tokenizer.
+    // Reading more blocks from the stream can invalidate the last tag, so any
+    // attributes needed from it must be parsed before reading the data.
+    std::optional<std::string_view> read_data();
+
+    // Reads the raw text of the next <name> element, including any nested
+    // elements with the same name. Returns std::nullopt if the closing tag of
+    // the enclosing <parent_name> element or the end of the input are found
+    // first. The view is valid until the next call to the Tokenizer.
+    std::optional<std::string_view> next_element(std::string_view name,
+                                                 std::string_view parent_name);
+
+    // Position of the given view relative to the beginning of the input. The
+    // view must point into the data returned by the last call to the
+    // Tokenizer.
+    uint64_t offset(std::string_view view) const;
+
+   private:
+    // Read the next block from the stream into the buffer, discarding the
+    // data that is no longer needed. Returns false if no more data is
+    // available.
+    bool fill();
+};
+
+}  // namespace XmlTokenizer
+
+#endif /* RAWDATA_XMLTOKENIZER_HPP */
@@ -1,46 +1,169 @@
+#include <zlib.h>
+#include <algorithm>
 #include <cstring>
+#include <optional>
 #include <string>
 #include <vector>
 
 #include "utils/base64.hpp"
 
-void Base64::decode_base64(const std::string &input, std::vector<uint8_t> &output) {
-    size_t in_len = input.size();
+void Base64::decode_base64(std::string_view input,
+                           std::vector<uint8_t> &output) {
+    output.resize(input.size() / 4 * 3);
+    output.resize(decode_base64(input, output.data()));
+}
+
+size_t Base64::decode_base64(std::string_view input, uint8_t *output) {
+    auto in = reinterpret_cast<const unsigned char *>(input.data());
+    size_t num_blocks = input.size() / 4;
+    if (num_blocks == 0) {
+        return 0;
+    }
 
-    size_t out_len = in_len / 4 * 3;
-    if (input[in_len - 1] == '=') {
-        --out_len;
+    // Only the last block of four characters can contain padding, the rest
+    // are decoded without any checks.
+    size_t j = 0;
+    for (size_t i = 0; i < num_blocks - 1; ++i, in += 4, j += 3) {
+        uint32_t block = (translation_table[in[0]] << 18) |
+                         (translation_table[in[1]] << 12) |
+                         (translation_table[in[2]] << 6) |
+                         translation_table[in[3]];
+        output[j] = block >> 16;
+        output[j + 1] = block >> 8;
+        output[j + 2] = block;
+    }
+    size_t padding = (in[3] == '=') + (in[2] == '=');
+    uint32_t block = (translation_table[in[0]] << 18) |
+                     (translation_table[in[1]] << 12) |
+                     ((in[2] == '=' ? 0 : translation_table[in[2]]) << 6) |
+                     (in[3] == '=' ? 0 : translation_table[in[3]]);
+    output[j] = block >> 16;
+    if (padding < 2) {
+        output[j + 1] = block >> 8;
     }
-    if (input[in_len - 2] == '=') {
-        --out_len;
+    if (padding < 1) {
+        output[j + 2] = block;
     }
+    return j + 3 - padding;
+}
+
+// Reverse the byte order of the given integer.
+static uint32_t swap_bytes(uint32_t value) {
+    return ((value & 0x000000FFu) << 24) | ((value & 0x0000FF00u) << 8) |
+           ((value & 0x00FF0000u) >> 8) | ((value & 0xFF000000u) >> 24);
+}
 
-    output.resize(out_len);
-
-    for (size_t i = 0, j = 0; i < in_len; i += 4, j += 3) {
-        uint8_t a = input[i] == '='
-                        ? 0
-                        : translation_table[static_cast<int>(input[i])];
-        uint8_t b = input[i + 1] == '='
-                        ? 0
-                        : translation_table[static_cast<int>(input[i + 1])];
-        uint8_t c = input[i + 2] == '='
-                        ? 0
-                        : translation_table[static_cast<int>(input[i + 2])];
-        uint8_t d = input[i + 3] == '='
-                        ? 0
-                        : translation_table[static_cast<int>(input[i + 3])];
-
-        if (j < out_len) {
-            output[j] = (a << 2) + (b >> 4);
+static uint64_t swap_bytes(uint64_t value) {
+    return (static_cast<uint64_t>(swap_bytes(static_cast<uint32_t>(value)))
+            << 32) |
+           swap_bytes(static_cast<uint32_t>(value >> 32));
+}
+
+// Interpret the first `num_bytes` bytes stored in the memory of the output
+// vector as floating point numbers of the given precision, and convert them in
+// place into the elements of the vector.
+static void interpret_array(std::vector<double> &output, size_t num_bytes,
+                            int precision, bool little_endian) {
+    if (precision == 64) {
+        size_t num_values = num_bytes / 8;
+        output.resize(num_values);
+        if (!little_endian) {
+            for (auto &value : output) {
+                uint64_t bytes;
+                std::memcpy(&bytes, &value, sizeof(bytes));
+                bytes = swap_bytes(bytes);
+                std::memcpy(&value, &bytes, sizeof(bytes));
+            }
         }
-        if (j + 1 < out_len) {
-            output[j + 1] = (b << 4) + (c >> 2);
+        return;
+    }
+
+    // The float values take half the space of the resulting doubles. The
+    // conversion is done from back to front, so that every float is read
+    // before its memory is overwritten.
+    size_t num_values = num_bytes / 4;
+    output.resize(num_values);
+    auto bytes = reinterpret_cast<const uint8_t *>(output.data());
+    for (size_t i = num_values; i-- > 0;) {
+        uint32_t value_bytes;
+        std::memcpy(&value_bytes, bytes + i * 4, sizeof(value_bytes));
+        if (!little_endian) {
+            value_bytes = swap_bytes(value_bytes);
         }
-        if (j + 2 < out_len) {
-            output[j + 2] = (c << 6) + d;
+        float value;
+        std::memcpy(&value, &value_bytes, sizeof(value));
+        output[i] = value;
+    }
+}
+
+// Inflate the zlib compressed input into the memory of the output vector,
+// growing it as necessary. Returns the number of decompressed bytes, or
+// std::nullopt if the data could not be decompressed.
+static std::optional<size_t> inflate_array(const std::vector<uint8_t> &input,
+                                           std::vector<double> &output) {
+    z_stream strm = {};
+    if (inflateInit(&strm) != Z_OK) {
+        return std::nullopt;
+    }
+    strm.next_in = const_cast<uint8_t *>(input.data());
+    strm.avail_in = input.size();
+
+    // Numeric arrays don't compress well, so the initial size estimate is
+    // rarely exceeded.
+    output.resize(std::max<size_t>(input.size() / 4, 64));
+    int ret = Z_OK;
+    while (ret == Z_OK) {
+        size_t capacity = output.size() * sizeof(double);
+        if (strm.total_out == capacity) {
+            output.resize(output.size() * 2);
+            capacity = output.size() * sizeof(double);
+        }
+        strm.next_out = reinterpret_cast<uint8_t *>(output.data()) +
+                        strm.total_out;
+        strm.avail_out = capacity - strm.total_out;
+        ret = inflate(&strm, Z_NO_FLUSH);
+        if (ret == Z_BUF_ERROR && strm.avail_out != 0) {
+            // The input ended before the end of the compressed stream.
+            break;
+        }
+        if (ret == Z_BUF_ERROR) {
+            ret = Z_OK;
+        }
+    }
+    size_t num_bytes = strm.total_out;
+    (void)inflateEnd(&strm);
+    if (ret != Z_STREAM_END) {
+        return std::nullopt;
+    }
+    return num_bytes;
+}
+
+bool Base64::decode_array(std::string_view input, int precision,
+                          bool little_endian, bool compressed,
+                          std::vector<double> &output) {
+    if (precision != 32 && precision != 64) {
+        return false;
+    }
+    size_t num_bytes = 0;
+    if (compressed) {
+        std::vector<uint8_t> compressed_data;
+        decode_base64(input, compressed_data);
+        auto inflated_bytes = inflate_array(compressed_data, output);
+        if (!inflated_bytes) {
+            output.clear();
+            return false;
         }
+        num_bytes = inflated_bytes.value();
+    } else {
+        // Make sure there is enough space to fit the decoded bytes, and the
+        // resulting values.
+        size_t max_bytes = input.size() / 4 * 3;
+        output.resize(max_bytes / (precision / 8) + 1);
+        num_bytes = decode_base64(
+            input, reinterpret_cast<uint8_t *>(output.data()));
     }
+    interpret_array(output, num_bytes, precision, little_endian);
+    return true;
 }
 
 // Interpreting functions.
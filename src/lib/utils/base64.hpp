@@ -2,6 +2,7 @@
 #define UTILS_BASE64_HPP
 
 #include <stdint.h>
+#include <string_view>
 #include <vector>
 
 // This namespace contains functions to decode base64-encoded data into raw
@@ -28,7 +29,20 @@ static constexpr unsigned char translation_table[] = {
 // Decode input string containing base64-encoded data into bytes, result is
 // returned in the output vector. This function allocates the appropriate amount
 // of memory for the output vector.
-void decode_base64(std::string const &input, std::vector<uint8_t> &output);
+void decode_base64(std::string_view input, std::vector<uint8_t> &output);
+
+// Decode input string containing base64-encoded data into the given memory
+// buffer, which must have space for at least `input.size() / 4 * 3` bytes.
+// Returns the number of bytes that were written.
+size_t decode_base64(std::string_view input, uint8_t *output);
+
+// Decode a base64-encoded array of 32 or 64 bit floating point numbers into
+// the output vector in a single pass. The values are decoded in place in the
+// memory of the output vector. If the data is zlib compressed, it is inflated
+// directly into the output vector as well. Returns false if the precision is
+// not supported or the data could not be decompressed.
+bool decode_array(std::string_view input, int precision, bool little_endian,
+                  bool compressed, std::vector<double> &output);
 
 // Interpreting raw data into floating-point values.
 uint32_t interpret_uint32(std::vector<uint8_t> &data, size_t offset,
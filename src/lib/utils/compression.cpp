@@ -1,4 +1,5 @@
 #include <zlib.h>
+#include <algorithm>
 #include <cassert>
 #include <cstdint>
 #include <cstring>
@@ -97,9 +98,75 @@ int Compression::inflate(std::vector<uint8_t> &in_data,
     return ret == Z_STREAM_END ? Z_OK : Z_DATA_ERROR;
 }
 
+static const char header_magic[] = "PASTAQ";
+
+bool Compression::read_header(const char *header, Codec::Type *codec) {
+    if (std::memcmp(header, header_magic, 6) != 0) {
+        return false;
+    }
+    // The compression level in header[7] is not needed for decompression.
+    *codec = static_cast<Codec::Type>(header[6]);
+    return true;
+}
+
+void Compression::write_header(char *header, Codec::Type codec, int level) {
+    std::memcpy(header, header_magic, 6);
+    header[6] = codec;
+    header[7] = static_cast<char>(level);
+}
+
+bool Compression::compress_block(const uint8_t *data, size_t size,
+                                 Codec::Type codec, int level,
+                                 std::vector<uint8_t> &out_data) {
+    switch (codec) {
+        case Codec::NONE: {
+            out_data.assign(data, data + size);
+            return true;
+        } break;
+        case Codec::ZLIB: {
+            uLongf compressed_size = compressBound(size);
+            out_data.resize(compressed_size);
+            if (compress2(out_data.data(), &compressed_size, data, size,
+                          level) != Z_OK) {
+                return false;
+            }
+            out_data.resize(compressed_size);
+            return true;
+        } break;
+        default: {
+            return false;
+        } break;
+    }
+}
+
+bool Compression::decompress_block(const uint8_t *data, size_t size,
+                                   Codec::Type codec, uint8_t *out_data,
+                                   size_t out_size) {
+    switch (codec) {
+        case Codec::NONE: {
+            if (size != out_size) {
+                return false;
+            }
+            if (size > 0) {
+                std::memcpy(out_data, data, size);
+            }
+            return true;
+        } break;
+        case Codec::ZLIB: {
+            uLongf decompressed_size = out_size;
+            return uncompress(out_data, &decompressed_size, data, size) ==
+                       Z_OK &&
+                   decompressed_size == out_size;
+        } break;
+        default: {
+            return false;
+        } break;
+    }
+}
+
 // Initialize buffer.
 Compression::DeflateStreambuf::DeflateStreambuf(size_t _buffer_size)
-    : buffer_size(_buffer_size) {
+    : buffer_size(_buffer_size), strm() {
     // Allocate new buffer.
     buffer = new char[buffer_size];
     // Set streambuf's internal pointer to buffer.
@@ -109,34 +176,50 @@ Compression::DeflateStreambuf::DeflateStreambuf(size_t _buffer_size)
 // Destructor flushes the buffer, deletes the allocated memory, closes the
 // output file, and frees the allocated Zlib state.
 Compression::DeflateStreambuf::~DeflateStreambuf() {
-    // Flush current buffer.
-    sync();
-
-    // Perform last write for Zlib to flush it's internal buffer.
-    strm.next_in = nullptr;
-    strm.avail_in = 0;
-    write_buffer(Z_FINISH);
-
-    delete[] buffer;
     if (out_file) {
+        // Flush current buffer.
+        sync();
+
+        // Perform last write for Zlib to flush it's internal buffer.
+        if (codec == Codec::ZLIB) {
+            strm.next_in = nullptr;
+            strm.avail_in = 0;
+            write_buffer(Z_FINISH);
+        }
         fclose(out_file);
     }
+    delete[] buffer;
     (void)deflateEnd(&strm);
 }
 
 // Open file, allocate buffer, and initialize Zlib state.
-int Compression::DeflateStreambuf::open(std::string const &filename) {
+int Compression::DeflateStreambuf::open(std::string const &filename,
+                                        Codec::Type _codec, int level) {
+    if ((_codec != Codec::NONE && _codec != Codec::ZLIB) ||
+        (_codec == Codec::ZLIB && (level < -1 || level > 9))) {
+        return ERROR;
+    }
+    codec = _codec;
+
     // Open file.
     out_file = fopen(filename.c_str(), "wb");
     if (out_file == NULL) {
         return ERROR;
     }
+    char header[header_size];
+    write_header(header, codec, codec == Codec::ZLIB ? level : 0);
+    if (fwrite(header, 1, header_size, out_file) != header_size) {
+        return ERROR;
+    }
+    if (codec == Codec::NONE) {
+        return OK;
+    }
 
     // Initialize zlib stream.
     strm.zalloc = Z_NULL;
     strm.zfree = Z_NULL;
     strm.opaque = Z_NULL;
-    int ret = deflateInit(&strm, Z_DEFAULT_COMPRESSION);
+    int ret = deflateInit(&strm, level);
     if (ret != Z_OK) {
         return ERROR;
     }
@@ -177,6 +260,14 @@ int Compression::DeflateStreambuf::sync() {
 // argument flush should be equal to Z_FINISH so Zlib knows to flush all of
 // the compressed data.
 int Compression::DeflateStreambuf::write_buffer(int flush) {
+    if (codec == Codec::NONE) {
+        size_t size = pptr() - pbase();
+        if (fwrite(pbase(), 1, size, out_file) != size) {
+            return Z_ERRNO;
+        }
+        return Z_OK;
+    }
+
     // Set buffer and buffer size.
     strm.avail_in = pptr() - pbase();
     strm.next_in = reinterpret_cast<unsigned char *>(pbase());
@@ -197,6 +288,7 @@ int Compression::DeflateStreambuf::write_buffer(int flush) {
         size_t have = buffer_size - strm.avail_out;
 
         if (fwrite(out, 1, have, out_file) != have || ferror(out_file)) {
+            delete[] out;
             return Z_ERRNO;
         }
     } while (strm.avail_out == 0);
@@ -206,18 +298,20 @@ int Compression::DeflateStreambuf::write_buffer(int flush) {
 }
 
 // Open streambuf and check for success.
-void Compression::DeflateStream::open(std::string const &filename) {
-    int state = DeflateStreambuf::open(filename);
+void Compression::DeflateStream::open(std::string const &filename,
+                                      Codec::Type codec, int level) {
+    int state = DeflateStreambuf::open(filename, codec, level);
     if (state == ERROR) {
         setstate(std::ios::badbit);
     }
 }
 
-// Initialize buffer.
+// Initialize buffers.
 Compression::InflateStreambuf::InflateStreambuf(size_t _buffer_size)
-    : buffer_size(_buffer_size) {
-    // Allocate new buffer.
+    : buffer_size(_buffer_size), strm() {
+    // Allocate new buffers.
     buffer = new char[buffer_size];
+    in_buffer = new unsigned char[buffer_size];
     // Set streambuf's internal pointer to buffer.
     setg(buffer, buffer + buffer_size, buffer + buffer_size);
 }
@@ -226,97 +320,151 @@ Compression::InflateStreambuf::InflateStreambuf(size_t _buffer_size)
 // allocated Zlib state.
 Compression::InflateStreambuf::~InflateStreambuf() {
     delete[] buffer;
+    delete[] in_buffer;
     if (in_file) {
         fclose(in_file);
     }
     (void)inflateEnd(&strm);
 }
 
+// Seek to an absolute position of the file, which might be past 2 GB.
+static bool seek_file(FILE *file, uint64_t position) {
+#ifdef _WIN32
+    return _fseeki64(file, position, SEEK_SET) == 0;
+#else
+    return fseeko(file, position, SEEK_SET) == 0;
+#endif
+}
+
 // Open file and initialize Zlib state.
-int Compression::InflateStreambuf::open(std::string const &filename) {
+int Compression::InflateStreambuf::open(std::string const &filename,
+                                        uint64_t _offset, uint64_t _size) {
     // Open file.
     in_file = fopen(filename.c_str(), "rb");
     if (in_file == NULL) {
         return ERROR;
     }
+    offset = _offset;
+    size = _size;
+    remaining = _size;
+    if (offset != 0 && !seek_file(in_file, offset)) {
+        return ERROR;
+    }
 
-    // Initialize zlib stream.
+    // Files without header are read from the beginning as zlib or gzip
+    // streams.
+    char header[header_size];
+    if (read_file(header, header_size) != header_size ||
+        !read_header(header, &codec)) {
+        codec = Codec::ZLIB;
+        remaining = size;
+        if (!seek_file(in_file, offset)) {
+            return ERROR;
+        }
+    }
+    if (codec == Codec::NONE) {
+        return OK;
+    }
+    if (codec != Codec::ZLIB) {
+        return ERROR;
+    }
+
+    // Initialize zlib stream. The window bits are increased by 32 to
+    // automatically detect zlib and gzip headers.
     strm.zalloc = Z_NULL;
     strm.zfree = Z_NULL;
     strm.opaque = Z_NULL;
-    int ret = inflateInit(&strm);
+    strm.avail_in = 0;
+    strm.next_in = Z_NULL;
+    int ret = inflateInit2(&strm, 15 + 32);
     if (ret != Z_OK) {
         return ERROR;
     }
     return OK;
 }
 
+// Read from the file without going past the end of the range being read.
+size_t Compression::InflateStreambuf::read_file(void *data,
+                                                size_t num_bytes) {
+    size_t nread = fread(
+        data, 1, static_cast<size_t>(std::min<uint64_t>(num_bytes, remaining)),
+        in_file);
+    remaining -= nread;
+    return nread;
+}
+
 // Read a character when the buffer is empty.
 int Compression::InflateStreambuf::underflow() {
     if (gptr() < egptr()) {
-        return *gptr();
+        return traits_type::to_int_type(*gptr());
     }
 
     size_t nread = read_buffer();
 
-    if (nread <= 0) {
+    if (nread == 0) {
         return EOF;
     }
     setg(buffer, buffer, buffer + nread);
-    return static_cast<unsigned char>(*gptr());
+    return traits_type::to_int_type(*gptr());
 }
 
 // Fill the buffer using the Zlib library for decompression, returns the number
-// of bytes that were read to the buffer.
+// of bytes that were read to the buffer. The compressed data that was read
+// from the file but not yet decompressed is kept for the next call.
 int Compression::InflateStreambuf::read_buffer() {
-    // Buffer to store data read from file.
-    unsigned char *in = new unsigned char[buffer_size];
-    strm.avail_in = fread(in, 1, buffer_size, in_file);
-    if (ferror(in_file)) {
-        (void)inflateEnd(&strm);
+    if (in_file == nullptr) {
         return 0;
     }
-
-    // Return on EOF.
-    if (strm.avail_in == 0) {
-        return 0;
+    if (codec == Codec::NONE) {
+        return read_file(buffer, buffer_size);
     }
-    strm.next_in = in;
-
-    size_t bytes_read = 0;
-    // Read and inflate data until the output buffer is full or the input buffer
-    // is empty.
-    do {
-        // Set output buffer.
-        size_t size = buffer_size - bytes_read;
-        strm.avail_out = size;
-        strm.next_out = reinterpret_cast<unsigned char *>(eback() + bytes_read);
+    strm.avail_out = buffer_size;
+    strm.next_out = reinterpret_cast<unsigned char *>(buffer);
+
+    // Read and inflate data until the output buffer is full or the end of the
+    // file is reached.
+    while (strm.avail_out != 0) {
+        if (strm.avail_in == 0) {
+            strm.avail_in = read_file(in_buffer, buffer_size);
+            strm.next_in = in_buffer;
+            if (ferror(in_file) || strm.avail_in == 0) {
+                break;
+            }
+        }
 
-        // Inflate data.
         int ret = inflate(&strm, Z_NO_FLUSH);
-        switch (ret) {
-            case Z_NEED_DICT:
-                ret = Z_DATA_ERROR;
-                [[fallthrough]];
-            case Z_DATA_ERROR:
-            case Z_MEM_ERROR:
-                (void)inflateEnd(&strm);
-                return ret;
+        if (ret == Z_STREAM_END) {
+            // Gzip files can contain multiple concatenated members, which are
+            // decompressed as a single stream.
+            if (inflateReset(&strm) != Z_OK) {
+                break;
+            }
+            continue;
         }
-        bytes_read += size - strm.avail_out;
-    } while (strm.avail_in != 0 && strm.avail_out != 0);
-
-    // Move to position in file directly after the last byte that was
-    // decompressed already.
-    fseek(in_file, -(int)strm.avail_in, SEEK_CUR);
+        if (ret != Z_OK) {
+            // Stop at corrupted data. The data decompressed up to this point
+            // is still returned.
+            break;
+        }
+    }
+    return buffer_size - strm.avail_out;
+}
 
-    delete[] in;
-    return bytes_read;
+bool Compression::is_gzip(std::string const &filename) {
+    FILE *file = fopen(filename.c_str(), "rb");
+    if (file == NULL) {
+        return false;
+    }
+    unsigned char magic[2];
+    size_t nread = fread(magic, 1, 2, file);
+    fclose(file);
+    return nread == 2 && magic[0] == 0x1f && magic[1] == 0x8b;
 }
 
 // Open streambuf and check for success.
-void Compression::InflateStream::open(std::string const &filename) {
-    int state = InflateStreambuf::open(filename);
+void Compression::InflateStream::open(std::string const &filename,
+                                      uint64_t offset, uint64_t size) {
+    int state = InflateStreambuf::open(filename, offset, size);
     if (state == ERROR) {
         setstate(std::ios::badbit);
     }
@@ -2,8 +2,10 @@
 #define UTILS_COMPRESSION_HPP
 
 #include <zlib.h>
+#include <cstdint>
 #include <iostream>
 #include <streambuf>
+#include <string>
 #include <vector>
 
 // This namespace contains necessary functions to (de)compress raw data.
@@ -15,6 +17,36 @@ enum state { OK, ERROR };
 int inflate(std::vector<uint8_t> &in_data, std::vector<uint8_t> &out_data,
             size_t decompressed_len);
 
+// Check if the given file is gzip compressed by looking at its magic number.
+bool is_gzip(std::string const &filename);
+
+// Codecs used to compress the files written with DeflateStream.
+namespace Codec {
+enum Type : uint8_t {
+    NONE = 0,
+    ZLIB = 1,
+};
+}  // namespace Codec
+
+// Files written with DeflateStream start with a header of `header_size` bytes:
+// the "PASTAQ" magic number followed by the codec and the compression level.
+// Files without this header are read as zlib or gzip streams, which is the
+// format written by older versions.
+constexpr size_t header_size = 8;
+bool read_header(const char *header, Codec::Type *codec);
+void write_header(char *header, Codec::Type codec, int level);
+
+// Compress a block of memory into `out_data` with the given codec and level.
+// Blocks compressed this way are independent of each other and can be
+// decompressed separately.
+bool compress_block(const uint8_t *data, size_t size, Codec::Type codec,
+                    int level, std::vector<uint8_t> &out_data);
+
+// Decompress a block of memory into `out_data`, which must have the size of
+// the decompressed block.
+bool decompress_block(const uint8_t *data, size_t size, Codec::Type codec,
+                      uint8_t *out_data, size_t out_size);
+
 // Streambuf class allows a stream to write compressed data to a file by use of
 // an intermediate buffer.
 class DeflateStreambuf : public std::streambuf {
@@ -25,6 +57,9 @@ class DeflateStreambuf : public std::streambuf {
     // File to write compressed data to.
     FILE *out_file = nullptr;
 
+    // Codec used to compress the data.
+    Codec::Type codec = Codec::ZLIB;
+
     // Zlib stream used in compression.
     z_stream strm;
 
@@ -34,8 +69,11 @@ class DeflateStreambuf : public std::streambuf {
     // Destructor flushes the buffer, closes the file, and deletes buffer.
     virtual ~DeflateStreambuf();
 
-    // Open file and allocate Zlib state.
-    int open(std::string const &filename);
+    // Open file, write the header and allocate Zlib state. The level is the
+    // zlib compression level, from 1 (fastest) to 9 (smallest), or -1 for the
+    // zlib default.
+    int open(std::string const &filename, Codec::Type codec = Codec::ZLIB,
+             int level = Z_DEFAULT_COMPRESSION);
 
    private:
     virtual int overflow(int c);  // Writes byte when buffer is full.
@@ -55,19 +93,33 @@ class DeflateStream : private DeflateStreambuf, public std::ostream {
     }
 
     // Open streambuf and check for success.
-    void open(std::string const &filename);
+    void open(std::string const &filename, Codec::Type codec = Codec::ZLIB,
+              int level = Z_DEFAULT_COMPRESSION);
 };
 
 // Streambuf class allows a stream to read data from a file and decompress it
-// using an intermediate buffer
+// using an intermediate buffer. The codec is detected from the file header.
+// Both zlib and gzip compressed files without header are supported, including
+// gzip files with multiple members.
 class InflateStreambuf : public std::streambuf {
     // Buffer to store decompressed data.
     char *buffer;
     size_t buffer_size;
 
+    // Buffer to store the compressed data read from the file.
+    unsigned char *in_buffer;
+
     // File to read compressed data from.
     FILE *in_file = nullptr;
 
+    // Range of the file that is read.
+    uint64_t offset = 0;
+    uint64_t size = UINT64_MAX;
+    uint64_t remaining = UINT64_MAX;
+
+    // Codec of the file, given by its header.
+    Codec::Type codec = Codec::ZLIB;
+
     // Zlib stream used in decompression.
     z_stream strm;
 
@@ -77,12 +129,15 @@ class InflateStreambuf : public std::streambuf {
     // Destructor flushes the buffer, closes the file, and deletes buffer.
     virtual ~InflateStreambuf();
 
-    // Open file and allocate Zlib state.
-    int open(std::string const &filename);
+    // Open file and allocate Zlib state. Only the `size` bytes of the file
+    // starting at `offset` are read, as if they were a separate file.
+    int open(std::string const &filename, uint64_t offset = 0,
+             uint64_t size = UINT64_MAX);
 
    private:
     virtual int underflow();  // Read byte when buffer is empty.
     int read_buffer();        // Decompress data from file into the buffer.
+    size_t read_file(void *data, size_t num_bytes);  // Read from the range.
 };
 
 // InflateStream uses the InflateStreambuf to decompress the data read from a
@@ -97,7 +152,8 @@ class InflateStream : private InflateStreambuf, public std::istream {
     }
 
     // Open streambuf and check for success.
-    void open(std::string const &filename);
+    void open(std::string const &filename, uint64_t offset = 0,
+              uint64_t size = UINT64_MAX);
 };
 
 }  // namespace Compression
@@ -0,0 +1,350 @@
+#include <algorithm>
+#include <cerrno>
+#include <cstring>
+#include <filesystem>
+#include <fstream>
+#include <mutex>
+#include <utility>
+
+#include "utils/container.hpp"
+#include "utils/serialization.hpp"
+
+#ifdef _WIN32
+#define NOMINMAX
+#include <windows.h>
+#else
+#include <fcntl.h>
+#include <sys/file.h>
+#include <unistd.h>
+#endif
+
+// Exclusive lock used to serialize the modifications of a container file. The
+// lock is advisory, so it only excludes other writers, and it is held until
+// the object is destroyed. Threads of the same process are excluded with a
+// mutex, as file locks are not guaranteed to do so on every platform.
+class ContainerLock {
+    std::unique_lock<std::mutex> mutex_lock;
+#ifdef _WIN32
+    HANDLE file_handle = INVALID_HANDLE_VALUE;
+    OVERLAPPED overlapped = {};
+#else
+    int file_descriptor = -1;
+#endif
+    bool locked = false;
+
+    static std::mutex &mutex() {
+        static std::mutex mutex;
+        return mutex;
+    }
+
+   public:
+    explicit ContainerLock(const std::string &filename)
+        : mutex_lock(mutex()) {
+#ifdef _WIN32
+        file_handle = CreateFileA(
+            filename.c_str(), GENERIC_READ | GENERIC_WRITE,
+            FILE_SHARE_READ | FILE_SHARE_WRITE | FILE_SHARE_DELETE, nullptr,
+            OPEN_EXISTING, FILE_ATTRIBUTE_NORMAL, nullptr);
+        // Windows locks are mandatory, so a byte far beyond the end of the
+        // file is locked instead of the contents.
+        overlapped.OffsetHigh = 0x80000000;
+        locked = file_handle != INVALID_HANDLE_VALUE &&
+                 LockFileEx(file_handle, LOCKFILE_EXCLUSIVE_LOCK, 0, 1, 0,
+                            &overlapped);
+#else
+        file_descriptor = ::open(filename.c_str(), O_RDWR);
+        if (file_descriptor != -1) {
+            int result = 0;
+            do {
+                result = flock(file_descriptor, LOCK_EX);
+            } while (result == -1 && errno == EINTR);
+            locked = result == 0;
+        }
+#endif
+    }
+
+    ContainerLock(const ContainerLock &) = delete;
+    ContainerLock &operator=(const ContainerLock &) = delete;
+
+    ~ContainerLock() {
+#ifdef _WIN32
+        if (file_handle != INVALID_HANDLE_VALUE) {
+            if (locked) {
+                UnlockFileEx(file_handle, 0, 1, 0, &overlapped);
+            }
+            CloseHandle(file_handle);
+        }
+#else
+        if (file_descriptor != -1) {
+            if (locked) {
+                flock(file_descriptor, LOCK_UN);
+            }
+            ::close(file_descriptor);
+        }
+#endif
+    }
+
+    bool is_locked() const { return locked; }
+};
+
+static bool read_container_header(std::istream &stream,
+                                  uint64_t *directory_offset) {
+    char file_magic[8];
+    uint64_t file_version = 0;
+    stream.read(file_magic, sizeof(file_magic));
+    Serialization::read_uint64(stream, &file_version);
+    Serialization::read_uint64(stream, directory_offset);
+    return stream.good() &&
+           std::memcmp(file_magic, Container::magic, 8) == 0 &&
+           file_version <= Container::version;
+}
+
+static bool read_directory(std::istream &stream, uint64_t file_size,
+                           std::vector<Container::Member> *members) {
+    uint64_t directory_offset = 0;
+    stream.seekg(0);
+    if (!read_container_header(stream, &directory_offset) ||
+        directory_offset > file_size) {
+        return false;
+    }
+    stream.seekg(directory_offset);
+    uint64_t num_members = 0;
+    Serialization::read_uint64(stream, &num_members);
+    // Each member takes at least 24 bytes of the directory.
+    if (!stream.good() || num_members > (file_size - directory_offset) / 24) {
+        return false;
+    }
+    members->clear();
+    members->reserve(num_members);
+    for (size_t i = 0; i < num_members; ++i) {
+        Container::Member member;
+        Serialization::read_string(stream, &member.name);
+        Serialization::read_uint64(stream, &member.offset);
+        Serialization::read_uint64(stream, &member.size);
+        if (!stream.good() || member.offset > file_size ||
+            member.size > file_size - member.offset) {
+            return false;
+        }
+        members->push_back(member);
+    }
+    return true;
+}
+
+static void write_padding(std::ostream &stream, uint64_t position) {
+    const char zeros[8] = {};
+    stream.write(zeros, (8 - position % 8) % 8);
+}
+
+bool Container::Container::create(const std::string &filename) {
+    std::ofstream stream(filename, std::ios::binary | std::ios::trunc);
+    stream.write(magic, 8);
+    Serialization::write_uint64(stream, version);
+    Serialization::write_uint64(stream, header_size);
+    Serialization::write_uint64(stream, 0);
+    return stream.good();
+}
+
+bool Container::Container::open(const std::string &filename) {
+    // The filename can refer to filename_ when reopening the container.
+    Container container;
+    container.filename_ = filename;
+    *this = Container();
+    std::ifstream stream(container.filename_, std::ios::binary);
+    std::error_code error;
+    uint64_t file_size =
+        std::filesystem::file_size(container.filename_, error);
+    if (error || !read_directory(stream, file_size, &container.members_)) {
+        return false;
+    }
+    *this = std::move(container);
+    return true;
+}
+
+const Container::Member *Container::Container::find(
+    const std::string &name) const {
+    for (const auto &member : members_) {
+        if (member.name == name) {
+            return &member;
+        }
+    }
+    return nullptr;
+}
+
+bool Container::Container::add(const std::string &name, std::istream &data) {
+    // Only one writer can append to the container and update its directory at
+    // a time.
+    ContainerLock lock(filename_);
+    if (!lock.is_locked()) {
+        return false;
+    }
+    std::fstream stream(filename_,
+                        std::ios::binary | std::ios::in | std::ios::out);
+    // Read the directory again, in case the container was modified since it
+    // was opened.
+    stream.seekg(0, std::ios::end);
+    uint64_t file_size = stream.tellg();
+    if (!stream.good() || !read_directory(stream, file_size, &members_)) {
+        return false;
+    }
+
+    // Append the contents of the member.
+    stream.seekp(0, std::ios::end);
+    write_padding(stream, file_size);
+    Member member = {name, file_size + (8 - file_size % 8) % 8, 0};
+    std::vector<char> buffer(1 << 20);
+    while (data.good()) {
+        data.read(buffer.data(), buffer.size());
+        stream.write(buffer.data(), data.gcount());
+        member.size += data.gcount();
+    }
+    if (data.bad()) {
+        return false;
+    }
+
+    // Write the new directory and point the header to it.
+    members_.erase(std::remove_if(members_.begin(), members_.end(),
+                                  [&name](const Member &other) {
+                                      return other.name == name;
+                                  }),
+                   members_.end());
+    members_.push_back(member);
+    uint64_t end = member.offset + member.size;
+    uint64_t directory_offset = end + (8 - end % 8) % 8;
+    write_padding(stream, end);
+    Serialization::write_uint64(stream, members_.size());
+    for (const auto &other : members_) {
+        Serialization::write_string(stream, other.name);
+        Serialization::write_uint64(stream, other.offset);
+        Serialization::write_uint64(stream, other.size);
+    }
+    stream.flush();
+    stream.seekp(16);
+    Serialization::write_uint64(stream, directory_offset);
+    stream.flush();
+    return stream.good();
+}
+
+const uint8_t *Container::Container::map(const Member &member) {
+    if (mappings_.empty() ||
+        mappings_.back().size() < member.offset + member.size) {
+        Mmap::MappedFile file;
+        if (!file.open(filename_) ||
+            file.size() < member.offset + member.size) {
+            return nullptr;
+        }
+        mappings_.push_back(std::move(file));
+    }
+    return mappings_.back().data() + member.offset;
+}
+
+bool Container::split_path(const std::string &path, std::string *filename,
+                           std::string *name) {
+    for (size_t i = 1; i < path.size(); ++i) {
+        if (path[i] != '/' && path[i] != '\\') {
+            continue;
+        }
+        std::string prefix = path.substr(0, i);
+        std::error_code error;
+        auto status = std::filesystem::status(prefix, error);
+        if (std::filesystem::is_directory(status)) {
+            continue;
+        }
+        if (!std::filesystem::is_regular_file(status)) {
+            return false;
+        }
+        std::ifstream stream(prefix, std::ios::binary);
+        char file_magic[8];
+        stream.read(file_magic, sizeof(file_magic));
+        if (!stream.good() || std::memcmp(file_magic, magic, 8) != 0 ||
+            i + 1 >= path.size()) {
+            return false;
+        }
+        *filename = prefix;
+        *name = path.substr(i + 1);
+        std::replace(name->begin(), name->end(), '\\', '/');
+        return true;
+    }
+    return false;
+}
+
+bool Container::open_input(const std::string &path,
+                           Compression::InflateStream &stream) {
+    std::string filename;
+    std::string name;
+    if (!split_path(path, &filename, &name)) {
+        stream.open(path);
+        return stream.good();
+    }
+    Container container;
+    const Member *member = nullptr;
+    if (!container.open(filename) ||
+        (member = container.find(name)) == nullptr) {
+        stream.setstate(std::ios::badbit);
+        return false;
+    }
+    stream.open(filename, member->offset, member->size);
+    return stream.good();
+}
+
+bool Container::open_file(const std::string &path, std::ifstream &stream) {
+    std::string filename;
+    std::string name;
+    if (!split_path(path, &filename, &name)) {
+        stream.open(path, std::ios::binary);
+        return stream.good();
+    }
+    Container container;
+    const Member *member = nullptr;
+    if (!container.open(filename) ||
+        (member = container.find(name)) == nullptr) {
+        stream.setstate(std::ios::badbit);
+        return false;
+    }
+    stream.open(filename, std::ios::binary);
+    stream.seekg(member->offset);
+    return stream.good();
+}
+
+bool Container::OutputFile::open(const std::string &path,
+                                 Compression::Codec::Type _codec, int _level) {
+    codec = _codec;
+    level = _level;
+    if (!split_path(path, &filename, &name)) {
+        filename = path;
+        name.clear();
+        file_stream.open(path, codec, level);
+        return file_stream.good();
+    }
+    Container container;
+    return container.open(filename);
+}
+
+std::ostream &Container::OutputFile::stream() {
+    if (name.empty()) {
+        return file_stream;
+    }
+    return member_stream;
+}
+
+bool Container::OutputFile::close() {
+    if (name.empty()) {
+        file_stream.flush();
+        return file_stream.good();
+    }
+    std::string data = member_stream.str();
+    member_stream.str(std::string());
+    char header[Compression::header_size];
+    Compression::write_header(header, codec, level);
+    std::vector<uint8_t> compressed;
+    if (!Compression::compress_block(
+            reinterpret_cast<const uint8_t *>(data.data()), data.size(), codec,
+            level, compressed)) {
+        return false;
+    }
+    data = std::string(header, Compression::header_size);
+    data.append(reinterpret_cast<const char *>(compressed.data()),
+                compressed.size());
+    std::istringstream data_stream(std::move(data));
+    Container container;
+    return container.open(filename) && container.add(name, data_stream);
+}
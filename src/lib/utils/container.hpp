@@ -0,0 +1,123 @@
+#ifndef UTILS_CONTAINER_HPP
+#define UTILS_CONTAINER_HPP
+
+#include <stdint.h>
+#include <fstream>
+#include <iostream>
+#include <sstream>
+#include <string>
+#include <vector>
+
+#include "utils/compression.hpp"
+#include "utils/mapped_file.hpp"
+
+// This namespace contains the functions to store the files of a project in a
+// single container file. Each member of the container holds the exact
+// contents of a standalone file, so members are compressed independently and
+// uncompressed members can be memory mapped in place.
+//
+// The container starts with a header:
+//
+//     magic                    "PASTAQPC"
+//     version                  uint64
+//     directory_offset         uint64
+//
+// Members are appended after the header, aligned to 8 bytes, followed by a
+// new directory every time the container is modified:
+//
+//     num_members              uint64
+//     members                  num_members * (name, offset, size)
+//
+// where the name is a string and the offset and size are uint64 values. The
+// directory offset in the header is updated last, so readers always find a
+// complete directory, and data referenced by a directory is never overwritten.
+// Any number of readers can use the container while it is being modified.
+// Writers hold an exclusive lock on the file while they append a member and
+// update the directory, so concurrent writes from multiple threads or
+// processes are applied one after the other. Replacing a member leaves the
+// previous contents unused in the file.
+namespace Container {
+
+constexpr char magic[] = "PASTAQPC";
+constexpr uint64_t version = 1;
+constexpr uint64_t header_size = 24;
+
+struct Member {
+    std::string name;
+    uint64_t offset;
+    uint64_t size;
+};
+
+class Container {
+    std::string filename_;
+    std::vector<Member> members_;
+    // The container is mapped again when it grows, keeping the previous
+    // mappings alive for the members already in use.
+    std::vector<Mmap::MappedFile> mappings_;
+
+   public:
+    Container() = default;
+    Container(const Container &) = delete;
+    Container &operator=(const Container &) = delete;
+    Container(Container &&) = default;
+    Container &operator=(Container &&) = default;
+
+    // Create an empty container, replacing the file if it exists.
+    static bool create(const std::string &filename);
+
+    // Open the container and read its directory. Returns false if the file
+    // is not a valid container.
+    bool open(const std::string &filename);
+
+    const std::string &filename() const { return filename_; }
+    const std::vector<Member> &members() const { return members_; }
+
+    // Find the member with the given name. Returns nullptr if it doesn't
+    // exist.
+    const Member *find(const std::string &name) const;
+
+    // Append a member with the contents of the stream, replacing any member
+    // with the same name. The container file is locked while it is modified.
+    bool add(const std::string &name, std::istream &data);
+
+    // Pointer to the contents of the member in the memory mapped container.
+    // The mapping remains valid until the container is closed. Returns
+    // nullptr if the container can't be mapped.
+    const uint8_t *map(const Member &member);
+};
+
+// Split a path inside a container, for example "project.pastaq/peaks/a.peaks",
+// into the container file and the name of the member. Returns false if no
+// parent of the path is a container file.
+bool split_path(const std::string &path, std::string *filename,
+                std::string *name);
+
+// Open a regular file or a member of a container for reading, detecting its
+// compression codec.
+bool open_input(const std::string &path, Compression::InflateStream &stream);
+
+// Open a regular file or a member of a container for random access, with the
+// stream positioned at the start of the file or member.
+bool open_file(const std::string &path, std::ifstream &stream);
+
+// Output file that can be a regular file or a member of a container. The
+// contents of members are kept in memory and added to the container when the
+// file is closed, compressed the same way as a standalone file.
+class OutputFile {
+    std::string filename;
+    std::string name;
+    Compression::Codec::Type codec = Compression::Codec::NONE;
+    int level = 0;
+    Compression::DeflateStream file_stream;
+    std::ostringstream member_stream;
+
+   public:
+    bool open(const std::string &path, Compression::Codec::Type codec,
+              int level);
+    std::ostream &stream();
+    bool close();
+};
+
+}  // namespace Container
+
+#endif /* UTILS_CONTAINER_HPP */
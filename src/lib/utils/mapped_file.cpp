@@ -0,0 +1,116 @@
+#include <utility>
+
+#include "utils/mapped_file.hpp"
+
+#ifdef _WIN32
+#define NOMINMAX
+#include <windows.h>
+#else
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#endif
+
+Mmap::MappedFile::MappedFile(MappedFile &&other) noexcept {
+    *this = std::move(other);
+}
+
+Mmap::MappedFile &Mmap::MappedFile::operator=(MappedFile &&other) noexcept {
+    if (this != &other) {
+        close();
+        std::swap(data_, other.data_);
+        std::swap(size_, other.size_);
+#ifdef _WIN32
+        std::swap(file_handle, other.file_handle);
+        std::swap(mapping_handle, other.mapping_handle);
+#else
+        std::swap(file_descriptor, other.file_descriptor);
+#endif
+    }
+    return *this;
+}
+
+Mmap::MappedFile::~MappedFile() { close(); }
+
+#ifdef _WIN32
+bool Mmap::MappedFile::open(const std::string &filename) {
+    close();
+    file_handle = CreateFileA(filename.c_str(), GENERIC_READ, FILE_SHARE_READ,
+                              nullptr, OPEN_EXISTING, FILE_ATTRIBUTE_NORMAL,
+                              nullptr);
+    if (file_handle == INVALID_HANDLE_VALUE) {
+        file_handle = nullptr;
+        return false;
+    }
+    LARGE_INTEGER file_size;
+    if (!GetFileSizeEx(file_handle, &file_size) || file_size.QuadPart == 0) {
+        close();
+        return false;
+    }
+    mapping_handle = CreateFileMappingA(file_handle, nullptr, PAGE_READONLY, 0,
+                                        0, nullptr);
+    if (mapping_handle == nullptr) {
+        close();
+        return false;
+    }
+    void *view = MapViewOfFile(mapping_handle, FILE_MAP_READ, 0, 0, 0);
+    if (view == nullptr) {
+        close();
+        return false;
+    }
+    data_ = static_cast<const uint8_t *>(view);
+    size_ = file_size.QuadPart;
+    return true;
+}
+
+void Mmap::MappedFile::close() {
+    if (data_ != nullptr) {
+        UnmapViewOfFile(data_);
+    }
+    if (mapping_handle != nullptr) {
+        CloseHandle(mapping_handle);
+    }
+    if (file_handle != nullptr) {
+        CloseHandle(file_handle);
+    }
+    data_ = nullptr;
+    size_ = 0;
+    mapping_handle = nullptr;
+    file_handle = nullptr;
+}
+#else
+bool Mmap::MappedFile::open(const std::string &filename) {
+    close();
+    file_descriptor = ::open(filename.c_str(), O_RDONLY);
+    if (file_descriptor == -1) {
+        return false;
+    }
+    struct stat file_stat;
+    if (fstat(file_descriptor, &file_stat) == -1 || file_stat.st_size == 0) {
+        close();
+        return false;
+    }
+    void *view = mmap(nullptr, file_stat.st_size, PROT_READ, MAP_SHARED,
+                      file_descriptor, 0);
+    if (view == MAP_FAILED) {
+        close();
+        return false;
+    }
+    data_ = static_cast<const uint8_t *>(view);
+    size_ = file_stat.st_size;
+    return true;
+}
+
+void Mmap::MappedFile::close() {
+    if (data_ != nullptr) {
+        munmap(const_cast<uint8_t *>(data_), size_);
+    }
+    if (file_descriptor != -1) {
+        ::close(file_descriptor);
+    }
+    data_ = nullptr;
+    size_ = 0;
+    file_descriptor = -1;
+}
+#endif
@@ -0,0 +1,43 @@
+#ifndef UTILS_MAPPEDFILE_HPP
+#define UTILS_MAPPEDFILE_HPP
+
+#include <stdint.h>
+#include <string>
+
+// This namespace contains a portable wrapper for read only memory mapped
+// files.
+namespace Mmap {
+
+// A file mapped read only into memory. The mapping is released when the
+// object is destroyed. Objects can be moved but not copied.
+class MappedFile {
+    const uint8_t *data_ = nullptr;
+    uint64_t size_ = 0;
+#ifdef _WIN32
+    void *file_handle = nullptr;
+    void *mapping_handle = nullptr;
+#else
+    int file_descriptor = -1;
+#endif
+
+   public:
+    MappedFile() = default;
+    MappedFile(const MappedFile &) = delete;
+    MappedFile &operator=(const MappedFile &) = delete;
+    MappedFile(MappedFile &&other) noexcept;
+    MappedFile &operator=(MappedFile &&other) noexcept;
+    ~MappedFile();
+
+    // Map the given file into memory. Returns false if the file can't be
+    // opened or mapped.
+    bool open(const std::string &filename);
+    void close();
+
+    bool is_open() const { return data_ != nullptr; }
+    const uint8_t *data() const { return data_; }
+    uint64_t size() const { return size_; }
+};
+
+}  // namespace Mmap
+
+#endif /* UTILS_MAPPEDFILE_HPP */
@@ -0,0 +1,168 @@
+#include <cmath>
+#include <cstring>
+
+#include "utils/numpress.hpp"
+
+// Numpress stores the fixed point used to scale the values as a big endian
+// double in the first 8 bytes of the data.
+static double decode_fixed_point(const uint8_t *data) {
+    uint64_t bytes = 0;
+    for (size_t i = 0; i < 8; ++i) {
+        bytes = (bytes << 8) | data[i];
+    }
+    double fixed_point;
+    std::memcpy(&fixed_point, &bytes, sizeof(fixed_point));
+    return fixed_point;
+}
+
+// Reads a 32 bit little endian integer.
+static uint32_t decode_uint32(const uint8_t *data) {
+    return static_cast<uint32_t>(data[0]) |
+           (static_cast<uint32_t>(data[1]) << 8) |
+           (static_cast<uint32_t>(data[2]) << 16) |
+           (static_cast<uint32_t>(data[3]) << 24);
+}
+
+// Integers are encoded as a sequence of half bytes. The first half byte is a
+// header with the number of leading half bytes that are all zeros (0-8) or all
+// ones (9-15, minus 8), which are omitted. The remaining half bytes follow
+// from the least significant to the most significant. `position` and `half`
+// keep track of the current half byte in the data. Returns false if the data
+// ends before the integer is complete.
+static bool decode_int(const uint8_t *data, size_t size, size_t &position,
+                       bool &half, uint32_t &value) {
+    auto next_half_byte = [&]() {
+        uint8_t half_byte = 0;
+        if (!half) {
+            half_byte = data[position] >> 4;
+        } else {
+            half_byte = data[position] & 0xf;
+            ++position;
+        }
+        half = !half;
+        return half_byte;
+    };
+
+    uint8_t header = next_half_byte();
+    size_t num_omitted = header;
+    value = 0;
+    if (header > 8) {
+        num_omitted = header - 8;
+        for (size_t i = 0; i < num_omitted; ++i) {
+            value |= 0xf0000000u >> (4 * i);
+        }
+    }
+    if (num_omitted == 8) {
+        return true;
+    }
+
+    // Check that all the remaining half bytes are in the data.
+    size_t remaining = 8 - num_omitted;
+    if ((2 * position + half + remaining + 1) / 2 > size) {
+        return false;
+    }
+    for (size_t i = 0; i < remaining; ++i) {
+        value |= static_cast<uint32_t>(next_half_byte()) << (4 * i);
+    }
+    return true;
+}
+
+// The last byte of the half byte encoded data is padded with a zero half byte
+// if the number of half bytes is odd.
+static bool is_padding(const uint8_t *data, size_t size, size_t position,
+                       bool half) {
+    return position == size - 1 && half && (data[position] & 0xf) == 0;
+}
+
+bool Numpress::decode_linear(const uint8_t *data, size_t size,
+                             std::vector<double> &output) {
+    output.clear();
+    if (size == 8) {
+        return true;
+    }
+    if (size < 12) {
+        return false;
+    }
+    double fixed_point = decode_fixed_point(data);
+
+    // The first two values are stored as is, the rest are the difference with
+    // the linear extrapolation of the previous two.
+    int64_t previous = 0;
+    int64_t current = decode_uint32(data + 8);
+    output.reserve((size - 8) * 2);
+    output.push_back(current / fixed_point);
+    if (size == 12) {
+        return true;
+    }
+    if (size < 16) {
+        return false;
+    }
+    previous = current;
+    current = decode_uint32(data + 12);
+    output.push_back(current / fixed_point);
+
+    size_t position = 16;
+    bool half = false;
+    while (position < size) {
+        if (is_padding(data, size, position, half)) {
+            break;
+        }
+        uint32_t difference = 0;
+        if (!decode_int(data, size, position, half, difference)) {
+            return false;
+        }
+        int64_t extrapolation = current + (current - previous);
+        previous = current;
+        current = extrapolation + static_cast<int32_t>(difference);
+        output.push_back(current / fixed_point);
+    }
+    return true;
+}
+
+bool Numpress::decode_pic(const uint8_t *data, size_t size,
+                          std::vector<double> &output) {
+    output.clear();
+    output.reserve(size * 2);
+    size_t position = 0;
+    bool half = false;
+    while (position < size) {
+        if (is_padding(data, size, position, half)) {
+            break;
+        }
+        uint32_t value = 0;
+        if (!decode_int(data, size, position, half, value)) {
+            return false;
+        }
+        output.push_back(value);
+    }
+    return true;
+}
+
+bool Numpress::decode_slof(const uint8_t *data, size_t size,
+                           std::vector<double> &output) {
+    output.clear();
+    if (size < 8 || size % 2 != 0) {
+        return false;
+    }
+    double fixed_point = decode_fixed_point(data);
+    output.resize((size - 8) / 2);
+    for (size_t i = 0; i < output.size(); ++i) {
+        uint16_t value = data[8 + 2 * i] | (data[8 + 2 * i + 1] << 8);
+        output[i] = std::exp(value / fixed_point) - 1;
+    }
+    return true;
+}
+
+bool Numpress::decode(Type type, const uint8_t *data, size_t size,
+                      std::vector<double> &output) {
+    switch (type) {
+        case LINEAR:
+            return decode_linear(data, size, output);
+        case PIC:
+            return decode_pic(data, size, output);
+        case SLOF:
+            return decode_slof(data, size, output);
+        default:
+            return false;
+    }
+}
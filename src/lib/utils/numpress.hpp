@@ -0,0 +1,34 @@
+#ifndef UTILS_NUMPRESS_HPP
+#define UTILS_NUMPRESS_HPP
+
+#include <stdint.h>
+#include <vector>
+
+// This namespace contains functions to decode binary data arrays encoded with
+// the MS-Numpress compression schemes (https://github.com/ms-numpress).
+namespace Numpress {
+
+enum Type : uint8_t {
+    NONE = 0,
+    // Linear prediction of the values, used for mz and retention time arrays.
+    LINEAR = 1,
+    // Positive integers, used for ion counts.
+    PIC = 2,
+    // Short logged floats, used for intensities.
+    SLOF = 3,
+};
+
+// Decode `size` bytes of numpress encoded data into the output vector. Returns
+// false if the encoding is not supported or the data is corrupt.
+bool decode(Type type, const uint8_t *data, size_t size,
+            std::vector<double> &output);
+
+bool decode_linear(const uint8_t *data, size_t size,
+                   std::vector<double> &output);
+bool decode_pic(const uint8_t *data, size_t size, std::vector<double> &output);
+bool decode_slof(const uint8_t *data, size_t size,
+                 std::vector<double> &output);
+
+}  // namespace Numpress
+
+#endif /* UTILS_NUMPRESS_HPP */
@@ -1,3 +1,4 @@
+#include <algorithm>
 #include <cstring>
 #include <iostream>
 #include <limits>
@@ -39,21 +40,17 @@ bool Serialization::read_string(std::istream &stream, std::string *value) {
     uint64_t size = 0;
     read_uint64(stream, &size);
     *value = "";
-    for (size_t i = 0; i < size; ++i) {
-        uint8_t read_value = 0;
-        read_uint8(stream, &read_value);
-        value->push_back(read_value);
+    if (!stream.good()) {
+        return false;
     }
-    return stream.good();
+    value->resize(size);
+    return read_block(stream, value->data(), 1, size);
 }
 
 bool Serialization::write_string(std::ostream &stream,
                                  const std::string &value) {
     write_uint64(stream, value.length());
-    for (size_t i = 0; i < value.length(); ++i) {
-        write_uint8(stream, value[i]);
-    }
-    return stream.good();
+    return write_block(stream, value.data(), 1, value.length());
 }
 
 bool Serialization::read_uint8(std::istream &stream, uint8_t *value) {
@@ -234,3 +231,58 @@ bool Serialization::write_double(std::ostream &stream, double value) {
     std::memcpy(&raw_value, &value, sizeof(value));
     return write_uint64(stream, raw_value);
 }
+
+uint64_t Serialization::double_to_bits(double value) {
+    uint64_t bits;
+    std::memcpy(&bits, &value, sizeof(bits));
+    return bits;
+}
+
+double Serialization::bits_to_double(uint64_t bits) {
+    double value;
+    std::memcpy(&value, &bits, sizeof(value));
+    return value;
+}
+
+static bool is_little_endian() {
+    const uint16_t value = 1;
+    return *reinterpret_cast<const uint8_t *>(&value) == 1;
+}
+
+static void swap_byte_order(uint8_t *data, size_t element_size, size_t size) {
+    for (size_t i = 0; i < size; ++i) {
+        std::reverse(data + i * element_size, data + (i + 1) * element_size);
+    }
+}
+
+bool Serialization::read_block(std::istream &stream, void *data,
+                               size_t element_size, size_t size) {
+    auto bytes = static_cast<uint8_t *>(data);
+    stream.read(reinterpret_cast<char *>(bytes), element_size * size);
+    if (!is_little_endian() && element_size > 1) {
+        swap_byte_order(bytes, element_size, size);
+    }
+    return stream.good();
+}
+
+bool Serialization::write_block(std::ostream &stream, const void *data,
+                                size_t element_size, size_t size) {
+    auto bytes = static_cast<const uint8_t *>(data);
+    if (is_little_endian() || element_size == 1) {
+        stream.write(reinterpret_cast<const char *>(bytes),
+                     element_size * size);
+        return stream.good();
+    }
+    // The input can't be modified, so the elements are converted in chunks
+    // through an intermediate buffer.
+    uint8_t buffer[4096];
+    size_t chunk_size = sizeof(buffer) / element_size;
+    for (size_t i = 0; i < size; i += chunk_size) {
+        size_t n = std::min(chunk_size, size - i);
+        std::memcpy(buffer, bytes + i * element_size, n * element_size);
+        swap_byte_order(buffer, element_size, n);
+        stream.write(reinterpret_cast<const char *>(buffer),
+                     n * element_size);
+    }
+    return stream.good();
+}
@@ -3,6 +3,7 @@
 
 #include <iostream>
 #include <stdint.h>
+#include <type_traits>
 #include <vector>
 
 // This namespace contains necessary functions to serialize commonly used types
@@ -57,6 +58,54 @@ bool write_float(std::ostream &stream, float value);
 bool read_double(std::istream &stream, double *value);
 bool write_double(std::ostream &stream, double value);
 
+// Reinterpret the bits of a double as an uint64 and vice versa. Records where
+// all fields are 8 bytes long can be moved to/from the stream in bulk as an
+// array of uint64 values.
+uint64_t double_to_bits(double value);
+double bits_to_double(uint64_t bits);
+
+// Write/read a contiguous block of `size` elements of `element_size` bytes
+// to/from the stream with a single stream operation. On big endian machines
+// the byte order of the elements is swapped in place, in chunks when writing.
+bool read_block(std::istream &stream, void *data, size_t element_size,
+                size_t size);
+bool write_block(std::ostream &stream, const void *data, size_t element_size,
+                 size_t size);
+
+// Write/read an array of numeric values to/from the stream. The values are
+// stored in the same format as the ones written with the functions above for
+// a single value.
+template <typename T>
+bool read_array(std::istream &stream, T *values, size_t size) {
+    static_assert(std::is_arithmetic<T>::value && !std::is_same<T, bool>::value,
+                  "error: only numeric arrays can be read in bulk");
+    return read_block(stream, values, sizeof(T), size);
+}
+template <typename T>
+bool write_array(std::ostream &stream, const T *values, size_t size) {
+    static_assert(std::is_arithmetic<T>::value && !std::is_same<T, bool>::value,
+                  "error: only numeric arrays can be written in bulk");
+    return write_block(stream, values, sizeof(T), size);
+}
+
+// Write/read a vector of numeric values to/from the stream, preceded by the
+// number of elements. The format is the same as the one of the generic vector
+// functions below with the functions for a single value.
+template <typename T>
+bool read_vector(std::istream &stream, std::vector<T> *value) {
+    uint64_t num_elements = 0;
+    if (!read_uint64(stream, &num_elements)) {
+        return false;
+    }
+    *value = std::vector<T>(num_elements);
+    return read_array(stream, value->data(), num_elements);
+}
+template <typename T>
+bool write_vector(std::ostream &stream, const std::vector<T> &value) {
+    write_uint64(stream, value.size());
+    return write_array(stream, value.data(), value.size());
+}
+
 // Write/read a generic vector to/from the stream.
 template <typename T>
 bool read_vector(std::istream &stream, std::vector<T> *value,
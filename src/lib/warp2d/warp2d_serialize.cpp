@@ -6,14 +6,10 @@ bool Warp2D::Serialize::read_time_map(std::istream &stream,
     Serialization::read_uint64(stream, &time_map->num_segments);
     Serialization::read_double(stream, &time_map->rt_min);
     Serialization::read_double(stream, &time_map->rt_max);
-    Serialization::read_vector<double>(stream, &time_map->rt_start,
-                                       Serialization::read_double);
-    Serialization::read_vector<double>(stream, &time_map->rt_end,
-                                       Serialization::read_double);
-    Serialization::read_vector<double>(stream, &time_map->sample_rt_start,
-                                       Serialization::read_double);
-    Serialization::read_vector<double>(stream, &time_map->sample_rt_end,
-                                       Serialization::read_double);
+    Serialization::read_vector(stream, &time_map->rt_start);
+    Serialization::read_vector(stream, &time_map->rt_end);
+    Serialization::read_vector(stream, &time_map->sample_rt_start);
+    Serialization::read_vector(stream, &time_map->sample_rt_end);
     return stream.good();
 }
 
@@ -22,13 +18,9 @@ bool Warp2D::Serialize::write_time_map(std::ostream &stream,
     Serialization::write_uint64(stream, time_map.num_segments);
     Serialization::write_double(stream, time_map.rt_min);
     Serialization::write_double(stream, time_map.rt_max);
-    Serialization::write_vector<double>(stream, time_map.rt_start,
-                                        Serialization::write_double);
-    Serialization::write_vector<double>(stream, time_map.rt_end,
-                                        Serialization::write_double);
-    Serialization::write_vector<double>(stream, time_map.sample_rt_start,
-                                        Serialization::write_double);
-    Serialization::write_vector<double>(stream, time_map.sample_rt_end,
-                                        Serialization::write_double);
+    Serialization::write_vector(stream, time_map.rt_start);
+    Serialization::write_vector(stream, time_map.rt_end);
+    Serialization::write_vector(stream, time_map.sample_rt_start);
+    Serialization::write_vector(stream, time_map.sample_rt_end);
     return stream.good();
 }
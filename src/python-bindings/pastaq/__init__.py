@@ -1,13 +1,16 @@
+import collections
+import concurrent.futures
 import datetime
+import functools
+import hashlib
+import importlib
+import itertools
 import json
 import logging
-import matplotlib.colors as colors
-import matplotlib.gridspec as gridspec
-import matplotlib.pyplot as plt
 import numpy as np
 import os
-import pandas as pd
-import seaborn as sns
+import shutil
+import sys
 import time
 
 # Import the dll or .so containing the bound C++ functions so they are in the pastaq namespace
@@ -17,15 +20,47 @@ from .pastaq import *  # noqa F401, F403
 # so they need to be loaded explicitly for access from python
 # Those _ functions should only be referenced here and are called by higher level python functions with the same
 # name but no underscore
-from .pastaq import _read_mzml, _resample, _find_peaks, _find_local_maxima, _get_fit_failure_errors, _calculate_time_map, _warp_peaks  # noqa F401
+from .pastaq import _read_mzml, _read_raw_multi, _read_raw_lazy, _iter_scans, _resample, _find_peaks, _find_local_maxima, _get_fit_failure_errors, _calculate_time_map, _warp_peaks  # noqa F401
 import pastaq
 
+# The plotting and table building functions are defined in submodules that are
+# only imported when one of them is used, as matplotlib, seaborn and pandas
+# take a long time to import.
+_lazy_attributes = {
+    'plot_mesh': 'plots',
+    'plot_xic': 'plots',
+    'plot_peak_raw_points': 'plots',
+    'generate_qc_plots': 'plots',
+    'to_dataframe': 'tables',
+    'find_sequence_consensus': 'tables',
+    'find_protein_groups': 'tables',
+    'calculate_similarity_matrix': 'tables',
+    'create_quantitative_tables': 'tables',
+}
+
+
+def __getattr__(name):
+    if name in _lazy_attributes:
+        module = importlib.import_module('.' + _lazy_attributes[name], __name__)
+        return getattr(module, name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_lazy_attributes))
+
 
 def read_mzml(input_file, min_mz=-1, max_mz=-1, min_rt=-1, max_rt=-1, instrument_type='ORBITRAP', resolution_ms1=70000,
-              resolution_msn=17500, reference_mz=200, fwhm_rt=9, polarity='+', ms_level=1):
+              resolution_msn=17500, reference_mz=200, fwhm_rt=9, polarity='+', ms_level=1, use_index=True,
+              max_threads=None):
     """Read the mzml file.
 
     The specified sub-region of the file is read as specified by the mz and rt ranges.
+    When an rt range is given and use_index is enabled, the spectrum offsets
+    from the mzML index are used to seek directly to the spectra in range. For
+    files without an index, a sidecar index file ('<input_file>.idx') is built
+    on the first read. Gzip compressed files ('.mzML.gz') are decompressed while
+    reading, but can't use the index.
 
     Args:
         input_file (string): Path to the mzML file
@@ -40,15 +75,129 @@ def read_mzml(input_file, min_mz=-1, max_mz=-1, min_rt=-1, max_rt=-1, instrument
         fwhm_rt (float): fwhm of peaks in the rt dimension
         polarity (string): Polarity of the instrument: can be '+', '-', 'pos', 'neg', '+-', 'both'
         ms_level (int): ms_level of the data
+        use_index (bool): Use the spectrum offset index for rt ranged reads
+        max_threads (int): Maximum number of threads used for decoding the spectra (None for all available cores)
 
     Returns:
         RawData structure over the specified sub-region
     """
+    if max_threads is None:
+        max_threads = os.cpu_count() or 1
     return pastaq._read_mzml(input_file, min_mz, max_mz, min_rt, max_rt, instrument_type, resolution_ms1, resolution_msn,
-                             reference_mz, fwhm_rt, polarity, ms_level)
+                             reference_mz, fwhm_rt, polarity, ms_level, use_index, max_threads)
+
+
+def read_raw_multi(input_file, min_mz=-1, max_mz=-1, min_rt=-1, max_rt=-1, instrument_type='ORBITRAP',
+                   resolution_ms1=70000, resolution_msn=17500, reference_mz=200, fwhm_rt=9, polarity='+',
+                   ms_levels=[1, 2], split_polarity=False, split_faims=False, use_index=True, max_threads=None):
+    """Read the mzXML or mzML file in a single pass, splitting the scans into multiple outputs.
+
+    Scans are split by MS level, and optionally by polarity and FAIMS compensation voltage. When only splitting by MS
+    level, one output is returned for each of the given ms_levels, even if it contains no scans. Gzip compressed files
+    ('.mzXML.gz', '.mzML.gz') are decompressed while reading.
+
+    Args:
+        input_file (string): Path to the mzXML or mzML file
+        min_mz (float): Min of the mz range to import (-1 for all)
+        max_mz (float): Max of the mz range to import (-1 for all)
+        min_rt (float): Min of the rt range to import (-1 for all)
+        max_rt (float): Max of the rt range to import (-1 for all)
+        instrument type (string): Type of instrument - one of ORBITRAP, TOF, QUAD, FTICR
+        resolution_ms1 (float): Resolution of the MS1 spectra at the reference mz value
+        resolution_msn (float): Resolution of the MSN spectra at the reference mz value
+        reference_mz (float): Reference mz where resolution is specified
+        fwhm_rt (float): fwhm of peaks in the rt dimension
+        polarity (string): Polarity of the instrument: can be '+', '-', 'pos', 'neg', '+-', 'both'
+        ms_levels (list of int): ms_levels to extract, each on a separate output
+        split_polarity (bool): Split the scans by polarity
+        split_faims (bool): Split the scans by FAIMS compensation voltage
+        use_index (bool): Use the spectrum offset index for rt ranged reads (mzML only)
+        max_threads (int): Maximum number of threads used for decoding the scans (None for all available cores)
+
+    Returns:
+        List of RawDataOutput, sorted by ms_level, polarity and compensation_voltage. The RawData structure for each
+        output can be accessed with the raw_data attribute.
+    """
+    if max_threads is None:
+        max_threads = os.cpu_count() or 1
+    return pastaq._read_raw_multi(input_file, min_mz, max_mz, min_rt, max_rt, instrument_type, resolution_ms1,
+                                  resolution_msn, reference_mz, fwhm_rt, polarity, ms_levels, split_polarity,
+                                  split_faims, use_index, max_threads)
+
+
+def read_raw_lazy(input_file, min_mz=-1, max_mz=-1, min_rt=-1, max_rt=-1, instrument_type='ORBITRAP',
+                  resolution_ms1=70000, resolution_msn=17500, reference_mz=200, fwhm_rt=9, polarity='+', ms_level=1,
+                  use_index=True, max_cache_mb=256):
+    """Read the scan metadata of the mzXML or mzML file, decoding the peaks of each scan only when it is accessed.
+
+    Only the scan metadata is parsed when reading the file, which is much faster than reading the full raw data when
+    the peaks are not needed, for example for counting scans or looking up precursors. The number of points and the
+    total/max intensity of the metadata scans are the ones reported in the file, before filtering by mz range. The
+    decoded scans are kept in a least recently used cache of up to max_cache_mb. Compressed files are not supported.
+
+    Args:
+        input_file (string): Path to the mzXML or mzML file
+        min_mz (float): Min of the mz range to import (-1 for all)
+        max_mz (float): Max of the mz range to import (-1 for all)
+        min_rt (float): Min of the rt range to import (-1 for all)
+        max_rt (float): Max of the rt range to import (-1 for all)
+        instrument type (string): Type of instrument - one of ORBITRAP, TOF, QUAD, FTICR
+        resolution_ms1 (float): Resolution of the MS1 spectra at the reference mz value
+        resolution_msn (float): Resolution of the MSN spectra at the reference mz value
+        reference_mz (float): Reference mz where resolution is specified
+        fwhm_rt (float): fwhm of peaks in the rt dimension
+        polarity (string): Polarity of the instrument: can be '+', '-', 'pos', 'neg', '+-', 'both'
+        ms_level (int): ms_level of the data
+        use_index (bool): Use the spectrum offset index for rt ranged reads (mzML only)
+        max_cache_mb (int): Maximum size in MB of the peaks kept in the decoded scan cache
+
+    Returns:
+        LazyRawData. The RawData structure with the metadata of the scans can be accessed with the metadata attribute,
+        the decoded scans with scan(i), and the full RawData structure with load().
+    """
+    return pastaq._read_raw_lazy(input_file, min_mz, max_mz, min_rt, max_rt, instrument_type, resolution_ms1,
+                                 resolution_msn, reference_mz, fwhm_rt, polarity, ms_level, use_index, max_cache_mb)
+
+def iter_scans(input_file, min_mz=-1, max_mz=-1, min_rt=-1, max_rt=-1, polarity='+', ms_level=1, chunk_size=None,
+               use_index=True):
+    """Iterate over the scans of the mzXML or mzML file while it is being parsed.
+
+    Only the scans that were parsed but not yet yielded are kept in memory, so files larger than the available memory
+    can be processed. Scans are filtered as in read_mzml/read_mzxml. Gzip compressed files ('.mzXML.gz', '.mzML.gz')
+    are decompressed while reading.
 
+    Args:
+        input_file (string): Path to the mzXML or mzML file
+        min_mz (float): Min of the mz range to import (-1 for all)
+        max_mz (float): Max of the mz range to import (-1 for all)
+        min_rt (float): Min of the rt range to import (-1 for all)
+        max_rt (float): Max of the rt range to import (-1 for all)
+        polarity (string): Polarity of the instrument: can be '+', '-', 'pos', 'neg', '+-', 'both'
+        ms_level (int): ms_level of the data
+        chunk_size (int): If given, yield batches of up to chunk_size scans as NumPy arrays instead of Scan objects
+        use_index (bool): Use the spectrum offset index for rt ranged reads (mzML only)
+
+    Yields:
+        Scan objects in file order. If chunk_size is given, dictionaries of NumPy arrays with the 'scan_number',
+        'ms_level' and 'retention_time' of each scan, and the 'mz' and 'intensity' of all points concatenated. The
+        points of scan i are in the [offsets[i], offsets[i + 1]) range of the 'mz' and 'intensity' arrays, as given by
+        the 'offsets' array.
+    """
+    reader = pastaq._iter_scans(input_file, min_mz, max_mz, min_rt, max_rt, polarity, ms_level, use_index)
+    if chunk_size is None:
+        while True:
+            scans = reader.next_batch(64)
+            if not scans:
+                return
+            yield from scans
+    else:
+        while True:
+            arrays = reader.next_arrays(chunk_size)
+            if arrays is None:
+                return
+            yield arrays
 
-def resample(raw_data, num_samples_mz, num_samples_rt, smoothing_coef_mz, smoothing_coef_rt):
+def resample(raw_data, num_samples_mz, num_samples_rt, smoothing_coef_mz, smoothing_coef_rt, precision='double'):
     """Resample the raw data onto a uniform grid.
 
     Args:
@@ -57,11 +206,13 @@ def resample(raw_data, num_samples_mz, num_samples_rt, smoothing_coef_mz, smooth
         num_samples_rt (int): The number of sub-samples per rt step in the mesh
         smoothing_coef_mz (float): Smoothing coefficient in the mz direction
         smoothing_coef_rt (float): Smoothing coefficient in the rt direction
+        precision (str): Precision of the grid data, 'double' or 'float'.
+            Single precision grids use half the memory
 
     Returns:
         Grid or mesh object
     """
-    return pastaq._resample(raw_data, num_samples_mz, num_samples_rt, smoothing_coef_mz, smoothing_coef_rt)
+    return pastaq._resample(raw_data, num_samples_mz, num_samples_rt, smoothing_coef_mz, smoothing_coef_rt, precision)
 
 
 def find_peaks(raw_data, grid, max_peaks=1000):
@@ -77,6 +228,59 @@ def find_peaks(raw_data, grid, max_peaks=1000):
     """
     return pastaq._find_peaks(raw_data, grid, max_peaks)
 
+def validate_grid_precision(raw_data, peaks, params):
+    """Compare the peaks found on a single precision grid against the ones
+    found with the double precision path.
+
+    Args:
+        raw_data (RawData): The original raw data file
+        peaks (list): The peaks found on the single precision grid
+        params (dict): Parameters used for the resampling and peak detection
+
+    Returns:
+        Dictionary with the number of peaks of each path, the number of local
+        maxima found in both at the same position, the maximum relative error
+        of their height and the similarity between both peak lists
+    """
+    grid = pastaq._resample(
+        raw_data,
+        params['num_samples_mz'],
+        params['num_samples_rt'],
+        params['smoothing_coefficient_mz'],
+        params['smoothing_coefficient_rt'],
+        'double',
+    )
+    reference_peaks = pastaq._find_peaks(raw_data, grid, params['max_peaks'])
+
+    # Local maxima are located on the grid bins, so the same maxima are found
+    # at the exact same coordinates on both grids.
+    reference_heights = {
+        (peak.local_max_mz, peak.local_max_rt): peak.local_max_height
+        for peak in reference_peaks
+    }
+    num_matched = 0
+    max_height_error = 0.0
+    for peak in peaks:
+        key = (peak.local_max_mz, peak.local_max_rt)
+        if key not in reference_heights:
+            continue
+        num_matched += 1
+        reference_height = reference_heights[key]
+        if reference_height != 0:
+            max_height_error = max(max_height_error, abs(
+                peak.local_max_height - reference_height) / reference_height)
+    similarity = pastaq.find_similarity(
+        list(reference_peaks), list(peaks),
+        params.get('similarity_num_peaks', 2000))
+    return {
+        'num_peaks_double': len(reference_peaks),
+        'num_peaks_float': len(peaks),
+        'num_matched': num_matched,
+        'max_height_error': max_height_error,
+        'similarity': similarity.geometric_ratio,
+    }
+
+
 def find_local_maxima(grid):
     """Find local maxima in the grid derived from the raw data.
 
@@ -131,455 +335,6 @@ def warp_peaks(peak_list, time_map):
     return pastaq._warp_peaks(peak_list, time_map)
 
 
-def find_sequence_consensus(annotations, sequence_column, min_consensus_count):
-    consensus = annotations[["cluster_id", "file_id", sequence_column]]
-    consensus = consensus.drop_duplicates()
-    consensus.columns = ["cluster_id", "file_id", "consensus_sequence"]
-    consensus = consensus.groupby(["cluster_id", "consensus_sequence"]).agg(
-        consensus_count=('consensus_sequence', 'count'))
-    max_count = consensus.groupby("cluster_id").max().reset_index()
-    max_count.columns = ["cluster_id", "consensus_count_max"]
-    consensus = pd.merge(consensus.reset_index(), max_count, on="cluster_id")
-    consensus = consensus[consensus["consensus_count"]
-                          == consensus["consensus_count_max"]]
-    # NOTE: Should we ignore annotations when the consensus is ambiguous? For
-    # example, if we have sequence A for 3 samples and sequence B for another 3,
-    # the consensus is "unclear". Furthermore, we might choose to ignore it or
-    # to choose a suitable one. For now we are keeping all annotations even if
-    # that means having ambiguity about the sequence being assigned to a given
-    # isotope/feature cluster.
-    consensus = consensus[consensus["consensus_count"] >= min_consensus_count]
-    consensus = consensus.drop(["consensus_count_max"], axis=1)
-    return consensus
-
-
-def find_protein_groups(
-        feature_data,
-        feature_annotations,
-        sequence_col,
-        protein_col,
-        protein_description_col,
-        min_peptides_number,
-        remove_subset_proteins,
-        ignore_ambiguous_peptides,
-        protein_quant_type,
-        ):
-
-    # Create a list of annotations only with the info we need for protein groups.
-    protein_annotations = feature_annotations[['cluster_id', sequence_col, protein_col, protein_description_col]].copy()
-    protein_annotations = protein_annotations.drop_duplicates().dropna()
-
-    # Assign a unique numeric id for peptide and proteins for faster comparisons.
-    peptide_map = dict(zip(range(0, len(protein_annotations[sequence_col].unique())), protein_annotations[sequence_col].unique()))
-    protein_map = dict(zip(range(0, len(protein_annotations[protein_col].unique())), protein_annotations[protein_col].unique()))
-    peptide_map_df = pd.DataFrame({'peptide_id': peptide_map.keys(), sequence_col: peptide_map.values()})
-    protein_map_df = pd.DataFrame({'protein_id': protein_map.keys(), protein_col: protein_map.values()})
-    protein_annotations = pd.merge(protein_annotations, peptide_map_df)
-    protein_annotations = pd.merge(protein_annotations, protein_map_df)
-    protein_annotations = pd.merge(protein_annotations, protein_annotations)
-
-    # Create a copy of the feature data for aggregation.
-    protein_group_data = feature_data.copy()
-    protein_group_data['protein_group_id'] = -1
-    protein_group_metadata = protein_annotations.copy()
-    protein_group_metadata['protein_group_id'] = -1
-
-    # Initialize graph of protein-peptide nodes.
-    protein_nodes = {}  # protein_id -> [peptide_1, peptide_2...]
-    peptide_nodes = {}  # peptide_id -> [protein_1, protein_2...]
-    for index, row in protein_annotations.iterrows():
-        if row.protein_id not in protein_nodes:
-            protein_nodes[row.protein_id] = set()
-        protein_nodes[row.protein_id].add(row.peptide_id)
-        if row.peptide_id not in peptide_nodes:
-            peptide_nodes[row.peptide_id] = set()
-        peptide_nodes[row.peptide_id].add(row.protein_id)
-
-    def remove_proteins_from_graph(to_be_removed, protein_nodes, peptide_nodes):
-        for protein_id in to_be_removed:
-            for peptide_id in protein_nodes[protein_id]:
-                peptide_nodes[peptide_id] = set([
-                        this_id
-                        for this_id in peptide_nodes[peptide_id]
-                        if this_id != protein_id
-                    ])
-            if len(peptide_nodes[peptide_id]) == 0:
-                del peptide_nodes[peptide_id]
-            del protein_nodes[protein_id]
-
-    # Filter out proteins that don't meet the minimum number of peptides requirement.
-    if min_peptides_number > 1:
-        to_be_removed = []
-        for protein_id, peptide_ids in protein_nodes.items():
-            if len(peptide_ids) < min_peptides_number:
-                to_be_removed += [protein_id]
-        remove_proteins_from_graph(to_be_removed, protein_nodes, peptide_nodes)
-
-    # Remove fully subset proteins.
-    if remove_subset_proteins:
-        subset_proteins = []
-        for protein_id, peptide_ids in protein_nodes.items():
-
-            # Find proteins that share some peptide with this one.
-            target_proteins = set()
-            for peptide_id in peptide_ids:
-                for target_protein in peptide_nodes[peptide_id]:
-                    if target_protein != protein_id:
-                        target_proteins.add(target_protein)
-
-            # Check target proteins to check if peptides are fully contained within
-            # another group.
-            for target_protein in target_proteins:
-                target_peptides = protein_nodes[target_protein]
-                if set(peptide_ids).issubset(target_peptides) and len(peptide_ids) < len(target_peptides):
-                    subset_proteins += [protein_id]
-                    break
-        remove_proteins_from_graph(subset_proteins, protein_nodes, peptide_nodes)
-
-    #
-    # Identify the type of peptide (Unique vs shared) and if razor principle is
-    # applied, to which protein(s) will they be assigned.
-    # - Unique: Only appears on a single protein.
-    # - Shared: The peptide is shared by one or more proteins.
-    # - Razor: Appears on multiple proteins, assigned to the protein with the
-    #          largest number of peptides.
-    # - Ambiguous: When multiple proteins have the exact same number of peptides.
-    #              Has more than one assigned protein.
-    #
-
-    # Initialize protein_peptides
-    protein_peptides = {}
-    for protein_id in protein_nodes.keys():
-        protein_peptides[protein_id] = {
-                'unique': set(),
-                'shared': set(),
-                'razor': set(),
-                'ambiguous': set(),
-            }
-
-    for peptide_id, protein_ids in peptide_nodes.items():
-        if len(protein_ids) == 1:
-            protein_id = list(protein_ids)[0]
-            if protein_id not in protein_peptides:
-                protein_peptides[protein_id] = {
-                        'unique': [peptide_id],
-                        'razor': [],
-                        'ambiguous': [],
-                }
-            else:
-                protein_peptides[protein_id]['unique'].add(peptide_id)
-            continue
-
-        cur_assigned_proteins = []
-        cur_assigned_peptide_count = 0
-        for protein_id in protein_ids:
-            protein_peptides[protein_id]['shared'].add(peptide_id)
-            if len(protein_nodes[protein_id]) == cur_assigned_peptide_count:
-                cur_assigned_proteins += [protein_id]
-            if len(protein_nodes[protein_id]) > cur_assigned_peptide_count:
-                cur_assigned_proteins = [protein_id]
-                cur_assigned_peptide_count = len(protein_nodes[protein_id])
-
-        for protein_id in cur_assigned_proteins:
-            if len(cur_assigned_proteins) > 1:
-                protein_peptides[protein_id]['ambiguous'].add(peptide_id)
-            else:
-                protein_peptides[protein_id]['razor'].add(peptide_id)
-
-    # Find protein groups that contain unique peptides
-    protein_groups = {}
-    protein_group_counter = 0
-    unique_protein_ids = []
-    non_unique_protein_ids = []
-    for protein_id, peptide_ids in protein_nodes.items():
-        unique_found = False
-        for peptide_id in peptide_ids:
-            if len(peptide_nodes[peptide_id]) == 1:
-                unique_protein_ids += [protein_id]
-                unique_found = True
-                protein_groups[protein_group_counter] = set([protein_id])
-                protein_group_counter += 1
-                break
-        if not unique_found:
-            non_unique_protein_ids += [protein_id]
-
-    # Remove unique protein groups from the graph.
-    remove_proteins_from_graph(unique_protein_ids, protein_nodes, peptide_nodes)
-
-    # Group proteins with shared peptides only.
-    explored_proteins = set()
-    for protein_id in non_unique_protein_ids:
-        if protein_id in explored_proteins:
-            continue
-
-        previous_protein_group_size = 0
-        protein_group = set()
-        protein_group.add(protein_id)
-        while previous_protein_group_size != len(protein_group):
-            previous_protein_group_size = len(protein_group)
-            proteins_to_explore = [id for id in protein_group if id not in explored_proteins]
-
-            # Find all proteins associated with all peptides for unexplored proteins.
-            for id in proteins_to_explore:
-                for peptide_id in protein_nodes[id]:
-                    for new_protein in peptide_nodes[peptide_id]:
-                        protein_group.add(new_protein)
-                explored_proteins.add(id)
-
-        # Update protein group list and remove them from the available list.
-        protein_groups[protein_group_counter] = protein_group
-        protein_group_counter += 1
-        remove_proteins_from_graph(list(protein_group), protein_nodes, peptide_nodes)
-
-    # Depending on the selected quantification type, find which peptides should be
-    # used for quantification for each protein group.
-    for protein_group_id, protein_ids in protein_groups.items():
-        selected_peptides = set()
-        for protein_id in protein_ids:
-            for peptide_id in protein_peptides[protein_id]['unique']:
-                selected_peptides.add(peptide_id)
-            if protein_quant_type == 'all':
-                for peptide_id in protein_peptides[protein_id]['shared']:
-                    selected_peptides.add(peptide_id)
-            elif protein_quant_type == 'razor':
-                for peptide_id in protein_peptides[protein_id]['razor']:
-                    selected_peptides.add(peptide_id)
-                if ignore_ambiguous_peptides:
-                    for peptide_id in protein_peptides[protein_id]['ambiguous']:
-                        selected_peptides.add(peptide_id)
-        selected_cluster_ids = protein_annotations.cluster_id[protein_annotations.peptide_id.isin(selected_peptides)].unique()
-        protein_group_data.loc[protein_group_data.cluster_id.isin(selected_cluster_ids), 'protein_group_id'] = protein_group_id
-        # FIXME what is purpose of & below
-        protein_group_metadata.loc[protein_group_metadata.peptide_id.isin(selected_peptides) &
-                                   protein_group_metadata.protein_id.isin(protein_ids), 'protein_group_id'] = protein_group_id
-
-    def aggregate_protein_group_annotations(x):
-        ret = {}
-        if "consensus_sequence" in x:
-            ret["consensus_sequence"] = ".|.".join(
-                np.unique(x['consensus_sequence'].dropna())).strip(".|.")
-        if "consensus_protein_name" in x:
-            ret["consensus_protein_name"] = ".|.".join(
-                np.unique(x['consensus_protein_name'].dropna())).strip(".|.")
-        if "consensus_protein_description" in x:
-            ret["consensus_protein_description"] = ".|.".join(
-                np.unique(x['consensus_protein_description'].dropna())).strip(".|.")
-        return pd.Series(ret)
-
-    protein_group_data = protein_group_data[protein_group_data.protein_group_id != -1]
-    del protein_group_data['cluster_id']
-    protein_group_data = protein_group_data.groupby('protein_group_id').sum().reset_index()
-
-    protein_group_metadata = protein_group_metadata[protein_group_metadata.protein_group_id != -1]
-    del protein_group_metadata['cluster_id']
-    del protein_group_metadata['peptide_id']
-    del protein_group_metadata['protein_id']
-    # protein_group_metdata = protein_group_metadata.drop_duplicates()
-    protein_group_metadata = protein_group_metadata.groupby('protein_group_id')
-    protein_group_metadata = protein_group_metadata.apply(aggregate_protein_group_annotations)
-    protein_group_metadata = protein_group_metadata.reset_index()
-
-    return protein_group_data, protein_group_metadata
-
-
-def plot_mesh(mesh, transform='sqrt', figure=None):
-    """Plot the mesh with side plots showing TIC vs. m/z and retention time.
-
-    The central plot shows the mesh as a colored 2D image with RT vs. m/z.
-    On the right is a plot of total ion current vs. retention matching the y-axis;
-    On the top is a plot of total ion current vs. m/z matchint the x-axis.
-
-    Args:
-        mesh (Grid): Grid of ion current vs. m/z and rt e.g. created by resample
-        transform (string): Optional transform to apply, either sqrt, cubic, or log
-        figure (figure): Optional figure in which to place the plots - otherwise created anew
-
-    Returns:
-        dictionary containing the three created plots with string keys img_plot, mz_plot, rt_plot
-
-    The returned dict need not be used and the entire layout of the three plots will appear if plt.show() is executed.
-
-    """
-
-    plt.style.use('dark_background')
-
-    if figure is None:
-        figure = plt.figure()
-
-    img = mesh.data
-    img = np.reshape(img, (mesh.m, mesh.n))
-    bins_rt = mesh.bins_rt
-    bins_mz = mesh.bins_mz
-
-    plt.figure(figure.number)
-    plt.clf()
-    gs = gridspec.GridSpec(5, 5)
-    mz_plot = plt.subplot(gs[0, :-1])
-    mz_plot.clear()
-    mz_plot.plot(bins_mz, img.sum(axis=0))
-    mz_plot.margins(x=0)
-    mz_plot.set_xticks([])
-    mz_plot.set_ylabel("Intensity")
-
-    rt_plot = plt.subplot(gs[1:, -1])
-    rt_plot.clear()
-    rt_plot.plot(img.sum(axis=1), bins_rt)
-    rt_plot.margins(y=0)
-    rt_plot.set_yticks([])
-    rt_plot.set_xlabel("Intens")
-
-    img_plot = plt.subplot(gs[1:, :-1])
-    offset_rt = (np.array(mesh.bins_rt).max() -
-                 np.array(mesh.bins_rt).min())/mesh.m / 2
-    offset_mz = (np.array(mesh.bins_mz).max() -
-                 np.array(mesh.bins_mz).min())/mesh.n / 2
-    if transform == 'sqrt':
-        img_plot.pcolormesh(
-            np.array(mesh.bins_mz) - offset_mz,
-            np.array(mesh.bins_rt) - offset_rt,
-            img,
-            snap=True,
-            norm=colors.PowerNorm(gamma=1./2.))
-    elif transform == 'cubic':
-        img_plot.pcolormesh(
-            np.array(mesh.bins_mz) - offset_mz,
-            np.array(mesh.bins_rt) - offset_rt,
-            img,
-            norm=colors.PowerNorm(gamma=1./3.))
-    elif transform == 'log':
-        img_plot.pcolormesh(
-            np.array(mesh.bins_mz) - offset_mz,
-            np.array(mesh.bins_rt) - offset_rt,
-            img,
-            norm=colors.LogNorm(vmin=img.min()+1e-8, vmax=img.max()))
-    else:
-        img_plot.pcolormesh(mesh.bins_mz, mesh.bins_rt, img)
-
-    img_plot.set_xlim([np.array(mesh.bins_mz).min() - offset_mz,
-                       np.array(mesh.bins_mz).max() - offset_mz])
-    img_plot.set_ylim([np.array(mesh.bins_rt).min() - offset_rt,
-                       np.array(mesh.bins_rt).max() - offset_rt])
-
-    img_plot.set_xlabel("m/z")
-    img_plot.set_ylabel("retention time (s)")
-
-    return {
-        "img_plot": img_plot,
-        "mz_plot": mz_plot,
-        "rt_plot": rt_plot,
-    }
-
-
-def plot_xic(peak, raw_data, figure=None, method="max"):
-    xic = peak.xic(raw_data, method=method)
-    x = xic.retention_time
-    y = xic.intensity
-    plt.style.use('dark_background')
-    if not figure:
-        figure = plt.figure()
-
-    plt.plot(x, y, label='peak_id = {}'.format(peak.id))
-    plt.xlabel('Retention time (s)')
-    plt.ylabel('Intensity')
-    plt.legend()
-
-    return figure
-
-
-def plot_peak_raw_points(
-        peak,
-        raw_data,
-        img_plot=None,
-        rt_plot=None,
-        mz_plot=None,
-        xic_method="max"):
-    data_points = raw_data.raw_points(
-        peak.roi_min_mz,
-        peak.roi_max_mz,
-        peak.roi_min_rt,
-        peak.roi_max_rt,
-    )
-    rts = data_points.rt
-    mzs = data_points.mz
-    intensities = data_points.intensity
-
-    # Calculate min/max values for the given peak.
-    min_mz = peak.roi_min_mz
-    max_mz = peak.roi_max_mz
-    min_rt = peak.roi_min_rt
-    max_rt = peak.roi_max_rt
-
-    if not img_plot and not rt_plot and not mz_plot:
-        plt.style.use('dark_background')
-        plt.figure()
-        plt.clf()
-        gs = gridspec.GridSpec(5, 5)
-        mz_plot = plt.subplot(gs[0, :-1])
-        mz_plot.margins(x=0)
-        mz_plot.set_xticks([])
-        mz_plot.set_ylabel("Intensity")
-        rt_plot = plt.subplot(gs[1:, -1])
-        rt_plot.margins(y=0)
-        rt_plot.set_yticks([])
-        rt_plot.set_xlabel("Intensity")
-        img_plot = plt.subplot(gs[1:, :-1])
-
-        # Set the min/max limits for mz/rt.
-        mz_plot.set_xlim([min_mz, max_mz])
-        rt_plot.set_ylim([min_rt, max_rt])
-        img_plot.set_xlim([min_mz, max_mz])
-        img_plot.set_ylim([min_rt, max_rt])
-
-    # NOTE: Adding 200 for a more pleasant color map on the first peaks, found
-    # this number by trial and error, dont @ me.
-    np.random.seed(peak.id + 200)
-    color = np.append(np.random.rand(3, 1).flatten(), 0.5)
-    np.random.seed(None)
-
-    if img_plot:
-        img_plot.scatter(
-            mzs, rts,
-            c=np.sqrt(intensities),
-            edgecolor=color,
-        )
-    if rt_plot:
-        xic = peak.xic(raw_data, method=xic_method)
-        x = xic.retention_time
-        y = xic.intensity
-        rt_plot.plot(y, x, color=color)
-    if mz_plot:
-        sort_idx_mz = np.argsort(mzs)
-        markerline, stemlines, baseline = mz_plot.stem(
-            np.array(mzs)[sort_idx_mz],
-            np.array(intensities)[sort_idx_mz],
-            markerfmt=' ',
-        )
-        plt.setp(baseline, color=color, alpha=0.5)
-        plt.setp(stemlines, color=color, alpha=0.5)
-
-    # Set x/y limits if necessary.
-    lim_min_mz, lim_max_mz = img_plot.get_xlim()
-    lim_min_rt, lim_max_rt = img_plot.get_ylim()
-    if min_mz < lim_min_mz:
-        lim_min_mz = min_mz
-    if min_rt < lim_min_rt:
-        lim_min_rt = min_rt
-    if max_mz > lim_max_mz:
-        lim_max_mz = max_mz
-    if max_rt > lim_max_rt:
-        lim_max_rt = max_rt
-    mz_plot.set_xlim([lim_min_mz, lim_max_mz])
-    rt_plot.set_ylim([lim_min_rt, lim_max_rt])
-    img_plot.set_xlim([lim_min_mz, lim_max_mz])
-    img_plot.set_ylim([lim_min_rt, lim_max_rt])
-
-    return {
-        "img_plot": img_plot,
-        "mz_plot": mz_plot,
-        "rt_plot": rt_plot,
-    }
-
-
 # TODO: Probably we don't want avg_fwhm_rt to be a parameter being passed on
 # this function. Just set it to a resonable level for the default parameters and
 # modify it later as needed.
@@ -603,6 +358,12 @@ def default_parameters(instrument='orbitrap', avg_fwhm_rt=9):
             'num_samples_rt': 5,
             'smoothing_coefficient_mz': 0.4,
             'smoothing_coefficient_rt': 0.4,
+            # Options: 'double', 'float'. Single precision grids use half the
+            # memory and bandwidth.
+            'grid_precision': 'double',
+            # Compare the peaks found on single precision grids against the
+            # double precision path and log the differences.
+            'grid_precision_validation': False,
             #
             # Warp2D.
             #
@@ -631,6 +392,53 @@ def default_parameters(instrument='orbitrap', avg_fwhm_rt=9):
             'min_rt': 0,
             'max_rt': 100000,
             #
+            # Storage.
+            #
+            # Compression codec used for the intermediate binary files.
+            # Options: 'zlib', 'none'
+            'compression': 'zlib',
+            # Options: -1 (zlib default), [0-9] (0 is fastest, 9 is smallest)
+            'compression_level': 1,
+            # Uncompressed raw data files can be memory mapped with
+            # 'map_raw_data'. Compressed ones store the scans in independently
+            # compressed blocks, so that ranges can still be read quickly with
+            # 'read_raw_data'.
+            # Options: 'none', 'zlib'
+            'raw_data_compression': 'none',
+            # Directory shared between pipeline runs where the results of
+            # each stage are stored by the hash of their parameters and
+            # inputs. When a result is missing or outdated in the output
+            # directory, it is copied from here if available instead of being
+            # recomputed. Options: None, path to a directory.
+            'cache_dir': None,
+            # Grids saved with 'save_grid' are split in square tiles of this
+            # number of bins, and only the tiles with values above the
+            # threshold are stored. Ranges of tiled grids can be read with
+            # 'read_grid'. A tile size of 0 stores the full grid.
+            'grid_tile_size': 128,
+            'grid_tile_threshold': 0.0,
+            # Number of files processed concurrently in the stages that work
+            # on each file independently: raw data parsing, peak detection,
+            # retention time alignment, feature detection, mzIdentML parsing
+            # and linking. The 'thread' executor relies on the library
+            # releasing the GIL, while 'process' runs each file in a separate
+            # process.
+            # Options: 'thread', 'process'
+            'max_workers': 1,
+            'executor': 'thread',
+            # Files are only processed concurrently while the combined size on
+            # disk of their inputs is below this number of megabytes, which
+            # bounds the memory used by the workers. A file larger than the
+            # limit is processed on its own. Options: 0 (no limit), megabytes.
+            'max_memory': 0,
+            # When files are processed one at a time, peak and feature
+            # detection can read the inputs of the next files and write the
+            # results of the previous ones in the background while the current
+            # file is computed. This is the number of files read ahead, and
+            # of results waiting to be written. Options: 0 (disabled), number
+            # of files.
+            'prefetch_depth': 0,
+            #
             # Annotation linking.
             #
             'link_n_sig_mz': 3,
@@ -720,129 +528,381 @@ def _custom_log(msg, logger):
     print(msg)
 
 
-def parse_raw_files(params, output_dir, logger=None, force_override=False):
-    _custom_log('Starting raw data conversion', logger)
-    time_start = time.time()
+def _compression_args(params, raw_data=False):
+    # Parameter files written by older versions don't have the storage
+    # options.
+    if raw_data:
+        compression = params.get('raw_data_compression', 'none')
+    else:
+        compression = params.get('compression', 'zlib')
+    return {
+        'compression': compression,
+        'compression_level': params.get('compression_level', -1),
+    }
 
-    for file in params['input_files']:
-        raw_path = file['raw_path']
-        stem = file['stem']
 
-        # Check if file has already been processed.
-        out_path = os.path.join(output_dir, 'raw', "{}.ms1".format(stem))
-        if os.path.exists(out_path) and not force_override:
-            continue
+# Each file written by a pipeline stage has a record next to it with the key
+# of the stage that produced it and the hash of its contents. The key is the
+# hash of the parameters of the stage, the contents of its inputs and the
+# library version, so a result is only reused if none of them changed.
+_CACHE_RECORD_EXTENSION = '.cache.json'
+
+
+@functools.lru_cache(maxsize=None)
+def _library_version():
+    # importlib.metadata is only available from Python 3.8, and
+    # packages_distributions from Python 3.10.
+    try:
+        import importlib.metadata as metadata
+    except ImportError:
+        metadata = None
+    if metadata is not None:
+        if hasattr(metadata, 'packages_distributions'):
+            distributions = metadata.packages_distributions().get('pastaq', [])
+        else:
+            distributions = ['pastaq-venus79']
+        for distribution in distributions:
+            try:
+                return metadata.version(distribution)
+            except metadata.PackageNotFoundError:
+                pass
+    # Builds that are not installed as a distribution are identified by the
+    # compiled extension, so that rebuilding the library invalidates the
+    # cached results.
+    return 'extension:{}'.format(_file_hash(sys.modules[__name__ + '.pastaq'].__file__))
+
+
+def _file_hash(path):
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def _read_cache_record(path):
+    # Records are only valid if the file didn't change after writing them.
+    try:
+        with open(path + _CACHE_RECORD_EXTENSION) as record_file:
+            record = json.load(record_file)
+        stat = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    if record.get('size') != stat.st_size or record.get('mtime_ns') != stat.st_mtime_ns:
+        return None
+    return record
+
+
+def _write_cache_record(path, key, file_hash):
+    stat = os.stat(path)
+    record = {
+        'key': key,
+        'hash': file_hash,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+    }
+    with open(path + _CACHE_RECORD_EXTENSION, 'w') as record_file:
+        json.dump(record, record_file)
+
+
+def _artifact_hash(path, external=False):
+    # Files not written by the pipeline, such as the raw data and mzIdentML
+    # files, are identified by their name, size and modification time to
+    # avoid reading them completely on every run.
+    if not os.path.exists(path):
+        return None
+    if external:
+        stat = os.stat(path)
+        return '{}:{}:{}'.format(os.path.basename(path), stat.st_size, stat.st_mtime_ns)
+    record = _read_cache_record(path)
+    if record is not None:
+        return record['hash']
+    return _file_hash(path)
+
+
+def _stage_key(stage, params, param_names, inputs=(), external_inputs=(), extra=None):
+    key = {
+        'stage': stage,
+        'version': _library_version(),
+        'params': {name: params.get(name) for name in param_names},
+        'inputs': [_artifact_hash(path) for path in inputs],
+        'external_inputs': [_artifact_hash(path, external=True) for path in external_inputs],
+        'extra': extra,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def _cache_entry(params, key):
+    cache_dir = params.get('cache_dir')
+    if not cache_dir:
+        return None
+    return os.path.join(cache_dir, key[:2], key)
+
 
-        # File extension.
-        file_extension = os.path.splitext(raw_path)[1]
-
-        # Read raw files (MS1).
-        _custom_log('Reading MS1: {}'.format(raw_path), logger)
-        if file_extension.lower() == '.mzxml':
-            raw_data = pastaq.read_mzxml(
-                raw_path,
-                min_mz=params['min_mz'],
-                max_mz=params['max_mz'],
-                min_rt=params['min_rt'],
-                max_rt=params['max_rt'],
-                instrument_type=params['instrument_type'],
-                resolution_ms1=params['resolution_ms1'],
-                resolution_msn=params['resolution_msn'],
-                reference_mz=params['reference_mz'],
-                fwhm_rt=params['avg_fwhm_rt'],
-                polarity=params['polarity'],
-                ms_level=1,
-            )
-        elif file_extension.lower() == '.mzml':
-            raw_data = pastaq._read_mzml(
-                raw_path,
-                min_mz=params['min_mz'],
-                max_mz=params['max_mz'],
-                min_rt=params['min_rt'],
-                max_rt=params['max_rt'],
-                instrument_type=params['instrument_type'],
-                resolution_ms1=params['resolution_ms1'],
-                resolution_msn=params['resolution_msn'],
-                reference_mz=params['reference_mz'],
-                fwhm_rt=params['avg_fwhm_rt'],
-                polarity=params['polarity'],
-                ms_level=1,
-            )
-
-        # Write raw_data to disk (MS1).
-        _custom_log('Writing MS1: {}'.format(out_path), logger)
-        raw_data.dump(out_path)
-
-    for file in params['input_files']:
-        raw_path = file['raw_path']
-        stem = file['stem']
-
-        # Check if file has already been processed.
-        out_path = os.path.join(output_dir, 'raw', "{}.ms2".format(stem))
-        if os.path.exists(out_path) and not force_override:
+def _is_cached(params, key, out_paths, logger=None, force_override=False):
+    """Check if the outputs of a stage are up to date for the given key.
+
+    Outputs missing in the output directory are restored from the shared
+    cache directory if all of them are available there.
+    """
+    if force_override:
+        return False
+    records = [_read_cache_record(path) for path in out_paths]
+    if all(record is not None and record['key'] == key for record in records):
+        return True
+    entry = _cache_entry(params, key)
+    if entry is None:
+        return False
+    cached_paths = [os.path.join(entry, os.path.basename(path)) for path in out_paths]
+    cached_records = [_read_cache_record(path) for path in cached_paths]
+    if any(record is None or record['key'] != key for record in cached_records):
+        return False
+    for cached_path, cached_record, out_path in zip(cached_paths, cached_records, out_paths):
+        _custom_log('Restoring from cache: {}'.format(out_path), logger)
+        shutil.copyfile(cached_path, out_path)
+        _write_cache_record(out_path, key, cached_record['hash'])
+    return True
+
+
+def _save_to_cache(params, key, out_paths):
+    """Record the key of the stage that produced the given outputs, and store
+    them in the shared cache directory if there is one.
+    """
+    entry = _cache_entry(params, key)
+    if entry is not None:
+        os.makedirs(entry, exist_ok=True)
+    for out_path in out_paths:
+        file_hash = _file_hash(out_path)
+        _write_cache_record(out_path, key, file_hash)
+        if entry is None:
             continue
+        # Copy under a temporary name first, so that concurrent runs never
+        # see partially written files.
+        cached_path = os.path.join(entry, os.path.basename(out_path))
+        tmp_path = '{}.{}.tmp'.format(cached_path, os.getpid())
+        shutil.copyfile(out_path, tmp_path)
+        os.replace(tmp_path, cached_path)
+        _write_cache_record(cached_path, key, file_hash)
+
+
+def _pipeline_artifacts(params, output_dir):
+    # Files written by the per file and matching stages of the pipeline.
+    paths = []
+    for input_file in params['input_files']:
+        stem = input_file['stem']
+        paths += [
+            os.path.join(output_dir, 'raw', "{}.ms1".format(stem)),
+            os.path.join(output_dir, 'raw', "{}.ms2".format(stem)),
+            os.path.join(output_dir, 'peaks', "{}.peaks".format(stem)),
+            os.path.join(output_dir, 'time_map', "{}.tmap".format(stem)),
+            os.path.join(output_dir, 'warped_peaks', "{}.peaks".format(stem)),
+            os.path.join(output_dir, 'features', "{}.features".format(stem)),
+            os.path.join(output_dir, 'ident', "{}.ident".format(stem)),
+            os.path.join(output_dir, 'linking', "{}.peak_ms2.link".format(stem)),
+            os.path.join(output_dir, 'linking', "{}.ident_ms2.link".format(stem)),
+            os.path.join(output_dir, 'linking', "{}.ident_peak.link".format(stem)),
+        ]
+    paths += [
+        os.path.join(output_dir, 'metamatch', "peaks.clusters"),
+        os.path.join(output_dir, 'metamatch', "features.clusters"),
+    ]
+    return paths
+
+
+def _is_stage_current(output_dir, stage, key):
+    # The keys of the stages that combine the results of all files, which are
+    # only recreated as a whole.
+    try:
+        with open(os.path.join(output_dir, 'stages.json')) as stages_file:
+            return json.load(stages_file).get(stage) == key
+    except (OSError, ValueError):
+        return False
+
+
+def _set_stage_key(output_dir, stage, key):
+    stages_path = os.path.join(output_dir, 'stages.json')
+    try:
+        with open(stages_path) as stages_file:
+            stages = json.load(stages_file)
+    except (OSError, ValueError):
+        stages = {}
+    stages[stage] = key
+    with open(stages_path, 'w') as stages_file:
+        json.dump(stages, stages_file)
+
+
+def _input_size(paths):
+    size = 0
+    for path in paths:
+        try:
+            size += os.path.getsize(path)
+        except OSError:
+            pass
+    return size
+
+
+def _process_files(params, output_dir, process_file, input_paths, logger=None, force_override=False, *args):
+    # Runs process_file for each of the input files, with up to
+    # params['max_workers'] files processed concurrently. The size of the files
+    # returned by input_paths is used to estimate the memory needed by each
+    # file, and files are only submitted while the total for the files in
+    # flight is within params['max_memory']. A file larger than the limit is
+    # processed on its own.
+    input_files = params['input_files']
+    max_workers = params.get('max_workers', 1)
+    if max_workers <= 1 or len(input_files) <= 1:
+        for input_file in input_files:
+            process_file(params, output_dir, input_file, logger, force_override, *args)
+        return
 
-        # File extension.
-        file_extension = os.path.splitext(raw_path)[1]
-
-        # Read raw files (MS2).
-        _custom_log('Reading MS2: {}'.format(raw_path), logger)
-        if file_extension.lower() == '.mzxml':
-            raw_data = pastaq.read_mzxml(
-                raw_path,
-                min_mz=params['min_mz'],
-                max_mz=params['max_mz'],
-                min_rt=params['min_rt'],
-                max_rt=params['max_rt'],
-                instrument_type=params['instrument_type'],
-                resolution_ms1=params['resolution_ms1'],
-                resolution_msn=params['resolution_msn'],
-                reference_mz=params['reference_mz'],
-                fwhm_rt=params['avg_fwhm_rt'],
-                polarity=params['polarity'],
-                ms_level=2,
-            )
-        elif file_extension.lower() == '.mzml':
-            raw_data = pastaq._read_mzml(
-                raw_path,
-                min_mz=params['min_mz'],
-                max_mz=params['max_mz'],
-                min_rt=params['min_rt'],
-                max_rt=params['max_rt'],
-                instrument_type=params['instrument_type'],
-                resolution_ms1=params['resolution_ms1'],
-                resolution_msn=params['resolution_msn'],
-                reference_mz=params['reference_mz'],
-                fwhm_rt=params['avg_fwhm_rt'],
-                polarity=params['polarity'],
-                ms_level=2,
-            )
-
-        # Write raw_data to disk (MS2).
-        _custom_log('Writing MS2: {}'.format(out_path), logger)
-        raw_data.dump(out_path)
+    executor = params.get('executor', 'thread')
+    if executor == 'thread':
+        executor_class = concurrent.futures.ThreadPoolExecutor
+    elif executor == 'process':
+        executor_class = concurrent.futures.ProcessPoolExecutor
+    else:
+        raise ValueError("unknown executor: {}".format(executor))
+    max_memory = params.get('max_memory', 0) * 1024 * 1024
 
-    elapsed_time = datetime.timedelta(seconds=time.time()-time_start)
-    _custom_log('Finished raw data parsing in {}'.format(elapsed_time), logger)
+    pending = {}
+    memory = 0
+    with executor_class(max_workers=max_workers) as executor:
+        for input_file in input_files:
+            size = _input_size(input_paths(input_file))
+            while pending and 0 < max_memory < memory + size:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    memory -= pending.pop(future)
+                    future.result()
+            future = executor.submit(
+                process_file, params, output_dir, input_file, logger, force_override, *args)
+            pending[future] = size
+            memory += size
+        for future in concurrent.futures.as_completed(pending):
+            future.result()
+
+
+def _run_steps(steps):
+    # Runs the (read, compute, write) steps for a single file, as returned by
+    # the *_steps functions. They are None when the results are up to date.
+    if steps is None:
+        return
+    read, compute, write = steps
+    write(compute(read()))
+
+
+def _prefetch_files(params, output_dir, file_steps, logger=None, force_override=False, *args):
+    # Processes the input files one at a time, but reads the inputs of the next
+    # files and writes the results of the previous ones on background threads
+    # while the current file is being computed. params['prefetch_depth'] is the
+    # number of files read ahead and of results waiting to be written, which
+    # bounds the memory used.
+    depth = max(params.get('prefetch_depth', 1), 1)
+    steps = (
+        file_steps(params, output_dir, input_file, logger, force_override, *args)
+        for input_file in params['input_files']
+    )
+    steps = (step for step in steps if step is not None)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as reader, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=1) as writer:
+        reads = collections.deque()
+        writes = collections.deque()
+        for read, compute, write in itertools.islice(steps, depth):
+            reads.append((reader.submit(read), compute, write))
+        while reads:
+            data, compute, write = reads.popleft()
+            data = data.result()
+            for read, next_compute, next_write in itertools.islice(steps, 1):
+                reads.append((reader.submit(read), next_compute, next_write))
+            result = compute(data)
+            del data
+            writes.append(writer.submit(write, result))
+            del result
+            while len(writes) > depth:
+                writes.popleft().result()
+        for future in writes:
+            future.result()
+
+
+def _parse_raw_file(params, output_dir, input_file, logger=None, force_override=False):
+    raw_path = input_file['raw_path']
+    stem = input_file['stem']
+
+    # Check if file has already been processed.
+    out_path_ms1 = os.path.join(output_dir, 'raw', "{}.ms1".format(stem))
+    out_path_ms2 = os.path.join(output_dir, 'raw', "{}.ms2".format(stem))
+    key = _stage_key('raw', params, [
+        'min_mz', 'max_mz', 'min_rt', 'max_rt', 'instrument_type',
+        'resolution_ms1', 'resolution_msn', 'reference_mz', 'avg_fwhm_rt',
+        'polarity', 'raw_data_compression', 'compression_level',
+    ], external_inputs=[raw_path])
+    if _is_cached(params, key, [out_path_ms1, out_path_ms2], logger, force_override):
+        return
 
+    # Read raw files (MS1 and MS2) in a single pass.
+    _custom_log('Reading MS1/MS2: {}'.format(raw_path), logger)
+    raw_data_ms1, raw_data_ms2 = [
+        output.raw_data for output in pastaq.read_raw_multi(
+            raw_path,
+            min_mz=params['min_mz'],
+            max_mz=params['max_mz'],
+            min_rt=params['min_rt'],
+            max_rt=params['max_rt'],
+            instrument_type=params['instrument_type'],
+            resolution_ms1=params['resolution_ms1'],
+            resolution_msn=params['resolution_msn'],
+            reference_mz=params['reference_mz'],
+            fwhm_rt=params['avg_fwhm_rt'],
+            polarity=params['polarity'],
+            ms_levels=[1, 2],
+        )
+    ]
 
-def detect_peaks(params, output_dir, save_grid=False, logger=None, force_override=False):
-    # Perform resampling/smoothing and peak detection and save results to disk.
-    _custom_log('Starting peak detection', logger)
+    # Write raw_data to disk (MS1 and MS2).
+    _custom_log('Writing MS1: {}'.format(out_path_ms1), logger)
+    raw_data_ms1.dump(out_path_ms1, **_compression_args(params, True))
+    _custom_log('Writing MS2: {}'.format(out_path_ms2), logger)
+    raw_data_ms2.dump(out_path_ms2, **_compression_args(params, True))
+    _save_to_cache(params, key, [out_path_ms1, out_path_ms2])
+
+
+def parse_raw_files(params, output_dir, logger=None, force_override=False):
+    _custom_log('Starting raw data conversion', logger)
     time_start = time.time()
+    _process_files(
+        params, output_dir, _parse_raw_file,
+        lambda input_file: [input_file['raw_path']], logger, force_override)
+
+    elapsed_time = datetime.timedelta(seconds=time.time()-time_start)
+    _custom_log('Finished raw data parsing in {}'.format(elapsed_time), logger)
 
-    for file in params['input_files']:
-        stem = file['stem']
 
-        # Check if file has already been processed.
-        in_path = os.path.join(output_dir, 'raw', "{}.ms1".format(stem))
-        out_path = os.path.join(output_dir, 'peaks', "{}.peaks".format(stem))
-        if os.path.exists(out_path) and not force_override:
-            continue
+def _peak_detection_steps(params, output_dir, input_file, logger=None, force_override=False, save_grid=False):
+    stem = input_file['stem']
 
+    # Check if file has already been processed.
+    in_path = os.path.join(output_dir, 'raw', "{}.ms1".format(stem))
+    out_path = os.path.join(output_dir, 'peaks', "{}.peaks".format(stem))
+    mesh_path = os.path.join(output_dir, 'grid', "{}.grid".format(stem))
+    param_names = [
+        'num_samples_mz', 'num_samples_rt', 'smoothing_coefficient_mz',
+        'smoothing_coefficient_rt', 'grid_precision', 'max_peaks',
+        'compression', 'compression_level',
+    ]
+    out_paths = [out_path]
+    if save_grid:
+        param_names += ['grid_tile_size', 'grid_tile_threshold']
+        out_paths += [mesh_path]
+    key = _stage_key('peaks', params, param_names, inputs=[in_path])
+    if _is_cached(params, key, out_paths, logger, force_override):
+        return None
+
+    def read():
         _custom_log("Reading raw_data from disk: {}".format(stem), logger)
-        raw_data = pastaq.read_raw_data(in_path)
+        return pastaq.read_raw_data(in_path)
 
+    def compute(raw_data):
         _custom_log("Resampling: {}".format(stem), logger)
         grid = pastaq._resample(
             raw_data,
@@ -850,62 +910,63 @@ def detect_peaks(params, output_dir, save_grid=False, logger=None, force_overrid
             params['num_samples_rt'],
             params['smoothing_coefficient_mz'],
             params['smoothing_coefficient_rt'],
+            params.get('grid_precision', 'double'),
         )
 
-        if save_grid:
-            mesh_path = os.path.join(output_dir, 'grid', "{}.grid".format(stem))
-            _custom_log('Writing grid: {}'.format(mesh_path), logger)
-            grid.dump(mesh_path)
-
         _custom_log("Finding peaks: {}".format(stem), logger)
         peaks = pastaq._find_peaks(raw_data, grid, params['max_peaks'])
+        if grid.precision == 'FLOAT' and params.get('grid_precision_validation', False):
+            _custom_log("Validating grid precision: {}".format(stem), logger)
+            validation = validate_grid_precision(raw_data, peaks, params)
+            _custom_log(
+                "Peaks (double/float/matched): {}/{}/{}, max height error: "
+                "{:.3g}, similarity: {:.6f}".format(
+                    validation['num_peaks_double'],
+                    validation['num_peaks_float'],
+                    validation['num_matched'],
+                    validation['max_height_error'],
+                    validation['similarity'],
+                ), logger)
+        return grid, peaks
+
+    def write(result):
+        grid, peaks = result
+        if save_grid:
+            _custom_log('Writing grid: {}'.format(mesh_path), logger)
+            grid.dump(
+                mesh_path,
+                tile_size=params.get('grid_tile_size', 0),
+                threshold=params.get('grid_tile_threshold', 0.0),
+                **_compression_args(params))
         _custom_log('Writing peaks: {msg}'.format(msg=out_path), logger)
-        pastaq.write_peaks(peaks, out_path)
+        pastaq.write_peaks(peaks, out_path, **_compression_args(params))
+        _save_to_cache(params, key, out_paths)
 
-    elapsed_time = datetime.timedelta(seconds=time.time()-time_start)
-    _custom_log('Finished peak detection in {}'.format(elapsed_time), logger)
+    return read, compute, write
 
 
-def calculate_similarity_matrix(params, output_dir, peak_dir, logger=None, force_override=False):
-    out_path = os.path.join(output_dir, 'quality', 'similarity_{}.csv'.format(peak_dir))
-    if os.path.exists(out_path) and not force_override:
-        return
+def _detect_file_peaks(params, output_dir, input_file, logger=None, force_override=False, save_grid=False):
+    _run_steps(_peak_detection_steps(params, output_dir, input_file, logger, force_override, save_grid))
+
 
-    _custom_log("Starting similarity matrix calculation for {}".format(peak_dir), logger)
+def detect_peaks(params, output_dir, save_grid=False, logger=None, force_override=False):
+    # Perform resampling/smoothing and peak detection and save results to disk.
+    _custom_log('Starting peak detection', logger)
     time_start = time.time()
-    if not os.path.exists("{}.csv".format(out_path)) or force_override:
-        input_files = params['input_files']
-        n_files = len(input_files)
-        similarity_matrix = np.zeros(n_files ** 2).reshape(n_files, n_files)
-        for i in range(0, n_files):
-            stem_a = input_files[i]['stem']
-            peaks_a = pastaq.read_peaks(os.path.join(
-                output_dir, peak_dir, '{}.peaks'.format(stem_a)))
-            for j in range(i, n_files):
-                stem_b = input_files[j]['stem']
-                peaks_b = pastaq.read_peaks(os.path.join(output_dir, peak_dir, '{}.peaks'.format(stem_b)))
-                _custom_log("Calculating similarity of {} vs {}".format(stem_a, stem_b), logger)
-                similarity_matrix[j, i] = pastaq.find_similarity(
-                    peaks_a, peaks_b,
-                    params['similarity_num_peaks']).geometric_ratio
-                similarity_matrix[i, j] = similarity_matrix[j, i]
-        similarity_matrix = pd.DataFrame(similarity_matrix)
-        similarity_matrix_names = [input_file['stem'] for input_file in input_files]
-        similarity_matrix.columns = similarity_matrix_names
-        similarity_matrix.rename(index=dict(zip(range(0, len(similarity_matrix_names), 1), similarity_matrix_names)), inplace=True)
 
-        # Save similarity matrix to disk.
-        _custom_log("Saving similarity matrix for {}: {}".format(peak_dir, out_path), logger)
-        similarity_matrix.to_csv(out_path)
+    if params.get('max_workers', 1) <= 1 and params.get('prefetch_depth', 0) > 0:
+        _prefetch_files(params, output_dir, _peak_detection_steps, logger, force_override, save_grid)
+    else:
+        _process_files(
+            params, output_dir, _detect_file_peaks,
+            lambda input_file: [os.path.join(output_dir, 'raw', '{}.ms1'.format(input_file['stem']))],
+            logger, force_override, save_grid)
 
     elapsed_time = datetime.timedelta(seconds=time.time()-time_start)
-    _custom_log('Finished similarity matrix calculation from {} in {}'.format(peak_dir, elapsed_time), logger)
+    _custom_log('Finished peak detection in {}'.format(elapsed_time), logger)
 
 
-def perform_rt_alignment(params, output_dir, logger=None, force_override=False):
-    warped_sim_path = os.path.join(output_dir, 'quality', 'similarity_warped_peaks.csv')
-    if os.path.exists(warped_sim_path) and not force_override:
-        return
+def _select_reference(params, output_dir, logger=None):
     input_files = params['input_files']
     # Find selected reference samples.
     ref_candidates = []
@@ -960,166 +1021,269 @@ def perform_rt_alignment(params, output_dir, logger=None, force_override=False):
         ref_index = similarity_matrix.sum(axis=1).argmax()
         ref = ref_candidates[ref_index]
         _custom_log("Selected reference: {}".format(ref['stem']), logger)
+    return ref
+
+
+def _warp_file_peaks(params, output_dir, input_file, logger=None, force_override=False, ref_stem=None, ref_peaks=None):
+    stem = input_file['stem']
+    # Check if file has already been processed.
+    ref_path_peaks = os.path.join(output_dir, 'peaks', '{}.peaks'.format(ref_stem))
+    in_path = os.path.join(output_dir, 'peaks', "{}.peaks".format(stem))
+    out_path = os.path.join(output_dir, 'warped_peaks', "{}.peaks".format(stem))
+    out_path_tmap = os.path.join(output_dir, 'time_map', "{}.tmap".format(stem))
+    key = _stage_key(
+        'warp', params, [
+            'warp2d_slack', 'warp2d_window_size', 'warp2d_num_points',
+            'warp2d_rt_expand_factor', 'warp2d_peaks_per_window',
+            'compression', 'compression_level',
+        ], inputs=[ref_path_peaks, in_path], extra=stem == ref_stem)
+    if _is_cached(params, key, [out_path_tmap, out_path], logger, force_override):
+        return
+
+    if isinstance(ref_peaks, SharedData):
+        ref_peaks = _attach_shared_cached(ref_peaks)
+    peaks = pastaq.read_peaks(in_path)
+
+    _custom_log("Calculating time_map for {}".format(stem), logger)
+    time_map = pastaq._calculate_time_map(
+        ref_peaks, peaks,
+        params['warp2d_slack'],
+        params['warp2d_window_size'],
+        params['warp2d_num_points'],
+        params['warp2d_rt_expand_factor'],
+        params['warp2d_peaks_per_window'])
+    pastaq.write_time_map(time_map, out_path_tmap, **_compression_args(params))
+
+    if stem != ref_stem:
+        _custom_log("Warping {} peaks to reference {}".format(stem, ref_stem), logger)
+        peaks = pastaq._warp_peaks(peaks, time_map)
+    pastaq.write_peaks(peaks, out_path, **_compression_args(params))
+    _save_to_cache(params, key, [out_path_tmap, out_path])
+
+
+def perform_rt_alignment(params, output_dir, logger=None, force_override=False):
+    input_files = params['input_files']
+    warp_params = [
+        'warp2d_slack', 'warp2d_window_size', 'warp2d_num_points',
+        'warp2d_rt_expand_factor', 'warp2d_peaks_per_window',
+    ]
+
+    # The reference is selected comparing the peaks of all files, so the
+    # selection is stored and only repeated if any of them change.
+    ref_path = os.path.join(output_dir, 'time_map', 'reference.json')
+    ref_key = _stage_key('reference', params, warp_params + ['similarity_num_peaks'], inputs=[
+        os.path.join(output_dir, 'peaks', '{}.peaks'.format(input_file['stem']))
+        for input_file in input_files
+    ], extra=[
+        [input_file['stem'], bool(input_file.get('reference', False))]
+        for input_file in input_files
+    ])
+    if _is_cached(params, ref_key, [ref_path], logger, force_override):
+        with open(ref_path) as ref_file:
+            ref_stem = json.load(ref_file)['reference']
+        _custom_log("Using previously selected reference: {}".format(ref_stem), logger)
+    else:
+        ref_stem = _select_reference(params, output_dir, logger)['stem']
+        with open(ref_path, 'w') as ref_file:
+            json.dump({'reference': ref_stem}, ref_file)
+        _save_to_cache(params, ref_key, [ref_path])
 
     _custom_log("Starting peak warping to reference", logger)
     time_start = time.time()
-    ref_stem = ref['stem']
     ref_peaks = pastaq.read_peaks(os.path.join(output_dir, 'peaks', '{}.peaks'.format(ref_stem)))
-    for input_file in input_files:
-        stem = input_file['stem']
-        # Check if file has already been processed.
-        in_path = os.path.join(output_dir, 'peaks', "{}.peaks".format(stem))
-        out_path = os.path.join(output_dir, 'warped_peaks', "{}.peaks".format(stem))
-        out_path_tmap = os.path.join(output_dir, 'time_map', "{}.tmap".format(stem))
-
-        peaks = pastaq.read_peaks(in_path)
-
-        if not os.path.exists(out_path_tmap) or force_override:
-            _custom_log("Calculating time_map for {}".format(stem), logger)
-            time_map = pastaq._calculate_time_map(
-                ref_peaks, peaks,
-                params['warp2d_slack'],
-                params['warp2d_window_size'],
-                params['warp2d_num_points'],
-                params['warp2d_rt_expand_factor'],
-                params['warp2d_peaks_per_window'])
-            pastaq.write_time_map(time_map, out_path_tmap)
-
-        if os.path.exists(out_path) and not force_override:
-            continue
-        if stem != ref_stem:
-            _custom_log("Warping {} peaks to reference {}".format(stem, ref_stem), logger)
-            peaks = pastaq._warp_peaks(peaks, time_map)
-        pastaq.write_peaks(peaks, out_path)
+    # Worker processes read the reference peaks from shared memory, instead of
+    # receiving a pickled copy for each file.
+    if params.get('max_workers', 1) > 1 and params.get('executor', 'thread') == 'process':
+        ref_peaks = export_shared(ref_peaks)
+    try:
+        _process_files(
+            params, output_dir, _warp_file_peaks,
+            lambda input_file: [os.path.join(output_dir, 'peaks', '{}.peaks'.format(input_file['stem']))],
+            logger, force_override, ref_stem, ref_peaks)
+    finally:
+        if isinstance(ref_peaks, SharedData):
+            _attached_shared.pop(ref_peaks.name, None)
+            ref_peaks.close()
 
     elapsed_time = datetime.timedelta(seconds=time.time()-time_start)
     _custom_log('Finished peak warping to reference in {}'.format(elapsed_time), logger)
 
 
-def perform_feature_detection(params, output_dir, logger=None, force_override=False):
-    _custom_log('Starting feature detection', logger)
-    time_start = time.time()
-    for input_file in params['input_files']:
-        stem = input_file['stem']
-        # Check if file has already been processed.
-        in_path_peaks = os.path.join(output_dir, 'warped_peaks', '{}.peaks'.format(stem))
-        out_path = os.path.join(output_dir, 'features', '{}.features'.format(stem))
-        if os.path.exists(out_path) and not force_override:
-            continue
+def _feature_detection_steps(params, output_dir, input_file, logger=None, force_override=False):
+    stem = input_file['stem']
+    # Check if file has already been processed.
+    in_path_peaks = os.path.join(output_dir, 'warped_peaks', '{}.peaks'.format(stem))
+    out_path = os.path.join(output_dir, 'features', '{}.features'.format(stem))
+    key = _stage_key('features', params, [
+        'feature_detection_charge_states', 'compression', 'compression_level',
+    ], inputs=[in_path_peaks])
+    if _is_cached(params, key, [out_path], logger, force_override):
+        return None
 
+    def read():
         _custom_log("Reading peaks from disk: {}".format(stem), logger)
-        peaks = pastaq.read_peaks(in_path_peaks)
+        return pastaq.read_peaks(in_path_peaks)
 
+    def compute(peaks):
         _custom_log("Performing feature_detection: {}".format(stem), logger)
-        features = pastaq.detect_features(
+        return pastaq.detect_features(
             peaks, params['feature_detection_charge_states'])
+
+    def write(features):
         _custom_log('Writing features: {}'.format(out_path), logger)
-        pastaq.write_features(features, out_path)
+        pastaq.write_features(features, out_path, **_compression_args(params))
+        _save_to_cache(params, key, [out_path])
+
+    return read, compute, write
+
+
+def _detect_file_features(params, output_dir, input_file, logger=None, force_override=False):
+    _run_steps(_feature_detection_steps(params, output_dir, input_file, logger, force_override))
+
+
+def perform_feature_detection(params, output_dir, logger=None, force_override=False):
+    _custom_log('Starting feature detection', logger)
+    time_start = time.time()
+    if params.get('max_workers', 1) <= 1 and params.get('prefetch_depth', 0) > 0:
+        _prefetch_files(params, output_dir, _feature_detection_steps, logger, force_override)
+    else:
+        _process_files(
+            params, output_dir, _detect_file_features,
+            lambda input_file: [os.path.join(output_dir, 'warped_peaks', '{}.peaks'.format(input_file['stem']))],
+            logger, force_override)
 
     elapsed_time = datetime.timedelta(seconds=time.time()-time_start)
     _custom_log('Finished feature detection in {}'.format(elapsed_time), logger)
 
 
+def _parse_mzidentml_file(params, output_dir, input_file, logger=None, force_override=False):
+    stem = input_file['stem']
+    in_path = input_file['ident_path']
+    out_path = os.path.join(output_dir, 'ident', "{}.ident".format(stem))
+    if in_path == 'none':
+        return
+    key = _stage_key('ident', params, [
+        'ident_ignore_decoy', 'ident_require_threshold', 'ident_max_rank_only',
+        'min_mz', 'max_mz', 'min_rt', 'max_rt', 'compression', 'compression_level',
+    ], external_inputs=[in_path])
+    if _is_cached(params, key, [out_path], logger, force_override):
+        return
+    _custom_log('Reading mzIdentML: {}'.format(in_path), logger)
+    # TODO: We may want to add an option to pass a prefix for ignoring
+    # decoys when they are not properly annotated, for example in msfragger
+    # + idconvert
+    ident_data = pastaq.read_mzidentml(
+        in_path,
+        ignore_decoy=params['ident_ignore_decoy'],
+        require_threshold=params['ident_require_threshold'],
+        max_rank_only=params['ident_max_rank_only'],
+        min_mz=params['min_mz'],
+        max_mz=params['max_mz'],
+        min_rt=params['min_rt'],
+        max_rt=params['max_rt'],
+    )
+    _custom_log('Writing ident data: {}'.format(out_path), logger)
+    pastaq.write_ident_data(ident_data, out_path, **_compression_args(params))
+    _save_to_cache(params, key, [out_path])
+
+
 def parse_mzidentml_files(params, output_dir, logger=None, force_override=False):
     _custom_log('Starting mzIdentML parsing', logger)
     time_start = time.time()
-    for input_file in params['input_files']:
-        stem = input_file['stem']
-        in_path = input_file['ident_path']
-        out_path = os.path.join(output_dir, 'ident', "{}.ident".format(stem))
-        if in_path == 'none' or (os.path.exists(out_path) and not force_override):
-            continue
-        _custom_log('Reading mzIdentML: {}'.format(in_path), logger)
-        # TODO: We may want to add an option to pass a prefix for ignoring
-        # decoys when they are not properly annotated, for example in msfragger
-        # + idconvert
-        ident_data = pastaq.read_mzidentml(
-            in_path,
-            ignore_decoy=params['ident_ignore_decoy'],
-            require_threshold=params['ident_require_threshold'],
-            max_rank_only=params['ident_max_rank_only'],
-            min_mz=params['min_mz'],
-            max_mz=params['max_mz'],
-            min_rt=params['min_rt'],
-            max_rt=params['max_rt'],
-        )
-        _custom_log('Writing ident data: {}'.format(out_path), logger)
-        pastaq.write_ident_data(ident_data, out_path)
+    _process_files(
+        params, output_dir, _parse_mzidentml_file,
+        lambda input_file: [input_file['ident_path']], logger, force_override)
 
     elapsed_time = datetime.timedelta(seconds=time.time()-time_start)
     _custom_log('Finished mzIdentML parsing in {}'.format(elapsed_time), logger)
 
 
+def _link_file_peaks_msms_idents(params, output_dir, input_file, logger=None, force_override=False):
+    stem = input_file['stem']
+
+    # Check if file has already been processed.
+    in_path_raw = os.path.join(output_dir, 'raw', "{}.ms2".format(stem))
+    in_path_peaks = os.path.join(output_dir, 'warped_peaks', "{}.peaks".format(stem))
+    in_path_idents = os.path.join(output_dir, 'ident', "{}.ident".format(stem))
+    out_path_peak_ms2 = os.path.join(output_dir, 'linking', "{}.peak_ms2.link".format(stem))
+    out_path_ident_ms2 = os.path.join(output_dir, 'linking', "{}.ident_ms2.link".format(stem))
+    out_path_psm = os.path.join(output_dir, 'linking', "{}.ident_peak.link".format(stem))
+
+    raw_data = None
+    peaks = None
+    ident_data = None
+    link_params = ['link_n_sig_mz', 'link_n_sig_rt', 'compression', 'compression_level']
+
+    key = _stage_key('peak_ms2', params, link_params, inputs=[in_path_peaks, in_path_raw])
+    if not _is_cached(params, key, [out_path_peak_ms2], logger, force_override):
+        _custom_log("Performing peaks-msms linkage: {}".format(stem), logger)
+        if raw_data is None:
+            raw_data = pastaq.read_raw_data(in_path_raw)
+        if peaks is None:
+            peaks = pastaq.read_peaks(in_path_peaks)
+        linked_msms = pastaq.link_peaks(
+                peaks,
+                raw_data,
+                params['link_n_sig_mz'],
+                params['link_n_sig_rt'],
+        )
+        _custom_log('Writing linked_msms: {}'.format(out_path_peak_ms2), logger)
+        pastaq.write_linked_msms(linked_msms, out_path_peak_ms2, **_compression_args(params))
+        _save_to_cache(params, key, [out_path_peak_ms2])
+
+    # Check that we had identification info.
+    if input_file['ident_path'] == 'none':
+        return
+
+    key = _stage_key('ident_ms2', params, link_params, inputs=[in_path_idents, in_path_raw])
+    if not _is_cached(params, key, [out_path_ident_ms2], logger, force_override):
+        _custom_log("Performing ident-msms linkage: {}".format(stem), logger)
+        if ident_data is None:
+            ident_data = pastaq.read_ident_data(in_path_idents)
+        if raw_data is None:
+            raw_data = pastaq.read_raw_data(in_path_raw)
+
+        linked_idents = pastaq.link_idents(
+                ident_data,
+                raw_data,
+                params['link_n_sig_mz'],
+                params['link_n_sig_rt'],
+        )
+        _custom_log('Writing linked_msms: {}'.format(out_path_ident_ms2), logger)
+        pastaq.write_linked_msms(linked_idents, out_path_ident_ms2, **_compression_args(params))
+        _save_to_cache(params, key, [out_path_ident_ms2])
+
+    key = _stage_key('ident_peak', params, link_params, inputs=[in_path_idents, in_path_peaks, in_path_raw])
+    if not _is_cached(params, key, [out_path_psm], logger, force_override):
+        _custom_log("Performing ident-peaks linkage: {}".format(stem), logger)
+        if ident_data is None:
+            ident_data = pastaq.read_ident_data(in_path_idents)
+        if raw_data is None:
+            raw_data = pastaq.read_raw_data(in_path_raw)
+        if peaks is None:
+            peaks = pastaq.read_peaks(in_path_peaks)
+        linked_psm = pastaq.link_psm(
+                ident_data,
+                peaks,
+                raw_data,
+                params['link_n_sig_mz'],
+                params['link_n_sig_rt'],
+        )
+        _custom_log('Writing linked_psm: {}'.format(out_path_psm), logger)
+        pastaq.write_linked_psm(linked_psm, out_path_psm, **_compression_args(params))
+        _save_to_cache(params, key, [out_path_psm])
+
+
 def link_peaks_msms_idents(params, output_dir, logger=None, force_override=False):
     _custom_log('Starting ident/msms linkage', logger)
     time_start = time.time()
-    for input_file in params['input_files']:
-        stem = input_file['stem']
-
-        # Check if file has already been processed.
-        in_path_raw = os.path.join(output_dir, 'raw', "{}.ms2".format(stem))
-        in_path_peaks = os.path.join(output_dir, 'warped_peaks', "{}.peaks".format(stem))
-        in_path_idents = os.path.join(output_dir, 'ident', "{}.ident".format(stem))
-        out_path_peak_ms2 = os.path.join(output_dir, 'linking', "{}.peak_ms2.link".format(stem))
-        out_path_ident_ms2 = os.path.join(output_dir, 'linking', "{}.ident_ms2.link".format(stem))
-        out_path_psm = os.path.join(output_dir, 'linking', "{}.ident_peak.link".format(stem))
-
-        raw_data = None
-        peaks = None
-        ident_data = None
-
-        if not os.path.exists(out_path_peak_ms2) or force_override:
-            _custom_log("Performing peaks-msms linkage: {}".format(stem), logger)
-            if raw_data is None:
-                raw_data = pastaq.read_raw_data(in_path_raw)
-            if peaks is None:
-                peaks = pastaq.read_peaks(in_path_peaks)
-            linked_msms = pastaq.link_peaks(
-                    peaks,
-                    raw_data,
-                    params['link_n_sig_mz'],
-                    params['link_n_sig_rt'],
-            )
-            _custom_log('Writing linked_msms: {}'.format(out_path_peak_ms2), logger)
-            pastaq.write_linked_msms(linked_msms, out_path_peak_ms2)
-
-        # Check that we had identification info.
-        if input_file['ident_path'] == 'none':
-            continue
-
-        if not os.path.exists(out_path_ident_ms2) or force_override:
-            _custom_log("Performing ident-msms linkage: {}".format(stem), logger)
-            if ident_data is None:
-                ident_data = pastaq.read_ident_data(in_path_idents)
-            if raw_data is None:
-                raw_data = pastaq.read_raw_data(in_path_raw)
-
-            linked_idents = pastaq.link_idents(
-                    ident_data,
-                    raw_data,
-                    params['link_n_sig_mz'],
-                    params['link_n_sig_rt'],
-            )
-            _custom_log('Writing linked_msms: {}'.format(out_path_ident_ms2), logger)
-            pastaq.write_linked_msms(linked_idents, out_path_ident_ms2)
-
-        if not os.path.exists(out_path_psm) or force_override:
-            _custom_log("Performing ident-peaks linkage: {}".format(stem), logger)
-            if ident_data is None:
-                ident_data = pastaq.read_ident_data(in_path_idents)
-            if raw_data is None:
-                raw_data = pastaq.read_raw_data(in_path_raw)
-            if peaks is None:
-                peaks = pastaq.read_peaks(in_path_peaks)
-            linked_psm = pastaq.link_psm(
-                    ident_data,
-                    peaks,
-                    raw_data,
-                    params['link_n_sig_mz'],
-                    params['link_n_sig_rt'],
-            )
-            _custom_log('Writing linked_psm: {}'.format(out_path_psm), logger)
-            pastaq.write_linked_psm(linked_psm, out_path_psm)
+    _process_files(
+        params, output_dir, _link_file_peaks_msms_idents,
+        lambda input_file: [
+            os.path.join(output_dir, 'raw', '{}.ms2'.format(input_file['stem'])),
+            os.path.join(output_dir, 'warped_peaks', '{}.peaks'.format(input_file['stem'])),
+            os.path.join(output_dir, 'ident', '{}.ident'.format(input_file['stem'])),
+        ], logger, force_override)
 
     elapsed_time = datetime.timedelta(seconds=time.time()-time_start)
     _custom_log('Finished ident/msms linkage in {}'.format(elapsed_time), logger)
@@ -1146,7 +1310,15 @@ def match_peaks_and_features(params, output_dir, logger=None, force_override=Fal
     time_start = time.time()
     in_path_peaks = os.path.join(output_dir, 'warped_peaks')
     out_path = os.path.join(output_dir, 'metamatch', "peaks.clusters")
-    if (not os.path.exists(out_path) or force_override):
+    metamatch_params = [
+        'metamatch_fraction', 'metamatch_n_sig_mz', 'metamatch_n_sig_rt',
+        'compression', 'compression_level',
+    ]
+    key = _stage_key('peak_clusters', params, metamatch_params, inputs=[
+        os.path.join(in_path_peaks, "{}.peaks".format(input_file['stem']))
+        for input_file in input_files
+    ], extra=groups)
+    if not _is_cached(params, key, [out_path], logger, force_override):
         _custom_log("Reading peaks from disk", logger)
         peaks = [
             pastaq.read_peaks(os.path.join(in_path_peaks, "{}.peaks".format(input_file['stem'])))
@@ -1160,7 +1332,8 @@ def match_peaks_and_features(params, output_dir, logger=None, force_override=Fal
             params["metamatch_n_sig_mz"],
             params["metamatch_n_sig_rt"])
         _custom_log("Writing peak clusters to disk", logger)
-        pastaq.write_peak_clusters(peak_clusters, out_path)
+        pastaq.write_peak_clusters(peak_clusters, out_path, **_compression_args(params))
+        _save_to_cache(params, key, [out_path])
     elapsed_time = datetime.timedelta(seconds=time.time()-time_start)
     _custom_log('Finished peak matching in {}'.format(elapsed_time), logger)
 
@@ -1169,7 +1342,11 @@ def match_peaks_and_features(params, output_dir, logger=None, force_override=Fal
     time_start = time.time()
     in_path_features = os.path.join(output_dir, 'features')
     out_path = os.path.join(output_dir, 'metamatch', "features.clusters")
-    if (not os.path.exists(out_path) or force_override):
+    key = _stage_key('feature_clusters', params, metamatch_params, inputs=[
+        os.path.join(in_path_features, "{}.features".format(input_file['stem']))
+        for input_file in input_files
+    ], extra=groups)
+    if not _is_cached(params, key, [out_path], logger, force_override):
         _custom_log("Reading features from disk", logger)
         features = [
             pastaq.read_features(os.path.join(in_path_features, "{}.features".format(input_file['stem'])))
@@ -1183,656 +1360,12 @@ def match_peaks_and_features(params, output_dir, logger=None, force_override=Fal
             params["metamatch_n_sig_mz"],
             params["metamatch_n_sig_rt"])
         _custom_log("Writing feature clusters to disk", logger)
-        pastaq.write_feature_clusters(feature_clusters, out_path)
+        pastaq.write_feature_clusters(feature_clusters, out_path, **_compression_args(params))
+        _save_to_cache(params, key, [out_path])
     elapsed_time = datetime.timedelta(seconds=time.time()-time_start)
     _custom_log('Finished feature matching in {}'.format(elapsed_time), logger)
 
 
-# NOTE: This is a giant ball of spaghetti and could use some love.
-def create_quantitative_tables(params, output_dir, logger=None, force_override=False):
-    input_files = params['input_files']
-
-    _custom_log('Starting creation of quantitative tables', logger)
-    time_start = time.time()
-    for input_file in input_files:
-        stem = input_file['stem']
-        # Peak quantification.
-        # ====================
-        in_path_peaks = os.path.join(output_dir, 'warped_peaks', "{}.peaks".format(stem))
-        in_path_peaks_link = os.path.join(output_dir, 'linking', "{}.peak_ms2.link".format(stem))
-        in_path_ident_link_msms = os.path.join(output_dir, 'linking', "{}.ident_ms2.link".format(stem))
-        in_path_ident_link_theomz = os.path.join(output_dir, 'linking', "{}.ident_peak.link".format(stem))
-        in_path_ident_data = os.path.join(output_dir, 'ident', "{}.ident".format(stem))
-        out_path_peaks = os.path.join(output_dir, 'quant', "{}_peaks.csv".format(stem))
-        out_path_peak_annotations = os.path.join(output_dir, 'quant', "{}_peak_annotations.csv".format(stem))
-
-        # TODO: This is probably not necessary or needs to be changed if we are
-        # doing all per-peak quantification in a single loop.
-        if os.path.exists(out_path_peaks) and not force_override:
-            continue
-
-        _custom_log("Reading peaks from disk: {}".format(stem), logger)
-        peaks = pastaq.read_peaks(in_path_peaks)
-
-        _custom_log("Generating peaks quantitative table", logger)
-        peaks_df = pd.DataFrame({
-            'peak_id': [peak.id for peak in peaks],
-            'mz': [peak.fitted_mz for peak in peaks],
-            'rt': [peak.fitted_rt for peak in peaks],
-            'rt_delta': [peak.rt_delta for peak in peaks],
-            'height': [peak.fitted_height for peak in peaks],
-            'sigma_mz': [peak.fitted_sigma_mz for peak in peaks],
-            'sigma_rt': [peak.fitted_sigma_rt for peak in peaks],
-            'volume': [peak.fitted_volume for peak in peaks],
-            'smooth_height': [peak.local_max_height for peak in peaks],
-            'smooth_mz': [peak.local_max_mz for peak in peaks],
-            'smooth_rt': [peak.local_max_rt for peak in peaks],
-            'roi_min_mz': [peak.roi_min_mz for peak in peaks],
-            'roi_max_mz': [peak.roi_max_mz for peak in peaks],
-            'roi_min_rt': [peak.roi_min_rt for peak in peaks],
-            'roi_max_rt': [peak.roi_max_rt for peak in peaks],
-            'raw_mean_mz': [peak.raw_roi_mean_mz for peak in peaks],
-            'raw_mean_rt': [peak.raw_roi_mean_rt for peak in peaks],
-            'raw_std_mz': [peak.raw_roi_sigma_mz for peak in peaks],
-            'raw_std_rt': [peak.raw_roi_sigma_rt for peak in peaks],
-            'raw_skewness_mz': [peak.raw_roi_skewness_mz for peak in peaks],
-            'raw_skewness_rt': [peak.raw_roi_skewness_rt for peak in peaks],
-            'raw_kurtosis_mz': [peak.raw_roi_kurtosis_mz for peak in peaks],
-            'raw_kurtosis_rt': [peak.raw_roi_kurtosis_rt for peak in peaks],
-            'raw_total_intensity': [peak.raw_roi_total_intensity for peak in peaks],
-            'num_points': [peak.raw_roi_num_points for peak in peaks],
-            'num_scans': [peak.raw_roi_num_scans for peak in peaks],
-        })
-
-        # Peak Annotations.
-        # =================
-        _custom_log("Reading linked peaks from disk: {}".format(stem), logger)
-        peak_annotations = peaks_df[["peak_id"]]
-        linked_peaks = pastaq.read_linked_msms(in_path_peaks_link)
-        linked_peaks = pd.DataFrame({
-            'peak_id': [linked_peak.entity_id for linked_peak in linked_peaks],
-            'msms_id': [linked_peak.msms_id for linked_peak in linked_peaks],
-        })
-        peak_annotations = pd.merge(
-            peak_annotations, linked_peaks, on="peak_id", how="left")
-
-        if os.path.isfile(in_path_ident_data):
-            _custom_log("Reading ident_data from disk: {}".format(stem), logger)
-            ident_data = pastaq.read_ident_data(in_path_ident_data)
-            psms = pd.DataFrame({
-                'psm_index': [i for i in range(0, len(ident_data.spectrum_matches))],
-                'psm_id': [psm.id for psm in ident_data.spectrum_matches],
-                'psm_pass_threshold': [psm.pass_threshold for psm in ident_data.spectrum_matches],
-                'psm_charge_state': [psm.charge_state for psm in ident_data.spectrum_matches],
-                'psm_theoretical_mz': [psm.theoretical_mz for psm in ident_data.spectrum_matches],
-                'psm_experimental_mz': [psm.experimental_mz for psm in ident_data.spectrum_matches],
-                'psm_retention_time': [psm.retention_time for psm in ident_data.spectrum_matches],
-                'psm_rank': [psm.rank for psm in ident_data.spectrum_matches],
-                'psm_peptide_id': [psm.match_id for psm in ident_data.spectrum_matches],
-            })
-            if not psms.empty:
-                if params["quant_ident_linkage"] == 'theoretical_mz':
-                    _custom_log(
-                        "Reading linked ident_peak from disk: {}".format(stem), logger)
-                    linked_idents = pastaq.read_linked_psm(
-                        in_path_ident_link_theomz)
-                    linked_idents = pd.DataFrame({
-                        'peak_id': [linked_ident.peak_id for linked_ident in linked_idents],
-                        'psm_index': [linked_ident.psm_index for linked_ident in linked_idents],
-                        'psm_link_distance': [linked_ident.distance for linked_ident in linked_idents],
-                    })
-                    linked_idents = pd.merge(
-                        linked_idents, psms, on="psm_index")
-                    peak_annotations = pd.merge(
-                        peak_annotations, linked_idents, on="peak_id", how="left")
-                elif params["quant_ident_linkage"] == 'msms_event':
-                    _custom_log(
-                        "Reading linked ident_peak from disk: {}".format(stem), logger)
-                    linked_idents = pastaq.read_linked_msms(
-                        in_path_ident_link_msms)
-                    linked_idents = pd.DataFrame({
-                        'msms_id': [linked_ident.msms_id for linked_ident in linked_idents],
-                        'psm_index': [linked_ident.entity_id for linked_ident in linked_idents],
-                        'psm_link_distance': [linked_ident.distance for linked_ident in linked_idents],
-                    })
-                    linked_idents = pd.merge(
-                        linked_idents, psms, on="psm_index")
-                    peak_annotations = pd.merge(
-                        peak_annotations, linked_idents, on="msms_id", how="left")
-                else:
-                    raise ValueError("unknown quant_ident_linkage parameter")
-
-                # Get the peptide information per psm.
-                def format_modification(mod):
-                    ret = "monoisotopic_mass_delta: {}, ".format(
-                        mod.monoisotopic_mass_delta)
-                    ret += "average_mass_delta: {}, ".format(
-                        mod.average_mass_delta)
-                    ret += "residues: {}, ".format(mod.residues)
-                    ret += "location: {}, ".format(mod.location)
-                    ret += "id: {}".format("; ".join(mod.id))
-                    return ret
-                peptides = pd.DataFrame({
-                    'psm_peptide_id': [pep.id for pep in ident_data.peptides],
-                    'psm_sequence': [pep.sequence for pep in ident_data.peptides],
-                    'psm_modifications_num': [len(pep.modifications) for pep in ident_data.peptides],
-                    'psm_modifications_info': [" / ".join(map(format_modification, pep.modifications)) for pep in ident_data.peptides],
-                })
-                peak_annotations = pd.merge(
-                    peak_annotations, peptides, on="psm_peptide_id", how="left")
-
-                # Get the protein information per peptide.
-                db_sequences = pd.DataFrame({
-                    'db_seq_id': [db_seq.id for db_seq in ident_data.db_sequences],
-                    'protein_name': [db_seq.accession for db_seq in ident_data.db_sequences],
-                    'protein_description': [db_seq.description for db_seq in ident_data.db_sequences],
-                })
-                peptide_evidence = pd.DataFrame({
-                    'db_seq_id': [pe.db_sequence_id for pe in ident_data.peptide_evidence],
-                    'psm_peptide_id': [pe.peptide_id for pe in ident_data.peptide_evidence],
-                    'psm_decoy': [pe.decoy for pe in ident_data.peptide_evidence],
-                })
-                peptide_evidence = pd.merge(
-                    peptide_evidence, db_sequences, on="db_seq_id").drop(["db_seq_id"], axis=1)
-
-                # Get the protein information per psm.
-                peak_annotations = pd.merge(
-                    peak_annotations, peptide_evidence, on="psm_peptide_id")
-
-        _custom_log("Saving peaks quantitative table to disk: {}".format(stem), logger)
-        peaks_df.to_csv(out_path_peaks, index=False)
-
-        _custom_log("Saving peaks annotations table to disk: {}".format(stem), logger)
-        if "msms_id" in peak_annotations:
-            peak_annotations["msms_id"] = peak_annotations["msms_id"].astype(
-                'Int64')
-        if "psm_charge_state" in peak_annotations:
-            peak_annotations["psm_charge_state"] = peak_annotations["psm_charge_state"].astype(
-                'Int64')
-        if "psm_rank" in peak_annotations:
-            peak_annotations["psm_rank"] = peak_annotations["psm_rank"].astype(
-                'Int64')
-        if "psm_modifications_num" in peak_annotations:
-            peak_annotations["psm_modifications_num"] = peak_annotations["psm_modifications_num"].astype(
-                'Int64')
-        peak_annotations = peak_annotations.sort_values("peak_id")
-        peak_annotations.to_csv(out_path_peak_annotations, index=False)
-
-        in_path_features = os.path.join(
-            output_dir, 'features', "{}.features".format(stem))
-        if os.path.isfile(in_path_features):
-            out_path_features = os.path.join(output_dir, 'quant',
-                                             "{}_features.csv".format(stem))
-            out_path_feature_annotations = os.path.join(output_dir, 'quant',
-                                                        "{}_feature_annotations.csv".format(stem))
-
-            _custom_log("Reading features from disk: {}".format(stem), logger)
-            features = pastaq.read_features(in_path_features)
-
-            _custom_log("Generating features quantitative table", logger)
-            features_df = pd.DataFrame({
-                'feature_id': [feature.id for feature in features],
-                'average_mz': [feature.average_mz for feature in features],
-                'average_mz_sigma': [feature.average_mz_sigma for feature in features],
-                'average_rt': [feature.average_rt for feature in features],
-                'average_rt_sigma': [feature.average_rt_sigma for feature in features],
-                'average_rt_delta': [feature.average_rt_delta for feature in features],
-                'total_height': [feature.total_height for feature in features],
-                'monoisotopic_mz': [feature.monoisotopic_mz for feature in features],
-                'monoisotopic_height': [feature.monoisotopic_height for feature in features],
-                'charge_state': [feature.charge_state for feature in features],
-                'peak_id': [feature.peak_ids for feature in features],
-            })
-            # Find the peak annotations that belong to each feature.
-            feature_annotations = features_df[[
-                "feature_id", "peak_id"]].explode("peak_id")
-
-            # TODO: It's possible that we want to regenerate the feature table
-            # without doing the same with the peak tables.
-            feature_annotations = pd.merge(
-                feature_annotations, peak_annotations,
-                on="peak_id", how="left")
-
-            features_df.to_csv(out_path_features, index=False)
-            feature_annotations.to_csv(
-                out_path_feature_annotations, index=False)
-
-    # Matched Peaks
-    # =============
-    _custom_log("Reading peak clusters from disk", logger)
-    in_path_peak_clusters = os.path.join(
-        output_dir, 'metamatch', 'peaks.clusters')
-    out_path_peak_clusters_metadata = os.path.join(output_dir, 'quant',
-                                                   "peak_clusters_metadata.csv")
-    out_path_peak_clusters_peaks = os.path.join(output_dir, 'quant',
-                                                "peak_clusters_peaks.csv")
-    out_path_peak_clusters_annotations = os.path.join(output_dir, 'quant',
-                                                      "peak_clusters_annotations.csv")
-
-    # TODO: This is clearly suboptimal and will take a long time if the
-    # number of clusters is very high. Needs a rewrite for optimal
-    # performance.
-    def aggregate_cluster_annotations(x):
-        ret = {}
-        if "psm_sequence" in x:
-            ret["psm_sequence"] = ".|.".join(
-                np.unique(x['psm_sequence'].dropna())).strip(".|.")
-        if "psm_charge_state" in x:
-            ret["psm_charge_state"] = ".|.".join(
-                map(str, np.unique(x['psm_charge_state'].dropna()))).strip(".|.")
-        if "psm_modifications_num" in x:
-            ret["psm_modifications_num"] = ".|.".join(
-                map(str, np.unique(x['psm_modifications_num'].dropna()))).strip(".|.")
-        if "protein_name" in x:
-            ret["protein_name"] = ".|.".join(
-                np.unique(x['protein_name'].dropna())).strip(".|.")
-        if "protein_description" in x:
-            ret["protein_description"] = ".|.".join(
-                np.unique(x['protein_description'].dropna())).strip(".|.")
-        if "consensus_sequence" in x:
-            ret["consensus_sequence"] = ".|.".join(
-                np.unique(x['consensus_sequence'].dropna())).strip(".|.")
-        if "consensus_count" in x:
-            ret["consensus_count"] = ".|.".join(
-                map(str, np.unique(x['consensus_count'].dropna()))).strip(".|.")
-        if "consensus_protein_name" in x:
-            ret["consensus_protein_name"] = ".|.".join(
-                np.unique(x['consensus_protein_name'].dropna())).strip(".|.")
-        if "consensus_protein_description" in x:
-            ret["consensus_protein_description"] = ".|.".join(
-                np.unique(x['consensus_protein_description'].dropna())).strip(".|.")
-        if "protein_group" in x:
-            ret["protein_group"] = ".|.".join(
-                map(str, np.unique(x['protein_group'].dropna()))).strip(".|.")
-        return pd.Series(ret)
-
-    if (not os.path.exists(out_path_peak_clusters_metadata) or force_override):
-        peak_clusters = pastaq.read_peak_clusters(in_path_peak_clusters)
-        _custom_log("Generating peak clusters quantitative table", logger)
-        peak_clusters_metadata_df = pd.DataFrame({
-            'cluster_id': [cluster.id for cluster in peak_clusters],
-            'mz': [cluster.mz for cluster in peak_clusters],
-            'rt': [cluster.rt for cluster in peak_clusters],
-            'avg_height': [cluster.avg_height for cluster in peak_clusters],
-        })
-
-        _custom_log("Generating peak clusters quantitative table", logger)
-        peak_clusters_df = pd.DataFrame({
-            'cluster_id': [cluster.id for cluster in peak_clusters],
-        })
-        if params['quant_isotopes'] == 'volume':
-            out_path_peak_clusters = os.path.join(output_dir, 'quant',
-                                                  "peak_clusters_volume.csv")
-            for i, input_file in enumerate(input_files):
-                stem = input_file['stem']
-                peak_clusters_df[stem] = [cluster.file_volumes[i]
-                                          for cluster in peak_clusters]
-        elif params['quant_isotopes'] == 'height':
-            out_path_peak_clusters = os.path.join(output_dir, 'quant',
-                                                  "peak_clusters_height.csv")
-            for i, input_file in enumerate(input_files):
-                stem = input_file['stem']
-                peak_clusters_df[stem] = [cluster.heights[i]
-                                          for cluster in peak_clusters]
-        else:
-            raise ValueError("unknown quant_isotopes parameter")
-        _custom_log("Writing peaks quantitative table to disk", logger)
-        peak_clusters_df.to_csv(out_path_peak_clusters, index=False)
-
-        # Peak associations.
-        _custom_log("Generating peak clusters peak associations table", logger)
-        cluster_peaks = [(cluster.id, cluster.peak_ids)
-                         for cluster in peak_clusters]
-        cluster_peaks = pd.DataFrame(cluster_peaks, columns=[
-                                     "cluster_id", "peak_ids"]).explode("peak_ids")
-        cluster_peaks["file_id"] = cluster_peaks["peak_ids"].map(
-            lambda x: input_files[x.file_id]['stem'])
-        cluster_peaks["peak_id"] = cluster_peaks["peak_ids"].map(
-            lambda x: x.peak_id)
-        cluster_peaks = cluster_peaks.drop(["peak_ids"], axis=1)
-        _custom_log("Writing cluster to peak table to disk", logger)
-        cluster_peaks.to_csv(out_path_peak_clusters_peaks, index=False)
-
-        # Cluster annotations.
-        _custom_log("Generating peak clusters annotations table", logger)
-        annotations = pd.DataFrame()
-        for input_file in input_files:
-            stem = input_file['stem']
-            _custom_log("Reading peak annotations for: {}".format(stem), logger)
-            in_path_peak_annotations = os.path.join(output_dir, 'quant',
-                                                    "{}_peak_annotations.csv".format(stem))
-            peak_annotations = pd.read_csv(
-                in_path_peak_annotations, low_memory=False)
-            cluster_annotations = cluster_peaks[cluster_peaks["file_id"] == stem][[
-                "cluster_id", "peak_id"]]
-            cluster_annotations["file_id"] = stem
-            _custom_log(
-                "Merging peak/clusters annotations for: {}".format(stem), logger)
-            cluster_annotations = pd.merge(
-                cluster_annotations, peak_annotations, on="peak_id", how="left")
-            annotations = pd.concat(
-                [annotations, cluster_annotations]).reset_index(drop=True)
-        # Ensure these columns have the proper type.
-        if "msms_id" in annotations:
-            annotations["msms_id"] = annotations["msms_id"].astype(
-                'Int64')
-        if "psm_charge_state" in annotations:
-            annotations["psm_charge_state"] = annotations["psm_charge_state"].astype(
-                'Int64')
-        if "psm_rank" in annotations:
-            annotations["psm_rank"] = annotations["psm_rank"].astype(
-                'Int64')
-        if "psm_modifications_num" in annotations:
-            annotations["psm_modifications_num"] = annotations["psm_modifications_num"].astype(
-                'Int64')
-
-        if params['quant_consensus'] and 'psm_sequence' in annotations:
-            # Find a sequence consensus
-            consensus_sequence = find_sequence_consensus(
-                annotations, 'psm_sequence', params['quant_consensus_min_ident'])
-            annotations = pd.merge(
-                annotations,
-                consensus_sequence[[
-                    "cluster_id",
-                    "consensus_sequence",
-                    "consensus_count",
-                ]], on="cluster_id", how="left")
-            # Find a consensus proteins
-            proteins = annotations[annotations['psm_sequence']
-                                   == annotations['consensus_sequence']]
-            proteins = proteins[['cluster_id', 'protein_name',
-                                 'protein_description']].drop_duplicates()
-            proteins.columns = [
-                'cluster_id', 'consensus_protein_name', 'consensus_protein_description']
-            annotations = pd.merge(annotations, proteins,
-                                   on="cluster_id", how="left")
-
-        # Saving annotations before aggregation.
-        if params['quant_save_all_annotations']:
-            _custom_log("Writing annotations to disk", logger)
-            annotations = annotations.sort_values(by=["cluster_id"])
-            annotations.to_csv(out_path_peak_clusters_annotations, index=False)
-
-        _custom_log("Aggregating annotations", logger)
-        # TODO: This is clearly suboptimal and will take a long time if the
-        # number of clusters is very high. Needs a rewrite for optimal
-        # performance.
-        annotations = annotations.groupby(
-            'cluster_id').apply(aggregate_cluster_annotations)
-
-        # Metadata
-        _custom_log("Merging metadata with annotations", logger)
-        peak_clusters_metadata_df = pd.merge(
-            peak_clusters_metadata_df, annotations, how="left", on="cluster_id")
-        _custom_log("Writing metadata to disk", logger)
-        peak_clusters_metadata_df.to_csv(
-            out_path_peak_clusters_metadata, index=False)
-
-    # Matched Features
-    # ================
-    _custom_log("Reading feature clusters from disk", logger)
-    in_path_feature_clusters = os.path.join(
-        output_dir, 'metamatch', 'features.clusters')
-    out_path_feature_clusters_metadata = os.path.join(output_dir, 'quant',
-                                                      "feature_clusters_metadata.csv")
-    out_path_feature_clusters_features = os.path.join(output_dir, 'quant',
-                                                      "feature_clusters_features.csv")
-    out_path_feature_clusters_annotations = os.path.join(output_dir, 'quant',
-                                                         "feature_clusters_annotations.csv")
-    if (not os.path.exists(out_path_feature_clusters_metadata) or force_override):
-        feature_clusters = pastaq.read_feature_clusters(
-            in_path_feature_clusters)
-
-        _custom_log("Generating feature clusters quantitative table", logger)
-        metadata = pd.DataFrame({
-            'cluster_id': [cluster.id for cluster in feature_clusters],
-            'mz': [cluster.mz for cluster in feature_clusters],
-            'rt': [cluster.rt for cluster in feature_clusters],
-            'avg_height': [cluster.avg_total_height for cluster in feature_clusters],
-            'charge_state': [cluster.charge_state for cluster in feature_clusters],
-        })
-        data = pd.DataFrame({
-            'cluster_id': [cluster.id for cluster in feature_clusters],
-        })
-        if params['quant_features'] == 'monoisotopic_height':
-            out_path_feature_clusters = os.path.join(output_dir, 'quant',
-                                                     "feature_clusters_monoisotopic_height.csv")
-            for i, input_file in enumerate(input_files):
-                stem = input_file['stem']
-                data[stem] = [cluster.monoisotopic_heights[i]
-                              for cluster in feature_clusters]
-        elif params['quant_features'] == 'monoisotopic_volume':
-            out_path_feature_clusters = os.path.join(output_dir, 'quant',
-                                                     "feature_clusters_monoisotopic_volume.csv")
-            for i, input_file in enumerate(input_files):
-                stem = input_file['stem']
-                data[stem] = [cluster.monoisotopic_volumes[i]
-                              for cluster in feature_clusters]
-        elif params['quant_features'] == 'total_height':
-            out_path_feature_clusters = os.path.join(output_dir, 'quant',
-                                                     "feature_clusters_total_height.csv")
-            for i, input_file in enumerate(input_files):
-                stem = input_file['stem']
-                data[stem] = [cluster.total_heights[i]
-                              for cluster in feature_clusters]
-        elif params['quant_features'] == 'total_volume':
-            out_path_feature_clusters = os.path.join(output_dir, 'quant',
-                                                     "feature_clusters_total_volume.csv")
-            for i, input_file in enumerate(input_files):
-                stem = input_file['stem']
-                data[stem] = [cluster.total_volumes[i]
-                              for cluster in feature_clusters]
-        elif params['quant_features'] == 'max_height':
-            out_path_feature_clusters = os.path.join(output_dir, 'quant',
-                                                     "feature_clusters_max_height.csv")
-            for i, input_file in enumerate(input_files):
-                stem = input_file['stem']
-                data[stem] = [cluster.max_heights[i]
-                              for cluster in feature_clusters]
-        elif params['quant_features'] == 'max_volume':
-            out_path_feature_clusters = os.path.join(output_dir, 'quant',
-                                                     "feature_clusters_max_volume.csv")
-            for i, input_file in enumerate(input_files):
-                stem = input_file['stem']
-                data[stem] = [cluster.max_volumes[i]
-                              for cluster in feature_clusters]
-        else:
-            raise ValueError("unknown quant_features parameter")
-        _custom_log("Writing feature clusters quantitative table to disk", logger)
-        data.to_csv(out_path_feature_clusters, index=False)
-
-        # Feature associations.
-        _custom_log("Generating feature clusters feature associations table", logger)
-        cluster_features = [(cluster.id, cluster.feature_ids)
-                            for cluster in feature_clusters]
-        cluster_features = pd.DataFrame(cluster_features, columns=[
-                                        "cluster_id", "feature_ids"]).explode("feature_ids")
-        cluster_features["file_id"] = cluster_features["feature_ids"].map(
-            lambda x: input_files[x.file_id]['stem'])
-        cluster_features["feature_id"] = cluster_features["feature_ids"].map(
-            lambda x: x.feature_id)
-        cluster_features = cluster_features.drop(["feature_ids"], axis=1)
-        _custom_log("Writing cluster to feature table to disk", logger)
-        cluster_features.to_csv(
-            out_path_feature_clusters_features, index=False)
-
-        # Cluster annotations.
-        _custom_log("Generating peak clusters annotations table", logger)
-        annotations = pd.DataFrame()
-        for input_file in input_files:
-            stem = input_file['stem']
-            _custom_log("Reading features for: {}".format(stem), logger)
-            in_path_peak_features = os.path.join(output_dir, 'features',
-                                                 "{}.features".format(stem))
-            in_path_peak_annotations = os.path.join(output_dir, 'quant',
-                                                    "{}_peak_annotations.csv".format(stem))
-            features = pastaq.read_features(in_path_peak_features)
-            features = [(feature.id, feature.peak_ids, feature.charge_state)
-                        for feature in features]
-            features = pd.DataFrame(
-                features, columns=["feature_id", "peak_id", "charge_state"]).explode("peak_id")
-            peak_annotations = pd.read_csv(
-                in_path_peak_annotations, low_memory=False)
-            cluster_annotations = cluster_features[cluster_features["file_id"] == stem][[
-                "cluster_id", "feature_id"]]
-            cluster_annotations["file_id"] = stem
-            _custom_log(
-                "Merging peak/clusters annotations for: {}".format(stem), logger)
-            cluster_annotations = pd.merge(
-                cluster_annotations, features, on="feature_id", how="left")
-            cluster_annotations = pd.merge(
-                cluster_annotations, peak_annotations, on="peak_id", how="left")
-            annotations = pd.concat([annotations, cluster_annotations])
-
-        # Ensure these columns have the proper type.
-        if "msms_id" in annotations:
-            annotations["msms_id"] = annotations["msms_id"].astype('Int64')
-        if "charge_state" in annotations:
-            annotations["charge_state"] = annotations["charge_state"].astype(
-                'Int64')
-        if "psm_charge_state" in annotations:
-            annotations["psm_charge_state"] = annotations["psm_charge_state"].astype(
-                'Int64')
-        if "psm_rank" in annotations:
-            annotations["psm_rank"] = annotations["psm_rank"].astype('Int64')
-        if "psm_modifications_num" in annotations:
-            annotations["psm_modifications_num"] = annotations["psm_modifications_num"].astype(
-                'Int64')
-
-        if params['quant_consensus'] and 'psm_sequence' in annotations:
-            # Find a sequence consensus
-            consensus_sequence = find_sequence_consensus(
-                annotations, 'psm_sequence', params['quant_consensus_min_ident'])
-            annotations = pd.merge(
-                annotations,
-                consensus_sequence[[
-                    "cluster_id",
-                    "consensus_sequence",
-                    "consensus_count",
-                ]], on="cluster_id", how="left")
-            # Find a consensus proteins
-            proteins = annotations[annotations['psm_sequence']
-                                   == annotations['consensus_sequence']]
-            proteins = proteins[['cluster_id', 'protein_name',
-                                 'protein_description']].drop_duplicates()
-            proteins.columns = [
-                'cluster_id', 'consensus_protein_name', 'consensus_protein_description']
-            annotations = pd.merge(annotations, proteins,
-                                   on="cluster_id", how="left")
-
-        # Calculate protein groups.
-        _custom_log("Calculating protein groups", logger)
-        sequence_column = 'psm_sequence'
-        protein_name_column = 'protein_name'
-        protein_description_column = 'protein_description'
-        if params['quant_consensus'] and 'psm_sequence' in annotations:
-            sequence_column = 'consensus_sequence'
-            protein_name_column = 'consensus_protein_name'
-            protein_description_column = 'consensus_protein_description'
-
-        # Combine protein name/description in case
-        if (sequence_column in annotations and
-                protein_name_column in annotations and
-                protein_description_column in annotations):
-            prot_data, prot_metadata = find_protein_groups(
-                    data,
-                    annotations,
-                    sequence_column,
-                    protein_name_column,
-                    protein_description_column,
-                    params['quant_proteins_min_peptides'],
-                    params['quant_proteins_remove_subset_proteins'],
-                    params['quant_proteins_ignore_ambiguous_peptides'],
-                    params['quant_proteins_quant_type'],
-                    )
-            out_path_protein_data = os.path.join(output_dir, 'quant',
-                                                 "protein_groups.csv")
-            out_path_protein_metadata = os.path.join(output_dir, 'quant',
-                                                     "protein_groups_metadata.csv")
-
-            _custom_log("Writing protein group data/metadata to disk", logger)
-            prot_data.to_csv(out_path_protein_data, index=False)
-            prot_metadata.to_csv(out_path_protein_metadata, index=False)
-
-        # Saving annotations before aggregation.
-        if params['quant_save_all_annotations']:
-            _custom_log("Writing annotations to disk", logger)
-            annotations = annotations.sort_values(by=["cluster_id"])
-            annotations.to_csv(
-                out_path_feature_clusters_annotations, index=False)
-
-        _custom_log("Aggregating annotations", logger)
-        if ("psm_charge_state" in annotations and
-                params['quant_features_charge_state_filter']):
-            annotations = annotations[annotations["psm_charge_state"]
-                                      == annotations["charge_state"]]
-        # TODO: This is clearly suboptimal and will take a long time if the
-        # number of clusters is very high. Needs a rewrite for optimal
-        # performance.
-        annotations_agg = annotations.groupby(
-            'cluster_id').apply(aggregate_cluster_annotations)
-
-        # Metadata.
-        _custom_log("Merging metadata with annotations", logger)
-        metadata = pd.merge(
-            metadata, annotations_agg, how="left", on="cluster_id")
-        _custom_log("Writing metadata to disk", logger)
-        metadata.to_csv(out_path_feature_clusters_metadata, index=False)
-
-        # Aggregate peptides.
-        sequence_column = 'psm_sequence'
-        if params['quant_consensus'] and 'psm_sequence' in annotations:
-            sequence_column = 'consensus_sequence'
-
-        if sequence_column in annotations:
-            _custom_log("Aggregating peptide charge states", logger)
-
-            def aggregate_peptide_annotations(x):
-                ret = {}
-                if "psm_sequence" in x:
-                    ret["psm_sequence"] = ".|.".join(
-                        np.unique(x['psm_sequence'].dropna())).strip(".|.")
-                if "protein_name" in x:
-                    ret["protein_name"] = ".|.".join(
-                        np.unique(x['protein_name'].dropna())).strip(".|.")
-                if "protein_description" in x:
-                    ret["protein_description"] = ".|.".join(
-                        np.unique(x['protein_description'].dropna())).strip(".|.")
-                if "consensus_sequence" in x:
-                    ret["consensus_sequence"] = ".|.".join(
-                        np.unique(x['consensus_sequence'].dropna())).strip(".|.")
-                if "consensus_protein_name" in x:
-                    ret["consensus_protein_name"] = ".|.".join(
-                        np.unique(x['consensus_protein_name'].dropna())).strip(".|.")
-                if "consensus_protein_description" in x:
-                    ret["consensus_protein_description"] = ".|.".join(
-                        np.unique(x['consensus_protein_description'].dropna())).strip(".|.")
-                return pd.Series(ret)
-            peptide_data = data.copy()
-            peptide_data = peptide_data.drop(["cluster_id"], axis=1)
-            peptide_data[sequence_column] = metadata[sequence_column]
-            peptide_data = peptide_data[~peptide_data[sequence_column].isna()]
-            peptide_data = peptide_data[peptide_data[sequence_column] != '']
-            peptide_data = peptide_data[~peptide_data[sequence_column].str.contains(r'\.\|\.')]
-            peptide_data = peptide_data.groupby(sequence_column).agg(sum)
-            peptide_data = peptide_data.reset_index()
-            peptide_metadata = annotations.copy()
-            peptide_metadata = peptide_metadata[peptide_metadata[sequence_column].isin(peptide_data[sequence_column])]
-            peptide_metadata = peptide_metadata.groupby(sequence_column)
-            peptide_metadata = peptide_metadata.apply(aggregate_peptide_annotations)
-            out_path_peptide_data = os.path.join(output_dir, 'quant',
-                                                 "peptides_data.csv")
-            out_path_peptide_metadata = os.path.join(output_dir, 'quant',
-                                                     "peptides_metadata.csv")
-
-            _custom_log("Writing peptide data/metadata to disk", logger)
-            peptide_data.to_csv(out_path_peptide_data, index=False)
-            peptide_metadata.to_csv(out_path_peptide_metadata, index=False)
-
-    elapsed_time = datetime.timedelta(seconds=time.time()-time_start)
-    _custom_log('Finished creation of quantitative tables in {}'.format(elapsed_time), logger)
-
-
 def dda_pipeline_summary(params, output_dir, logger):
     _custom_log("Starting summary stats", logger)
     time_start = time.time()
@@ -1887,16 +1420,16 @@ def dda_pipeline_summary(params, output_dir, logger):
 
         in_path = os.path.join(output_dir, 'warped_peaks', "{}.peaks".format(stem))
         if os.path.exists(in_path):
-            peaks = pastaq.read_peaks(in_path)
-            peak_heights = np.array([peak.fitted_height for peak in peaks])
-            n_peaks += [len(peaks)]
+            peaks = pastaq.peaks_to_columns(pastaq.read_peaks(in_path))
+            peak_heights = peaks['fitted_height']
+            n_peaks += [len(peaks['id'])]
             mean_height = peak_heights.mean()
             median_height = np.median(peak_heights)
             std_height = np.std(peak_heights)
             avg_peak_heights += [mean_height]
             median_peak_heights += [median_height]
             std_peak_heights += [std_height]
-            summary_log.info('        Number of peaks: {}'.format(len(peaks)))
+            summary_log.info('        Number of peaks: {}'.format(len(peaks['id'])))
             summary_log.info('        Fitted height')
             summary_log.info('            mean: {}'.format(mean_height))
             summary_log.info('            median: {}'.format(median_height))
@@ -1928,11 +1461,11 @@ def dda_pipeline_summary(params, output_dir, logger):
 
         in_path = os.path.join(output_dir, 'features', "{}.features".format(stem))
         if os.path.exists(in_path):
-            features = pastaq.read_features(in_path)
+            features = pastaq.features_to_columns(pastaq.read_features(in_path))
 
-            feature_max_heights = np.array([feature.max_height for feature in features])
-            feature_monoisotopic_heights = np.array([feature.monoisotopic_height for feature in features])
-            feature_total_heights = np.array([feature.total_height for feature in features])
+            feature_max_heights = features['max_height']
+            feature_monoisotopic_heights = features['monoisotopic_height']
+            feature_total_heights = features['total_height']
 
             feature_mean_max_height = feature_max_heights.mean()
             feature_median_max_height = np.median(feature_max_heights)
@@ -1946,7 +1479,7 @@ def dda_pipeline_summary(params, output_dir, logger):
             feature_median_total_height = np.median(feature_total_heights)
             feature_std_total_height = np.std(feature_total_heights)
 
-            n_features += [len(features)]
+            n_features += [len(features['id'])]
             avg_feature_max_heights += [feature_mean_max_height]
             median_feature_max_heights += [feature_median_max_height]
             std_feature_max_heights += [feature_std_max_height]
@@ -1959,7 +1492,7 @@ def dda_pipeline_summary(params, output_dir, logger):
             median_feature_total_heights += [feature_median_total_height]
             std_feature_total_heights += [feature_std_total_height]
 
-            summary_log.info('        Number of features: {}'.format(len(features)))
+            summary_log.info('        Number of features: {}'.format(len(features['id'])))
             summary_log.info('        Max height')
             summary_log.info('            mean: {}'.format(feature_mean_max_height))
             summary_log.info('            median: {}'.format(feature_median_max_height))
@@ -2041,531 +1574,6 @@ def dda_pipeline_summary(params, output_dir, logger):
     _custom_log('Finished summary stats in {}'.format(elapsed_time), logger)
 
 
-def generate_qc_plots(params, output_dir, logger=None, force_override=False):
-    input_files = params['input_files']
-
-    #
-    # General plot config.
-    #
-
-    # Font and figure size
-    plt.rcParams.update({
-        'font.family': params['qc_plot_font_family'],
-        'font.size': params['qc_plot_font_size'],
-        'figure.figsize': (params['qc_plot_fig_size_x'], params['qc_plot_fig_size_y']),
-    })
-
-    # Alpha parameters.
-    fill_alpha = params['qc_plot_fill_alpha']
-    line_alpha = params['qc_plot_line_alpha']
-    scatter_alpha = params['qc_plot_scatter_alpha']
-    if line_alpha == 'dynamic':
-        line_alpha = max(params['qc_plot_min_dynamic_alpha'], 1.0 / len(input_files))
-    if fill_alpha == 'dynamic':
-        fill_alpha = max(params['qc_plot_min_dynamic_alpha'], 1.0 / len(input_files))
-
-    # Colorscheme.
-    palette = sns.color_palette(params['qc_plot_palette'], len(input_files))
-
-    _custom_log("Starting quality control plotting", logger)
-    time_start = time.time()
-
-    #
-    # Peak sigma density
-    #
-    if not params['qc_plot_per_file']:
-        out_path = os.path.join(output_dir, 'quality', 'peak_sigma_mz_rt_density.{}'.format(params['qc_plot_extension']))
-        if not os.path.exists(out_path) or force_override:
-            fig, (ax_left, ax_right) = plt.subplots(1, 2)
-            for input_file, color in zip(input_files, palette):
-                stem = input_file['stem']
-                _custom_log("Plotting density of sigma_mz/sigma_rt: {}".format(stem), logger)
-                peaks_path = os.path.join(output_dir, 'warped_peaks', "{}.peaks".format(stem))
-                peaks = pastaq.read_peaks(peaks_path)
-
-                sigma_mzs = np.array([peak.fitted_sigma_mz for peak in peaks])
-                sigma_rts = np.array([peak.fitted_sigma_rt for peak in peaks])
-
-                if params['qc_plot_line_style'] == 'fill':
-                    sns.kdeplot(sigma_rts, label=stem, ax=ax_left, fill=True, linewidth=0, alpha=fill_alpha, color=color)
-                    sns.kdeplot(sigma_mzs, label=stem, ax=ax_right, fill=True, linewidth=0, alpha=fill_alpha, color=color)
-                else:
-                    sns.kdeplot(sigma_rts, label=stem, ax=ax_left, alpha=line_alpha, color=color)
-                    sns.kdeplot(sigma_mzs, label=stem, ax=ax_right, alpha=line_alpha, color=color)
-
-            if params['qc_plot_fig_legend']:
-                plt.legend()
-            ax_left.set_xlabel('$\\sigma_{rt}$')
-            ax_right.set_xlabel('$\\sigma_{mz}$')
-            ax_left.set_ylabel('Density')
-            ax_right.set_ylabel('')
-            _custom_log("Saving figure: {}".format(out_path), logger)
-            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
-            plt.close(fig)
-    else:
-        for input_file, color in zip(input_files, palette):
-            stem = input_file['stem']
-            out_path = os.path.join(output_dir, 'quality', '{}_peak_sigma_mz_rt_density.{}'.format(stem, params['qc_plot_extension']))
-            if os.path.exists(out_path) and not force_override:
-                continue
-            fig, (ax_left, ax_right) = plt.subplots(1, 2)
-            _custom_log("Plotting density of sigma_mz/sigma_rt: {}".format(stem), logger)
-            peaks_path = os.path.join(output_dir, 'warped_peaks', "{}.peaks".format(stem))
-            peaks = pastaq.read_peaks(peaks_path)
-
-            sigma_mzs = np.array([peak.fitted_sigma_mz for peak in peaks])
-            sigma_rts = np.array([peak.fitted_sigma_rt for peak in peaks])
-
-            if params['qc_plot_line_style'] == 'fill':
-                sns.kdeplot(sigma_rts, label=stem, ax=ax_left, fill=True, linewidth=0, alpha=fill_alpha, color=color)
-                sns.kdeplot(sigma_mzs, label=stem, ax=ax_right, fill=True, linewidth=0, alpha=fill_alpha, color=color)
-            else:
-                sns.kdeplot(sigma_rts, label=stem, ax=ax_left, alpha=line_alpha, color=color)
-                sns.kdeplot(sigma_mzs, label=stem, ax=ax_right, alpha=line_alpha, color=color)
-
-            if params['qc_plot_fig_legend']:
-                plt.legend()
-            ax_left.set_xlabel('$\\sigma_{rt}$')
-            ax_right.set_xlabel('$\\sigma_{mz}$')
-            ax_left.set_ylabel('Density')
-            ax_right.set_ylabel('')
-            _custom_log("Saving figure: {}".format(out_path), logger)
-            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
-            plt.close(fig)
-
-    #
-    # Peak rt vs rt_delta
-    #
-    if not params['qc_plot_per_file']:
-        out_path = os.path.join(output_dir, 'quality', 'peak_rt_vs_rt_delta.{}'.format(params['qc_plot_extension']))
-        if not os.path.exists(out_path) or force_override:
-            fig, ax = plt.subplots(1, 1)
-
-            for input_file, color in zip(input_files, palette):
-                stem = input_file['stem']
-                _custom_log("Plotting rt vs rt_delta: {}".format(stem), logger)
-                peaks_path = os.path.join(output_dir, 'warped_peaks', "{}.peaks".format(stem))
-                peaks = pastaq.read_peaks(peaks_path)
-
-                rts = np.array([peak.fitted_rt for peak in peaks])
-                rt_deltas = np.array([peak.rt_delta for peak in peaks])
-
-                idx = np.argsort(rts)
-                rts = rts[idx]
-                rt_deltas = rt_deltas[idx]
-                ax.plot(rts, rt_deltas, label=stem, alpha=line_alpha, color=color)
-
-            if params['qc_plot_fig_legend']:
-                plt.legend()
-            ax.set_xlabel('Retention time (s)')
-            ax.set_ylabel('Retention time delta (s)')
-            _custom_log("Saving figure: {}".format(out_path), logger)
-            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
-            plt.close(fig)
-    else:
-        for input_file, color in zip(input_files, palette):
-            stem = input_file['stem']
-            out_path = os.path.join(output_dir, 'quality', '{}_peak_rt_vs_rt_delta.{}'.format(stem, params['qc_plot_extension']))
-            if os.path.exists(out_path) and not force_override:
-                continue
-            fig, ax = plt.subplots(1, 1)
-            _custom_log("Plotting rt vs rt_delta: {}".format(stem), logger)
-            peaks_path = os.path.join(output_dir, 'warped_peaks', "{}.peaks".format(stem))
-            peaks = pastaq.read_peaks(peaks_path)
-
-            rts = np.array([peak.fitted_rt for peak in peaks])
-            rt_deltas = np.array([peak.rt_delta for peak in peaks])
-
-            idx = np.argsort(rts)
-            rts = rts[idx]
-            rt_deltas = rt_deltas[idx]
-            ax.plot(rts, rt_deltas, label=stem, alpha=line_alpha, color=color)
-
-            if params['qc_plot_fig_legend']:
-                plt.legend()
-            ax.set_xlabel('Retention time (s)')
-            ax.set_ylabel('Retention time delta (s)')
-            _custom_log("Saving figure: {}".format(out_path), logger)
-            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
-            plt.close(fig)
-
-    #
-    # Peak sigma_mz vs m/z scatterplot.
-    #
-    if not params['qc_plot_per_file']:
-        out_path = os.path.join(output_dir, 'quality', 'peak_mz_vs_sigma_mz.{}'.format(params['qc_plot_extension']))
-        if not os.path.exists(out_path) or force_override:
-            fig, ax = plt.subplots(1, 1)
-
-            for input_file, color in zip(input_files, palette):
-                stem = input_file['stem']
-                _custom_log("Plotting mz vs sigma_mz: {}".format(stem), logger)
-                peaks_path = os.path.join(output_dir, 'warped_peaks', "{}.peaks".format(stem))
-                peaks = pastaq.read_peaks(peaks_path)
-
-                mz = np.array([peak.fitted_mz for peak in peaks])[0:params['qc_plot_mz_vs_sigma_mz_max_peaks']]
-                sigma_mz = np.array([peak.fitted_sigma_mz for peak in peaks])[0:params['qc_plot_mz_vs_sigma_mz_max_peaks']]
-
-                ax.scatter(mz, sigma_mz, s=params['qc_plot_scatter_size'], label=stem, edgecolors='none', alpha=scatter_alpha, color=color)
-
-            if params['qc_plot_fig_legend']:
-                plt.legend()
-            ax.set_xlabel('m/z')
-            ax.set_ylabel('$\\sigma_{mz}$')
-            _custom_log("Saving figure: {}".format(out_path), logger)
-            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
-            plt.close(fig)
-    else:
-        for input_file, color in zip(input_files, palette):
-            stem = input_file['stem']
-            out_path = os.path.join(output_dir, 'quality', '{}_peak_mz_vs_sigma_mz.{}'.format(stem, params['qc_plot_extension']))
-            if os.path.exists(out_path) and not force_override:
-                continue
-            fig, ax = plt.subplots(1, 1)
-            _custom_log("Plotting mz vs sigma_mz: {}".format(stem), logger)
-            peaks_path = os.path.join(output_dir, 'warped_peaks', "{}.peaks".format(stem))
-            peaks = pastaq.read_peaks(peaks_path)
-
-            mz = np.array([peak.fitted_mz for peak in peaks])[0:params['qc_plot_mz_vs_sigma_mz_max_peaks']]
-            sigma_mz = np.array([peak.fitted_sigma_mz for peak in peaks])[0:params['qc_plot_mz_vs_sigma_mz_max_peaks']]
-
-            ax.scatter(mz, sigma_mz, s=params['qc_plot_scatter_size'], label=stem, edgecolors='none', alpha=scatter_alpha, color=color)
-
-            if params['qc_plot_fig_legend']:
-                plt.legend()
-            ax.set_xlabel('m/z')
-            ax.set_ylabel('$\\sigma_{mz}$')
-            _custom_log("Saving figure: {}".format(out_path), logger)
-            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
-            plt.close(fig)
-
-    #
-    # Extracted Ion Chromatogram (XIC) before and after alignment.
-    #
-    if not params['qc_plot_per_file']:
-        out_path = os.path.join(output_dir, 'quality', 'xic_unaligned.{}'.format(params['qc_plot_extension']))
-        if not os.path.exists(out_path) or force_override:
-            fig, ax = plt.subplots(1, 1)
-
-            for input_file, color in zip(input_files, palette):
-                stem = input_file['stem']
-                _custom_log("Plotting XIC (unaligned): {}".format(stem), logger)
-
-                raw_data_path = os.path.join(output_dir, 'raw', "{}.ms1".format(stem))
-                raw_data = pastaq.read_raw_data(raw_data_path)
-                xic = pastaq.xic(
-                    raw_data,
-                    raw_data.min_mz,
-                    raw_data.max_mz,
-                    raw_data.min_rt,
-                    raw_data.max_rt,
-                    "sum"
-                )
-                x = xic.retention_time
-                y = xic.intensity
-
-                if params['qc_plot_line_style'] == 'fill':
-                    ax.fill_between(x, 0, y, lw=0, color=color, alpha=fill_alpha, label=stem)
-                else:
-                    ax.plot(x, y, label=stem, alpha=line_alpha, color=color)
-
-            if params['qc_plot_fig_legend']:
-                plt.legend()
-            ax.set_xlabel('Retention time (s)')
-            ax.set_ylabel('Intensity')
-            _custom_log("Saving figure: {}".format(out_path), logger)
-            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
-            plt.close(fig)
-    else:
-        for input_file, color in zip(input_files, palette):
-            stem = input_file['stem']
-            out_path = os.path.join(output_dir, 'quality', '{}_xic_unaligned.{}'.format(stem, params['qc_plot_extension']))
-            if os.path.exists(out_path) and not force_override:
-                continue
-            fig, ax = plt.subplots(1, 1)
-            _custom_log("Plotting XIC (unaligned): {}".format(stem), logger)
-
-            raw_data_path = os.path.join(output_dir, 'raw', "{}.ms1".format(stem))
-            raw_data = pastaq.read_raw_data(raw_data_path)
-            xic = pastaq.xic(
-                raw_data,
-                raw_data.min_mz,
-                raw_data.max_mz,
-                raw_data.min_rt,
-                raw_data.max_rt,
-                "sum"
-            )
-            x = xic.retention_time
-            y = xic.intensity
-
-            if params['qc_plot_line_style'] == 'fill':
-                ax.fill_between(x, 0, y, lw=0, color=color, alpha=fill_alpha, label=stem)
-            else:
-                ax.plot(x, y, label=stem, alpha=line_alpha, color=color)
-
-            if params['qc_plot_fig_legend']:
-                plt.legend()
-            ax.set_xlabel('Retention time (s)')
-            ax.set_ylabel('Intensity')
-            _custom_log("Saving figure: {}".format(out_path), logger)
-            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
-            plt.close(fig)
-
-    if not params['qc_plot_per_file']:
-        out_path = os.path.join(output_dir, 'quality', 'xic_aligned.{}'.format(params['qc_plot_extension']))
-        if not os.path.exists(out_path) or force_override:
-            fig, ax = plt.subplots(1, 1)
-
-            for input_file, color in zip(input_files, palette):
-                stem = input_file['stem']
-                _custom_log("Plotting XIC (aligned): {}".format(stem), logger)
-
-                raw_data_path = os.path.join(output_dir, 'raw', "{}.ms1".format(stem))
-                tmap_path = os.path.join(output_dir, 'time_map', "{}.tmap".format(stem))
-
-                raw_data = pastaq.read_raw_data(raw_data_path)
-                tmap = pastaq.read_time_map(tmap_path)
-
-                xic = pastaq.xic(
-                    raw_data,
-                    raw_data.min_mz,
-                    raw_data.max_mz,
-                    raw_data.min_rt,
-                    raw_data.max_rt,
-                    "sum"
-                )
-                x = [tmap.warp(rt) for rt in xic.retention_time]
-                y = xic.intensity
-
-                if params['qc_plot_line_style'] == 'fill':
-                    ax.fill_between(x, 0, y, lw=0, color=color, alpha=fill_alpha, label=stem)
-                else:
-                    ax.plot(x, y, label=stem, alpha=line_alpha, color=color)
-
-            if params['qc_plot_fig_legend']:
-                plt.legend()
-            ax.set_xlabel('Retention time (s)')
-            ax.set_ylabel('Intensity')
-            _custom_log("Saving figure: {}".format(out_path), logger)
-            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
-            plt.close(fig)
-    else:
-        for input_file, color in zip(input_files, palette):
-            stem = input_file['stem']
-            out_path = os.path.join(output_dir, 'quality', '{}_xic_aligned.{}'.format(stem, params['qc_plot_extension']))
-            if os.path.exists(out_path) and not force_override:
-                continue
-            fig, ax = plt.subplots(1, 1)
-            _custom_log("Plotting XIC (aligned): {}".format(stem), logger)
-
-            raw_data_path = os.path.join(output_dir, 'raw', "{}.ms1".format(stem))
-            tmap_path = os.path.join(output_dir, 'time_map', "{}.tmap".format(stem))
-
-            raw_data = pastaq.read_raw_data(raw_data_path)
-            tmap = pastaq.read_time_map(tmap_path)
-
-            xic = pastaq.xic(
-                raw_data,
-                raw_data.min_mz,
-                raw_data.max_mz,
-                raw_data.min_rt,
-                raw_data.max_rt,
-                "sum"
-            )
-            x = [tmap.warp(rt) for rt in xic.retention_time]
-            y = xic.intensity
-
-            if params['qc_plot_line_style'] == 'fill':
-                ax.fill_between(x, 0, y, lw=0, color=color, alpha=fill_alpha, label=stem)
-            else:
-                ax.plot(x, y, label=stem, alpha=line_alpha, color=color)
-
-            if params['qc_plot_fig_legend']:
-                plt.legend()
-            ax.set_xlabel('Retention time (s)')
-            ax.set_ylabel('Intensity')
-            _custom_log("Saving figure: {}".format(out_path), logger)
-            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
-            plt.close(fig)
-
-    #
-    # Base Peak chromatogram before and after alignment.
-    #
-    if not params['qc_plot_per_file']:
-        out_path = os.path.join(output_dir, 'quality', 'bpc_unaligned.{}'.format(params['qc_plot_extension']))
-        if not os.path.exists(out_path) or force_override:
-            fig, ax = plt.subplots(1, 1)
-
-            for input_file, color in zip(input_files, palette):
-                stem = input_file['stem']
-                _custom_log("Plotting Base Peak Chromatogram (unaligned): {}".format(stem), logger)
-
-                raw_data_path = os.path.join(output_dir, 'raw', "{}.ms1".format(stem))
-                raw_data = pastaq.read_raw_data(raw_data_path)
-                xic = pastaq.xic(
-                    raw_data,
-                    raw_data.min_mz,
-                    raw_data.max_mz,
-                    raw_data.min_rt,
-                    raw_data.max_rt,
-                    "max"
-                )
-                x = xic.retention_time
-                y = xic.intensity
-
-                if params['qc_plot_line_style'] == 'fill':
-                    ax.fill_between(x, 0, y, lw=0, color=color, alpha=fill_alpha, label=stem)
-                else:
-                    ax.plot(x, y, label=stem, alpha=line_alpha, color=color)
-
-            if params['qc_plot_fig_legend']:
-                plt.legend()
-            ax.set_xlabel('Retention time (s)')
-            ax.set_ylabel('Intensity')
-            _custom_log("Saving figure: {}".format(out_path), logger)
-            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
-            plt.close(fig)
-    else:
-        for input_file, color in zip(input_files, palette):
-            stem = input_file['stem']
-            out_path = os.path.join(output_dir, 'quality', '{}_bpc_unaligned.{}'.format(stem, params['qc_plot_extension']))
-            if os.path.exists(out_path) and not force_override:
-                continue
-            fig, ax = plt.subplots(1, 1)
-            _custom_log("Plotting Base Peak Chromatogram (unaligned): {}".format(stem), logger)
-
-            raw_data_path = os.path.join(output_dir, 'raw', "{}.ms1".format(stem))
-            raw_data = pastaq.read_raw_data(raw_data_path)
-            xic = pastaq.xic(
-                raw_data,
-                raw_data.min_mz,
-                raw_data.max_mz,
-                raw_data.min_rt,
-                raw_data.max_rt,
-                "max"
-            )
-            x = xic.retention_time
-            y = xic.intensity
-
-            if params['qc_plot_line_style'] == 'fill':
-                ax.fill_between(x, 0, y, lw=0, color=color, alpha=fill_alpha, label=stem)
-            else:
-                ax.plot(x, y, label=stem, alpha=line_alpha, color=color)
-
-            if params['qc_plot_fig_legend']:
-                plt.legend()
-            ax.set_xlabel('Retention time (s)')
-            ax.set_ylabel('Intensity')
-            _custom_log("Saving figure: {}".format(out_path), logger)
-            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
-            plt.close(fig)
-
-    if not params['qc_plot_per_file']:
-        out_path = os.path.join(output_dir, 'quality', 'bpc_aligned.{}'.format(params['qc_plot_extension']))
-        if not os.path.exists(out_path) or force_override:
-            fig, ax = plt.subplots(1, 1)
-
-            for input_file, color in zip(input_files, palette):
-                stem = input_file['stem']
-                _custom_log("Plotting Base Peak Chromatogram (aligned): {}".format(stem), logger)
-
-                raw_data_path = os.path.join(output_dir, 'raw', "{}.ms1".format(stem))
-                tmap_path = os.path.join(output_dir, 'time_map', "{}.tmap".format(stem))
-
-                raw_data = pastaq.read_raw_data(raw_data_path)
-                tmap = pastaq.read_time_map(tmap_path)
-
-                xic = pastaq.xic(
-                    raw_data,
-                    raw_data.min_mz,
-                    raw_data.max_mz,
-                    raw_data.min_rt,
-                    raw_data.max_rt,
-                    "max"
-                )
-                x = [tmap.warp(rt) for rt in xic.retention_time]
-                y = xic.intensity
-
-                if params['qc_plot_line_style'] == 'fill':
-                    ax.fill_between(x, 0, y, lw=0, color=color, alpha=fill_alpha, label=stem)
-                else:
-                    ax.plot(x, y, label=stem, alpha=line_alpha, color=color)
-
-            if params['qc_plot_fig_legend']:
-                plt.legend()
-            ax.set_xlabel('Retention time (s)')
-            ax.set_ylabel('Intensity')
-            _custom_log("Saving figure: {}".format(out_path), logger)
-            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
-            plt.close(fig)
-    else:
-        for input_file, color in zip(input_files, palette):
-            stem = input_file['stem']
-            out_path = os.path.join(output_dir, 'quality', '{}_bpc_aligned.{}'.format(stem, params['qc_plot_extension']))
-            if os.path.exists(out_path) and not force_override:
-                continue
-            fig, ax = plt.subplots(1, 1)
-            _custom_log("Plotting Base Peak Chromatogram (aligned): {}".format(stem), logger)
-
-            raw_data_path = os.path.join(output_dir, 'raw', "{}.ms1".format(stem))
-            tmap_path = os.path.join(output_dir, 'time_map', "{}.tmap".format(stem))
-
-            raw_data = pastaq.read_raw_data(raw_data_path)
-            tmap = pastaq.read_time_map(tmap_path)
-
-            xic = pastaq.xic(
-                raw_data,
-                raw_data.min_mz,
-                raw_data.max_mz,
-                raw_data.min_rt,
-                raw_data.max_rt,
-                "max"
-            )
-            x = [tmap.warp(rt) for rt in xic.retention_time]
-            y = xic.intensity
-
-            if params['qc_plot_line_style'] == 'fill':
-                ax.fill_between(x, 0, y, lw=0, color=color, alpha=fill_alpha, label=stem)
-            else:
-                ax.plot(x, y, label=stem, alpha=line_alpha, color=color)
-
-            if params['qc_plot_fig_legend']:
-                plt.legend()
-            ax.set_xlabel('Retention time (s)')
-            ax.set_ylabel('Intensity')
-            _custom_log("Saving figure: {}".format(out_path), logger)
-            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
-            plt.close(fig)
-
-    #
-    # Similarity matrix before/after alignment.
-    #
-    out_path = os.path.join(output_dir, 'quality', 'similarity_unaligned.{}'.format(params['qc_plot_extension']))
-    if not os.path.exists(out_path) or force_override:
-        fig, ax = plt.subplots(1, 1)
-        _custom_log("Plotting similarity matrix before alignment", logger)
-        matrix_path = os.path.join(output_dir, 'quality', 'similarity_{}.csv'.format('peaks'))
-        similarity_matrix = pd.read_csv(matrix_path, index_col=0)
-        sns.heatmap(similarity_matrix, xticklabels=True, yticklabels=True, square=True, vmin=0, vmax=1)
-        _custom_log("Saving figure: {}".format(out_path), logger)
-        plt.savefig(out_path, dpi=params['qc_plot_dpi'])
-        plt.close(fig)
-
-    out_path = os.path.join(output_dir, 'quality', 'similarity_aligned.{}'.format(params['qc_plot_extension']))
-    if not os.path.exists(out_path) or force_override:
-        fig, ax = plt.subplots(1, 1)
-        _custom_log("Plotting similarity matrix after alignment", logger)
-        matrix_path = os.path.join(output_dir, 'quality', 'similarity_{}.csv'.format('warped_peaks'))
-        similarity_matrix = pd.read_csv(matrix_path, index_col=0)
-        sns.heatmap(similarity_matrix, xticklabels=True, yticklabels=True, square=True, vmin=0, vmax=1)
-        _custom_log("Saving figure: {}".format(out_path), logger)
-        plt.savefig(out_path, dpi=params['qc_plot_dpi'])
-        plt.close(fig)
-
-    elapsed_time = datetime.timedelta(seconds=time.time()-time_start)
-    _custom_log('Finished quality control plotting in {}'.format(elapsed_time), logger)
-
-
 def dda_pipeline(
     pastaq_parameters,
     input_files,
@@ -2578,6 +1586,8 @@ def dda_pipeline(
     # TODO: Sanitize parameters.
     # TODO: Sanitize input/outputs.
     # TODO:     - Check if there are name conflicts.
+    from .plots import generate_qc_plots
+    from .tables import calculate_similarity_matrix, create_quantitative_tables
 
     # Create output directory and subdirectoreis if necessary.
     if not os.path.exists(output_dir):
@@ -2640,6 +1650,8 @@ def dda_pipeline(
         # Obtain the stem for this file if not manually specified.
         if 'stem' not in file:
             base_name = os.path.basename(file['raw_path'])
+            if base_name.lower().endswith('.gz'):
+                base_name = base_name[:-3]
             base_name = os.path.splitext(base_name)
             file['stem'] = base_name[0]
 
@@ -2660,17 +1672,35 @@ def dda_pipeline(
     # Store current time for logging the total elapsed time for the entire run.
     time_pipeline_start = time.time()
 
-    parse_raw_files(pastaq_parameters, output_dir, logger, force_override)
-    detect_peaks(pastaq_parameters, output_dir, save_grid, logger, force_override)
-    calculate_similarity_matrix(pastaq_parameters, output_dir, 'peaks', logger, force_override)
-    perform_rt_alignment(pastaq_parameters, output_dir, logger, force_override)
-    calculate_similarity_matrix(pastaq_parameters, output_dir, 'warped_peaks', logger, force_override)
-    perform_feature_detection(pastaq_parameters, output_dir, logger, force_override)
-    parse_mzidentml_files(pastaq_parameters, output_dir, logger, force_override)
+    # The identification files don't depend on the raw data processing, so they are parsed on a background thread. The
+    # mzIdentML reader releases the GIL while parsing.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        ident_future = executor.submit(parse_mzidentml_files, pastaq_parameters, output_dir, logger, force_override)
+        parse_raw_files(pastaq_parameters, output_dir, logger, force_override)
+        detect_peaks(pastaq_parameters, output_dir, save_grid, logger, force_override)
+        calculate_similarity_matrix(pastaq_parameters, output_dir, 'peaks', logger, force_override)
+        perform_rt_alignment(pastaq_parameters, output_dir, logger, force_override)
+        calculate_similarity_matrix(pastaq_parameters, output_dir, 'warped_peaks', logger, force_override)
+        perform_feature_detection(pastaq_parameters, output_dir, logger, force_override)
+        ident_future.result()
     link_peaks_msms_idents(pastaq_parameters, output_dir, logger, force_override)
     match_peaks_and_features(pastaq_parameters, output_dir, logger, force_override)
-    create_quantitative_tables(pastaq_parameters, output_dir, logger, force_override)
-    generate_qc_plots(pastaq_parameters, output_dir, logger, force_override)
+
+    # The quantitative tables and quality control plots combine the results of
+    # all files, so they are recreated if any of them changed.
+    artifacts = _pipeline_artifacts(pastaq_parameters, output_dir)
+    quant_key = _stage_key('quant', pastaq_parameters, sorted(
+        name for name in pastaq_parameters if name.startswith('quant_')
+    ), inputs=artifacts)
+    quant_override = force_override or not _is_stage_current(output_dir, 'quant', quant_key)
+    create_quantitative_tables(pastaq_parameters, output_dir, logger, quant_override)
+    _set_stage_key(output_dir, 'quant', quant_key)
+    qc_key = _stage_key('qc', pastaq_parameters, sorted(
+        name for name in pastaq_parameters if name.startswith('qc_')
+    ), inputs=artifacts, extra=quant_key)
+    qc_override = force_override or not _is_stage_current(output_dir, 'qc', qc_key)
+    generate_qc_plots(pastaq_parameters, output_dir, logger, qc_override)
+    _set_stage_key(output_dir, 'qc', qc_key)
     dda_pipeline_summary(pastaq_parameters, output_dir, logger)
 
     logger.info('Total time elapsed: {}'.format(
@@ -2679,3 +1709,157 @@ def dda_pipeline(
     # Stop logger.
     logger.removeHandler(logger_fh)
     logger_fh.close()
+
+
+def pack_project(output_dir, file_name):
+    """Pack the results of a pipeline run into a single container file.
+
+    Every file in the output directory is stored unmodified as a member of the
+    container, named by its path relative to the output directory. The binary
+    files can be used directly from the container by the read_* functions, with
+    paths such as 'run.pastaq/peaks/a.peaks'.
+
+    Args:
+        output_dir (string): Output directory of the pipeline run
+        file_name (string): Path to the container file that will be created
+
+    Returns:
+        The Container with the packed files
+    """
+    container = pastaq.Container.create(file_name)
+    for root, dirs, files in os.walk(output_dir):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            member = os.path.relpath(path, output_dir).replace(os.sep, '/')
+            container.add_file(member, path)
+    return container
+
+
+def unpack_project(file_name, output_dir):
+    """Unpack a container file created with pack_project into a directory.
+
+    Args:
+        file_name (string): Path to the container file
+        output_dir (string): Directory where the members will be extracted
+    """
+    container = pastaq.Container(file_name)
+    for member in container.members():
+        path = os.path.join(output_dir, *member.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        container.extract(member, path)
+
+
+def _shared_kind(value):
+    if isinstance(value, pastaq.RawData):
+        return 'raw_data'
+    if isinstance(value, pastaq.Grid):
+        return 'grid'
+    if isinstance(value, pastaq.TimeMap):
+        return 'time_map'
+    if isinstance(value, pastaq.IdentData):
+        return 'ident_data'
+    if isinstance(value, list) and all(isinstance(element, pastaq.Peak) for element in value):
+        return 'peaks'
+    if isinstance(value, list) and all(isinstance(element, pastaq.Feature) for element in value):
+        return 'features'
+    raise TypeError("can't export {} to shared memory".format(type(value).__name__))
+
+
+class SharedData:
+    """Handle to an object exported to shared memory with export_shared.
+
+    The handle can be pickled and sent to other processes, which read the
+    object with attach_shared. The process that exported the object owns the
+    shared memory, and has to keep the handle until the other processes have
+    attached to it. The memory is released with close(), or at the end of a
+    with block.
+    """
+
+    def __init__(self, name, kind, size, shared_memory=None):
+        self.name = name
+        self.kind = kind
+        self.size = size
+        self._shared_memory = shared_memory
+
+    def __getstate__(self):
+        return {'name': self.name, 'kind': self.kind, 'size': self.size}
+
+    def __setstate__(self, state):
+        self.__init__(state['name'], state['kind'], state['size'])
+
+    def close(self):
+        if self._shared_memory is not None:
+            self._shared_memory.close()
+            self._shared_memory.unlink()
+            self._shared_memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return "SharedData <kind: {}, size: {}, name: {}>".format(self.kind, self.size, self.name)
+
+
+def export_shared(value):
+    """Copy an object to shared memory, so that it can be used by other
+    processes without pickling it for each of them.
+
+    Args:
+        value: RawData, Grid, TimeMap, IdentData or a list of Peak or Feature
+            objects
+
+    Returns:
+        The SharedData handle to pass to attach_shared
+    """
+    from multiprocessing import shared_memory
+
+    kind = _shared_kind(value)
+    data = getattr(pastaq, 'serialize_{}'.format(kind))(value)
+    memory = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+    memory.buf[:len(data)] = data
+    return SharedData(memory.name, kind, len(data), memory)
+
+
+def attach_shared(shared_data):
+    """Read an object exported with export_shared. The object is read
+    directly from the shared memory, which can be released by the exporting
+    process afterwards.
+
+    Args:
+        shared_data (SharedData): Handle returned by export_shared
+
+    Returns:
+        A copy of the exported object
+    """
+    from multiprocessing import shared_memory
+
+    # Only the exporting process removes the memory. Before Python 3.13 the
+    # attaching processes always register it with the resource tracker, which
+    # is shared by the workers of a process pool with their parent.
+    kwargs = {'track': False} if sys.version_info >= (3, 13) else {}
+    memory = shared_memory.SharedMemory(name=shared_data.name, **kwargs)
+    try:
+        data = memory.buf[:shared_data.size]
+        try:
+            return getattr(pastaq, 'deserialize_{}'.format(shared_data.kind))(data)
+        finally:
+            data.release()
+    finally:
+        memory.close()
+
+
+# Objects read with _attach_shared_cached in this process, by shared memory
+# name. Each export has a different name, so entries are never stale.
+_attached_shared = {}
+
+
+def _attach_shared_cached(shared_data):
+    # Worker processes of a pool run many tasks with the same shared object,
+    # which is only read from the shared memory for the first of them.
+    if shared_data.name not in _attached_shared:
+        _attached_shared[shared_data.name] = attach_shared(shared_data)
+    return _attached_shared[shared_data.name]
@@ -1,6 +1,9 @@
 #include <cassert>
 #include <fstream>
 #include <iostream>
+#include <memory>
+#include <sstream>
+#include <streambuf>
 #include <string>
 #include <thread>
 #include <tuple>
@@ -26,6 +29,7 @@
 #include "raw_data/raw_data_serialize.hpp"
 #include "raw_data/xml_reader.hpp"
 #include "utils/compression.hpp"
+#include "utils/container.hpp"
 #include "utils/search.hpp"
 #include "utils/serialization.hpp"
 #include "warp2d/warp2d.hpp"
@@ -34,59 +38,182 @@
 namespace py = pybind11;
 
 namespace PythonAPI {
-RawData::RawData read_mzxml(std::string &input_file, double min_mz,
-                            double max_mz, double min_rt, double max_rt,
-                            std::string instrument_type_str,
-                            double resolution_ms1, double resolution_msn,
-                            double reference_mz, double fwhm_rt,
-                            std::string polarity_str, size_t ms_level) {
-    pybind11::gil_scoped_release release;
-    // Setup infinite range if no point was specified.
-    min_rt = min_rt < 0 ? 0 : min_rt;
-    max_rt = max_rt < 0 ? std::numeric_limits<double>::infinity() : max_rt;
-    min_mz = min_mz < 0 ? 0 : min_mz;
-    max_mz = max_mz < 0 ? std::numeric_limits<double>::infinity() : max_mz;
-
-    // Parse the instrument type.
-    auto instrument_type = Instrument::UNKNOWN;
+// Parse the instrument type from its string representation.
+Instrument::Type parse_instrument_type(std::string instrument_type_str) {
     for (auto &ch : instrument_type_str) {
         ch = tolower(ch);
     }
     if (instrument_type_str == "orbitrap") {
-        instrument_type = Instrument::ORBITRAP;
+        return Instrument::ORBITRAP;
     } else if (instrument_type_str == "tof") {
-        instrument_type = Instrument::TOF;
-    } else if (instrument_type_str == "quad" || instrument_type_str == "quadrupole") {
-        instrument_type = Instrument::QUAD;
-    } else if (instrument_type_str == "fticr" || instrument_type_str == "ft-icr" ) {
-        instrument_type = Instrument::FTICR;
-    } else {
-        pybind11::gil_scoped_acquire acquire;
-        std::ostringstream error_stream;
-        error_stream << "the given instrument is not supported";
-        throw std::invalid_argument(error_stream.str());
+        return Instrument::TOF;
+    } else if (instrument_type_str == "quad" ||
+               instrument_type_str == "quadrupole") {
+        return Instrument::QUAD;
+    } else if (instrument_type_str == "fticr" ||
+               instrument_type_str == "ft-icr") {
+        return Instrument::FTICR;
+    }
+    pybind11::gil_scoped_acquire acquire;
+    std::ostringstream error_stream;
+    error_stream << "the given instrument is not supported";
+    throw std::invalid_argument(error_stream.str());
+}
+
+// Parse the compression codec used for the binary files from its string
+// representation.
+Compression::Codec::Type parse_codec(std::string codec_str) {
+    for (auto &ch : codec_str) {
+        ch = tolower(ch);
     }
-    // Parse the polarity.
-    auto polarity = Polarity::BOTH;
+    if (codec_str == "none") {
+        return Compression::Codec::NONE;
+    } else if (codec_str == "zlib") {
+        return Compression::Codec::ZLIB;
+    }
+    pybind11::gil_scoped_acquire acquire;
+    std::ostringstream error_stream;
+    error_stream << "the given compression codec is not supported. choose "
+                    "between 'none' or 'zlib' (default)";
+    throw std::invalid_argument(error_stream.str());
+}
+
+// Parse the floating point precision of the grid data from its string
+// representation.
+Grid::Precision::Type parse_precision(std::string precision_str) {
+    for (auto &ch : precision_str) {
+        ch = tolower(ch);
+    }
+    if (precision_str == "double" || precision_str == "float64") {
+        return Grid::Precision::DOUBLE;
+    } else if (precision_str == "float" || precision_str == "float32") {
+        return Grid::Precision::FLOAT;
+    }
+    pybind11::gil_scoped_acquire acquire;
+    std::ostringstream error_stream;
+    error_stream << "the given precision is not supported. choose "
+                    "between 'float' or 'double' (default)";
+    throw std::invalid_argument(error_stream.str());
+}
+
+// Parse the polarity from its string representation.
+Polarity::Type parse_polarity(std::string polarity_str) {
     for (auto &ch : polarity_str) {
         ch = tolower(ch);
     }
     if (polarity_str == "" || polarity_str == "both" || polarity_str == "+-" ||
         polarity_str == "-+") {
-        polarity = Polarity::BOTH;
+        return Polarity::BOTH;
     } else if (polarity_str == "+" || polarity_str == "pos" ||
                polarity_str == "positive") {
-        polarity = Polarity::POSITIVE;
+        return Polarity::POSITIVE;
     } else if (polarity_str == "-" || polarity_str == "neg" ||
                polarity_str == "negative") {
-        polarity = Polarity::NEGATIVE;
+        return Polarity::NEGATIVE;
+    }
+    pybind11::gil_scoped_acquire acquire;
+    std::ostringstream error_stream;
+    error_stream << "the given polarity is not supported. choose "
+                    "between '+', '-', 'both' (default)";
+    throw std::invalid_argument(error_stream.str());
+}
+
+// Open the given input file for reading. Gzip compressed files are
+// decompressed on the fly, reading them in large blocks.
+std::unique_ptr<std::istream> open_input_file(const std::string &input_file) {
+    std::unique_ptr<std::istream> stream;
+    if (Compression::is_gzip(input_file)) {
+        stream = std::make_unique<Compression::InflateStream>(input_file,
+                                                              1 << 20);
     } else {
+        stream = std::make_unique<std::ifstream>(input_file);
+    }
+    if (!*stream) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
-        error_stream << "the given polarity is not supported. choose "
-                        "between '+', '-', 'both' (default)";
+        error_stream << "error: couldn't open input file" << input_file;
         throw std::invalid_argument(error_stream.str());
     }
+    return stream;
+}
+
+// Find the format of a raw data file from its extension, ignoring the
+// compression extension if present. Returns either "mzxml" or "mzml".
+std::string raw_file_format(const std::string &input_file) {
+    std::string file_name = input_file;
+    for (auto &ch : file_name) {
+        ch = tolower(ch);
+    }
+    if (file_name.size() > 3 &&
+        file_name.compare(file_name.size() - 3, 3, ".gz") == 0) {
+        file_name.resize(file_name.size() - 3);
+    }
+    std::string extension = file_name.substr(file_name.rfind('.') + 1);
+    if (extension != "mzxml" && extension != "mzml") {
+        pybind11::gil_scoped_acquire acquire;
+        std::ostringstream error_stream;
+        error_stream << "error: unknown file format for " << input_file
+                     << ", expected an mzXML or mzML file";
+        throw std::invalid_argument(error_stream.str());
+    }
+    return extension;
+}
+
+// Prepare the stream for reading the mzML spectra in the given retention time
+// range. When reading a retention time window, use the spectrum offset index
+// to seek directly to the requested spectra. If the file is not indexed, a
+// sidecar index is built once and stored next to the input file. Compressed
+// files can't be seeked and are always read from the start.
+void seek_mzml_spectrum(const std::string &input_file, std::istream &stream,
+                        double min_rt, double max_rt, bool use_index) {
+    bool rt_window =
+        min_rt > 0 || max_rt != std::numeric_limits<double>::infinity();
+    if (!use_index || !rt_window || Compression::is_gzip(input_file)) {
+        return;
+    }
+    auto index = XmlReader::read_mzml_index(stream);
+    if (!index) {
+        std::string index_file = input_file + ".idx";
+        std::ifstream index_stream;
+        index_stream.open(index_file, std::ios::in | std::ios::binary);
+        XmlReader::SpectrumIndex sidecar_index = {};
+        if (index_stream &&
+            XmlReader::read_spectrum_index(index_stream, &sidecar_index)) {
+            stream.clear();
+            stream.seekg(0, std::ios::end);
+            if (sidecar_index.file_size ==
+                static_cast<uint64_t>(stream.tellg())) {
+                index = sidecar_index;
+            }
+        }
+    }
+    if (!index) {
+        index = XmlReader::build_mzml_index(stream);
+        std::ofstream out_stream;
+        out_stream.open(input_file + ".idx", std::ios::out | std::ios::binary);
+        if (out_stream) {
+            XmlReader::write_spectrum_index(out_stream, index.value());
+        }
+    }
+    XmlReader::seek_mzml_spectrum(stream, index.value(), min_rt);
+}
+
+RawData::RawData read_mzxml(std::string &input_file, double min_mz,
+                            double max_mz, double min_rt, double max_rt,
+                            std::string instrument_type_str,
+                            double resolution_ms1, double resolution_msn,
+                            double reference_mz, double fwhm_rt,
+                            std::string polarity_str, size_t ms_level,
+                            size_t max_threads) {
+    pybind11::gil_scoped_release release;
+    // Setup infinite range if no point was specified.
+    min_rt = min_rt < 0 ? 0 : min_rt;
+    max_rt = max_rt < 0 ? std::numeric_limits<double>::infinity() : max_rt;
+    min_mz = min_mz < 0 ? 0 : min_mz;
+    max_mz = max_mz < 0 ? std::numeric_limits<double>::infinity() : max_mz;
+
+    auto instrument_type = parse_instrument_type(instrument_type_str);
+    auto polarity = parse_polarity(polarity_str);
 
     // Sanity check the min/max rt/mz.
     if (min_rt >= max_rt) {
@@ -105,18 +232,12 @@ RawData::RawData read_mzxml(std::string &input_file, double min_mz,
     }
 
     // Open file stream.
-    std::ifstream stream;
-    stream.open(input_file);
-    if (!stream) {
-        pybind11::gil_scoped_acquire acquire;
-        std::ostringstream error_stream;
-        error_stream << "error: couldn't open input file" << input_file;
-        throw std::invalid_argument(error_stream.str());
-    }
+    auto stream_ptr = open_input_file(input_file);
+    auto &stream = *stream_ptr;
 
     auto raw_data = XmlReader::read_mzxml(
         stream, min_mz, max_mz, min_rt, max_rt, instrument_type, resolution_ms1,
-        resolution_msn, reference_mz, polarity, ms_level);
+        resolution_msn, reference_mz, polarity, ms_level, max_threads);
     if (!raw_data) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
@@ -135,7 +256,8 @@ RawData::RawData _read_mzml(std::string &input_file, double min_mz,
                            std::string instrument_type_str,
                            double resolution_ms1, double resolution_msn,
                            double reference_mz, double fwhm_rt,
-                           std::string polarity_str, size_t ms_level) {
+                           std::string polarity_str, size_t ms_level,
+                           bool use_index, size_t max_threads) {
     pybind11::gil_scoped_release release;
     // Setup infinite range if no point was specified.
     min_rt = min_rt < 0 ? 0 : min_rt;
@@ -143,46 +265,62 @@ RawData::RawData _read_mzml(std::string &input_file, double min_mz,
     min_mz = min_mz < 0 ? 0 : min_mz;
     max_mz = max_mz < 0 ? std::numeric_limits<double>::infinity() : max_mz;
 
-    // Parse the instrument type.
-    auto instrument_type = Instrument::UNKNOWN;
-    for (auto &ch : instrument_type_str) {
-        ch = tolower(ch);
-    }
-    if (instrument_type_str == "orbitrap") {
-        instrument_type = Instrument::ORBITRAP;
-    } else if (instrument_type_str == "tof") {
-        instrument_type = Instrument::TOF;
-    } else if (instrument_type_str == "quad") {
-        instrument_type = Instrument::QUAD;
-    } else if (instrument_type_str == "fticr") {
-        instrument_type = Instrument::FTICR;
-    } else {
+    auto instrument_type = parse_instrument_type(instrument_type_str);
+    auto polarity = parse_polarity(polarity_str);
+
+    // Sanity check the min/max rt/mz.
+    if (min_rt >= max_rt) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
-        error_stream << "the given instrument is not supported";
+        error_stream << "error: min_rt >= max_rt (min_rt: " << min_rt
+                     << ", max_rt: " << max_rt << ")";
         throw std::invalid_argument(error_stream.str());
     }
-    // Parse the polarity.
-    auto polarity = Polarity::BOTH;
-    for (auto &ch : polarity_str) {
-        ch = tolower(ch);
+    if (min_mz >= max_mz) {
+        pybind11::gil_scoped_acquire acquire;
+        std::ostringstream error_stream;
+        error_stream << "error: min_mz >= max_mz (min_mz: " << min_mz
+                     << ", max_mz: " << max_mz << ")";
+        throw std::invalid_argument(error_stream.str());
     }
-    if (polarity_str == "" || polarity_str == "both" || polarity_str == "+-" ||
-        polarity_str == "-+") {
-        polarity = Polarity::BOTH;
-    } else if (polarity_str == "+" || polarity_str == "pos" ||
-               polarity_str == "positive") {
-        polarity = Polarity::POSITIVE;
-    } else if (polarity_str == "-" || polarity_str == "neg" ||
-               polarity_str == "negative") {
-        polarity = Polarity::NEGATIVE;
-    } else {
+
+    // Open file stream.
+    auto stream_ptr = open_input_file(input_file);
+    auto &stream = *stream_ptr;
+
+    seek_mzml_spectrum(input_file, stream, min_rt, max_rt, use_index);
+    auto raw_data = XmlReader::_read_mzml(
+        stream, min_mz, max_mz, min_rt, max_rt, instrument_type, resolution_ms1,
+        resolution_msn, reference_mz, polarity, ms_level, max_threads);
+    if (!raw_data) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
-        error_stream << "the given polarity is not supported. choose "
-                        "between '+', '-', 'both' (default)";
+        error_stream << "error: an error occurred when reading the file"
+                     << input_file;
         throw std::invalid_argument(error_stream.str());
     }
+    raw_data.value().fwhm_rt = fwhm_rt;
+
+    pybind11::gil_scoped_acquire acquire;
+    return raw_data.value();
+}
+
+std::vector<XmlReader::RawDataOutput> _read_raw_multi(
+    std::string &input_file, double min_mz, double max_mz, double min_rt,
+    double max_rt, std::string instrument_type_str, double resolution_ms1,
+    double resolution_msn, double reference_mz, double fwhm_rt,
+    std::string polarity_str, std::vector<size_t> ms_levels,
+    bool split_polarity, bool split_faims, bool use_index,
+    size_t max_threads) {
+    pybind11::gil_scoped_release release;
+    // Setup infinite range if no point was specified.
+    min_rt = min_rt < 0 ? 0 : min_rt;
+    max_rt = max_rt < 0 ? std::numeric_limits<double>::infinity() : max_rt;
+    min_mz = min_mz < 0 ? 0 : min_mz;
+    max_mz = max_mz < 0 ? std::numeric_limits<double>::infinity() : max_mz;
+
+    auto instrument_type = parse_instrument_type(instrument_type_str);
+    auto polarity = parse_polarity(polarity_str);
 
     // Sanity check the min/max rt/mz.
     if (min_rt >= max_rt) {
@@ -199,31 +337,493 @@ RawData::RawData _read_mzml(std::string &input_file, double min_mz,
                      << ", max_mz: " << max_mz << ")";
         throw std::invalid_argument(error_stream.str());
     }
+    if (ms_levels.empty()) {
+        pybind11::gil_scoped_acquire acquire;
+        std::ostringstream error_stream;
+        error_stream << "error: at least one ms_level must be given";
+        throw std::invalid_argument(error_stream.str());
+    }
+
+    auto extension = raw_file_format(input_file);
 
     // Open file stream.
-    std::ifstream stream;
-    stream.open(input_file);
-    if (!stream) {
+    auto stream_ptr = open_input_file(input_file);
+    auto &stream = *stream_ptr;
+
+    XmlReader::SplitParams split_params = {ms_levels, split_polarity,
+                                           split_faims ? IonMobility::FAIMS
+                                                       : IonMobility::UNKNOWN};
+    std::vector<XmlReader::RawDataOutput> outputs;
+    if (extension == "mzxml") {
+        outputs = XmlReader::read_mzxml_multi(
+            stream, min_mz, max_mz, min_rt, max_rt, instrument_type,
+            resolution_ms1, resolution_msn, reference_mz, polarity,
+            split_params, max_threads);
+    } else {
+        seek_mzml_spectrum(input_file, stream, min_rt, max_rt, use_index);
+        outputs = XmlReader::_read_mzml_multi(
+            stream, min_mz, max_mz, min_rt, max_rt, instrument_type,
+            resolution_ms1, resolution_msn, reference_mz, polarity,
+            split_params, max_threads);
+    }
+    for (auto &output : outputs) {
+        output.raw_data.fwhm_rt = fwhm_rt;
+    }
+
+    pybind11::gil_scoped_acquire acquire;
+    return outputs;
+}
+
+XmlReader::LazyRawData _read_raw_lazy(
+    std::string &input_file, double min_mz, double max_mz, double min_rt,
+    double max_rt, std::string instrument_type_str, double resolution_ms1,
+    double resolution_msn, double reference_mz, double fwhm_rt,
+    std::string polarity_str, size_t ms_level, bool use_index,
+    size_t max_cache_mb) {
+    pybind11::gil_scoped_release release;
+    // Setup infinite range if no point was specified.
+    min_rt = min_rt < 0 ? 0 : min_rt;
+    max_rt = max_rt < 0 ? std::numeric_limits<double>::infinity() : max_rt;
+    min_mz = min_mz < 0 ? 0 : min_mz;
+    max_mz = max_mz < 0 ? std::numeric_limits<double>::infinity() : max_mz;
+
+    auto instrument_type = parse_instrument_type(instrument_type_str);
+    auto polarity = parse_polarity(polarity_str);
+
+    // Sanity check the min/max rt/mz.
+    if (min_rt >= max_rt) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
-        error_stream << "error: couldn't open input file" << input_file;
+        error_stream << "error: min_rt >= max_rt (min_rt: " << min_rt
+                     << ", max_rt: " << max_rt << ")";
+        throw std::invalid_argument(error_stream.str());
+    }
+    if (min_mz >= max_mz) {
+        pybind11::gil_scoped_acquire acquire;
+        std::ostringstream error_stream;
+        error_stream << "error: min_mz >= max_mz (min_mz: " << min_mz
+                     << ", max_mz: " << max_mz << ")";
         throw std::invalid_argument(error_stream.str());
     }
 
-    auto raw_data = XmlReader::_read_mzml(
-        stream, min_mz, max_mz, min_rt, max_rt, instrument_type, resolution_ms1,
-        resolution_msn, reference_mz, polarity, ms_level);
-    if (!raw_data) {
+    // The scans are decoded by seeking to their position in the file, which
+    // is not possible for compressed files.
+    if (Compression::is_gzip(input_file)) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
-        error_stream << "error: an error occurred when reading the file"
-                     << input_file;
+        error_stream << "error: lazy reading is not supported for compressed "
+                        "files ("
+                     << input_file << ")";
         throw std::invalid_argument(error_stream.str());
     }
-    raw_data.value().fwhm_rt = fwhm_rt;
+
+    auto extension = raw_file_format(input_file);
+
+    // Open file stream.
+    auto stream = open_input_file(input_file);
+    size_t max_cache_bytes = max_cache_mb << 20;
+    std::optional<XmlReader::LazyRawData> lazy_raw_data;
+    if (extension == "mzxml") {
+        lazy_raw_data = XmlReader::read_mzxml_lazy(
+            std::move(stream), min_mz, max_mz, min_rt, max_rt, instrument_type,
+            resolution_ms1, resolution_msn, reference_mz, polarity, ms_level,
+            max_cache_bytes);
+    } else {
+        seek_mzml_spectrum(input_file, *stream, min_rt, max_rt, use_index);
+        lazy_raw_data = XmlReader::_read_mzml_lazy(
+            std::move(stream), min_mz, max_mz, min_rt, max_rt, instrument_type,
+            resolution_ms1, resolution_msn, reference_mz, polarity, ms_level,
+            max_cache_bytes);
+    }
+    lazy_raw_data.value().metadata().fwhm_rt = fwhm_rt;
 
     pybind11::gil_scoped_acquire acquire;
-    return raw_data.value();
+    return std::move(lazy_raw_data.value());
+}
+
+XmlReader::ScanReader _iter_scans(std::string &input_file, double min_mz,
+                                  double max_mz, double min_rt, double max_rt,
+                                  std::string polarity_str, size_t ms_level,
+                                  bool use_index) {
+    pybind11::gil_scoped_release release;
+    // Setup infinite range if no point was specified.
+    min_rt = min_rt < 0 ? 0 : min_rt;
+    max_rt = max_rt < 0 ? std::numeric_limits<double>::infinity() : max_rt;
+    min_mz = min_mz < 0 ? 0 : min_mz;
+    max_mz = max_mz < 0 ? std::numeric_limits<double>::infinity() : max_mz;
+
+    auto polarity = parse_polarity(polarity_str);
+
+    // Sanity check the min/max rt/mz.
+    if (min_rt >= max_rt) {
+        pybind11::gil_scoped_acquire acquire;
+        std::ostringstream error_stream;
+        error_stream << "error: min_rt >= max_rt (min_rt: " << min_rt
+                     << ", max_rt: " << max_rt << ")";
+        throw std::invalid_argument(error_stream.str());
+    }
+    if (min_mz >= max_mz) {
+        pybind11::gil_scoped_acquire acquire;
+        std::ostringstream error_stream;
+        error_stream << "error: min_mz >= max_mz (min_mz: " << min_mz
+                     << ", max_mz: " << max_mz << ")";
+        throw std::invalid_argument(error_stream.str());
+    }
+    auto extension = raw_file_format(input_file);
+
+    // Open file stream.
+    auto stream = open_input_file(input_file);
+    if (extension == "mzml") {
+        seek_mzml_spectrum(input_file, *stream, min_rt, max_rt, use_index);
+    }
+    XmlReader::ScanReader reader(std::move(stream), extension == "mzxml",
+                                 min_mz, max_mz, min_rt, max_rt, polarity,
+                                 ms_level);
+
+    pybind11::gil_scoped_acquire acquire;
+    return reader;
+}
+
+// Store a batch of scans as NumPy arrays. The mz/intensity values of all scans
+// are concatenated, with the points of scan i in [offsets[i], offsets[i + 1]).
+py::dict scans_to_arrays(const std::vector<RawData::Scan> &scans) {
+    size_t num_points = 0;
+    for (const auto &scan : scans) {
+        num_points += scan.mz.size();
+    }
+    py::array_t<uint64_t> scan_number(scans.size());
+    py::array_t<uint64_t> ms_level(scans.size());
+    py::array_t<double> retention_time(scans.size());
+    py::array_t<uint64_t> offsets(scans.size() + 1);
+    py::array_t<double> mz(num_points);
+    py::array_t<double> intensity(num_points);
+    auto scan_number_data = scan_number.mutable_data();
+    auto ms_level_data = ms_level.mutable_data();
+    auto retention_time_data = retention_time.mutable_data();
+    auto offsets_data = offsets.mutable_data();
+    auto mz_data = mz.mutable_data();
+    auto intensity_data = intensity.mutable_data();
+    size_t offset = 0;
+    for (size_t i = 0; i < scans.size(); ++i) {
+        const auto &scan = scans[i];
+        scan_number_data[i] = scan.scan_number;
+        ms_level_data[i] = scan.ms_level;
+        retention_time_data[i] = scan.retention_time;
+        offsets_data[i] = offset;
+        std::copy(scan.mz.begin(), scan.mz.end(), mz_data + offset);
+        std::copy(scan.intensity.begin(), scan.intensity.end(),
+                  intensity_data + offset);
+        offset += scan.mz.size();
+    }
+    offsets_data[scans.size()] = offset;
+
+    py::dict arrays;
+    arrays["scan_number"] = scan_number;
+    arrays["ms_level"] = ms_level;
+    arrays["retention_time"] = retention_time;
+    arrays["offsets"] = offsets;
+    arrays["mz"] = mz;
+    arrays["intensity"] = intensity;
+    return arrays;
+}
+
+// Store the given member of all elements as a NumPy array.
+template <typename Element, typename T>
+py::array_t<T> column(const std::vector<Element> &elements,
+                      T Element::*member) {
+    py::array_t<T> values(elements.size());
+    auto values_data = values.mutable_data();
+    for (size_t i = 0; i < elements.size(); ++i) {
+        values_data[i] = elements[i].*member;
+    }
+    return values;
+}
+
+// Store the given string member of all elements as a NumPy array of objects.
+template <typename Element>
+py::array string_column(const std::vector<Element> &elements,
+                        std::string Element::*member) {
+    py::list values(elements.size());
+    for (size_t i = 0; i < elements.size(); ++i) {
+        values[i] = py::str(elements[i].*member);
+    }
+    return py::module_::import("numpy").attr("array")(values,
+                                                     py::arg("dtype") = "O");
+}
+
+// Store the per file values of all clusters as a 2D NumPy array, with the
+// values of cluster i in row i.
+template <typename Cluster>
+py::array_t<double> file_column(const std::vector<Cluster> &clusters,
+                                std::vector<double> Cluster::*member) {
+    size_t num_files = clusters.empty() ? 0 : (clusters[0].*member).size();
+    py::array_t<double> values({clusters.size(), num_files});
+    auto values_data = values.mutable_data();
+    for (size_t i = 0; i < clusters.size(); ++i) {
+        const auto &file_values = clusters[i].*member;
+        if (file_values.size() != num_files) {
+            throw std::invalid_argument(
+                "error: the clusters have a different number of files");
+        }
+        std::copy(file_values.begin(), file_values.end(),
+                  values_data + i * num_files);
+    }
+    return values;
+}
+
+// Export the peaks as a dictionary of NumPy arrays with one column per member.
+py::dict peaks_to_columns(const std::vector<Centroid::Peak> &peaks) {
+    using Centroid::Peak;
+    py::dict columns;
+    columns["id"] = column(peaks, &Peak::id);
+    columns["local_max_mz"] = column(peaks, &Peak::local_max_mz);
+    columns["local_max_rt"] = column(peaks, &Peak::local_max_rt);
+    columns["local_max_height"] = column(peaks, &Peak::local_max_height);
+    columns["rt_delta"] = column(peaks, &Peak::rt_delta);
+    columns["roi_min_mz"] = column(peaks, &Peak::roi_min_mz);
+    columns["roi_max_mz"] = column(peaks, &Peak::roi_max_mz);
+    columns["roi_min_rt"] = column(peaks, &Peak::roi_min_rt);
+    columns["roi_max_rt"] = column(peaks, &Peak::roi_max_rt);
+    columns["raw_roi_mean_mz"] = column(peaks, &Peak::raw_roi_mean_mz);
+    columns["raw_roi_mean_rt"] = column(peaks, &Peak::raw_roi_mean_rt);
+    columns["raw_roi_sigma_mz"] = column(peaks, &Peak::raw_roi_sigma_mz);
+    columns["raw_roi_sigma_rt"] = column(peaks, &Peak::raw_roi_sigma_rt);
+    columns["raw_roi_skewness_mz"] = column(peaks, &Peak::raw_roi_skewness_mz);
+    columns["raw_roi_skewness_rt"] = column(peaks, &Peak::raw_roi_skewness_rt);
+    columns["raw_roi_kurtosis_mz"] = column(peaks, &Peak::raw_roi_kurtosis_mz);
+    columns["raw_roi_kurtosis_rt"] = column(peaks, &Peak::raw_roi_kurtosis_rt);
+    columns["raw_roi_max_height"] = column(peaks, &Peak::raw_roi_max_height);
+    columns["raw_roi_total_intensity"] =
+        column(peaks, &Peak::raw_roi_total_intensity);
+    columns["raw_roi_num_points"] = column(peaks, &Peak::raw_roi_num_points);
+    columns["raw_roi_num_scans"] = column(peaks, &Peak::raw_roi_num_scans);
+    columns["fitted_height"] = column(peaks, &Peak::fitted_height);
+    columns["fitted_mz"] = column(peaks, &Peak::fitted_mz);
+    columns["fitted_rt"] = column(peaks, &Peak::fitted_rt);
+    columns["fitted_sigma_mz"] = column(peaks, &Peak::fitted_sigma_mz);
+    columns["fitted_sigma_rt"] = column(peaks, &Peak::fitted_sigma_rt);
+    columns["fitted_volume"] = column(peaks, &Peak::fitted_volume);
+    columns["peak_fit_failure"] = column(peaks, &Peak::peak_fit_failure);
+    columns["fit_failure_code"] = column(peaks, &Peak::fit_failure_code);
+    return columns;
+}
+
+// Export the features as a dictionary of NumPy arrays with one column per
+// member. The peak ids of all features are concatenated, with the ids of
+// feature i in [peak_ids_offsets[i], peak_ids_offsets[i + 1]).
+py::dict features_to_columns(
+    const std::vector<FeatureDetection::Feature> &features) {
+    using FeatureDetection::Feature;
+    py::dict columns;
+    columns["id"] = column(features, &Feature::id);
+    columns["score"] = column(features, &Feature::score);
+    columns["average_rt"] = column(features, &Feature::average_rt);
+    columns["average_rt_delta"] = column(features, &Feature::average_rt_delta);
+    columns["average_rt_sigma"] = column(features, &Feature::average_rt_sigma);
+    columns["average_mz"] = column(features, &Feature::average_mz);
+    columns["average_mz_sigma"] = column(features, &Feature::average_mz_sigma);
+    columns["total_height"] = column(features, &Feature::total_height);
+    columns["total_volume"] = column(features, &Feature::total_volume);
+    columns["max_height"] = column(features, &Feature::max_height);
+    columns["max_volume"] = column(features, &Feature::max_volume);
+    columns["monoisotopic_mz"] = column(features, &Feature::monoisotopic_mz);
+    columns["monoisotopic_rt"] = column(features, &Feature::monoisotopic_rt);
+    columns["monoisotopic_height"] =
+        column(features, &Feature::monoisotopic_height);
+    columns["monoisotopic_volume"] =
+        column(features, &Feature::monoisotopic_volume);
+    columns["charge_state"] = column(features, &Feature::charge_state);
+
+    size_t num_peak_ids = 0;
+    for (const auto &feature : features) {
+        num_peak_ids += feature.peak_ids.size();
+    }
+    py::array_t<uint64_t> offsets(features.size() + 1);
+    py::array_t<uint64_t> peak_ids(num_peak_ids);
+    auto offsets_data = offsets.mutable_data();
+    auto peak_ids_data = peak_ids.mutable_data();
+    size_t offset = 0;
+    for (size_t i = 0; i < features.size(); ++i) {
+        const auto &feature = features[i];
+        offsets_data[i] = offset;
+        std::copy(feature.peak_ids.begin(), feature.peak_ids.end(),
+                  peak_ids_data + offset);
+        offset += feature.peak_ids.size();
+    }
+    offsets_data[features.size()] = offset;
+    columns["peak_ids"] = peak_ids;
+    columns["peak_ids_offsets"] = offsets;
+    return columns;
+}
+
+// Export the peak clusters as a dictionary of NumPy arrays with one column per
+// member. The heights and volumes are stored as 2D arrays with one column per
+// file. The ids of the peaks of all clusters are concatenated in the file_ids
+// and peak_ids arrays, with the peaks of cluster i in
+// [peak_ids_offsets[i], peak_ids_offsets[i + 1]).
+py::dict peak_clusters_to_columns(
+    const std::vector<MetaMatch::PeakCluster> &clusters) {
+    using MetaMatch::PeakCluster;
+    py::dict columns;
+    columns["id"] = column(clusters, &PeakCluster::id);
+    columns["mz"] = column(clusters, &PeakCluster::mz);
+    columns["rt"] = column(clusters, &PeakCluster::rt);
+    columns["avg_height"] = column(clusters, &PeakCluster::avg_height);
+    columns["avg_volume"] = column(clusters, &PeakCluster::avg_volume);
+    columns["heights"] = file_column(clusters, &PeakCluster::heights);
+    columns["volumes"] = file_column(clusters, &PeakCluster::volumes);
+
+    size_t num_peak_ids = 0;
+    for (const auto &cluster : clusters) {
+        num_peak_ids += cluster.peak_ids.size();
+    }
+    py::array_t<uint64_t> offsets(clusters.size() + 1);
+    py::array_t<uint64_t> file_ids(num_peak_ids);
+    py::array_t<uint64_t> peak_ids(num_peak_ids);
+    auto offsets_data = offsets.mutable_data();
+    auto file_ids_data = file_ids.mutable_data();
+    auto peak_ids_data = peak_ids.mutable_data();
+    size_t offset = 0;
+    for (size_t i = 0; i < clusters.size(); ++i) {
+        offsets_data[i] = offset;
+        for (const auto &peak_id : clusters[i].peak_ids) {
+            file_ids_data[offset] = peak_id.file_id;
+            peak_ids_data[offset] = peak_id.peak_id;
+            ++offset;
+        }
+    }
+    offsets_data[clusters.size()] = offset;
+    columns["file_ids"] = file_ids;
+    columns["peak_ids"] = peak_ids;
+    columns["peak_ids_offsets"] = offsets;
+    return columns;
+}
+
+// Export the feature clusters as a dictionary of NumPy arrays with one column
+// per member. The quantifications are stored as 2D arrays with one column per
+// file. The ids of the features of all clusters are concatenated in the
+// file_ids and feature_ids arrays, with the features of cluster i in
+// [feature_ids_offsets[i], feature_ids_offsets[i + 1]).
+py::dict feature_clusters_to_columns(
+    const std::vector<MetaMatch::FeatureCluster> &clusters) {
+    using MetaMatch::FeatureCluster;
+    py::dict columns;
+    columns["id"] = column(clusters, &FeatureCluster::id);
+    columns["mz"] = column(clusters, &FeatureCluster::mz);
+    columns["rt"] = column(clusters, &FeatureCluster::rt);
+    columns["charge_state"] = column(clusters, &FeatureCluster::charge_state);
+    columns["avg_total_height"] =
+        column(clusters, &FeatureCluster::avg_total_height);
+    columns["avg_monoisotopic_height"] =
+        column(clusters, &FeatureCluster::avg_monoisotopic_height);
+    columns["avg_max_height"] =
+        column(clusters, &FeatureCluster::avg_max_height);
+    columns["avg_total_volume"] =
+        column(clusters, &FeatureCluster::avg_total_volume);
+    columns["avg_monoisotopic_volume"] =
+        column(clusters, &FeatureCluster::avg_monoisotopic_volume);
+    columns["avg_max_volume"] =
+        column(clusters, &FeatureCluster::avg_max_volume);
+    columns["total_heights"] =
+        file_column(clusters, &FeatureCluster::total_heights);
+    columns["monoisotopic_heights"] =
+        file_column(clusters, &FeatureCluster::monoisotopic_heights);
+    columns["max_heights"] =
+        file_column(clusters, &FeatureCluster::max_heights);
+    columns["total_volumes"] =
+        file_column(clusters, &FeatureCluster::total_volumes);
+    columns["monoisotopic_volumes"] =
+        file_column(clusters, &FeatureCluster::monoisotopic_volumes);
+    columns["max_volumes"] =
+        file_column(clusters, &FeatureCluster::max_volumes);
+
+    size_t num_feature_ids = 0;
+    for (const auto &cluster : clusters) {
+        num_feature_ids += cluster.feature_ids.size();
+    }
+    py::array_t<uint64_t> offsets(clusters.size() + 1);
+    py::array_t<uint64_t> file_ids(num_feature_ids);
+    py::array_t<uint64_t> feature_ids(num_feature_ids);
+    auto offsets_data = offsets.mutable_data();
+    auto file_ids_data = file_ids.mutable_data();
+    auto feature_ids_data = feature_ids.mutable_data();
+    size_t offset = 0;
+    for (size_t i = 0; i < clusters.size(); ++i) {
+        offsets_data[i] = offset;
+        for (const auto &feature_id : clusters[i].feature_ids) {
+            file_ids_data[offset] = feature_id.file_id;
+            feature_ids_data[offset] = feature_id.feature_id;
+            ++offset;
+        }
+    }
+    offsets_data[clusters.size()] = offset;
+    columns["file_ids"] = file_ids;
+    columns["feature_ids"] = feature_ids;
+    columns["feature_ids_offsets"] = offsets;
+    return columns;
+}
+
+// Export the identification data as a dictionary of tables, each of them a
+// dictionary of NumPy arrays with one column per member. The modifications of
+// the peptides are not exported, only their number.
+py::dict ident_data_to_columns(const IdentData::IdentData &ident_data) {
+    using IdentData::DBSequence;
+    using IdentData::Peptide;
+    using IdentData::PeptideEvidence;
+    using IdentData::SpectrumMatch;
+    const auto &psms = ident_data.spectrum_matches;
+    py::dict spectrum_matches;
+    spectrum_matches["id"] = string_column(psms, &SpectrumMatch::id);
+    spectrum_matches["pass_threshold"] =
+        column(psms, &SpectrumMatch::pass_threshold);
+    spectrum_matches["match_id"] =
+        string_column(psms, &SpectrumMatch::match_id);
+    spectrum_matches["charge_state"] =
+        column(psms, &SpectrumMatch::charge_state);
+    spectrum_matches["theoretical_mz"] =
+        column(psms, &SpectrumMatch::theoretical_mz);
+    spectrum_matches["experimental_mz"] =
+        column(psms, &SpectrumMatch::experimental_mz);
+    spectrum_matches["retention_time"] =
+        column(psms, &SpectrumMatch::retention_time);
+    spectrum_matches["rank"] = column(psms, &SpectrumMatch::rank);
+
+    const auto &peptides = ident_data.peptides;
+    py::array_t<uint64_t> num_modifications(peptides.size());
+    auto num_modifications_data = num_modifications.mutable_data();
+    for (size_t i = 0; i < peptides.size(); ++i) {
+        num_modifications_data[i] = peptides[i].modifications.size();
+    }
+    py::dict peptide_columns;
+    peptide_columns["id"] = string_column(peptides, &Peptide::id);
+    peptide_columns["sequence"] = string_column(peptides, &Peptide::sequence);
+    peptide_columns["num_modifications"] = num_modifications;
+
+    const auto &evidence = ident_data.peptide_evidence;
+    py::dict peptide_evidence;
+    peptide_evidence["id"] = string_column(evidence, &PeptideEvidence::id);
+    peptide_evidence["db_sequence_id"] =
+        string_column(evidence, &PeptideEvidence::db_sequence_id);
+    peptide_evidence["peptide_id"] =
+        string_column(evidence, &PeptideEvidence::peptide_id);
+    peptide_evidence["decoy"] = column(evidence, &PeptideEvidence::decoy);
+
+    const auto &sequences = ident_data.db_sequences;
+    py::dict db_sequences;
+    db_sequences["id"] = string_column(sequences, &DBSequence::id);
+    db_sequences["accession"] =
+        string_column(sequences, &DBSequence::accession);
+    db_sequences["db_reference"] =
+        string_column(sequences, &DBSequence::db_reference);
+    db_sequences["description"] =
+        string_column(sequences, &DBSequence::description);
+
+    py::dict tables;
+    tables["spectrum_matches"] = spectrum_matches;
+    tables["peptides"] = peptide_columns;
+    tables["peptide_evidence"] = peptide_evidence;
+    tables["db_sequences"] = db_sequences;
+    return tables;
 }
 
 Xic::Xic xic(const RawData::RawData &raw_data, double min_mz, double max_mz,
@@ -250,18 +850,30 @@ Xic::Xic xic(const RawData::RawData &raw_data, double min_mz, double max_mz,
 
 Grid::Grid _resample(const RawData::RawData &raw_data, uint64_t num_samples_mz,
                     uint64_t num_samples_rt, double smoothing_coef_mz,
-                    double smoothing_coef_rt) {
+                    double smoothing_coef_rt, std::string precision) {
     pybind11::gil_scoped_release release;
     auto params = Grid::ResampleParams{};
     params.num_samples_mz = num_samples_mz;
     params.num_samples_rt = num_samples_rt;
     params.smoothing_coef_mz = smoothing_coef_mz;
     params.smoothing_coef_rt = smoothing_coef_rt;
+    params.precision = parse_precision(precision);
     auto grid =  Grid::_resample(raw_data, params);
     pybind11::gil_scoped_acquire acquire;
     return grid;
 }
 
+std::string to_string(const Grid::Precision::Type &precision) {
+    switch (precision) {
+        case Grid::Precision::DOUBLE:
+            return "DOUBLE";
+        case Grid::Precision::FLOAT:
+            return "FLOAT";
+        default:
+            return "UNKNOWN";
+    };
+}
+
 std::string to_string(const Instrument::Type &instrument_type) {
     switch (instrument_type) {
         case Instrument::QUAD:
@@ -290,6 +902,17 @@ std::string to_string(const Polarity::Type &polarity) {
     };
 }
 
+std::string to_string(const IonMobility::Type &ion_mobility) {
+    switch (ion_mobility) {
+        case IonMobility::TIMS:
+            return "TIMS";
+        case IonMobility::FAIMS:
+            return "FAIMS";
+        default:
+            return "UNKNOWN";
+    };
+}
+
 std::string to_string(const Xic::Method &method) {
     switch (method) {
         case Xic::Method::MAX:
@@ -362,19 +985,25 @@ SimilarityResults find_similarity(std::vector<Centroid::Peak> &peak_list_a,
 }
 
 void write_raw_data(const RawData::RawData &raw_data,
-                    std::string &output_file) {
+                    std::string &output_file, std::string compression,
+                    int compression_level) {
     pybind11::gil_scoped_release release;
-    // Open file stream.
-    Compression::DeflateStream stream;
-    stream.open(output_file);
-    if (!stream) {
+    // Open file stream. The points are compressed in independent blocks
+    // instead of compressing the whole file, so that ranges of the file can be
+    // read without decompressing the rest. Uncompressed files can be memory
+    // mapped.
+    auto codec = parse_codec(compression);
+    Container::OutputFile file;
+    if (!file.open(output_file, Compression::Codec::NONE, compression_level)) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't open output file" << output_file;
         throw std::invalid_argument(error_stream.str());
     }
 
-    if (!RawData::Serialize::write_raw_data(stream, raw_data)) {
+    if (!RawData::Serialize::write_raw_data_columnar(
+            file.stream(), raw_data, codec, compression_level) ||
+        !file.close()) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream
@@ -385,20 +1014,47 @@ void write_raw_data(const RawData::RawData &raw_data,
     pybind11::gil_scoped_acquire acquire;
 }
 
-RawData::RawData read_raw_data(std::string &input_file) {
+RawData::RawData read_raw_data(std::string &input_file, double min_rt,
+                               double max_rt, double min_mz, double max_mz) {
     pybind11::gil_scoped_release release;
-    // Open file stream.
+    RawData::RawData raw_data;
+    bool success = false;
+    if (min_rt >= 0 || max_rt >= 0 || min_mz >= 0 || max_mz >= 0) {
+        // Setup infinite range if no point was specified.
+        double infinity = std::numeric_limits<double>::infinity();
+        min_rt = min_rt < 0 ? 0 : min_rt;
+        max_rt = max_rt < 0 ? infinity : max_rt;
+        min_mz = min_mz < 0 ? 0 : min_mz;
+        max_mz = max_mz < 0 ? infinity : max_mz;
+        if (!RawData::Serialize::read_raw_data_range(
+                input_file, min_rt, max_rt, min_mz, max_mz, &raw_data)) {
+            pybind11::gil_scoped_acquire acquire;
+            std::ostringstream error_stream;
+            error_stream << "error: couldn't read the raw_data from the input "
+                            "file "
+                         << input_file;
+            throw std::invalid_argument(error_stream.str());
+        }
+        pybind11::gil_scoped_acquire acquire;
+        return raw_data;
+    }
+    bool columnar = RawData::Serialize::is_columnar_file(input_file);
+    // Open file stream. The codec is detected from the file header.
     Compression::InflateStream stream;
-    stream.open(input_file);
-    if (!stream) {
+    if (!Container::open_input(input_file, stream)) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't open input file" << input_file;
         throw std::invalid_argument(error_stream.str());
     }
-
-    RawData::RawData raw_data;
-    if (!RawData::Serialize::read_raw_data(stream, &raw_data)) {
+    if (columnar) {
+        success =
+            RawData::Serialize::read_raw_data_columnar(stream, &raw_data);
+    } else {
+        // Files written by older versions use the interleaved format.
+        success = RawData::Serialize::read_raw_data(stream, &raw_data);
+    }
+    if (!success) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't write the raw_data into the input file"
@@ -409,19 +1065,79 @@ RawData::RawData read_raw_data(std::string &input_file) {
     return raw_data;
 }
 
-void write_grid(const Grid::Grid &grid, std::string &output_file) {
+RawData::MappedRawData map_raw_data(std::string &input_file) {
     pybind11::gil_scoped_release release;
-    // Open file stream.
-    Compression::DeflateStream stream;
-    stream.open(output_file);
-    if (!stream) {
+    RawData::MappedRawData mapped_raw_data;
+    // Uncompressed members of container files are mapped in place.
+    std::string filename;
+    std::string name;
+    bool success = false;
+    if (Container::split_path(input_file, &filename, &name)) {
+        Container::Container container;
+        const Container::Member *member = nullptr;
+        success = container.open(filename) &&
+                  (member = container.find(name)) != nullptr &&
+                  mapped_raw_data.open(filename, member->offset, member->size);
+    } else {
+        success = mapped_raw_data.open(input_file);
+    }
+    if (!success) {
+        pybind11::gil_scoped_acquire acquire;
+        std::ostringstream error_stream;
+        error_stream << "error: couldn't map the raw_data file " << input_file
+                     << ", only uncompressed columnar files can be mapped";
+        throw std::invalid_argument(error_stream.str());
+    }
+    pybind11::gil_scoped_acquire acquire;
+    return mapped_raw_data;
+}
+
+// Read only NumPy view of the given array. The owner object is kept alive for
+// as long as the view is in use.
+template <typename T>
+py::array_t<T> array_view(const T *data, size_t size, py::handle owner) {
+    py::array_t<T> view(size, data, owner);
+    view.attr("setflags")(py::arg("write") = false);
+    return view;
+}
+
+// Property getter returning a read only NumPy view of a vector member, owned by
+// the Python object that holds the vector.
+template <typename Class, typename T>
+auto vector_view(std::vector<T> Class::*member) {
+    return [member](py::object self) {
+        const auto &values = self.cast<const Class &>().*member;
+        return array_view(values.data(), values.size(), self);
+    };
+}
+
+void write_grid(const Grid::Grid &grid, std::string &output_file,
+                std::string compression, int compression_level,
+                uint64_t tile_size, double threshold) {
+    pybind11::gil_scoped_release release;
+    // Open file stream. Tiled grids compress each tile independently instead
+    // of the whole file, so that ranges of the grid can be read without
+    // decompressing the rest.
+    auto codec = parse_codec(compression);
+    Container::OutputFile file;
+    if (!file.open(output_file,
+                   tile_size == 0 ? codec : Compression::Codec::NONE,
+                   compression_level)) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't open output file" << output_file;
         throw std::invalid_argument(error_stream.str());
     }
 
-    if (!Grid::Serialize::write_grid(stream, grid)) {
+    bool success = false;
+    if (tile_size == 0) {
+        success = Grid::Serialize::write_grid(file.stream(), grid);
+    } else {
+        success = Grid::Serialize::write_grid_tiled(file.stream(), grid,
+                                                    tile_size, threshold,
+                                                    codec, compression_level);
+    }
+    if (!success || !file.close()) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't write the grid into the output file"
@@ -431,12 +1147,31 @@ void write_grid(const Grid::Grid &grid, std::string &output_file) {
     pybind11::gil_scoped_acquire acquire;
 }
 
-Grid::Grid read_grid(std::string &input_file) {
+Grid::Grid read_grid(std::string &input_file, double min_mz, double max_mz,
+                     double min_rt, double max_rt) {
     pybind11::gil_scoped_release release;
+    if (min_mz >= 0 || max_mz >= 0 || min_rt >= 0 || max_rt >= 0) {
+        // Setup infinite range if no point was specified.
+        double infinity = std::numeric_limits<double>::infinity();
+        min_mz = min_mz < 0 ? 0 : min_mz;
+        max_mz = max_mz < 0 ? infinity : max_mz;
+        min_rt = min_rt < 0 ? 0 : min_rt;
+        max_rt = max_rt < 0 ? infinity : max_rt;
+        Grid::Grid grid;
+        if (!Grid::Serialize::read_grid_range(input_file, min_mz, max_mz,
+                                              min_rt, max_rt, &grid)) {
+            pybind11::gil_scoped_acquire acquire;
+            std::ostringstream error_stream;
+            error_stream << "error: couldn't read the grid from the input file "
+                         << input_file;
+            throw std::invalid_argument(error_stream.str());
+        }
+        pybind11::gil_scoped_acquire acquire;
+        return grid;
+    }
     // Open file stream.
     Compression::InflateStream stream;
-    stream.open(input_file);
-    if (!stream) {
+    if (!Container::open_input(input_file, stream)) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't open input file" << input_file;
@@ -455,19 +1190,20 @@ Grid::Grid read_grid(std::string &input_file) {
     return grid;
 }
 
-void write_time_map(const Warp2D::TimeMap &time_map, std::string &output_file) {
+void write_time_map(const Warp2D::TimeMap &time_map, std::string &output_file,
+                    std::string compression, int compression_level) {
     pybind11::gil_scoped_release release;
     // Open file stream.
-    Compression::DeflateStream stream;
-    stream.open(output_file);
-    if (!stream) {
+    Container::OutputFile file;
+    if (!file.open(output_file, parse_codec(compression), compression_level)) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't open output file" << output_file;
         throw std::invalid_argument(error_stream.str());
     }
 
-    if (!Warp2D::Serialize::write_time_map(stream, time_map)) {
+    if (!Warp2D::Serialize::write_time_map(file.stream(), time_map) ||
+        !file.close()) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream
@@ -482,8 +1218,7 @@ Warp2D::TimeMap read_time_map(std::string &input_file) {
     pybind11::gil_scoped_release release;
     // Open file stream.
     Compression::InflateStream stream;
-    stream.open(input_file);
-    if (!stream) {
+    if (!Container::open_input(input_file, stream)) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't open input file" << input_file;
@@ -503,19 +1238,20 @@ Warp2D::TimeMap read_time_map(std::string &input_file) {
 }
 
 void write_peaks(const std::vector<Centroid::Peak> &peaks,
-                 std::string &output_file) {
+                 std::string &output_file, std::string compression,
+                 int compression_level) {
     pybind11::gil_scoped_release release;
     // Open file stream.
-    Compression::DeflateStream stream;
-    stream.open(output_file);
-    if (!stream) {
+    Container::OutputFile file;
+    if (!file.open(output_file, parse_codec(compression), compression_level)) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't open output file" << output_file;
         throw std::invalid_argument(error_stream.str());
     }
 
-    if (!Centroid::Serialize::write_peaks(stream, peaks)) {
+    if (!Centroid::Serialize::write_peaks(file.stream(), peaks) ||
+        !file.close()) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't write the peaks into the output file"
@@ -529,8 +1265,7 @@ std::vector<Centroid::Peak> read_peaks(std::string &input_file) {
     pybind11::gil_scoped_release release;
     // Open file stream.
     Compression::InflateStream stream;
-    stream.open(input_file);
-    if (!stream) {
+    if (!Container::open_input(input_file, stream)) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't open input file" << input_file;
@@ -554,8 +1289,7 @@ std::vector<ProteinInference::InferredProtein> read_inferred_proteins(
     pybind11::gil_scoped_release release;
     // Open file stream.
     Compression::InflateStream stream;
-    stream.open(input_file);
-    if (!stream) {
+    if (!Container::open_input(input_file, stream)) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't open input file" << input_file;
@@ -578,12 +1312,12 @@ std::vector<ProteinInference::InferredProtein> read_inferred_proteins(
 
 void write_inferred_proteins(
     const std::vector<ProteinInference::InferredProtein> &inferred_proteins,
-    std::string &output_file) {
+    std::string &output_file, std::string compression,
+    int compression_level) {
     pybind11::gil_scoped_release release;
     // Open file stream.
-    Compression::DeflateStream stream;
-    stream.open(output_file);
-    if (!stream) {
+    Container::OutputFile file;
+    if (!file.open(output_file, parse_codec(compression), compression_level)) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't open output file" << output_file;
@@ -591,7 +1325,8 @@ void write_inferred_proteins(
     }
 
     if (!ProteinInference::Serialize::write_inferred_proteins(
-            stream, inferred_proteins)) {
+            file.stream(), inferred_proteins) ||
+        !file.close()) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't write the inferred_proteins into the "
@@ -604,20 +1339,21 @@ void write_inferred_proteins(
 
 void write_feature_clusters(
     const std::vector<MetaMatch::FeatureCluster> &feature_clusters,
-    std::string &output_file) {
+    std::string &output_file, std::string compression,
+    int compression_level) {
     pybind11::gil_scoped_release release;
     // Open file stream.
-    Compression::DeflateStream stream;
-    stream.open(output_file);
-    if (!stream) {
+    Container::OutputFile file;
+    if (!file.open(output_file, parse_codec(compression), compression_level)) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't open output file" << output_file;
         throw std::invalid_argument(error_stream.str());
     }
 
-    if (!MetaMatch::Serialize::write_feature_clusters(stream,
-                                                      feature_clusters)) {
+    if (!MetaMatch::Serialize::write_feature_clusters(file.stream(),
+                                                      feature_clusters) ||
+        !file.close()) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream
@@ -633,8 +1369,7 @@ std::vector<MetaMatch::FeatureCluster> read_feature_clusters(
     pybind11::gil_scoped_release release;
     // Open file stream.
     Compression::InflateStream stream;
-    stream.open(input_file);
-    if (!stream) {
+    if (!Container::open_input(input_file, stream)) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't open input file" << input_file;
@@ -657,19 +1392,21 @@ std::vector<MetaMatch::FeatureCluster> read_feature_clusters(
 
 void write_peak_clusters(
     const std::vector<MetaMatch::PeakCluster> &peak_clusters,
-    std::string &output_file) {
+    std::string &output_file, std::string compression,
+    int compression_level) {
     pybind11::gil_scoped_release release;
     // Open file stream.
-    Compression::DeflateStream stream;
-    stream.open(output_file);
-    if (!stream) {
+    Container::OutputFile file;
+    if (!file.open(output_file, parse_codec(compression), compression_level)) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't open output file" << output_file;
         throw std::invalid_argument(error_stream.str());
     }
 
-    if (!MetaMatch::Serialize::write_peak_clusters(stream, peak_clusters)) {
+    if (!MetaMatch::Serialize::write_peak_clusters(file.stream(),
+                                                   peak_clusters) ||
+        !file.close()) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream
@@ -685,8 +1422,7 @@ std::vector<MetaMatch::PeakCluster> read_peak_clusters(
     pybind11::gil_scoped_release release;
     // Open file stream.
     Compression::InflateStream stream;
-    stream.open(input_file);
-    if (!stream) {
+    if (!Container::open_input(input_file, stream)) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't open input file" << input_file;
@@ -707,19 +1443,21 @@ std::vector<MetaMatch::PeakCluster> read_peak_clusters(
 }
 
 void write_features(const std::vector<FeatureDetection::Feature> &features,
-                    std::string &output_file) {
+                    std::string &output_file, std::string compression,
+                    int compression_level) {
     pybind11::gil_scoped_release release;
     // Open file stream.
-    Compression::DeflateStream stream;
-    stream.open(output_file);
-    if (!stream) {
+    Container::OutputFile file;
+    if (!file.open(output_file, parse_codec(compression), compression_level)) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't open output file" << output_file;
         throw std::invalid_argument(error_stream.str());
     }
 
-    if (!FeatureDetection::Serialize::write_features(stream, features)) {
+    if (!FeatureDetection::Serialize::write_features(file.stream(),
+                                                     features) ||
+        !file.close()) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream
@@ -734,8 +1472,7 @@ std::vector<FeatureDetection::Feature> read_features(std::string &input_file) {
     pybind11::gil_scoped_release release;
     // Open file stream.
     Compression::InflateStream stream;
-    stream.open(input_file);
-    if (!stream) {
+    if (!Container::open_input(input_file, stream)) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't open input file" << input_file;
@@ -755,19 +1492,20 @@ std::vector<FeatureDetection::Feature> read_features(std::string &input_file) {
 }
 
 void write_ident_data(const IdentData::IdentData &ident_data,
-                      std::string &output_file) {
+                      std::string &output_file, std::string compression,
+                      int compression_level) {
     pybind11::gil_scoped_release release;
     // Open file stream.
-    Compression::DeflateStream stream;
-    stream.open(output_file);
-    if (!stream) {
+    Container::OutputFile file;
+    if (!file.open(output_file, parse_codec(compression), compression_level)) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't open output file" << output_file;
         throw std::invalid_argument(error_stream.str());
     }
 
-    if (!IdentData::Serialize::write_ident_data(stream, ident_data)) {
+    if (!IdentData::Serialize::write_ident_data(file.stream(), ident_data) ||
+        !file.close()) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream
@@ -782,8 +1520,7 @@ IdentData::IdentData read_ident_data(std::string &input_file) {
     pybind11::gil_scoped_release release;
     // Open file stream.
     Compression::InflateStream stream;
-    stream.open(input_file);
-    if (!stream) {
+    if (!Container::open_input(input_file, stream)) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't open input file" << input_file;
@@ -804,19 +1541,21 @@ IdentData::IdentData read_ident_data(std::string &input_file) {
 }
 
 void write_linked_msms(const std::vector<Link::LinkedMsms> &linked_msms,
-                       std::string &output_file) {
+                       std::string &output_file, std::string compression,
+                       int compression_level) {
     pybind11::gil_scoped_release release;
     // Open file stream.
-    Compression::DeflateStream stream;
-    stream.open(output_file);
-    if (!stream) {
+    Container::OutputFile file;
+    if (!file.open(output_file, parse_codec(compression), compression_level)) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't open output file" << output_file;
         throw std::invalid_argument(error_stream.str());
     }
 
-    if (!Link::Serialize::write_linked_msms_table(stream, linked_msms)) {
+    if (!Link::Serialize::write_linked_msms_table(file.stream(),
+                                                  linked_msms) ||
+        !file.close()) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream
@@ -831,8 +1570,7 @@ std::vector<Link::LinkedMsms> read_linked_msms(std::string &input_file) {
     pybind11::gil_scoped_release release;
     // Open file stream.
     Compression::InflateStream stream;
-    stream.open(input_file);
-    if (!stream) {
+    if (!Container::open_input(input_file, stream)) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't open input file" << input_file;
@@ -853,19 +1591,21 @@ std::vector<Link::LinkedMsms> read_linked_msms(std::string &input_file) {
 }
 
 void write_linked_psm(const std::vector<Link::LinkedPsm> &linked_psm,
-                      std::string &output_file) {
+                      std::string &output_file, std::string compression,
+                      int compression_level) {
     pybind11::gil_scoped_release release;
     // Open file stream.
-    Compression::DeflateStream stream;
-    stream.open(output_file);
-    if (!stream) {
+    Container::OutputFile file;
+    if (!file.open(output_file, parse_codec(compression), compression_level)) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't open output file" << output_file;
         throw std::invalid_argument(error_stream.str());
     }
 
-    if (!Link::Serialize::write_linked_psm_table(stream, linked_psm)) {
+    if (!Link::Serialize::write_linked_psm_table(file.stream(),
+                                                 linked_psm) ||
+        !file.close()) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream
@@ -880,8 +1620,7 @@ std::vector<Link::LinkedPsm> read_linked_psm(std::string &input_file) {
     pybind11::gil_scoped_release release;
     // Open file stream.
     Compression::InflateStream stream;
-    stream.open(input_file);
-    if (!stream) {
+    if (!Container::open_input(input_file, stream)) {
         pybind11::gil_scoped_acquire acquire;
         std::ostringstream error_stream;
         error_stream << "error: couldn't open input file" << input_file;
@@ -916,14 +1655,8 @@ IdentData::IdentData read_mzidentml(std::string &input_file, bool ignore_decoy,
     max_mz = max_mz < 0 ? std::numeric_limits<double>::infinity() : max_mz;
 
     // Open file stream.
-    std::ifstream stream;
-    stream.open(input_file);
-    if (!stream) {
-        pybind11::gil_scoped_acquire acquire;
-        std::ostringstream error_stream;
-        error_stream << "error: couldn't open input file" << input_file;
-        throw std::invalid_argument(error_stream.str());
-    }
+    auto stream_ptr = open_input_file(input_file);
+    auto &stream = *stream_ptr;
     auto ident_data = XmlReader::read_mzidentml(stream, ignore_decoy, require_threshold,
                                      max_rank_only, min_mz, max_mz, min_rt, max_rt);
     pybind11::gil_scoped_acquire acquire;
@@ -968,6 +1701,242 @@ std::vector<MetaMatch::PeakCluster> find_peak_clusters(
     return clusters;
 }
 
+Container::Container open_container(std::string &file_name) {
+    pybind11::gil_scoped_release release;
+    Container::Container container;
+    if (!container.open(file_name)) {
+        pybind11::gil_scoped_acquire acquire;
+        std::ostringstream error_stream;
+        error_stream << "error: couldn't open the container file " << file_name;
+        throw std::invalid_argument(error_stream.str());
+    }
+    pybind11::gil_scoped_acquire acquire;
+    return container;
+}
+
+Container::Container create_container(std::string &file_name) {
+    pybind11::gil_scoped_release release;
+    if (!Container::Container::create(file_name)) {
+        pybind11::gil_scoped_acquire acquire;
+        std::ostringstream error_stream;
+        error_stream << "error: couldn't create the container file "
+                     << file_name;
+        throw std::invalid_argument(error_stream.str());
+    }
+    pybind11::gil_scoped_acquire acquire;
+    return open_container(file_name);
+}
+
+const Container::Member &find_member(const Container::Container &container,
+                                     const std::string &name) {
+    const auto *member = container.find(name);
+    if (member == nullptr) {
+        throw py::key_error("member not found in the container: " + name);
+    }
+    return *member;
+}
+
+// Members written by PASTAQ start with the compression header, other files
+// are stored as they are.
+bool member_codec(const Container::Container &container,
+                  const Container::Member &member,
+                  Compression::Codec::Type *codec) {
+    char header[Compression::header_size];
+    std::ifstream stream(container.filename(), std::ios::binary);
+    stream.seekg(member.offset);
+    stream.read(header, Compression::header_size);
+    return member.size >= Compression::header_size && stream.good() &&
+           Compression::read_header(header, codec);
+}
+
+py::bytes read_member(const Container::Container &container,
+                      const std::string &name) {
+    const auto &member = find_member(container, name);
+    std::string data;
+    {
+        pybind11::gil_scoped_release release;
+        Compression::Codec::Type codec;
+        if (member_codec(container, member, &codec)) {
+            Compression::InflateStream stream;
+            stream.open(container.filename(), member.offset, member.size);
+            data.assign(std::istreambuf_iterator<char>(stream),
+                        std::istreambuf_iterator<char>());
+        } else {
+            data.resize(member.size);
+            std::ifstream stream(container.filename(), std::ios::binary);
+            stream.seekg(member.offset);
+            stream.read(data.data(), data.size());
+        }
+    }
+    return py::bytes(data);
+}
+
+void write_member(Container::Container &container, const std::string &name,
+                  const py::bytes &data, std::string compression,
+                  int compression_level) {
+    std::string contents = data;
+    pybind11::gil_scoped_release release;
+    Container::OutputFile file;
+    if (!file.open(container.filename() + "/" + name, parse_codec(compression),
+                   compression_level) ||
+        !file.stream().write(contents.data(), contents.size()) ||
+        !file.close() || !container.open(container.filename())) {
+        pybind11::gil_scoped_acquire acquire;
+        std::ostringstream error_stream;
+        error_stream << "error: couldn't write the member " << name
+                     << " into the container file " << container.filename();
+        throw std::invalid_argument(error_stream.str());
+    }
+    pybind11::gil_scoped_acquire acquire;
+}
+
+void add_file(Container::Container &container, const std::string &name,
+              std::string &file_name) {
+    pybind11::gil_scoped_release release;
+    std::ifstream stream(file_name, std::ios::binary);
+    if (!stream || !container.add(name, stream)) {
+        pybind11::gil_scoped_acquire acquire;
+        std::ostringstream error_stream;
+        error_stream << "error: couldn't add the file " << file_name
+                     << " to the container file " << container.filename();
+        throw std::invalid_argument(error_stream.str());
+    }
+    pybind11::gil_scoped_acquire acquire;
+}
+
+void extract_member(const Container::Container &container,
+                    const std::string &name, std::string &file_name) {
+    const auto &member = find_member(container, name);
+    pybind11::gil_scoped_release release;
+    std::ifstream stream(container.filename(), std::ios::binary);
+    std::ofstream out_stream(file_name, std::ios::binary);
+    stream.seekg(member.offset);
+    std::vector<char> buffer(1 << 20);
+    uint64_t remaining = member.size;
+    while (remaining > 0 && stream && out_stream) {
+        uint64_t size = std::min<uint64_t>(remaining, buffer.size());
+        stream.read(buffer.data(), size);
+        out_stream.write(buffer.data(), size);
+        remaining -= size;
+    }
+    if (!stream || !out_stream) {
+        pybind11::gil_scoped_acquire acquire;
+        std::ostringstream error_stream;
+        error_stream << "error: couldn't extract the member " << name
+                     << " into the file " << file_name;
+        throw std::invalid_argument(error_stream.str());
+    }
+    pybind11::gil_scoped_acquire acquire;
+}
+
+py::array_t<uint8_t> map_member(py::object self, const std::string &name) {
+    auto &container = self.cast<Container::Container &>();
+    const auto &member = find_member(container, name);
+    Compression::Codec::Type codec;
+    uint64_t header_size = 0;
+    if (member_codec(container, member, &codec)) {
+        if (codec != Compression::Codec::NONE) {
+            throw std::invalid_argument(
+                "error: only uncompressed members can be mapped: " + name);
+        }
+        header_size = Compression::header_size;
+    }
+    const uint8_t *data = container.map(member);
+    if (data == nullptr) {
+        throw std::invalid_argument("error: couldn't map the container file " +
+                                    container.filename());
+    }
+    return array_view(data + header_size, member.size - header_size, self);
+}
+
+// Stream buffer reading from a block of memory, so that objects can be
+// deserialized from Python buffers, including shared memory, without copying
+// them first.
+class MemoryStreambuf : public std::streambuf {
+   public:
+    MemoryStreambuf(const char *data, size_t size) {
+        char *begin = const_cast<char *>(data);
+        setg(begin, begin, begin + size);
+    }
+
+   protected:
+    pos_type seekoff(off_type offset, std::ios_base::seekdir dir,
+                     std::ios_base::openmode which) override {
+        char *position = dir == std::ios_base::beg   ? eback()
+                         : dir == std::ios_base::cur ? gptr()
+                                                     : egptr();
+        position += offset;
+        if (!(which & std::ios_base::in) || position < eback() ||
+            position > egptr()) {
+            return pos_type(off_type(-1));
+        }
+        setg(eback(), position, egptr());
+        return pos_type(position - eback());
+    }
+
+    pos_type seekpos(pos_type position,
+                     std::ios_base::openmode which) override {
+        return seekoff(off_type(position), std::ios_base::beg, which);
+    }
+};
+
+// Serialize the value into bytes with the given binary serializer.
+template <typename T, typename Write>
+py::bytes serialize(const T &value, Write write, const std::string &name) {
+    std::ostringstream stream;
+    bool success = false;
+    {
+        pybind11::gil_scoped_release release;
+        success = write(stream, value);
+    }
+    if (!success) {
+        throw std::invalid_argument("error: couldn't serialize the " + name);
+    }
+    return py::bytes(stream.str());
+}
+
+// Deserialize a value from the contents of a buffer, such as bytes or a
+// memoryview of shared memory, with the given binary serializer.
+template <typename T, typename Read>
+T deserialize(py::buffer buffer, Read read, const std::string &name) {
+    py::buffer_info info = buffer.request();
+    T value = {};
+    bool success = false;
+    {
+        pybind11::gil_scoped_release release;
+        MemoryStreambuf streambuf(static_cast<const char *>(info.ptr),
+                                  info.size * info.itemsize);
+        std::istream stream(&streambuf);
+        success = read(stream, &value);
+    }
+    if (!success) {
+        throw std::invalid_argument("error: couldn't deserialize the " + name);
+    }
+    return value;
+}
+
+bool write_raw_data_state(std::ostream &stream,
+                          const RawData::RawData &raw_data) {
+    return RawData::Serialize::write_raw_data_columnar(stream, raw_data);
+}
+
+bool read_raw_data_state(std::istream &stream, RawData::RawData *raw_data) {
+    return RawData::Serialize::read_raw_data_columnar(stream, raw_data);
+}
+
+// Support for pickling with the binary serializers. The state of the object
+// is the serialized bytes.
+template <typename T>
+auto pickle(bool (*write)(std::ostream &, const T &),
+            bool (*read)(std::istream &, T *), const std::string &name) {
+    return py::pickle(
+        [write, name](const T &value) { return serialize(value, write, name); },
+        [read, name](py::bytes state) {
+            return deserialize<T>(py::reinterpret_borrow<py::buffer>(state),
+                                  read, name);
+        });
+}
+
 }  // namespace PythonAPI
 
 PYBIND11_MODULE(pastaq, m) {
@@ -988,8 +1957,10 @@ PYBIND11_MODULE(pastaq, m) {
         .def_readonly("ms_level", &RawData::Scan::ms_level)
         .def_readonly("num_points", &RawData::Scan::num_points)
         .def_readonly("retention_time", &RawData::Scan::retention_time)
-        .def_readonly("mz", &RawData::Scan::mz)
-        .def_readonly("intensity", &RawData::Scan::intensity)
+        .def_property_readonly(
+            "mz", PythonAPI::vector_view(&RawData::Scan::mz))
+        .def_property_readonly(
+            "intensity", PythonAPI::vector_view(&RawData::Scan::intensity))
         .def_readonly("polarity", &RawData::Scan::polarity)
         .def_readonly("precursor_information",
                       &RawData::Scan::precursor_information)
@@ -1024,8 +1995,47 @@ PYBIND11_MODULE(pastaq, m) {
             return PythonAPI::to_string(polarity);
         });
 
+    py::class_<IonMobility::Type>(m, "IonMobility")
+        .def("__repr__", [](const IonMobility::Type &ion_mobility) {
+            return PythonAPI::to_string(ion_mobility);
+        });
+
+    py::class_<XmlReader::RawDataOutput>(m, "RawDataOutput")
+        .def_readonly("ms_level", &XmlReader::RawDataOutput::ms_level)
+        .def_readonly("polarity", &XmlReader::RawDataOutput::polarity)
+        .def_readonly("ion_mobility", &XmlReader::RawDataOutput::ion_mobility)
+        .def_readonly("compensation_voltage",
+                      &XmlReader::RawDataOutput::compensation_voltage)
+        .def_readonly("raw_data", &XmlReader::RawDataOutput::raw_data)
+        .def("__repr__", [](const XmlReader::RawDataOutput &o) {
+            auto msg = "RawDataOutput <ms_level: " + std::to_string(o.ms_level) +
+                       ", polarity: " + PythonAPI::to_string(o.polarity);
+            if (o.ion_mobility != IonMobility::UNKNOWN) {
+                msg += ", ion_mobility: " +
+                       PythonAPI::to_string(o.ion_mobility) +
+                       ", compensation_voltage: " +
+                       std::to_string(o.compensation_voltage);
+            }
+            return msg + ", number of scans: " +
+                   std::to_string(o.raw_data.scans.size()) + ">";
+        });
+
     py::class_<RawData::RawData>(m, "RawData")
-        .def_readonly("scans", &RawData::RawData::scans)
+        .def(PythonAPI::pickle(&PythonAPI::write_raw_data_state,
+                               &PythonAPI::read_raw_data_state, "raw_data"))
+        .def_property_readonly(
+            "scans",
+            [](py::object self) {
+                // The scans reference the raw data instead of copying it.
+                py::list scans;
+                for (const auto &scan :
+                     self.cast<const RawData::RawData &>().scans) {
+                    scans.append(py::cast(
+                        scan, py::return_value_policy::reference_internal,
+                        self));
+                }
+                return scans;
+            })
         .def_readonly("fwhm_rt", &RawData::RawData::fwhm_rt)
         .def_readonly("instrument_type", &RawData::RawData::instrument_type)
         .def_readonly("resolution_ms1", &RawData::RawData::resolution_ms1)
@@ -1038,12 +2048,15 @@ PYBIND11_MODULE(pastaq, m) {
         .def_readonly("centroid", &RawData::RawData::centroid)
         .def_readwrite("get_failed_peaks", &RawData::RawData::get_failed_peaks)
         .def("theoretical_fwhm", &RawData::theoretical_fwhm, py::arg("mz"))
-        .def("dump", &PythonAPI::write_raw_data)
-        .def("raw_points", &RawData::raw_points, 
+        .def("dump", &PythonAPI::write_raw_data,
+             "Write the raw_data to disk in a binary format",
+             py::arg("file_name"), py::arg("compression") = "none",
+             py::arg("compression_level") = -1)
+        .def("raw_points", &RawData::raw_points,
              "Get the raw data points on the square region defined by "
              "min/max_mz/rt",
              py::arg("min_mz"), py::arg("max_mz"), py::arg("min_rt"),
-             py::arg("max_rt"))
+             py::arg("max_rt"), py::call_guard<py::gil_scoped_release>())
         .def("__repr__", [](const RawData::RawData &rd) {
             return "RawData:\n> instrument_type: " +
                    PythonAPI::to_string(rd.instrument_type) +
@@ -1063,14 +2076,225 @@ PYBIND11_MODULE(pastaq, m) {
             "Calculate theoretical sigma mz for a given m/z, resolution, and reference_mz. "
             " The later two parameters are obtained from the raw data");
 
+    py::class_<Container::Container>(m, "Container")
+        .def(py::init(&PythonAPI::open_container),
+             "Open a container file, where each member holds a file of a "
+             "project. The read_* and write_* functions can access the "
+             "members with paths such as 'project.pastaq/peaks/a.peaks'",
+             py::arg("file_name"))
+        .def_static("create", &PythonAPI::create_container,
+                    "Create an empty container file, replacing the file if it "
+                    "exists",
+                    py::arg("file_name"))
+        .def_property_readonly("file_name", &Container::Container::filename)
+        .def("members",
+             [](const Container::Container &container) {
+                 std::vector<std::string> names;
+                 for (const auto &member : container.members()) {
+                     names.push_back(member.name);
+                 }
+                 return names;
+             },
+             "Names of the members of the container")
+        .def("__len__",
+             [](const Container::Container &container) {
+                 return container.members().size();
+             })
+        .def("__contains__",
+             [](const Container::Container &container,
+                const std::string &name) {
+                 return container.find(name) != nullptr;
+             })
+        .def("read", &PythonAPI::read_member,
+             "Read the decompressed contents of the member", py::arg("name"))
+        .def("write", &PythonAPI::write_member,
+             "Add a member with the given contents, replacing any member with "
+             "the same name",
+             py::arg("name"), py::arg("data"), py::arg("compression") = "zlib",
+             py::arg("compression_level") = -1)
+        .def("map", &PythonAPI::map_member,
+             "Read only NumPy view of the contents of an uncompressed member, "
+             "memory mapped in place",
+             py::arg("name"))
+        .def("add_file", &PythonAPI::add_file,
+             "Add a file as a member without modifying it", py::arg("name"),
+             py::arg("file_name"))
+        .def("extract", &PythonAPI::extract_member,
+             "Copy the member into a standalone file", py::arg("name"),
+             py::arg("file_name"))
+        .def("__repr__", [](const Container::Container &container) {
+            return "Container <file_name: " + container.filename() +
+                   ", number of members: " +
+                   std::to_string(container.members().size()) + ">";
+        });
+
+    py::class_<RawData::MappedRawData>(m, "MappedRawData")
+        .def_property_readonly("metadata", &RawData::MappedRawData::metadata,
+                               py::return_value_policy::reference_internal)
+        .def("__len__", &RawData::MappedRawData::size)
+        .def("mz",
+             [](py::object self, size_t i) {
+                 auto &mapped = self.cast<RawData::MappedRawData &>();
+                 if (i >= mapped.size()) {
+                     throw py::index_error("scan index out of range");
+                 }
+                 return PythonAPI::array_view(mapped.mz(i),
+                                              mapped.num_points(i), self);
+             },
+             "Read only NumPy view of the mz values of the scan at the given "
+             "index",
+             py::arg("i"))
+        .def("intensity",
+             [](py::object self, size_t i) {
+                 auto &mapped = self.cast<RawData::MappedRawData &>();
+                 if (i >= mapped.size()) {
+                     throw py::index_error("scan index out of range");
+                 }
+                 return PythonAPI::array_view(mapped.intensity(i),
+                                              mapped.num_points(i), self);
+             },
+             "Read only NumPy view of the intensity values of the scan at the "
+             "given index",
+             py::arg("i"))
+        .def("arrays",
+             [](py::object self) {
+                 auto &mapped = self.cast<RawData::MappedRawData &>();
+                 py::dict arrays;
+                 arrays["offsets"] = PythonAPI::array_view(
+                     mapped.offsets(), mapped.size() + 1, self);
+                 arrays["mz"] = PythonAPI::array_view(
+                     mapped.mz(), mapped.num_points(), self);
+                 arrays["intensity"] = PythonAPI::array_view(
+                     mapped.intensity(), mapped.num_points(), self);
+                 return arrays;
+             },
+             "Read only NumPy views of the 'mz' and 'intensity' of all scans "
+             "concatenated. The points of scan i are in the [offsets[i], "
+             "offsets[i + 1]) range, as given by the 'offsets' array")
+        .def("scan",
+             [](const RawData::MappedRawData &mapped, size_t i) {
+                 if (i >= mapped.size()) {
+                     throw py::index_error("scan index out of range");
+                 }
+                 return mapped.scan(i);
+             },
+             "Copy the scan at the given index into memory", py::arg("i"))
+        .def("load",
+             [](const RawData::MappedRawData &mapped) {
+                 py::gil_scoped_release release;
+                 return mapped.load();
+             },
+             "Copy all scans into a RawData object")
+        .def("__repr__", [](const RawData::MappedRawData &mapped) {
+            return "MappedRawData <number of scans: " +
+                   std::to_string(mapped.size()) +
+                   ", number of points: " +
+                   std::to_string(mapped.num_points()) + ">";
+        });
+
+    py::class_<XmlReader::LazyRawData>(m, "LazyRawData")
+        .def_property_readonly(
+            "metadata",
+            py::overload_cast<>(&XmlReader::LazyRawData::metadata),
+            py::return_value_policy::reference_internal)
+        .def("__len__", &XmlReader::LazyRawData::size)
+        .def("scan",
+             [](XmlReader::LazyRawData &lazy_raw_data, size_t i) {
+                 if (i >= lazy_raw_data.size()) {
+                     throw py::index_error("scan index out of range");
+                 }
+                 std::optional<RawData::Scan> scan;
+                 {
+                     py::gil_scoped_release release;
+                     scan = lazy_raw_data.scan(i);
+                 }
+                 if (!scan) {
+                     std::ostringstream error_stream;
+                     error_stream << "error: couldn't decode the scan at index "
+                                  << i;
+                     throw std::invalid_argument(error_stream.str());
+                 }
+                 return scan.value();
+             },
+             "Get the scan at the given index, decoding its peaks if they "
+             "are not in the cache",
+             py::arg("i"))
+        .def("load",
+             [](XmlReader::LazyRawData &lazy_raw_data) {
+                 std::optional<RawData::RawData> raw_data;
+                 {
+                     py::gil_scoped_release release;
+                     raw_data = lazy_raw_data.load();
+                 }
+                 if (!raw_data) {
+                     throw std::invalid_argument(
+                         "error: couldn't decode the scans");
+                 }
+                 return raw_data.value();
+             },
+             "Decode the peaks of all scans into a RawData object")
+        .def("__repr__", [](const XmlReader::LazyRawData &lazy_raw_data) {
+            return "LazyRawData <number of scans: " +
+                   std::to_string(lazy_raw_data.size()) + ">";
+        });
+
+    py::class_<XmlReader::ScanReader>(m, "ScanReader")
+        .def("next_batch",
+             [](XmlReader::ScanReader &reader, size_t max_scans) {
+                 py::gil_scoped_release release;
+                 return reader.next_batch(max_scans);
+             },
+             "Read up to max_scans of the next scans. Returns an empty list "
+             "when there are no more scans",
+             py::arg("max_scans"))
+        .def("next_arrays",
+             [](XmlReader::ScanReader &reader, size_t max_scans) -> py::object {
+                 std::vector<RawData::Scan> scans;
+                 {
+                     py::gil_scoped_release release;
+                     scans = reader.next_batch(max_scans);
+                 }
+                 if (scans.empty()) {
+                     return py::none();
+                 }
+                 return PythonAPI::scans_to_arrays(scans);
+             },
+             "Read up to max_scans of the next scans as a dictionary of NumPy "
+             "arrays. Returns None when there are no more scans",
+             py::arg("max_scans"));
+
     py::class_<Grid::Grid>(m, "Grid")
+        .def(PythonAPI::pickle(&Grid::Serialize::write_grid,
+                               &Grid::Serialize::read_grid, "grid"))
         .def_readonly("n", &Grid::Grid::n)
         .def_readonly("m", &Grid::Grid::m)
-        .def_readonly("data", &Grid::Grid::data)
-        .def_readonly("bins_mz", &Grid::Grid::bins_mz)
-        .def_readonly("bins_rt", &Grid::Grid::bins_rt)
-        .def("dump", &PythonAPI::write_grid)
-        .def("subset", &Grid::subset)
+        .def_property_readonly(
+            "data",
+            [](py::object self) -> py::object {
+                const auto &grid = self.cast<const Grid::Grid &>();
+                if (grid.precision == Grid::Precision::FLOAT) {
+                    return PythonAPI::array_view(
+                        grid.data_float.data(), grid.data_float.size(), self);
+                }
+                return PythonAPI::array_view(grid.data.data(), grid.data.size(),
+                                             self);
+            })
+        .def_property_readonly("precision",
+                               [](const Grid::Grid &grid) {
+                                   return PythonAPI::to_string(grid.precision);
+                               })
+        .def_property_readonly(
+            "bins_mz", PythonAPI::vector_view(&Grid::Grid::bins_mz))
+        .def_property_readonly(
+            "bins_rt", PythonAPI::vector_view(&Grid::Grid::bins_rt))
+        .def("dump", &PythonAPI::write_grid,
+             "Write the grid to disk in a binary format. If a tile size is "
+             "given, only the tiles with values above the threshold are "
+             "stored",
+             py::arg("file_name"), py::arg("compression") = "zlib",
+             py::arg("compression_level") = -1, py::arg("tile_size") = 0,
+             py::arg("threshold") = 0.0)
+        .def("subset", &Grid::subset, py::call_guard<py::gil_scoped_release>())
         .def("__repr__", [](const Grid::Grid &s) {
             return "Grid <n: " + std::to_string(s.n) +
                    ", m: " + std::to_string(s.m) +
@@ -1079,17 +2303,24 @@ PYBIND11_MODULE(pastaq, m) {
                    ", min_mz: " + std::to_string(s.min_mz) +
                    ", max_mz: " + std::to_string(s.max_mz) +
                    ", min_rt: " + std::to_string(s.min_rt) +
-                   ", max_rt: " + std::to_string(s.max_rt) + ">";
+                   ", max_rt: " + std::to_string(s.max_rt) +
+                   ", precision: " + PythonAPI::to_string(s.precision) + ">";
         });
 
     py::class_<RawData::RawPoints>(m, "RawPoints")
-        .def_readonly("rt", &RawData::RawPoints::rt)
-        .def_readonly("mz", &RawData::RawPoints::mz)
-        .def_readonly("intensity", &RawData::RawPoints::intensity);
+        .def_property_readonly(
+            "rt", PythonAPI::vector_view(&RawData::RawPoints::rt))
+        .def_property_readonly(
+            "mz", PythonAPI::vector_view(&RawData::RawPoints::mz))
+        .def_property_readonly(
+            "intensity",
+            PythonAPI::vector_view(&RawData::RawPoints::intensity));
 
     py::class_<Xic::Xic>(m, "Xic")
-        .def_readonly("retention_time", &Xic::Xic::retention_time)
-        .def_readonly("intensity", &Xic::Xic::intensity)
+        .def_property_readonly(
+            "retention_time", PythonAPI::vector_view(&Xic::Xic::retention_time))
+        .def_property_readonly(
+            "intensity", PythonAPI::vector_view(&Xic::Xic::intensity))
         .def("__repr__", [](const Xic::Xic &s) {
             return "Xic <method: " + PythonAPI::to_string(s.method) +
                    ", min_mz: " + std::to_string(s.min_mz) +
@@ -1099,6 +2330,8 @@ PYBIND11_MODULE(pastaq, m) {
         });
 
     py::class_<Centroid::Peak>(m, "Peak")
+        .def(PythonAPI::pickle(&Centroid::Serialize::write_peak,
+                               &Centroid::Serialize::read_peak, "peak"))
         .def_readonly("id", &Centroid::Peak::id)
         .def_readonly("local_max_mz", &Centroid::Peak::local_max_mz)
         .def_readonly("local_max_rt", &Centroid::Peak::local_max_rt)
@@ -1181,11 +2414,19 @@ PYBIND11_MODULE(pastaq, m) {
         });
 
     py::class_<Warp2D::TimeMap>(m, "TimeMap")
+        .def(PythonAPI::pickle(&Warp2D::Serialize::write_time_map,
+                               &Warp2D::Serialize::read_time_map, "time_map"))
         .def_readonly("num_segments", &Warp2D::TimeMap::num_segments)
-        .def_readonly("rt_start", &Warp2D::TimeMap::rt_start)
-        .def_readonly("rt_end", &Warp2D::TimeMap::rt_end)
-        .def_readonly("sample_rt_start", &Warp2D::TimeMap::sample_rt_start)
-        .def_readonly("sample_rt_end", &Warp2D::TimeMap::sample_rt_end)
+        .def_property_readonly(
+            "rt_start", PythonAPI::vector_view(&Warp2D::TimeMap::rt_start))
+        .def_property_readonly(
+            "rt_end", PythonAPI::vector_view(&Warp2D::TimeMap::rt_end))
+        .def_property_readonly(
+            "sample_rt_start",
+            PythonAPI::vector_view(&Warp2D::TimeMap::sample_rt_start))
+        .def_property_readonly(
+            "sample_rt_end",
+            PythonAPI::vector_view(&Warp2D::TimeMap::sample_rt_end))
         .def("warp", &Warp2D::warp, py::arg("rt"))
         .def("__repr__", [](const Warp2D::TimeMap &m) {
             return "TimeMap <rt_min: " + std::to_string(m.rt_min) +
@@ -1282,6 +2523,9 @@ PYBIND11_MODULE(pastaq, m) {
         });
 
     py::class_<IdentData::IdentData>(m, "IdentData")
+        .def(PythonAPI::pickle(&IdentData::Serialize::write_ident_data,
+                               &IdentData::Serialize::read_ident_data,
+                               "ident_data"))
         .def_readonly("db_sequences", &IdentData::IdentData::db_sequences)
         .def_readonly("peptides", &IdentData::IdentData::peptides)
         .def_readonly("spectrum_matches",
@@ -1290,6 +2534,9 @@ PYBIND11_MODULE(pastaq, m) {
                       &IdentData::IdentData::peptide_evidence);
 
     py::class_<FeatureDetection::Feature>(m, "Feature")
+        .def(PythonAPI::pickle(&FeatureDetection::Serialize::write_feature,
+                               &FeatureDetection::Serialize::read_feature,
+                               "feature"))
         .def_readonly("id", &FeatureDetection::Feature::id)
         .def_readonly("score", &FeatureDetection::Feature::score)
         .def_readonly("average_rt", &FeatureDetection::Feature::average_rt)
@@ -1313,7 +2560,9 @@ PYBIND11_MODULE(pastaq, m) {
         .def_readonly("monoisotopic_volume",
                       &FeatureDetection::Feature::monoisotopic_volume)
         .def_readonly("charge_state", &FeatureDetection::Feature::charge_state)
-        .def_readonly("peak_ids", &FeatureDetection::Feature::peak_ids)
+        .def_property_readonly(
+            "peak_ids",
+            PythonAPI::vector_view(&FeatureDetection::Feature::peak_ids))
         .def("__repr__", [](const FeatureDetection::Feature &f) {
             std::string ret = "";
             ret += "Feature <id: " + std::to_string(f.id);
@@ -1358,10 +2607,10 @@ PYBIND11_MODULE(pastaq, m) {
                       &MetaMatch::PeakCluster::avg_height)
         .def_readonly("avg_volume",
                       &MetaMatch::PeakCluster::avg_volume)
-        .def_readonly("heights",
-                      &MetaMatch::PeakCluster::heights)
-        .def_readonly("volumes",
-                      &MetaMatch::PeakCluster::volumes)
+        .def_property_readonly(
+            "heights", PythonAPI::vector_view(&MetaMatch::PeakCluster::heights))
+        .def_property_readonly(
+            "volumes", PythonAPI::vector_view(&MetaMatch::PeakCluster::volumes))
         .def_readonly("peak_ids", &MetaMatch::PeakCluster::peak_ids)
         .def("__repr__", [](const MetaMatch::PeakCluster &c) {
             return "MetaCluster <id: " + std::to_string(c.id) +
@@ -1386,16 +2635,24 @@ PYBIND11_MODULE(pastaq, m) {
         .def_readonly("avg_max_volume",
                       &MetaMatch::FeatureCluster::avg_max_volume)
         .def_readonly("charge_state", &MetaMatch::FeatureCluster::charge_state)
-        .def_readonly("total_heights",
-                      &MetaMatch::FeatureCluster::total_heights)
-        .def_readonly("monoisotopic_heights",
-                      &MetaMatch::FeatureCluster::monoisotopic_heights)
-        .def_readonly("max_heights", &MetaMatch::FeatureCluster::max_heights)
-        .def_readonly("total_volumes",
-                      &MetaMatch::FeatureCluster::total_volumes)
-        .def_readonly("monoisotopic_volumes",
-                      &MetaMatch::FeatureCluster::monoisotopic_volumes)
-        .def_readonly("max_volumes", &MetaMatch::FeatureCluster::max_volumes)
+        .def_property_readonly(
+            "total_heights",
+            PythonAPI::vector_view(&MetaMatch::FeatureCluster::total_heights))
+        .def_property_readonly(
+            "monoisotopic_heights", PythonAPI::vector_view(
+                        &MetaMatch::FeatureCluster::monoisotopic_heights))
+        .def_property_readonly(
+            "max_heights",
+            PythonAPI::vector_view(&MetaMatch::FeatureCluster::max_heights))
+        .def_property_readonly(
+            "total_volumes",
+            PythonAPI::vector_view(&MetaMatch::FeatureCluster::total_volumes))
+        .def_property_readonly(
+            "monoisotopic_volumes", PythonAPI::vector_view(
+                        &MetaMatch::FeatureCluster::monoisotopic_volumes))
+        .def_property_readonly(
+            "max_volumes",
+            PythonAPI::vector_view(&MetaMatch::FeatureCluster::max_volumes))
         .def_readonly("feature_ids", &MetaMatch::FeatureCluster::feature_ids)
         .def("__repr__", [](const MetaMatch::FeatureCluster &c) {
             return "MetaCluster <id: " + std::to_string(c.id) +
@@ -1441,7 +2698,8 @@ PYBIND11_MODULE(pastaq, m) {
           py::arg("min_rt") = -1.0, py::arg("max_rt") = -1.0,
           py::arg("instrument_type") = "", py::arg("resolution_ms1"),
           py::arg("resolution_msn"), py::arg("reference_mz"),
-          py::arg("fwhm_rt"), py::arg("polarity") = "", py::arg("ms_level") = 1)
+          py::arg("fwhm_rt"), py::arg("polarity") = "", py::arg("ms_level") = 1,
+          py::arg("max_threads") = std::thread::hardware_concurrency())
         .def("_read_mzml", &PythonAPI::_read_mzml,
              "Read raw data from the given mzML file ", py::arg("file_name"),
              py::arg("min_mz") = -1.0, py::arg("max_mz") = -1.0,
@@ -1449,7 +2707,37 @@ PYBIND11_MODULE(pastaq, m) {
              py::arg("instrument_type") = "", py::arg("resolution_ms1"),
              py::arg("resolution_msn"), py::arg("reference_mz"),
              py::arg("fwhm_rt"), py::arg("polarity") = "",
-             py::arg("ms_level") = 1)
+             py::arg("ms_level") = 1, py::arg("use_index") = true,
+             py::arg("max_threads") = std::thread::hardware_concurrency())
+        .def("_read_raw_multi", &PythonAPI::_read_raw_multi,
+             "Read raw data from the given mzXML/mzML file in a single pass, "
+             "splitting the scans into multiple outputs",
+             py::arg("file_name"), py::arg("min_mz") = -1.0,
+             py::arg("max_mz") = -1.0, py::arg("min_rt") = -1.0,
+             py::arg("max_rt") = -1.0, py::arg("instrument_type") = "",
+             py::arg("resolution_ms1"), py::arg("resolution_msn"),
+             py::arg("reference_mz"), py::arg("fwhm_rt"),
+             py::arg("polarity") = "",
+             py::arg("ms_levels") = std::vector<size_t>{1, 2},
+             py::arg("split_polarity") = false, py::arg("split_faims") = false,
+             py::arg("use_index") = true,
+             py::arg("max_threads") = std::thread::hardware_concurrency())
+        .def("_read_raw_lazy", &PythonAPI::_read_raw_lazy,
+             "Read the scan metadata from the given mzXML/mzML file, decoding "
+             "the peaks of each scan on first access",
+             py::arg("file_name"), py::arg("min_mz") = -1.0,
+             py::arg("max_mz") = -1.0, py::arg("min_rt") = -1.0,
+             py::arg("max_rt") = -1.0, py::arg("instrument_type") = "",
+             py::arg("resolution_ms1"), py::arg("resolution_msn"),
+             py::arg("reference_mz"), py::arg("fwhm_rt"),
+             py::arg("polarity") = "", py::arg("ms_level") = 1,
+             py::arg("use_index") = true, py::arg("max_cache_mb") = 256)
+        .def("_iter_scans", &PythonAPI::_iter_scans,
+             "Read the scans of the given mzXML/mzML file incrementally",
+             py::arg("file_name"), py::arg("min_mz") = -1.0,
+             py::arg("max_mz") = -1.0, py::arg("min_rt") = -1.0,
+             py::arg("max_rt") = -1.0, py::arg("polarity") = "",
+             py::arg("ms_level") = 1, py::arg("use_index") = true)
         .def("theoretical_fwhm", &RawData::theoretical_fwhm,
              "Calculate the theoretical width of the peak at the given m/z for "
              "the given raw file",
@@ -1458,13 +2746,16 @@ PYBIND11_MODULE(pastaq, m) {
              "Resample the raw data into a smoothed warped grid",
              py::arg("raw_data"), py::arg("num_mz") = 10,
              py::arg("num_rt") = 10, py::arg("smoothing_coef_mz") = 0.5,
-             py::arg("smoothing_coef_rt") = 0.5)
+             py::arg("smoothing_coef_rt") = 0.5,
+             py::arg("precision") = "double")
         .def("_find_peaks", &Centroid::find_peaks_parallel,
              "Find all peaks in the given grid", py::arg("raw_data"),
              py::arg("grid"), py::arg("max_peaks") = 0,
-             py::arg("max_threads") = std::thread::hardware_concurrency())
+             py::arg("max_threads") = std::thread::hardware_concurrency(),
+             py::call_guard<py::gil_scoped_release>())
         .def("_find_local_maxima", &Centroid::find_local_maxima,
-             "Find all local maxima in the given grid", py::arg("grid"))
+             "Find all local maxima in the given grid", py::arg("grid"),
+             py::call_guard<py::gil_scoped_release>())
         .def("_get_fit_failure_errors",
              static_cast<std::string (*)(const uint64_t &, const std::vector<std::string> &)>(&Centroid::get_fit_failure_errors),
              "Get the fit failure errors for the given peak",
@@ -1477,26 +2768,42 @@ PYBIND11_MODULE(pastaq, m) {
              py::arg("rt_expand_factor"), py::arg("peaks_per_window"))
         .def("_warp_peaks", &Warp2D::_warp_peaks,
              "Warp the peak list using the given time map", py::arg("peaks"),
-             py::arg("time_map"))
+             py::arg("time_map"), py::call_guard<py::gil_scoped_release>())
         .def("find_similarity", &PythonAPI::find_similarity,
              "Find the similarity between two peak lists",
              py::arg("peak_list_a"), py::arg("peak_list_b"), py::arg("n_peaks"))
         .def("write_peaks", &PythonAPI::write_peaks,
              "Write the peaks to disk in a binary format", py::arg("peaks"),
-             py::arg("file_name"))
+             py::arg("file_name"),
+             py::arg("compression") = "zlib", py::arg("compression_level") = -1)
         .def("write_linked_msms", &PythonAPI::write_linked_msms,
              "Write the linked_msms to disk in a binary format",
-             py::arg("linked_msms"), py::arg("file_name"))
+             py::arg("linked_msms"), py::arg("file_name"),
+             py::arg("compression") = "zlib", py::arg("compression_level") = -1)
         .def("write_linked_psm", &PythonAPI::write_linked_psm,
              "Write the linked_psm to disk in a binary format",
-             py::arg("linked_psm"), py::arg("file_name"))
+             py::arg("linked_psm"), py::arg("file_name"),
+             py::arg("compression") = "zlib", py::arg("compression_level") = -1)
         .def("read_peaks", &PythonAPI::read_peaks,
              "Read the peaks from the binary peaks file", py::arg("file_name"))
         .def("read_raw_data", &PythonAPI::read_raw_data,
-             "Read the raw_data from the binary raw_data file",
+             "Read the raw_data from the binary raw_data file. If a retention "
+             "time or mz range is given, only the scans and points inside it "
+             "are read",
+             py::arg("file_name"), py::arg("min_rt") = -1.0,
+             py::arg("max_rt") = -1.0, py::arg("min_mz") = -1.0,
+             py::arg("max_mz") = -1.0)
+        .def("map_raw_data", &PythonAPI::map_raw_data,
+             "Memory map the binary raw_data file, giving access to the scan "
+             "points without reading them into memory",
              py::arg("file_name"))
         .def("read_grid", &PythonAPI::read_grid,
-             "Read the grid from the binary grid file", py::arg("file_name"))
+             "Read the grid from the binary grid file. If a mz or retention "
+             "time range is given, only the part of the grid inside it is "
+             "read",
+             py::arg("file_name"), py::arg("min_mz") = -1.0,
+             py::arg("max_mz") = -1.0, py::arg("min_rt") = -1.0,
+             py::arg("max_rt") = -1.0)
         .def("read_linked_psm", &PythonAPI::read_linked_psm,
              "Read the linked_psm from the binary linked_psm file",
              py::arg("file_name"))
@@ -1508,7 +2815,8 @@ PYBIND11_MODULE(pastaq, m) {
              py::arg("file_name"))
         .def("write_time_map", &PythonAPI::write_time_map,
              "Write the time_map to disk in a binary format",
-             py::arg("time_map"), py::arg("file_name"))
+             py::arg("time_map"), py::arg("file_name"),
+             py::arg("compression") = "zlib", py::arg("compression_level") = -1)
         .def("read_mzidentml", &PythonAPI::read_mzidentml,
              "Read identification data from the given mzIdentML file ",
              py::arg("file_name"), py::arg("ignore_decoy") = true,
@@ -1521,31 +2829,144 @@ PYBIND11_MODULE(pastaq, m) {
              py::arg("file_name"))
         .def("write_ident_data", &PythonAPI::write_ident_data,
              "Write the ident_data to disk in a binary format",
-             py::arg("ident_data"), py::arg("file_name"))
+             py::arg("ident_data"), py::arg("file_name"),
+             py::arg("compression") = "zlib", py::arg("compression_level") = -1)
         .def("read_inferred_proteins", &PythonAPI::read_inferred_proteins,
             "Read the inferred_proteins from the binary inferred_proteins file",
             py::arg("file_name"))
         .def("write_inferred_proteins", &PythonAPI::write_inferred_proteins,
              "Write the inferred_proteins to disk in a binary format",
-             py::arg("inferred_proteins"), py::arg("file_name"))
+             py::arg("inferred_proteins"), py::arg("file_name"),
+             py::arg("compression") = "zlib", py::arg("compression_level") = -1)
         .def("read_features", &PythonAPI::read_features,
              "Read the feature from the binary feature file",
              py::arg("file_name"))
         .def("write_features", &PythonAPI::write_features,
              "Write the feature to disk in a binary format", py::arg("feature"),
-             py::arg("file_name"))
+             py::arg("file_name"),
+             py::arg("compression") = "zlib", py::arg("compression_level") = -1)
         .def("read_peak_clusters", &PythonAPI::read_peak_clusters,
              "Read the peak_clusters from the binary peak_clusters file",
              py::arg("file_name"))
         .def("write_peak_clusters", &PythonAPI::write_peak_clusters,
              "Write the peak_clusters to disk in a binary format",
-             py::arg("peak_clusters"), py::arg("file_name"))
+             py::arg("peak_clusters"), py::arg("file_name"),
+             py::arg("compression") = "zlib", py::arg("compression_level") = -1)
         .def("read_feature_clusters", &PythonAPI::read_feature_clusters,
              "Read the feature_clusters from the binary feature_clusters file",
              py::arg("file_name"))
         .def("write_feature_clusters", &PythonAPI::write_feature_clusters,
              "Write the feature_clusters to disk in a binary format",
-             py::arg("feature_clusters"), py::arg("file_name"))
+             py::arg("feature_clusters"), py::arg("file_name"),
+             py::arg("compression") = "zlib", py::arg("compression_level") = -1)
+        .def("peaks_to_columns", &PythonAPI::peaks_to_columns,
+             "Export the peaks as a dictionary of NumPy arrays with one column "
+             "per attribute",
+             py::arg("peaks"))
+        .def("features_to_columns", &PythonAPI::features_to_columns,
+             "Export the features as a dictionary of NumPy arrays with one "
+             "column per attribute. The peak ids of all features are "
+             "concatenated, with the ids of feature i in "
+             "[peak_ids_offsets[i], peak_ids_offsets[i + 1])",
+             py::arg("features"))
+        .def("peak_clusters_to_columns", &PythonAPI::peak_clusters_to_columns,
+             "Export the peak clusters as a dictionary of NumPy arrays with "
+             "one column per attribute. Heights and volumes are 2D arrays "
+             "with one column per file. The file and peak ids of all clusters "
+             "are concatenated, with the peaks of cluster i in "
+             "[peak_ids_offsets[i], peak_ids_offsets[i + 1])",
+             py::arg("peak_clusters"))
+        .def("feature_clusters_to_columns",
+             &PythonAPI::feature_clusters_to_columns,
+             "Export the feature clusters as a dictionary of NumPy arrays with "
+             "one column per attribute. The quantifications are 2D arrays "
+             "with one column per file. The file and feature ids of all "
+             "clusters are concatenated, with the features of cluster i in "
+             "[feature_ids_offsets[i], feature_ids_offsets[i + 1])",
+             py::arg("feature_clusters"))
+        .def("ident_data_to_columns", &PythonAPI::ident_data_to_columns,
+             "Export the spectrum_matches, peptides, peptide_evidence and "
+             "db_sequences of the ident_data as dictionaries of NumPy arrays "
+             "with one column per attribute",
+             py::arg("ident_data"))
+        .def("serialize_raw_data",
+             [](const RawData::RawData &raw_data) {
+                 return PythonAPI::serialize(raw_data, PythonAPI::write_raw_data_state, "raw_data");
+             },
+             "Serialize the raw_data into bytes in the binary format",
+             py::arg("raw_data"))
+        .def("deserialize_raw_data",
+             [](py::buffer data) {
+                 return PythonAPI::deserialize<RawData::RawData>(data, PythonAPI::read_raw_data_state, "raw_data");
+             },
+             "Read the raw_data from bytes or any other buffer in the binary "
+             "format, without copying the buffer",
+             py::arg("data"))
+        .def("serialize_grid",
+             [](const Grid::Grid &grid) {
+                 return PythonAPI::serialize(grid, Grid::Serialize::write_grid, "grid");
+             },
+             "Serialize the grid into bytes in the binary format",
+             py::arg("grid"))
+        .def("deserialize_grid",
+             [](py::buffer data) {
+                 return PythonAPI::deserialize<Grid::Grid>(data, Grid::Serialize::read_grid, "grid");
+             },
+             "Read the grid from bytes or any other buffer in the binary "
+             "format, without copying the buffer",
+             py::arg("data"))
+        .def("serialize_peaks",
+             [](const std::vector<Centroid::Peak> &peaks) {
+                 return PythonAPI::serialize(peaks, Centroid::Serialize::write_peaks, "peaks");
+             },
+             "Serialize the peaks into bytes in the binary format",
+             py::arg("peaks"))
+        .def("deserialize_peaks",
+             [](py::buffer data) {
+                 return PythonAPI::deserialize<std::vector<Centroid::Peak>>(data, Centroid::Serialize::read_peaks, "peaks");
+             },
+             "Read the peaks from bytes or any other buffer in the binary "
+             "format, without copying the buffer",
+             py::arg("data"))
+        .def("serialize_features",
+             [](const std::vector<FeatureDetection::Feature> &features) {
+                 return PythonAPI::serialize(features, FeatureDetection::Serialize::write_features, "features");
+             },
+             "Serialize the features into bytes in the binary format",
+             py::arg("features"))
+        .def("deserialize_features",
+             [](py::buffer data) {
+                 return PythonAPI::deserialize<std::vector<FeatureDetection::Feature>>(data, FeatureDetection::Serialize::read_features, "features");
+             },
+             "Read the features from bytes or any other buffer in the binary "
+             "format, without copying the buffer",
+             py::arg("data"))
+        .def("serialize_time_map",
+             [](const Warp2D::TimeMap &time_map) {
+                 return PythonAPI::serialize(time_map, Warp2D::Serialize::write_time_map, "time_map");
+             },
+             "Serialize the time_map into bytes in the binary format",
+             py::arg("time_map"))
+        .def("deserialize_time_map",
+             [](py::buffer data) {
+                 return PythonAPI::deserialize<Warp2D::TimeMap>(data, Warp2D::Serialize::read_time_map, "time_map");
+             },
+             "Read the time_map from bytes or any other buffer in the binary "
+             "format, without copying the buffer",
+             py::arg("data"))
+        .def("serialize_ident_data",
+             [](const IdentData::IdentData &ident_data) {
+                 return PythonAPI::serialize(ident_data, IdentData::Serialize::write_ident_data, "ident_data");
+             },
+             "Serialize the ident_data into bytes in the binary format",
+             py::arg("ident_data"))
+        .def("deserialize_ident_data",
+             [](py::buffer data) {
+                 return PythonAPI::deserialize<IdentData::IdentData>(data, IdentData::Serialize::read_ident_data, "ident_data");
+             },
+             "Read the ident_data from bytes or any other buffer in the binary "
+             "format, without copying the buffer",
+             py::arg("data"))
         .def("find_feature_clusters", &PythonAPI::find_feature_clusters,
              "Perform metamatch for feature matching", py::arg("group_ids"),
              py::arg("features"), py::arg("keep_perc"),
@@ -1558,21 +2979,21 @@ PYBIND11_MODULE(pastaq, m) {
              py::arg("n_sig_rt") = 1.5)
         .def("link_peaks", &Link::link_peaks, "Link msms events to peak ids",
              py::arg("peaks"), py::arg("raw_data"), py::arg("n_sig_mz") = 3,
-             py::arg("n_sig_rt") = 3)
+             py::arg("n_sig_rt") = 3, py::call_guard<py::gil_scoped_release>())
         .def("link_idents", &Link::link_idents,
              "Link msms events to spectrum identifications",
              py::arg("ident_data"), py::arg("raw_data"),
-             py::arg("n_sig_mz") = 3, py::arg("n_sig_rt") = 3)
+             py::arg("n_sig_mz") = 3, py::arg("n_sig_rt") = 3, py::call_guard<py::gil_scoped_release>())
         .def("link_psm", &Link::link_psm,
              "Link spectrum identifications with peaks",
              py::arg("ident_data"), py::arg("peaks"), py::arg("raw_data"),
-             py::arg("n_sig_mz") = 3, py::arg("n_sig_rt") = 3)
+             py::arg("n_sig_mz") = 3, py::arg("n_sig_rt") = 3, py::call_guard<py::gil_scoped_release>())
         .def("xic", &PythonAPI::xic, py::arg("raw_data"), py::arg("min_mz"),
              py::arg("max_mz"), py::arg("min_rt"), py::arg("max_rt"),
              py::arg("method") = "sum")
         .def("perform_protein_inference", &ProteinInference::razor,
-             py::arg("ident_data"))
+             py::arg("ident_data"), py::call_guard<py::gil_scoped_release>())
         .def("detect_features", &FeatureDetection::detect_features,
              "Link peaks as features", py::arg("peaks"),
-             py::arg("charge_states"));
+             py::arg("charge_states"), py::call_guard<py::gil_scoped_release>());
 }
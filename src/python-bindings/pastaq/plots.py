@@ -0,0 +1,737 @@
+# Plotting functions and quality control plots. This module is imported on
+# first use, so that importing pastaq doesn't load matplotlib and seaborn.
+import datetime
+import matplotlib.colors as colors
+import matplotlib.gridspec as gridspec
+import matplotlib.pyplot as plt
+import numpy as np
+import os
+import pandas as pd
+import seaborn as sns
+import time
+
+import pastaq
+from . import _custom_log
+
+
+def plot_mesh(mesh, transform='sqrt', figure=None):
+    """Plot the mesh with side plots showing TIC vs. m/z and retention time.
+
+    The central plot shows the mesh as a colored 2D image with RT vs. m/z.
+    On the right is a plot of total ion current vs. retention matching the y-axis;
+    On the top is a plot of total ion current vs. m/z matchint the x-axis.
+
+    Args:
+        mesh (Grid): Grid of ion current vs. m/z and rt e.g. created by resample
+        transform (string): Optional transform to apply, either sqrt, cubic, or log
+        figure (figure): Optional figure in which to place the plots - otherwise created anew
+
+    Returns:
+        dictionary containing the three created plots with string keys img_plot, mz_plot, rt_plot
+
+    The returned dict need not be used and the entire layout of the three plots will appear if plt.show() is executed.
+
+    """
+
+    plt.style.use('dark_background')
+
+    if figure is None:
+        figure = plt.figure()
+
+    img = mesh.data
+    img = np.reshape(img, (mesh.m, mesh.n))
+    bins_rt = mesh.bins_rt
+    bins_mz = mesh.bins_mz
+
+    plt.figure(figure.number)
+    plt.clf()
+    gs = gridspec.GridSpec(5, 5)
+    mz_plot = plt.subplot(gs[0, :-1])
+    mz_plot.clear()
+    mz_plot.plot(bins_mz, img.sum(axis=0))
+    mz_plot.margins(x=0)
+    mz_plot.set_xticks([])
+    mz_plot.set_ylabel("Intensity")
+
+    rt_plot = plt.subplot(gs[1:, -1])
+    rt_plot.clear()
+    rt_plot.plot(img.sum(axis=1), bins_rt)
+    rt_plot.margins(y=0)
+    rt_plot.set_yticks([])
+    rt_plot.set_xlabel("Intens")
+
+    img_plot = plt.subplot(gs[1:, :-1])
+    offset_rt = (np.array(mesh.bins_rt).max() -
+                 np.array(mesh.bins_rt).min())/mesh.m / 2
+    offset_mz = (np.array(mesh.bins_mz).max() -
+                 np.array(mesh.bins_mz).min())/mesh.n / 2
+    if transform == 'sqrt':
+        img_plot.pcolormesh(
+            np.array(mesh.bins_mz) - offset_mz,
+            np.array(mesh.bins_rt) - offset_rt,
+            img,
+            snap=True,
+            norm=colors.PowerNorm(gamma=1./2.))
+    elif transform == 'cubic':
+        img_plot.pcolormesh(
+            np.array(mesh.bins_mz) - offset_mz,
+            np.array(mesh.bins_rt) - offset_rt,
+            img,
+            norm=colors.PowerNorm(gamma=1./3.))
+    elif transform == 'log':
+        img_plot.pcolormesh(
+            np.array(mesh.bins_mz) - offset_mz,
+            np.array(mesh.bins_rt) - offset_rt,
+            img,
+            norm=colors.LogNorm(vmin=img.min()+1e-8, vmax=img.max()))
+    else:
+        img_plot.pcolormesh(mesh.bins_mz, mesh.bins_rt, img)
+
+    img_plot.set_xlim([np.array(mesh.bins_mz).min() - offset_mz,
+                       np.array(mesh.bins_mz).max() - offset_mz])
+    img_plot.set_ylim([np.array(mesh.bins_rt).min() - offset_rt,
+                       np.array(mesh.bins_rt).max() - offset_rt])
+
+    img_plot.set_xlabel("m/z")
+    img_plot.set_ylabel("retention time (s)")
+
+    return {
+        "img_plot": img_plot,
+        "mz_plot": mz_plot,
+        "rt_plot": rt_plot,
+    }
+
+
+def plot_xic(peak, raw_data, figure=None, method="max"):
+    xic = peak.xic(raw_data, method=method)
+    x = xic.retention_time
+    y = xic.intensity
+    plt.style.use('dark_background')
+    if not figure:
+        figure = plt.figure()
+
+    plt.plot(x, y, label='peak_id = {}'.format(peak.id))
+    plt.xlabel('Retention time (s)')
+    plt.ylabel('Intensity')
+    plt.legend()
+
+    return figure
+
+
+def plot_peak_raw_points(
+        peak,
+        raw_data,
+        img_plot=None,
+        rt_plot=None,
+        mz_plot=None,
+        xic_method="max"):
+    data_points = raw_data.raw_points(
+        peak.roi_min_mz,
+        peak.roi_max_mz,
+        peak.roi_min_rt,
+        peak.roi_max_rt,
+    )
+    rts = data_points.rt
+    mzs = data_points.mz
+    intensities = data_points.intensity
+
+    # Calculate min/max values for the given peak.
+    min_mz = peak.roi_min_mz
+    max_mz = peak.roi_max_mz
+    min_rt = peak.roi_min_rt
+    max_rt = peak.roi_max_rt
+
+    if not img_plot and not rt_plot and not mz_plot:
+        plt.style.use('dark_background')
+        plt.figure()
+        plt.clf()
+        gs = gridspec.GridSpec(5, 5)
+        mz_plot = plt.subplot(gs[0, :-1])
+        mz_plot.margins(x=0)
+        mz_plot.set_xticks([])
+        mz_plot.set_ylabel("Intensity")
+        rt_plot = plt.subplot(gs[1:, -1])
+        rt_plot.margins(y=0)
+        rt_plot.set_yticks([])
+        rt_plot.set_xlabel("Intensity")
+        img_plot = plt.subplot(gs[1:, :-1])
+
+        # Set the min/max limits for mz/rt.
+        mz_plot.set_xlim([min_mz, max_mz])
+        rt_plot.set_ylim([min_rt, max_rt])
+        img_plot.set_xlim([min_mz, max_mz])
+        img_plot.set_ylim([min_rt, max_rt])
+
+    # NOTE: Adding 200 for a more pleasant color map on the first peaks, found
+    # this number by trial and error, dont @ me.
+    np.random.seed(peak.id + 200)
+    color = np.append(np.random.rand(3, 1).flatten(), 0.5)
+    np.random.seed(None)
+
+    if img_plot:
+        img_plot.scatter(
+            mzs, rts,
+            c=np.sqrt(intensities),
+            edgecolor=color,
+        )
+    if rt_plot:
+        xic = peak.xic(raw_data, method=xic_method)
+        x = xic.retention_time
+        y = xic.intensity
+        rt_plot.plot(y, x, color=color)
+    if mz_plot:
+        sort_idx_mz = np.argsort(mzs)
+        markerline, stemlines, baseline = mz_plot.stem(
+            np.array(mzs)[sort_idx_mz],
+            np.array(intensities)[sort_idx_mz],
+            markerfmt=' ',
+        )
+        plt.setp(baseline, color=color, alpha=0.5)
+        plt.setp(stemlines, color=color, alpha=0.5)
+
+    # Set x/y limits if necessary.
+    lim_min_mz, lim_max_mz = img_plot.get_xlim()
+    lim_min_rt, lim_max_rt = img_plot.get_ylim()
+    if min_mz < lim_min_mz:
+        lim_min_mz = min_mz
+    if min_rt < lim_min_rt:
+        lim_min_rt = min_rt
+    if max_mz > lim_max_mz:
+        lim_max_mz = max_mz
+    if max_rt > lim_max_rt:
+        lim_max_rt = max_rt
+    mz_plot.set_xlim([lim_min_mz, lim_max_mz])
+    rt_plot.set_ylim([lim_min_rt, lim_max_rt])
+    img_plot.set_xlim([lim_min_mz, lim_max_mz])
+    img_plot.set_ylim([lim_min_rt, lim_max_rt])
+
+    return {
+        "img_plot": img_plot,
+        "mz_plot": mz_plot,
+        "rt_plot": rt_plot,
+    }
+
+
+def generate_qc_plots(params, output_dir, logger=None, force_override=False):
+    input_files = params['input_files']
+
+    #
+    # General plot config.
+    #
+
+    # Font and figure size
+    plt.rcParams.update({
+        'font.family': params['qc_plot_font_family'],
+        'font.size': params['qc_plot_font_size'],
+        'figure.figsize': (params['qc_plot_fig_size_x'], params['qc_plot_fig_size_y']),
+    })
+
+    # Alpha parameters.
+    fill_alpha = params['qc_plot_fill_alpha']
+    line_alpha = params['qc_plot_line_alpha']
+    scatter_alpha = params['qc_plot_scatter_alpha']
+    if line_alpha == 'dynamic':
+        line_alpha = max(params['qc_plot_min_dynamic_alpha'], 1.0 / len(input_files))
+    if fill_alpha == 'dynamic':
+        fill_alpha = max(params['qc_plot_min_dynamic_alpha'], 1.0 / len(input_files))
+
+    # Colorscheme.
+    palette = sns.color_palette(params['qc_plot_palette'], len(input_files))
+
+    _custom_log("Starting quality control plotting", logger)
+    time_start = time.time()
+
+    #
+    # Peak sigma density
+    #
+    if not params['qc_plot_per_file']:
+        out_path = os.path.join(output_dir, 'quality', 'peak_sigma_mz_rt_density.{}'.format(params['qc_plot_extension']))
+        if not os.path.exists(out_path) or force_override:
+            fig, (ax_left, ax_right) = plt.subplots(1, 2)
+            for input_file, color in zip(input_files, palette):
+                stem = input_file['stem']
+                _custom_log("Plotting density of sigma_mz/sigma_rt: {}".format(stem), logger)
+                peaks_path = os.path.join(output_dir, 'warped_peaks', "{}.peaks".format(stem))
+                peaks = pastaq.peaks_to_columns(pastaq.read_peaks(peaks_path))
+
+                sigma_mzs = peaks['fitted_sigma_mz']
+                sigma_rts = peaks['fitted_sigma_rt']
+
+                if params['qc_plot_line_style'] == 'fill':
+                    sns.kdeplot(sigma_rts, label=stem, ax=ax_left, fill=True, linewidth=0, alpha=fill_alpha, color=color)
+                    sns.kdeplot(sigma_mzs, label=stem, ax=ax_right, fill=True, linewidth=0, alpha=fill_alpha, color=color)
+                else:
+                    sns.kdeplot(sigma_rts, label=stem, ax=ax_left, alpha=line_alpha, color=color)
+                    sns.kdeplot(sigma_mzs, label=stem, ax=ax_right, alpha=line_alpha, color=color)
+
+            if params['qc_plot_fig_legend']:
+                plt.legend()
+            ax_left.set_xlabel('$\\sigma_{rt}$')
+            ax_right.set_xlabel('$\\sigma_{mz}$')
+            ax_left.set_ylabel('Density')
+            ax_right.set_ylabel('')
+            _custom_log("Saving figure: {}".format(out_path), logger)
+            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
+            plt.close(fig)
+    else:
+        for input_file, color in zip(input_files, palette):
+            stem = input_file['stem']
+            out_path = os.path.join(output_dir, 'quality', '{}_peak_sigma_mz_rt_density.{}'.format(stem, params['qc_plot_extension']))
+            if os.path.exists(out_path) and not force_override:
+                continue
+            fig, (ax_left, ax_right) = plt.subplots(1, 2)
+            _custom_log("Plotting density of sigma_mz/sigma_rt: {}".format(stem), logger)
+            peaks_path = os.path.join(output_dir, 'warped_peaks', "{}.peaks".format(stem))
+            peaks = pastaq.peaks_to_columns(pastaq.read_peaks(peaks_path))
+
+            sigma_mzs = peaks['fitted_sigma_mz']
+            sigma_rts = peaks['fitted_sigma_rt']
+
+            if params['qc_plot_line_style'] == 'fill':
+                sns.kdeplot(sigma_rts, label=stem, ax=ax_left, fill=True, linewidth=0, alpha=fill_alpha, color=color)
+                sns.kdeplot(sigma_mzs, label=stem, ax=ax_right, fill=True, linewidth=0, alpha=fill_alpha, color=color)
+            else:
+                sns.kdeplot(sigma_rts, label=stem, ax=ax_left, alpha=line_alpha, color=color)
+                sns.kdeplot(sigma_mzs, label=stem, ax=ax_right, alpha=line_alpha, color=color)
+
+            if params['qc_plot_fig_legend']:
+                plt.legend()
+            ax_left.set_xlabel('$\\sigma_{rt}$')
+            ax_right.set_xlabel('$\\sigma_{mz}$')
+            ax_left.set_ylabel('Density')
+            ax_right.set_ylabel('')
+            _custom_log("Saving figure: {}".format(out_path), logger)
+            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
+            plt.close(fig)
+
+    #
+    # Peak rt vs rt_delta
+    #
+    if not params['qc_plot_per_file']:
+        out_path = os.path.join(output_dir, 'quality', 'peak_rt_vs_rt_delta.{}'.format(params['qc_plot_extension']))
+        if not os.path.exists(out_path) or force_override:
+            fig, ax = plt.subplots(1, 1)
+
+            for input_file, color in zip(input_files, palette):
+                stem = input_file['stem']
+                _custom_log("Plotting rt vs rt_delta: {}".format(stem), logger)
+                peaks_path = os.path.join(output_dir, 'warped_peaks', "{}.peaks".format(stem))
+                peaks = pastaq.peaks_to_columns(pastaq.read_peaks(peaks_path))
+
+                rts = peaks['fitted_rt']
+                rt_deltas = peaks['rt_delta']
+
+                idx = np.argsort(rts)
+                rts = rts[idx]
+                rt_deltas = rt_deltas[idx]
+                ax.plot(rts, rt_deltas, label=stem, alpha=line_alpha, color=color)
+
+            if params['qc_plot_fig_legend']:
+                plt.legend()
+            ax.set_xlabel('Retention time (s)')
+            ax.set_ylabel('Retention time delta (s)')
+            _custom_log("Saving figure: {}".format(out_path), logger)
+            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
+            plt.close(fig)
+    else:
+        for input_file, color in zip(input_files, palette):
+            stem = input_file['stem']
+            out_path = os.path.join(output_dir, 'quality', '{}_peak_rt_vs_rt_delta.{}'.format(stem, params['qc_plot_extension']))
+            if os.path.exists(out_path) and not force_override:
+                continue
+            fig, ax = plt.subplots(1, 1)
+            _custom_log("Plotting rt vs rt_delta: {}".format(stem), logger)
+            peaks_path = os.path.join(output_dir, 'warped_peaks', "{}.peaks".format(stem))
+            peaks = pastaq.peaks_to_columns(pastaq.read_peaks(peaks_path))
+
+            rts = peaks['fitted_rt']
+            rt_deltas = peaks['rt_delta']
+
+            idx = np.argsort(rts)
+            rts = rts[idx]
+            rt_deltas = rt_deltas[idx]
+            ax.plot(rts, rt_deltas, label=stem, alpha=line_alpha, color=color)
+
+            if params['qc_plot_fig_legend']:
+                plt.legend()
+            ax.set_xlabel('Retention time (s)')
+            ax.set_ylabel('Retention time delta (s)')
+            _custom_log("Saving figure: {}".format(out_path), logger)
+            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
+            plt.close(fig)
+
+    #
+    # Peak sigma_mz vs m/z scatterplot.
+    #
+    if not params['qc_plot_per_file']:
+        out_path = os.path.join(output_dir, 'quality', 'peak_mz_vs_sigma_mz.{}'.format(params['qc_plot_extension']))
+        if not os.path.exists(out_path) or force_override:
+            fig, ax = plt.subplots(1, 1)
+
+            for input_file, color in zip(input_files, palette):
+                stem = input_file['stem']
+                _custom_log("Plotting mz vs sigma_mz: {}".format(stem), logger)
+                peaks_path = os.path.join(output_dir, 'warped_peaks', "{}.peaks".format(stem))
+                peaks = pastaq.peaks_to_columns(pastaq.read_peaks(peaks_path))
+
+                mz = peaks['fitted_mz'][0:params['qc_plot_mz_vs_sigma_mz_max_peaks']]
+                sigma_mz = peaks['fitted_sigma_mz'][0:params['qc_plot_mz_vs_sigma_mz_max_peaks']]
+
+                ax.scatter(mz, sigma_mz, s=params['qc_plot_scatter_size'], label=stem, edgecolors='none', alpha=scatter_alpha, color=color)
+
+            if params['qc_plot_fig_legend']:
+                plt.legend()
+            ax.set_xlabel('m/z')
+            ax.set_ylabel('$\\sigma_{mz}$')
+            _custom_log("Saving figure: {}".format(out_path), logger)
+            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
+            plt.close(fig)
+    else:
+        for input_file, color in zip(input_files, palette):
+            stem = input_file['stem']
+            out_path = os.path.join(output_dir, 'quality', '{}_peak_mz_vs_sigma_mz.{}'.format(stem, params['qc_plot_extension']))
+            if os.path.exists(out_path) and not force_override:
+                continue
+            fig, ax = plt.subplots(1, 1)
+            _custom_log("Plotting mz vs sigma_mz: {}".format(stem), logger)
+            peaks_path = os.path.join(output_dir, 'warped_peaks', "{}.peaks".format(stem))
+            peaks = pastaq.peaks_to_columns(pastaq.read_peaks(peaks_path))
+
+            mz = peaks['fitted_mz'][0:params['qc_plot_mz_vs_sigma_mz_max_peaks']]
+            sigma_mz = peaks['fitted_sigma_mz'][0:params['qc_plot_mz_vs_sigma_mz_max_peaks']]
+
+            ax.scatter(mz, sigma_mz, s=params['qc_plot_scatter_size'], label=stem, edgecolors='none', alpha=scatter_alpha, color=color)
+
+            if params['qc_plot_fig_legend']:
+                plt.legend()
+            ax.set_xlabel('m/z')
+            ax.set_ylabel('$\\sigma_{mz}$')
+            _custom_log("Saving figure: {}".format(out_path), logger)
+            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
+            plt.close(fig)
+
+    #
+    # Extracted Ion Chromatogram (XIC) before and after alignment.
+    #
+    if not params['qc_plot_per_file']:
+        out_path = os.path.join(output_dir, 'quality', 'xic_unaligned.{}'.format(params['qc_plot_extension']))
+        if not os.path.exists(out_path) or force_override:
+            fig, ax = plt.subplots(1, 1)
+
+            for input_file, color in zip(input_files, palette):
+                stem = input_file['stem']
+                _custom_log("Plotting XIC (unaligned): {}".format(stem), logger)
+
+                raw_data_path = os.path.join(output_dir, 'raw', "{}.ms1".format(stem))
+                raw_data = pastaq.read_raw_data(raw_data_path)
+                xic = pastaq.xic(
+                    raw_data,
+                    raw_data.min_mz,
+                    raw_data.max_mz,
+                    raw_data.min_rt,
+                    raw_data.max_rt,
+                    "sum"
+                )
+                x = xic.retention_time
+                y = xic.intensity
+
+                if params['qc_plot_line_style'] == 'fill':
+                    ax.fill_between(x, 0, y, lw=0, color=color, alpha=fill_alpha, label=stem)
+                else:
+                    ax.plot(x, y, label=stem, alpha=line_alpha, color=color)
+
+            if params['qc_plot_fig_legend']:
+                plt.legend()
+            ax.set_xlabel('Retention time (s)')
+            ax.set_ylabel('Intensity')
+            _custom_log("Saving figure: {}".format(out_path), logger)
+            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
+            plt.close(fig)
+    else:
+        for input_file, color in zip(input_files, palette):
+            stem = input_file['stem']
+            out_path = os.path.join(output_dir, 'quality', '{}_xic_unaligned.{}'.format(stem, params['qc_plot_extension']))
+            if os.path.exists(out_path) and not force_override:
+                continue
+            fig, ax = plt.subplots(1, 1)
+            _custom_log("Plotting XIC (unaligned): {}".format(stem), logger)
+
+            raw_data_path = os.path.join(output_dir, 'raw', "{}.ms1".format(stem))
+            raw_data = pastaq.read_raw_data(raw_data_path)
+            xic = pastaq.xic(
+                raw_data,
+                raw_data.min_mz,
+                raw_data.max_mz,
+                raw_data.min_rt,
+                raw_data.max_rt,
+                "sum"
+            )
+            x = xic.retention_time
+            y = xic.intensity
+
+            if params['qc_plot_line_style'] == 'fill':
+                ax.fill_between(x, 0, y, lw=0, color=color, alpha=fill_alpha, label=stem)
+            else:
+                ax.plot(x, y, label=stem, alpha=line_alpha, color=color)
+
+            if params['qc_plot_fig_legend']:
+                plt.legend()
+            ax.set_xlabel('Retention time (s)')
+            ax.set_ylabel('Intensity')
+            _custom_log("Saving figure: {}".format(out_path), logger)
+            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
+            plt.close(fig)
+
+    if not params['qc_plot_per_file']:
+        out_path = os.path.join(output_dir, 'quality', 'xic_aligned.{}'.format(params['qc_plot_extension']))
+        if not os.path.exists(out_path) or force_override:
+            fig, ax = plt.subplots(1, 1)
+
+            for input_file, color in zip(input_files, palette):
+                stem = input_file['stem']
+                _custom_log("Plotting XIC (aligned): {}".format(stem), logger)
+
+                raw_data_path = os.path.join(output_dir, 'raw', "{}.ms1".format(stem))
+                tmap_path = os.path.join(output_dir, 'time_map', "{}.tmap".format(stem))
+
+                raw_data = pastaq.read_raw_data(raw_data_path)
+                tmap = pastaq.read_time_map(tmap_path)
+
+                xic = pastaq.xic(
+                    raw_data,
+                    raw_data.min_mz,
+                    raw_data.max_mz,
+                    raw_data.min_rt,
+                    raw_data.max_rt,
+                    "sum"
+                )
+                x = [tmap.warp(rt) for rt in xic.retention_time]
+                y = xic.intensity
+
+                if params['qc_plot_line_style'] == 'fill':
+                    ax.fill_between(x, 0, y, lw=0, color=color, alpha=fill_alpha, label=stem)
+                else:
+                    ax.plot(x, y, label=stem, alpha=line_alpha, color=color)
+
+            if params['qc_plot_fig_legend']:
+                plt.legend()
+            ax.set_xlabel('Retention time (s)')
+            ax.set_ylabel('Intensity')
+            _custom_log("Saving figure: {}".format(out_path), logger)
+            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
+            plt.close(fig)
+    else:
+        for input_file, color in zip(input_files, palette):
+            stem = input_file['stem']
+            out_path = os.path.join(output_dir, 'quality', '{}_xic_aligned.{}'.format(stem, params['qc_plot_extension']))
+            if os.path.exists(out_path) and not force_override:
+                continue
+            fig, ax = plt.subplots(1, 1)
+            _custom_log("Plotting XIC (aligned): {}".format(stem), logger)
+
+            raw_data_path = os.path.join(output_dir, 'raw', "{}.ms1".format(stem))
+            tmap_path = os.path.join(output_dir, 'time_map', "{}.tmap".format(stem))
+
+            raw_data = pastaq.read_raw_data(raw_data_path)
+            tmap = pastaq.read_time_map(tmap_path)
+
+            xic = pastaq.xic(
+                raw_data,
+                raw_data.min_mz,
+                raw_data.max_mz,
+                raw_data.min_rt,
+                raw_data.max_rt,
+                "sum"
+            )
+            x = [tmap.warp(rt) for rt in xic.retention_time]
+            y = xic.intensity
+
+            if params['qc_plot_line_style'] == 'fill':
+                ax.fill_between(x, 0, y, lw=0, color=color, alpha=fill_alpha, label=stem)
+            else:
+                ax.plot(x, y, label=stem, alpha=line_alpha, color=color)
+
+            if params['qc_plot_fig_legend']:
+                plt.legend()
+            ax.set_xlabel('Retention time (s)')
+            ax.set_ylabel('Intensity')
+            _custom_log("Saving figure: {}".format(out_path), logger)
+            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
+            plt.close(fig)
+
+    #
+    # Base Peak chromatogram before and after alignment.
+    #
+    if not params['qc_plot_per_file']:
+        out_path = os.path.join(output_dir, 'quality', 'bpc_unaligned.{}'.format(params['qc_plot_extension']))
+        if not os.path.exists(out_path) or force_override:
+            fig, ax = plt.subplots(1, 1)
+
+            for input_file, color in zip(input_files, palette):
+                stem = input_file['stem']
+                _custom_log("Plotting Base Peak Chromatogram (unaligned): {}".format(stem), logger)
+
+                raw_data_path = os.path.join(output_dir, 'raw', "{}.ms1".format(stem))
+                raw_data = pastaq.read_raw_data(raw_data_path)
+                xic = pastaq.xic(
+                    raw_data,
+                    raw_data.min_mz,
+                    raw_data.max_mz,
+                    raw_data.min_rt,
+                    raw_data.max_rt,
+                    "max"
+                )
+                x = xic.retention_time
+                y = xic.intensity
+
+                if params['qc_plot_line_style'] == 'fill':
+                    ax.fill_between(x, 0, y, lw=0, color=color, alpha=fill_alpha, label=stem)
+                else:
+                    ax.plot(x, y, label=stem, alpha=line_alpha, color=color)
+
+            if params['qc_plot_fig_legend']:
+                plt.legend()
+            ax.set_xlabel('Retention time (s)')
+            ax.set_ylabel('Intensity')
+            _custom_log("Saving figure: {}".format(out_path), logger)
+            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
+            plt.close(fig)
+    else:
+        for input_file, color in zip(input_files, palette):
+            stem = input_file['stem']
+            out_path = os.path.join(output_dir, 'quality', '{}_bpc_unaligned.{}'.format(stem, params['qc_plot_extension']))
+            if os.path.exists(out_path) and not force_override:
+                continue
+            fig, ax = plt.subplots(1, 1)
+            _custom_log("Plotting Base Peak Chromatogram (unaligned): {}".format(stem), logger)
+
+            raw_data_path = os.path.join(output_dir, 'raw', "{}.ms1".format(stem))
+            raw_data = pastaq.read_raw_data(raw_data_path)
+            xic = pastaq.xic(
+                raw_data,
+                raw_data.min_mz,
+                raw_data.max_mz,
+                raw_data.min_rt,
+                raw_data.max_rt,
+                "max"
+            )
+            x = xic.retention_time
+            y = xic.intensity
+
+            if params['qc_plot_line_style'] == 'fill':
+                ax.fill_between(x, 0, y, lw=0, color=color, alpha=fill_alpha, label=stem)
+            else:
+                ax.plot(x, y, label=stem, alpha=line_alpha, color=color)
+
+            if params['qc_plot_fig_legend']:
+                plt.legend()
+            ax.set_xlabel('Retention time (s)')
+            ax.set_ylabel('Intensity')
+            _custom_log("Saving figure: {}".format(out_path), logger)
+            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
+            plt.close(fig)
+
+    if not params['qc_plot_per_file']:
+        out_path = os.path.join(output_dir, 'quality', 'bpc_aligned.{}'.format(params['qc_plot_extension']))
+        if not os.path.exists(out_path) or force_override:
+            fig, ax = plt.subplots(1, 1)
+
+            for input_file, color in zip(input_files, palette):
+                stem = input_file['stem']
+                _custom_log("Plotting Base Peak Chromatogram (aligned): {}".format(stem), logger)
+
+                raw_data_path = os.path.join(output_dir, 'raw', "{}.ms1".format(stem))
+                tmap_path = os.path.join(output_dir, 'time_map', "{}.tmap".format(stem))
+
+                raw_data = pastaq.read_raw_data(raw_data_path)
+                tmap = pastaq.read_time_map(tmap_path)
+
+                xic = pastaq.xic(
+                    raw_data,
+                    raw_data.min_mz,
+                    raw_data.max_mz,
+                    raw_data.min_rt,
+                    raw_data.max_rt,
+                    "max"
+                )
+                x = [tmap.warp(rt) for rt in xic.retention_time]
+                y = xic.intensity
+
+                if params['qc_plot_line_style'] == 'fill':
+                    ax.fill_between(x, 0, y, lw=0, color=color, alpha=fill_alpha, label=stem)
+                else:
+                    ax.plot(x, y, label=stem, alpha=line_alpha, color=color)
+
+            if params['qc_plot_fig_legend']:
+                plt.legend()
+            ax.set_xlabel('Retention time (s)')
+            ax.set_ylabel('Intensity')
+            _custom_log("Saving figure: {}".format(out_path), logger)
+            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
+            plt.close(fig)
+    else:
+        for input_file, color in zip(input_files, palette):
+            stem = input_file['stem']
+            out_path = os.path.join(output_dir, 'quality', '{}_bpc_aligned.{}'.format(stem, params['qc_plot_extension']))
+            if os.path.exists(out_path) and not force_override:
+                continue
+            fig, ax = plt.subplots(1, 1)
+            _custom_log("Plotting Base Peak Chromatogram (aligned): {}".format(stem), logger)
+
+            raw_data_path = os.path.join(output_dir, 'raw', "{}.ms1".format(stem))
+            tmap_path = os.path.join(output_dir, 'time_map', "{}.tmap".format(stem))
+
+            raw_data = pastaq.read_raw_data(raw_data_path)
+            tmap = pastaq.read_time_map(tmap_path)
+
+            xic = pastaq.xic(
+                raw_data,
+                raw_data.min_mz,
+                raw_data.max_mz,
+                raw_data.min_rt,
+                raw_data.max_rt,
+                "max"
+            )
+            x = [tmap.warp(rt) for rt in xic.retention_time]
+            y = xic.intensity
+
+            if params['qc_plot_line_style'] == 'fill':
+                ax.fill_between(x, 0, y, lw=0, color=color, alpha=fill_alpha, label=stem)
+            else:
+                ax.plot(x, y, label=stem, alpha=line_alpha, color=color)
+
+            if params['qc_plot_fig_legend']:
+                plt.legend()
+            ax.set_xlabel('Retention time (s)')
+            ax.set_ylabel('Intensity')
+            _custom_log("Saving figure: {}".format(out_path), logger)
+            plt.savefig(out_path, dpi=params['qc_plot_dpi'])
+            plt.close(fig)
+
+    #
+    # Similarity matrix before/after alignment.
+    #
+    out_path = os.path.join(output_dir, 'quality', 'similarity_unaligned.{}'.format(params['qc_plot_extension']))
+    if not os.path.exists(out_path) or force_override:
+        fig, ax = plt.subplots(1, 1)
+        _custom_log("Plotting similarity matrix before alignment", logger)
+        matrix_path = os.path.join(output_dir, 'quality', 'similarity_{}.csv'.format('peaks'))
+        similarity_matrix = pd.read_csv(matrix_path, index_col=0)
+        sns.heatmap(similarity_matrix, xticklabels=True, yticklabels=True, square=True, vmin=0, vmax=1)
+        _custom_log("Saving figure: {}".format(out_path), logger)
+        plt.savefig(out_path, dpi=params['qc_plot_dpi'])
+        plt.close(fig)
+
+    out_path = os.path.join(output_dir, 'quality', 'similarity_aligned.{}'.format(params['qc_plot_extension']))
+    if not os.path.exists(out_path) or force_override:
+        fig, ax = plt.subplots(1, 1)
+        _custom_log("Plotting similarity matrix after alignment", logger)
+        matrix_path = os.path.join(output_dir, 'quality', 'similarity_{}.csv'.format('warped_peaks'))
+        similarity_matrix = pd.read_csv(matrix_path, index_col=0)
+        sns.heatmap(similarity_matrix, xticklabels=True, yticklabels=True, square=True, vmin=0, vmax=1)
+        _custom_log("Saving figure: {}".format(out_path), logger)
+        plt.savefig(out_path, dpi=params['qc_plot_dpi'])
+        plt.close(fig)
+
+    elapsed_time = datetime.timedelta(seconds=time.time()-time_start)
+    _custom_log('Finished quality control plotting in {}'.format(elapsed_time), logger)
@@ -0,0 +1,985 @@
+# Functions building the similarity matrices and the quantitative tables. This
+# module is imported on first use, so that importing pastaq doesn't load
+# pandas.
+import datetime
+import numpy as np
+import os
+import pandas as pd
+import time
+
+import pastaq
+from . import _custom_log, _is_cached, _save_to_cache, _stage_key
+
+
+def to_dataframe(columns):
+    """Build a DataFrame from the columns exported by the *_to_columns functions.
+
+    The 2D columns with per file values of clusters are split into one column
+    per file, named '<column>_<file index>'. The concatenated id lists and their
+    offsets don't have one value per element and are not included.
+
+    Args:
+        columns (dict): Dictionary of NumPy arrays, as returned by
+            peaks_to_columns, features_to_columns, peak_clusters_to_columns,
+            feature_clusters_to_columns or one of the tables of
+            ident_data_to_columns
+
+    Returns:
+        A pandas DataFrame with one row per element
+    """
+    num_rows = len(columns['id'])
+    data = {}
+    for name, values in columns.items():
+        if values.ndim == 2:
+            for i in range(values.shape[1]):
+                data['{}_{}'.format(name, i)] = values[:, i]
+        elif len(values) == num_rows and not name.endswith('_offsets'):
+            data[name] = values
+    return pd.DataFrame(data)
+
+
+def _split_ids(columns, name):
+    # Split the concatenated id lists of the exported columns into one list per
+    # element.
+    offsets = columns[name + '_offsets']
+    return [columns[name][start:end].tolist() for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def _file_values(columns, name, num_files):
+    # Per file values of the exported cluster columns, with one column per file
+    # even if there are no clusters.
+    return columns[name].reshape(len(columns['id']), num_files)
+
+
+def _repeat_ids(columns, name, values):
+    # Repeat the values of each element once per id in its id list, matching
+    # the concatenated ids of the exported columns.
+    return np.repeat(values, np.diff(columns[name + '_offsets']).astype(np.int64))
+
+
+def find_sequence_consensus(annotations, sequence_column, min_consensus_count):
+    consensus = annotations[["cluster_id", "file_id", sequence_column]]
+    consensus = consensus.drop_duplicates()
+    consensus.columns = ["cluster_id", "file_id", "consensus_sequence"]
+    consensus = consensus.groupby(["cluster_id", "consensus_sequence"]).agg(
+        consensus_count=('consensus_sequence', 'count'))
+    max_count = consensus.groupby("cluster_id").max().reset_index()
+    max_count.columns = ["cluster_id", "consensus_count_max"]
+    consensus = pd.merge(consensus.reset_index(), max_count, on="cluster_id")
+    consensus = consensus[consensus["consensus_count"]
+                          == consensus["consensus_count_max"]]
+    # NOTE: Should we ignore annotations when the consensus is ambiguous? For
+    # example, if we have sequence A for 3 samples and sequence B for another 3,
+    # the consensus is "unclear". Furthermore, we might choose to ignore it or
+    # to choose a suitable one. For now we are keeping all annotations even if
+    # that means having ambiguity about the sequence being assigned to a given
+    # isotope/feature cluster.
+    consensus = consensus[consensus["consensus_count"] >= min_consensus_count]
+    consensus = consensus.drop(["consensus_count_max"], axis=1)
+    return consensus
+
+
+def find_protein_groups(
+        feature_data,
+        feature_annotations,
+        sequence_col,
+        protein_col,
+        protein_description_col,
+        min_peptides_number,
+        remove_subset_proteins,
+        ignore_ambiguous_peptides,
+        protein_quant_type,
+        ):
+
+    # Create a list of annotations only with the info we need for protein groups.
+    protein_annotations = feature_annotations[['cluster_id', sequence_col, protein_col, protein_description_col]].copy()
+    protein_annotations = protein_annotations.drop_duplicates().dropna()
+
+    # Assign a unique numeric id for peptide and proteins for faster comparisons.
+    peptide_map = dict(zip(range(0, len(protein_annotations[sequence_col].unique())), protein_annotations[sequence_col].unique()))
+    protein_map = dict(zip(range(0, len(protein_annotations[protein_col].unique())), protein_annotations[protein_col].unique()))
+    peptide_map_df = pd.DataFrame({'peptide_id': peptide_map.keys(), sequence_col: peptide_map.values()})
+    protein_map_df = pd.DataFrame({'protein_id': protein_map.keys(), protein_col: protein_map.values()})
+    protein_annotations = pd.merge(protein_annotations, peptide_map_df)
+    protein_annotations = pd.merge(protein_annotations, protein_map_df)
+    protein_annotations = pd.merge(protein_annotations, protein_annotations)
+
+    # Create a copy of the feature data for aggregation.
+    protein_group_data = feature_data.copy()
+    protein_group_data['protein_group_id'] = -1
+    protein_group_metadata = protein_annotations.copy()
+    protein_group_metadata['protein_group_id'] = -1
+
+    # Initialize graph of protein-peptide nodes.
+    protein_nodes = {}  # protein_id -> [peptide_1, peptide_2...]
+    peptide_nodes = {}  # peptide_id -> [protein_1, protein_2...]
+    for index, row in protein_annotations.iterrows():
+        if row.protein_id not in protein_nodes:
+            protein_nodes[row.protein_id] = set()
+        protein_nodes[row.protein_id].add(row.peptide_id)
+        if row.peptide_id not in peptide_nodes:
+            peptide_nodes[row.peptide_id] = set()
+        peptide_nodes[row.peptide_id].add(row.protein_id)
+
+    def remove_proteins_from_graph(to_be_removed, protein_nodes, peptide_nodes):
+        for protein_id in to_be_removed:
+            for peptide_id in protein_nodes[protein_id]:
+                peptide_nodes[peptide_id] = set([
+                        this_id
+                        for this_id in peptide_nodes[peptide_id]
+                        if this_id != protein_id
+                    ])
+            if len(peptide_nodes[peptide_id]) == 0:
+                del peptide_nodes[peptide_id]
+            del protein_nodes[protein_id]
+
+    # Filter out proteins that don't meet the minimum number of peptides requirement.
+    if min_peptides_number > 1:
+        to_be_removed = []
+        for protein_id, peptide_ids in protein_nodes.items():
+            if len(peptide_ids) < min_peptides_number:
+                to_be_removed += [protein_id]
+        remove_proteins_from_graph(to_be_removed, protein_nodes, peptide_nodes)
+
+    # Remove fully subset proteins.
+    if remove_subset_proteins:
+        subset_proteins = []
+        for protein_id, peptide_ids in protein_nodes.items():
+
+            # Find proteins that share some peptide with this one.
+            target_proteins = set()
+            for peptide_id in peptide_ids:
+                for target_protein in peptide_nodes[peptide_id]:
+                    if target_protein != protein_id:
+                        target_proteins.add(target_protein)
+
+            # Check target proteins to check if peptides are fully contained within
+            # another group.
+            for target_protein in target_proteins:
+                target_peptides = protein_nodes[target_protein]
+                if set(peptide_ids).issubset(target_peptides) and len(peptide_ids) < len(target_peptides):
+                    subset_proteins += [protein_id]
+                    break
+        remove_proteins_from_graph(subset_proteins, protein_nodes, peptide_nodes)
+
+    #
+    # Identify the type of peptide (Unique vs shared) and if razor principle is
+    # applied, to which protein(s) will they be assigned.
+    # - Unique: Only appears on a single protein.
+    # - Shared: The peptide is shared by one or more proteins.
+    # - Razor: Appears on multiple proteins, assigned to the protein with the
+    #          largest number of peptides.
+    # - Ambiguous: When multiple proteins have the exact same number of peptides.
+    #              Has more than one assigned protein.
+    #
+
+    # Initialize protein_peptides
+    protein_peptides = {}
+    for protein_id in protein_nodes.keys():
+        protein_peptides[protein_id] = {
+                'unique': set(),
+                'shared': set(),
+                'razor': set(),
+                'ambiguous': set(),
+            }
+
+    for peptide_id, protein_ids in peptide_nodes.items():
+        if len(protein_ids) == 1:
+            protein_id = list(protein_ids)[0]
+            if protein_id not in protein_peptides:
+                protein_peptides[protein_id] = {
+                        'unique': [peptide_id],
+                        'razor': [],
+                        'ambiguous': [],
+                }
+            else:
+                protein_peptides[protein_id]['unique'].add(peptide_id)
+            continue
+
+        cur_assigned_proteins = []
+        cur_assigned_peptide_count = 0
+        for protein_id in protein_ids:
+            protein_peptides[protein_id]['shared'].add(peptide_id)
+            if len(protein_nodes[protein_id]) == cur_assigned_peptide_count:
+                cur_assigned_proteins += [protein_id]
+            if len(protein_nodes[protein_id]) > cur_assigned_peptide_count:
+                cur_assigned_proteins = [protein_id]
+                cur_assigned_peptide_count = len(protein_nodes[protein_id])
+
+        for protein_id in cur_assigned_proteins:
+            if len(cur_assigned_proteins) > 1:
+                protein_peptides[protein_id]['ambiguous'].add(peptide_id)
+            else:
+                protein_peptides[protein_id]['razor'].add(peptide_id)
+
+    # Find protein groups that contain unique peptides
+    protein_groups = {}
+    protein_group_counter = 0
+    unique_protein_ids = []
+    non_unique_protein_ids = []
+    for protein_id, peptide_ids in protein_nodes.items():
+        unique_found = False
+        for peptide_id in peptide_ids:
+            if len(peptide_nodes[peptide_id]) == 1:
+                unique_protein_ids += [protein_id]
+                unique_found = True
+                protein_groups[protein_group_counter] = set([protein_id])
+                protein_group_counter += 1
+                break
+        if not unique_found:
+            non_unique_protein_ids += [protein_id]
+
+    # Remove unique protein groups from the graph.
+    remove_proteins_from_graph(unique_protein_ids, protein_nodes, peptide_nodes)
+
+    # Group proteins with shared peptides only.
+    explored_proteins = set()
+    for protein_id in non_unique_protein_ids:
+        if protein_id in explored_proteins:
+            continue
+
+        previous_protein_group_size = 0
+        protein_group = set()
+        protein_group.add(protein_id)
+        while previous_protein_group_size != len(protein_group):
+            previous_protein_group_size = len(protein_group)
+            proteins_to_explore = [id for id in protein_group if id not in explored_proteins]
+
+            # Find all proteins associated with all peptides for unexplored proteins.
+            for id in proteins_to_explore:
+                for peptide_id in protein_nodes[id]:
+                    for new_protein in peptide_nodes[peptide_id]:
+                        protein_group.add(new_protein)
+                explored_proteins.add(id)
+
+        # Update protein group list and remove them from the available list.
+        protein_groups[protein_group_counter] = protein_group
+        protein_group_counter += 1
+        remove_proteins_from_graph(list(protein_group), protein_nodes, peptide_nodes)
+
+    # Depending on the selected quantification type, find which peptides should be
+    # used for quantification for each protein group.
+    for protein_group_id, protein_ids in protein_groups.items():
+        selected_peptides = set()
+        for protein_id in protein_ids:
+            for peptide_id in protein_peptides[protein_id]['unique']:
+                selected_peptides.add(peptide_id)
+            if protein_quant_type == 'all':
+                for peptide_id in protein_peptides[protein_id]['shared']:
+                    selected_peptides.add(peptide_id)
+            elif protein_quant_type == 'razor':
+                for peptide_id in protein_peptides[protein_id]['razor']:
+                    selected_peptides.add(peptide_id)
+                if ignore_ambiguous_peptides:
+                    for peptide_id in protein_peptides[protein_id]['ambiguous']:
+                        selected_peptides.add(peptide_id)
+        selected_cluster_ids = protein_annotations.cluster_id[protein_annotations.peptide_id.isin(selected_peptides)].unique()
+        protein_group_data.loc[protein_group_data.cluster_id.isin(selected_cluster_ids), 'protein_group_id'] = protein_group_id
+        # FIXME what is purpose of & below
+        protein_group_metadata.loc[protein_group_metadata.peptide_id.isin(selected_peptides) &
+                                   protein_group_metadata.protein_id.isin(protein_ids), 'protein_group_id'] = protein_group_id
+
+    def aggregate_protein_group_annotations(x):
+        ret = {}
+        if "consensus_sequence" in x:
+            ret["consensus_sequence"] = ".|.".join(
+                np.unique(x['consensus_sequence'].dropna())).strip(".|.")
+        if "consensus_protein_name" in x:
+            ret["consensus_protein_name"] = ".|.".join(
+                np.unique(x['consensus_protein_name'].dropna())).strip(".|.")
+        if "consensus_protein_description" in x:
+            ret["consensus_protein_description"] = ".|.".join(
+                np.unique(x['consensus_protein_description'].dropna())).strip(".|.")
+        return pd.Series(ret)
+
+    protein_group_data = protein_group_data[protein_group_data.protein_group_id != -1]
+    del protein_group_data['cluster_id']
+    protein_group_data = protein_group_data.groupby('protein_group_id').sum().reset_index()
+
+    protein_group_metadata = protein_group_metadata[protein_group_metadata.protein_group_id != -1]
+    del protein_group_metadata['cluster_id']
+    del protein_group_metadata['peptide_id']
+    del protein_group_metadata['protein_id']
+    # protein_group_metdata = protein_group_metadata.drop_duplicates()
+    protein_group_metadata = protein_group_metadata.groupby('protein_group_id')
+    protein_group_metadata = protein_group_metadata.apply(aggregate_protein_group_annotations)
+    protein_group_metadata = protein_group_metadata.reset_index()
+
+    return protein_group_data, protein_group_metadata
+
+
+def calculate_similarity_matrix(params, output_dir, peak_dir, logger=None, force_override=False):
+    out_path = os.path.join(output_dir, 'quality', 'similarity_{}.csv'.format(peak_dir))
+    stems = [input_file['stem'] for input_file in params['input_files']]
+    key = _stage_key('similarity', params, ['similarity_num_peaks'], inputs=[
+        os.path.join(output_dir, peak_dir, '{}.peaks'.format(stem)) for stem in stems
+    ], extra=stems)
+    if _is_cached(params, key, [out_path], logger, force_override):
+        return
+
+    _custom_log("Starting similarity matrix calculation for {}".format(peak_dir), logger)
+    time_start = time.time()
+    if not os.path.exists("{}.csv".format(out_path)) or force_override:
+        input_files = params['input_files']
+        n_files = len(input_files)
+        similarity_matrix = np.zeros(n_files ** 2).reshape(n_files, n_files)
+        for i in range(0, n_files):
+            stem_a = input_files[i]['stem']
+            peaks_a = pastaq.read_peaks(os.path.join(
+                output_dir, peak_dir, '{}.peaks'.format(stem_a)))
+            for j in range(i, n_files):
+                stem_b = input_files[j]['stem']
+                peaks_b = pastaq.read_peaks(os.path.join(output_dir, peak_dir, '{}.peaks'.format(stem_b)))
+                _custom_log("Calculating similarity of {} vs {}".format(stem_a, stem_b), logger)
+                similarity_matrix[j, i] = pastaq.find_similarity(
+                    peaks_a, peaks_b,
+                    params['similarity_num_peaks']).geometric_ratio
+                similarity_matrix[i, j] = similarity_matrix[j, i]
+        similarity_matrix = pd.DataFrame(similarity_matrix)
+        similarity_matrix_names = [input_file['stem'] for input_file in input_files]
+        similarity_matrix.columns = similarity_matrix_names
+        similarity_matrix.rename(index=dict(zip(range(0, len(similarity_matrix_names), 1), similarity_matrix_names)), inplace=True)
+
+        # Save similarity matrix to disk.
+        _custom_log("Saving similarity matrix for {}: {}".format(peak_dir, out_path), logger)
+        similarity_matrix.to_csv(out_path)
+        _save_to_cache(params, key, [out_path])
+
+    elapsed_time = datetime.timedelta(seconds=time.time()-time_start)
+    _custom_log('Finished similarity matrix calculation from {} in {}'.format(peak_dir, elapsed_time), logger)
+
+
+# NOTE: This is a giant ball of spaghetti and could use some love.
+def create_quantitative_tables(params, output_dir, logger=None, force_override=False):
+    input_files = params['input_files']
+
+    _custom_log('Starting creation of quantitative tables', logger)
+    time_start = time.time()
+    for input_file in input_files:
+        stem = input_file['stem']
+        # Peak quantification.
+        # ====================
+        in_path_peaks = os.path.join(output_dir, 'warped_peaks', "{}.peaks".format(stem))
+        in_path_peaks_link = os.path.join(output_dir, 'linking', "{}.peak_ms2.link".format(stem))
+        in_path_ident_link_msms = os.path.join(output_dir, 'linking', "{}.ident_ms2.link".format(stem))
+        in_path_ident_link_theomz = os.path.join(output_dir, 'linking', "{}.ident_peak.link".format(stem))
+        in_path_ident_data = os.path.join(output_dir, 'ident', "{}.ident".format(stem))
+        out_path_peaks = os.path.join(output_dir, 'quant', "{}_peaks.csv".format(stem))
+        out_path_peak_annotations = os.path.join(output_dir, 'quant', "{}_peak_annotations.csv".format(stem))
+
+        # TODO: This is probably not necessary or needs to be changed if we are
+        # doing all per-peak quantification in a single loop.
+        if os.path.exists(out_path_peaks) and not force_override:
+            continue
+
+        _custom_log("Reading peaks from disk: {}".format(stem), logger)
+        peaks = pastaq.peaks_to_columns(pastaq.read_peaks(in_path_peaks))
+
+        _custom_log("Generating peaks quantitative table", logger)
+        peaks_df = pd.DataFrame({
+            'peak_id': peaks['id'],
+            'mz': peaks['fitted_mz'],
+            'rt': peaks['fitted_rt'],
+            'rt_delta': peaks['rt_delta'],
+            'height': peaks['fitted_height'],
+            'sigma_mz': peaks['fitted_sigma_mz'],
+            'sigma_rt': peaks['fitted_sigma_rt'],
+            'volume': peaks['fitted_volume'],
+            'smooth_height': peaks['local_max_height'],
+            'smooth_mz': peaks['local_max_mz'],
+            'smooth_rt': peaks['local_max_rt'],
+            'roi_min_mz': peaks['roi_min_mz'],
+            'roi_max_mz': peaks['roi_max_mz'],
+            'roi_min_rt': peaks['roi_min_rt'],
+            'roi_max_rt': peaks['roi_max_rt'],
+            'raw_mean_mz': peaks['raw_roi_mean_mz'],
+            'raw_mean_rt': peaks['raw_roi_mean_rt'],
+            'raw_std_mz': peaks['raw_roi_sigma_mz'],
+            'raw_std_rt': peaks['raw_roi_sigma_rt'],
+            'raw_skewness_mz': peaks['raw_roi_skewness_mz'],
+            'raw_skewness_rt': peaks['raw_roi_skewness_rt'],
+            'raw_kurtosis_mz': peaks['raw_roi_kurtosis_mz'],
+            'raw_kurtosis_rt': peaks['raw_roi_kurtosis_rt'],
+            'raw_total_intensity': peaks['raw_roi_total_intensity'],
+            'num_points': peaks['raw_roi_num_points'],
+            'num_scans': peaks['raw_roi_num_scans'],
+        })
+
+        # Peak Annotations.
+        # =================
+        _custom_log("Reading linked peaks from disk: {}".format(stem), logger)
+        peak_annotations = peaks_df[["peak_id"]]
+        linked_peaks = pastaq.read_linked_msms(in_path_peaks_link)
+        linked_peaks = pd.DataFrame({
+            'peak_id': [linked_peak.entity_id for linked_peak in linked_peaks],
+            'msms_id': [linked_peak.msms_id for linked_peak in linked_peaks],
+        })
+        peak_annotations = pd.merge(
+            peak_annotations, linked_peaks, on="peak_id", how="left")
+
+        if os.path.isfile(in_path_ident_data):
+            _custom_log("Reading ident_data from disk: {}".format(stem), logger)
+            ident_data = pastaq.read_ident_data(in_path_ident_data)
+            ident_columns = pastaq.ident_data_to_columns(ident_data)
+            spectrum_matches = ident_columns['spectrum_matches']
+            psms = pd.DataFrame({
+                'psm_index': np.arange(len(spectrum_matches['id'])),
+                'psm_id': spectrum_matches['id'],
+                'psm_pass_threshold': spectrum_matches['pass_threshold'],
+                'psm_charge_state': spectrum_matches['charge_state'],
+                'psm_theoretical_mz': spectrum_matches['theoretical_mz'],
+                'psm_experimental_mz': spectrum_matches['experimental_mz'],
+                'psm_retention_time': spectrum_matches['retention_time'],
+                'psm_rank': spectrum_matches['rank'],
+                'psm_peptide_id': spectrum_matches['match_id'],
+            })
+            if not psms.empty:
+                if params["quant_ident_linkage"] == 'theoretical_mz':
+                    _custom_log(
+                        "Reading linked ident_peak from disk: {}".format(stem), logger)
+                    linked_idents = pastaq.read_linked_psm(
+                        in_path_ident_link_theomz)
+                    linked_idents = pd.DataFrame({
+                        'peak_id': [linked_ident.peak_id for linked_ident in linked_idents],
+                        'psm_index': [linked_ident.psm_index for linked_ident in linked_idents],
+                        'psm_link_distance': [linked_ident.distance for linked_ident in linked_idents],
+                    })
+                    linked_idents = pd.merge(
+                        linked_idents, psms, on="psm_index")
+                    peak_annotations = pd.merge(
+                        peak_annotations, linked_idents, on="peak_id", how="left")
+                elif params["quant_ident_linkage"] == 'msms_event':
+                    _custom_log(
+                        "Reading linked ident_peak from disk: {}".format(stem), logger)
+                    linked_idents = pastaq.read_linked_msms(
+                        in_path_ident_link_msms)
+                    linked_idents = pd.DataFrame({
+                        'msms_id': [linked_ident.msms_id for linked_ident in linked_idents],
+                        'psm_index': [linked_ident.entity_id for linked_ident in linked_idents],
+                        'psm_link_distance': [linked_ident.distance for linked_ident in linked_idents],
+                    })
+                    linked_idents = pd.merge(
+                        linked_idents, psms, on="psm_index")
+                    peak_annotations = pd.merge(
+                        peak_annotations, linked_idents, on="msms_id", how="left")
+                else:
+                    raise ValueError("unknown quant_ident_linkage parameter")
+
+                # Get the peptide information per psm.
+                def format_modification(mod):
+                    ret = "monoisotopic_mass_delta: {}, ".format(
+                        mod.monoisotopic_mass_delta)
+                    ret += "average_mass_delta: {}, ".format(
+                        mod.average_mass_delta)
+                    ret += "residues: {}, ".format(mod.residues)
+                    ret += "location: {}, ".format(mod.location)
+                    ret += "id: {}".format("; ".join(mod.id))
+                    return ret
+                peptides = pd.DataFrame({
+                    'psm_peptide_id': ident_columns['peptides']['id'],
+                    'psm_sequence': ident_columns['peptides']['sequence'],
+                    'psm_modifications_num': ident_columns['peptides']['num_modifications'],
+                    'psm_modifications_info': [" / ".join(map(format_modification, pep.modifications)) for pep in ident_data.peptides],
+                })
+                peak_annotations = pd.merge(
+                    peak_annotations, peptides, on="psm_peptide_id", how="left")
+
+                # Get the protein information per peptide.
+                db_sequences = pd.DataFrame({
+                    'db_seq_id': ident_columns['db_sequences']['id'],
+                    'protein_name': ident_columns['db_sequences']['accession'],
+                    'protein_description': ident_columns['db_sequences']['description'],
+                })
+                peptide_evidence = pd.DataFrame({
+                    'db_seq_id': ident_columns['peptide_evidence']['db_sequence_id'],
+                    'psm_peptide_id': ident_columns['peptide_evidence']['peptide_id'],
+                    'psm_decoy': ident_columns['peptide_evidence']['decoy'],
+                })
+                peptide_evidence = pd.merge(
+                    peptide_evidence, db_sequences, on="db_seq_id").drop(["db_seq_id"], axis=1)
+
+                # Get the protein information per psm.
+                peak_annotations = pd.merge(
+                    peak_annotations, peptide_evidence, on="psm_peptide_id")
+
+        _custom_log("Saving peaks quantitative table to disk: {}".format(stem), logger)
+        peaks_df.to_csv(out_path_peaks, index=False)
+
+        _custom_log("Saving peaks annotations table to disk: {}".format(stem), logger)
+        if "msms_id" in peak_annotations:
+            peak_annotations["msms_id"] = peak_annotations["msms_id"].astype(
+                'Int64')
+        if "psm_charge_state" in peak_annotations:
+            peak_annotations["psm_charge_state"] = peak_annotations["psm_charge_state"].astype(
+                'Int64')
+        if "psm_rank" in peak_annotations:
+            peak_annotations["psm_rank"] = peak_annotations["psm_rank"].astype(
+                'Int64')
+        if "psm_modifications_num" in peak_annotations:
+            peak_annotations["psm_modifications_num"] = peak_annotations["psm_modifications_num"].astype(
+                'Int64')
+        peak_annotations = peak_annotations.sort_values("peak_id")
+        peak_annotations.to_csv(out_path_peak_annotations, index=False)
+
+        in_path_features = os.path.join(
+            output_dir, 'features', "{}.features".format(stem))
+        if os.path.isfile(in_path_features):
+            out_path_features = os.path.join(output_dir, 'quant',
+                                             "{}_features.csv".format(stem))
+            out_path_feature_annotations = os.path.join(output_dir, 'quant',
+                                                        "{}_feature_annotations.csv".format(stem))
+
+            _custom_log("Reading features from disk: {}".format(stem), logger)
+            features = pastaq.features_to_columns(pastaq.read_features(in_path_features))
+
+            _custom_log("Generating features quantitative table", logger)
+            features_df = pd.DataFrame({
+                'feature_id': features['id'],
+                'average_mz': features['average_mz'],
+                'average_mz_sigma': features['average_mz_sigma'],
+                'average_rt': features['average_rt'],
+                'average_rt_sigma': features['average_rt_sigma'],
+                'average_rt_delta': features['average_rt_delta'],
+                'total_height': features['total_height'],
+                'monoisotopic_mz': features['monoisotopic_mz'],
+                'monoisotopic_height': features['monoisotopic_height'],
+                'charge_state': features['charge_state'],
+                'peak_id': _split_ids(features, 'peak_ids'),
+            })
+            # Find the peak annotations that belong to each feature.
+            feature_annotations = pd.DataFrame({
+                'feature_id': _repeat_ids(features, 'peak_ids', features['id']),
+                'peak_id': features['peak_ids'],
+            })
+
+            # TODO: It's possible that we want to regenerate the feature table
+            # without doing the same with the peak tables.
+            feature_annotations = pd.merge(
+                feature_annotations, peak_annotations,
+                on="peak_id", how="left")
+
+            features_df.to_csv(out_path_features, index=False)
+            feature_annotations.to_csv(
+                out_path_feature_annotations, index=False)
+
+    # Matched Peaks
+    # =============
+    _custom_log("Reading peak clusters from disk", logger)
+    in_path_peak_clusters = os.path.join(
+        output_dir, 'metamatch', 'peaks.clusters')
+    out_path_peak_clusters_metadata = os.path.join(output_dir, 'quant',
+                                                   "peak_clusters_metadata.csv")
+    out_path_peak_clusters_peaks = os.path.join(output_dir, 'quant',
+                                                "peak_clusters_peaks.csv")
+    out_path_peak_clusters_annotations = os.path.join(output_dir, 'quant',
+                                                      "peak_clusters_annotations.csv")
+
+    # TODO: This is clearly suboptimal and will take a long time if the
+    # number of clusters is very high. Needs a rewrite for optimal
+    # performance.
+    def aggregate_cluster_annotations(x):
+        ret = {}
+        if "psm_sequence" in x:
+            ret["psm_sequence"] = ".|.".join(
+                np.unique(x['psm_sequence'].dropna())).strip(".|.")
+        if "psm_charge_state" in x:
+            ret["psm_charge_state"] = ".|.".join(
+                map(str, np.unique(x['psm_charge_state'].dropna()))).strip(".|.")
+        if "psm_modifications_num" in x:
+            ret["psm_modifications_num"] = ".|.".join(
+                map(str, np.unique(x['psm_modifications_num'].dropna()))).strip(".|.")
+        if "protein_name" in x:
+            ret["protein_name"] = ".|.".join(
+                np.unique(x['protein_name'].dropna())).strip(".|.")
+        if "protein_description" in x:
+            ret["protein_description"] = ".|.".join(
+                np.unique(x['protein_description'].dropna())).strip(".|.")
+        if "consensus_sequence" in x:
+            ret["consensus_sequence"] = ".|.".join(
+                np.unique(x['consensus_sequence'].dropna())).strip(".|.")
+        if "consensus_count" in x:
+            ret["consensus_count"] = ".|.".join(
+                map(str, np.unique(x['consensus_count'].dropna()))).strip(".|.")
+        if "consensus_protein_name" in x:
+            ret["consensus_protein_name"] = ".|.".join(
+                np.unique(x['consensus_protein_name'].dropna())).strip(".|.")
+        if "consensus_protein_description" in x:
+            ret["consensus_protein_description"] = ".|.".join(
+                np.unique(x['consensus_protein_description'].dropna())).strip(".|.")
+        if "protein_group" in x:
+            ret["protein_group"] = ".|.".join(
+                map(str, np.unique(x['protein_group'].dropna()))).strip(".|.")
+        return pd.Series(ret)
+
+    if (not os.path.exists(out_path_peak_clusters_metadata) or force_override):
+        peak_clusters = pastaq.peak_clusters_to_columns(pastaq.read_peak_clusters(in_path_peak_clusters))
+        _custom_log("Generating peak clusters quantitative table", logger)
+        peak_clusters_metadata_df = pd.DataFrame({
+            'cluster_id': peak_clusters['id'],
+            'mz': peak_clusters['mz'],
+            'rt': peak_clusters['rt'],
+            'avg_height': peak_clusters['avg_height'],
+        })
+
+        _custom_log("Generating peak clusters quantitative table", logger)
+        peak_clusters_df = pd.DataFrame({
+            'cluster_id': peak_clusters['id'],
+        })
+        if params['quant_isotopes'] == 'volume':
+            out_path_peak_clusters = os.path.join(output_dir, 'quant',
+                                                  "peak_clusters_volume.csv")
+            for i, input_file in enumerate(input_files):
+                stem = input_file['stem']
+                peak_clusters_df[stem] = _file_values(peak_clusters, 'volumes', len(input_files))[:, i]
+        elif params['quant_isotopes'] == 'height':
+            out_path_peak_clusters = os.path.join(output_dir, 'quant',
+                                                  "peak_clusters_height.csv")
+            for i, input_file in enumerate(input_files):
+                stem = input_file['stem']
+                peak_clusters_df[stem] = _file_values(peak_clusters, 'heights', len(input_files))[:, i]
+        else:
+            raise ValueError("unknown quant_isotopes parameter")
+        _custom_log("Writing peaks quantitative table to disk", logger)
+        peak_clusters_df.to_csv(out_path_peak_clusters, index=False)
+
+        # Peak associations.
+        _custom_log("Generating peak clusters peak associations table", logger)
+        stems = np.array([input_file['stem'] for input_file in input_files], dtype=object)
+        cluster_peaks = pd.DataFrame({
+            'cluster_id': _repeat_ids(peak_clusters, 'peak_ids', peak_clusters['id']),
+            'file_id': stems[peak_clusters['file_ids']],
+            'peak_id': peak_clusters['peak_ids'],
+        })
+        _custom_log("Writing cluster to peak table to disk", logger)
+        cluster_peaks.to_csv(out_path_peak_clusters_peaks, index=False)
+
+        # Cluster annotations.
+        _custom_log("Generating peak clusters annotations table", logger)
+        annotations = pd.DataFrame()
+        for input_file in input_files:
+            stem = input_file['stem']
+            _custom_log("Reading peak annotations for: {}".format(stem), logger)
+            in_path_peak_annotations = os.path.join(output_dir, 'quant',
+                                                    "{}_peak_annotations.csv".format(stem))
+            peak_annotations = pd.read_csv(
+                in_path_peak_annotations, low_memory=False)
+            cluster_annotations = cluster_peaks[cluster_peaks["file_id"] == stem][[
+                "cluster_id", "peak_id"]]
+            cluster_annotations["file_id"] = stem
+            _custom_log(
+                "Merging peak/clusters annotations for: {}".format(stem), logger)
+            cluster_annotations = pd.merge(
+                cluster_annotations, peak_annotations, on="peak_id", how="left")
+            annotations = pd.concat(
+                [annotations, cluster_annotations]).reset_index(drop=True)
+        # Ensure these columns have the proper type.
+        if "msms_id" in annotations:
+            annotations["msms_id"] = annotations["msms_id"].astype(
+                'Int64')
+        if "psm_charge_state" in annotations:
+            annotations["psm_charge_state"] = annotations["psm_charge_state"].astype(
+                'Int64')
+        if "psm_rank" in annotations:
+            annotations["psm_rank"] = annotations["psm_rank"].astype(
+                'Int64')
+        if "psm_modifications_num" in annotations:
+            annotations["psm_modifications_num"] = annotations["psm_modifications_num"].astype(
+                'Int64')
+
+        if params['quant_consensus'] and 'psm_sequence' in annotations:
+            # Find a sequence consensus
+            consensus_sequence = find_sequence_consensus(
+                annotations, 'psm_sequence', params['quant_consensus_min_ident'])
+            annotations = pd.merge(
+                annotations,
+                consensus_sequence[[
+                    "cluster_id",
+                    "consensus_sequence",
+                    "consensus_count",
+                ]], on="cluster_id", how="left")
+            # Find a consensus proteins
+            proteins = annotations[annotations['psm_sequence']
+                                   == annotations['consensus_sequence']]
+            proteins = proteins[['cluster_id', 'protein_name',
+                                 'protein_description']].drop_duplicates()
+            proteins.columns = [
+                'cluster_id', 'consensus_protein_name', 'consensus_protein_description']
+            annotations = pd.merge(annotations, proteins,
+                                   on="cluster_id", how="left")
+
+        # Saving annotations before aggregation.
+        if params['quant_save_all_annotations']:
+            _custom_log("Writing annotations to disk", logger)
+            annotations = annotations.sort_values(by=["cluster_id"])
+            annotations.to_csv(out_path_peak_clusters_annotations, index=False)
+
+        _custom_log("Aggregating annotations", logger)
+        # TODO: This is clearly suboptimal and will take a long time if the
+        # number of clusters is very high. Needs a rewrite for optimal
+        # performance.
+        annotations = annotations.groupby(
+            'cluster_id').apply(aggregate_cluster_annotations)
+
+        # Metadata
+        _custom_log("Merging metadata with annotations", logger)
+        peak_clusters_metadata_df = pd.merge(
+            peak_clusters_metadata_df, annotations, how="left", on="cluster_id")
+        _custom_log("Writing metadata to disk", logger)
+        peak_clusters_metadata_df.to_csv(
+            out_path_peak_clusters_metadata, index=False)
+
+    # Matched Features
+    # ================
+    _custom_log("Reading feature clusters from disk", logger)
+    in_path_feature_clusters = os.path.join(
+        output_dir, 'metamatch', 'features.clusters')
+    out_path_feature_clusters_metadata = os.path.join(output_dir, 'quant',
+                                                      "feature_clusters_metadata.csv")
+    out_path_feature_clusters_features = os.path.join(output_dir, 'quant',
+                                                      "feature_clusters_features.csv")
+    out_path_feature_clusters_annotations = os.path.join(output_dir, 'quant',
+                                                         "feature_clusters_annotations.csv")
+    if (not os.path.exists(out_path_feature_clusters_metadata) or force_override):
+        feature_clusters = pastaq.feature_clusters_to_columns(pastaq.read_feature_clusters(
+            in_path_feature_clusters))
+
+        _custom_log("Generating feature clusters quantitative table", logger)
+        metadata = pd.DataFrame({
+            'cluster_id': feature_clusters['id'],
+            'mz': feature_clusters['mz'],
+            'rt': feature_clusters['rt'],
+            'avg_height': feature_clusters['avg_total_height'],
+            'charge_state': feature_clusters['charge_state'],
+        })
+        data = pd.DataFrame({
+            'cluster_id': feature_clusters['id'],
+        })
+        if params['quant_features'] == 'monoisotopic_height':
+            out_path_feature_clusters = os.path.join(output_dir, 'quant',
+                                                     "feature_clusters_monoisotopic_height.csv")
+            for i, input_file in enumerate(input_files):
+                stem = input_file['stem']
+                data[stem] = _file_values(feature_clusters, 'monoisotopic_heights', len(input_files))[:, i]
+        elif params['quant_features'] == 'monoisotopic_volume':
+            out_path_feature_clusters = os.path.join(output_dir, 'quant',
+                                                     "feature_clusters_monoisotopic_volume.csv")
+            for i, input_file in enumerate(input_files):
+                stem = input_file['stem']
+                data[stem] = _file_values(feature_clusters, 'monoisotopic_volumes', len(input_files))[:, i]
+        elif params['quant_features'] == 'total_height':
+            out_path_feature_clusters = os.path.join(output_dir, 'quant',
+                                                     "feature_clusters_total_height.csv")
+            for i, input_file in enumerate(input_files):
+                stem = input_file['stem']
+                data[stem] = _file_values(feature_clusters, 'total_heights', len(input_files))[:, i]
+        elif params['quant_features'] == 'total_volume':
+            out_path_feature_clusters = os.path.join(output_dir, 'quant',
+                                                     "feature_clusters_total_volume.csv")
+            for i, input_file in enumerate(input_files):
+                stem = input_file['stem']
+                data[stem] = _file_values(feature_clusters, 'total_volumes', len(input_files))[:, i]
+        elif params['quant_features'] == 'max_height':
+            out_path_feature_clusters = os.path.join(output_dir, 'quant',
+                                                     "feature_clusters_max_height.csv")
+            for i, input_file in enumerate(input_files):
+                stem = input_file['stem']
+                data[stem] = _file_values(feature_clusters, 'max_heights', len(input_files))[:, i]
+        elif params['quant_features'] == 'max_volume':
+            out_path_feature_clusters = os.path.join(output_dir, 'quant',
+                                                     "feature_clusters_max_volume.csv")
+            for i, input_file in enumerate(input_files):
+                stem = input_file['stem']
+                data[stem] = _file_values(feature_clusters, 'max_volumes', len(input_files))[:, i]
+        else:
+            raise ValueError("unknown quant_features parameter")
+        _custom_log("Writing feature clusters quantitative table to disk", logger)
+        data.to_csv(out_path_feature_clusters, index=False)
+
+        # Feature associations.
+        _custom_log("Generating feature clusters feature associations table", logger)
+        stems = np.array([input_file['stem'] for input_file in input_files], dtype=object)
+        cluster_features = pd.DataFrame({
+            'cluster_id': _repeat_ids(feature_clusters, 'feature_ids', feature_clusters['id']),
+            'file_id': stems[feature_clusters['file_ids']],
+            'feature_id': feature_clusters['feature_ids'],
+        })
+        _custom_log("Writing cluster to feature table to disk", logger)
+        cluster_features.to_csv(
+            out_path_feature_clusters_features, index=False)
+
+        # Cluster annotations.
+        _custom_log("Generating peak clusters annotations table", logger)
+        annotations = pd.DataFrame()
+        for input_file in input_files:
+            stem = input_file['stem']
+            _custom_log("Reading features for: {}".format(stem), logger)
+            in_path_peak_features = os.path.join(output_dir, 'features',
+                                                 "{}.features".format(stem))
+            in_path_peak_annotations = os.path.join(output_dir, 'quant',
+                                                    "{}_peak_annotations.csv".format(stem))
+            features = pastaq.features_to_columns(pastaq.read_features(in_path_peak_features))
+            features = pd.DataFrame({
+                'feature_id': _repeat_ids(features, 'peak_ids', features['id']),
+                'peak_id': features['peak_ids'],
+                'charge_state': _repeat_ids(features, 'peak_ids', features['charge_state']),
+            })
+            peak_annotations = pd.read_csv(
+                in_path_peak_annotations, low_memory=False)
+            cluster_annotations = cluster_features[cluster_features["file_id"] == stem][[
+                "cluster_id", "feature_id"]]
+            cluster_annotations["file_id"] = stem
+            _custom_log(
+                "Merging peak/clusters annotations for: {}".format(stem), logger)
+            cluster_annotations = pd.merge(
+                cluster_annotations, features, on="feature_id", how="left")
+            cluster_annotations = pd.merge(
+                cluster_annotations, peak_annotations, on="peak_id", how="left")
+            annotations = pd.concat([annotations, cluster_annotations])
+
+        # Ensure these columns have the proper type.
+        if "msms_id" in annotations:
+            annotations["msms_id"] = annotations["msms_id"].astype('Int64')
+        if "charge_state" in annotations:
+            annotations["charge_state"] = annotations["charge_state"].astype(
+                'Int64')
+        if "psm_charge_state" in annotations:
+            annotations["psm_charge_state"] = annotations["psm_charge_state"].astype(
+                'Int64')
+        if "psm_rank" in annotations:
+            annotations["psm_rank"] = annotations["psm_rank"].astype('Int64')
+        if "psm_modifications_num" in annotations:
+            annotations["psm_modifications_num"] = annotations["psm_modifications_num"].astype(
+                'Int64')
+
+        if params['quant_consensus'] and 'psm_sequence' in annotations:
+            # Find a sequence consensus
+            consensus_sequence = find_sequence_consensus(
+                annotations, 'psm_sequence', params['quant_consensus_min_ident'])
+            annotations = pd.merge(
+                annotations,
+                consensus_sequence[[
+                    "cluster_id",
+                    "consensus_sequence",
+                    "consensus_count",
+                ]], on="cluster_id", how="left")
+            # Find a consensus proteins
+            proteins = annotations[annotations['psm_sequence']
+                                   == annotations['consensus_sequence']]
+            proteins = proteins[['cluster_id', 'protein_name',
+                                 'protein_description']].drop_duplicates()
+            proteins.columns = [
+                'cluster_id', 'consensus_protein_name', 'consensus_protein_description']
+            annotations = pd.merge(annotations, proteins,
+                                   on="cluster_id", how="left")
+
+        # Calculate protein groups.
+        _custom_log("Calculating protein groups", logger)
+        sequence_column = 'psm_sequence'
+        protein_name_column = 'protein_name'
+        protein_description_column = 'protein_description'
+        if params['quant_consensus'] and 'psm_sequence' in annotations:
+            sequence_column = 'consensus_sequence'
+            protein_name_column = 'consensus_protein_name'
+            protein_description_column = 'consensus_protein_description'
+
+        # Combine protein name/description in case
+        if (sequence_column in annotations and
+                protein_name_column in annotations and
+                protein_description_column in annotations):
+            prot_data, prot_metadata = find_protein_groups(
+                    data,
+                    annotations,
+                    sequence_column,
+                    protein_name_column,
+                    protein_description_column,
+                    params['quant_proteins_min_peptides'],
+                    params['quant_proteins_remove_subset_proteins'],
+                    params['quant_proteins_ignore_ambiguous_peptides'],
+                    params['quant_proteins_quant_type'],
+                    )
+            out_path_protein_data = os.path.join(output_dir, 'quant',
+                                                 "protein_groups.csv")
+            out_path_protein_metadata = os.path.join(output_dir, 'quant',
+                                                     "protein_groups_metadata.csv")
+
+            _custom_log("Writing protein group data/metadata to disk", logger)
+            prot_data.to_csv(out_path_protein_data, index=False)
+            prot_metadata.to_csv(out_path_protein_metadata, index=False)
+
+        # Saving annotations before aggregation.
+        if params['quant_save_all_annotations']:
+            _custom_log("Writing annotations to disk", logger)
+            annotations = annotations.sort_values(by=["cluster_id"])
+            annotations.to_csv(
+                out_path_feature_clusters_annotations, index=False)
+
+        _custom_log("Aggregating annotations", logger)
+        if ("psm_charge_state" in annotations and
+                params['quant_features_charge_state_filter']):
+            annotations = annotations[annotations["psm_charge_state"]
+                                      == annotations["charge_state"]]
+        # TODO: This is clearly suboptimal and will take a long time if the
+        # number of clusters is very high. Needs a rewrite for optimal
+        # performance.
+        annotations_agg = annotations.groupby(
+            'cluster_id').apply(aggregate_cluster_annotations)
+
+        # Metadata.
+        _custom_log("Merging metadata with annotations", logger)
+        metadata = pd.merge(
+            metadata, annotations_agg, how="left", on="cluster_id")
+        _custom_log("Writing metadata to disk", logger)
+        metadata.to_csv(out_path_feature_clusters_metadata, index=False)
+
+        # Aggregate peptides.
+        sequence_column = 'psm_sequence'
+        if params['quant_consensus'] and 'psm_sequence' in annotations:
+            sequence_column = 'consensus_sequence'
+
+        if sequence_column in annotations:
+            _custom_log("Aggregating peptide charge states", logger)
+
+            def aggregate_peptide_annotations(x):
+                ret = {}
+                if "psm_sequence" in x:
+                    ret["psm_sequence"] = ".|.".join(
+                        np.unique(x['psm_sequence'].dropna())).strip(".|.")
+                if "protein_name" in x:
+                    ret["protein_name"] = ".|.".join(
+                        np.unique(x['protein_name'].dropna())).strip(".|.")
+                if "protein_description" in x:
+                    ret["protein_description"] = ".|.".join(
+                        np.unique(x['protein_description'].dropna())).strip(".|.")
+                if "consensus_sequence" in x:
+                    ret["consensus_sequence"] = ".|.".join(
+                        np.unique(x['consensus_sequence'].dropna())).strip(".|.")
+                if "consensus_protein_name" in x:
+                    ret["consensus_protein_name"] = ".|.".join(
+                        np.unique(x['consensus_protein_name'].dropna())).strip(".|.")
+                if "consensus_protein_description" in x:
+                    ret["consensus_protein_description"] = ".|.".join(
+                        np.unique(x['consensus_protein_description'].dropna())).strip(".|.")
+                return pd.Series(ret)
+            peptide_data = data.copy()
+            peptide_data = peptide_data.drop(["cluster_id"], axis=1)
+            peptide_data[sequence_column] = metadata[sequence_column]
+            peptide_data = peptide_data[~peptide_data[sequence_column].isna()]
+            peptide_data = peptide_data[peptide_data[sequence_column] != '']
+            peptide_data = peptide_data[~peptide_data[sequence_column].str.contains(r'\.\|\.')]
+            peptide_data = peptide_data.groupby(sequence_column).agg(sum)
+            peptide_data = peptide_data.reset_index()
+            peptide_metadata = annotations.copy()
+            peptide_metadata = peptide_metadata[peptide_metadata[sequence_column].isin(peptide_data[sequence_column])]
+            peptide_metadata = peptide_metadata.groupby(sequence_column)
+            peptide_metadata = peptide_metadata.apply(aggregate_peptide_annotations)
+            out_path_peptide_data = os.path.join(output_dir, 'quant',
+                                                 "peptides_data.csv")
+            out_path_peptide_metadata = os.path.join(output_dir, 'quant',
+                                                     "peptides_metadata.csv")
+
+            _custom_log("Writing peptide data/metadata to disk", logger)
+            peptide_data.to_csv(out_path_peptide_data, index=False)
+            peptide_metadata.to_csv(out_path_peptide_metadata, index=False)
+
+    elapsed_time = datetime.timedelta(seconds=time.time()-time_start)
+    _custom_log('Finished creation of quantitative tables in {}'.format(elapsed_time), logger)
@@ -0,0 +1,64 @@
+#include <cstdint>
+#include <vector>
+
+#include "doctest.h"
+#include "utils/base64.hpp"
+
+TEST_CASE("Decoding base64 bytes") {
+    std::vector<uint8_t> output;
+    Base64::decode_base64("AQIDBAU=", output);
+    CHECK(output == std::vector<uint8_t>{1, 2, 3, 4, 5});
+    Base64::decode_base64("AQIDBA==", output);
+    CHECK(output == std::vector<uint8_t>{1, 2, 3, 4});
+    Base64::decode_base64("AQID", output);
+    CHECK(output == std::vector<uint8_t>{1, 2, 3});
+    Base64::decode_base64("", output);
+    CHECK(output.empty());
+}
+
+TEST_CASE("Decoding base64 arrays") {
+    std::vector<double> expected = {100.5, 200.25, -3.0};
+    std::vector<double> output;
+
+    SUBCASE("64 bit little endian") {
+        CHECK(Base64::decode_array("AAAAAAAgWUA=", 64, true, false, output));
+        CHECK(output == std::vector<double>{100.5});
+        CHECK(Base64::decode_array("AAAAAAAgWUAAAAAAAAhpQA==", 64, true, false,
+                                   output));
+        CHECK(output == std::vector<double>{100.5, 200.25});
+        CHECK(Base64::decode_array("AAAAAAAgWUAAAAAAAAhpQAAAAAAAAAjA", 64,
+                                   true, false, output));
+        CHECK(output == expected);
+    }
+
+    SUBCASE("64 bit big endian") {
+        CHECK(Base64::decode_array("QFkgAAAAAABAaQgAAAAAAMAIAAAAAAAA", 64,
+                                   false, false, output));
+        CHECK(output == expected);
+    }
+
+    SUBCASE("32 bit") {
+        CHECK(Base64::decode_array("AADJQgBASEMAAEDA", 32, true, false,
+                                   output));
+        CHECK(output == expected);
+        CHECK(Base64::decode_array("QskAAENIQADAQAAA", 32, false, false,
+                                   output));
+        CHECK(output == expected);
+    }
+
+    SUBCASE("Zlib compressed") {
+        CHECK(Base64::decode_array("eJxjYAAChUgHEMXAkQmhGTgOAAAUfAIz", 64,
+                                   true, true, output));
+        CHECK(output == expected);
+        CHECK(Base64::decode_array("eJxjYDjpxODg4czA4HAAABA3Atc=", 32, true,
+                                   true, output));
+        CHECK(output == expected);
+    }
+
+    SUBCASE("Invalid data") {
+        CHECK(!Base64::decode_array("AAAAAAAgWUA=", 16, true, false, output));
+        CHECK(!Base64::decode_array("AAAAAAAgWUA=", 64, true, true, output));
+        CHECK(Base64::decode_array("", 64, true, false, output));
+        CHECK(output.empty());
+    }
+}
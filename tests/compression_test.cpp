@@ -0,0 +1,102 @@
+#include <zlib.h>
+#include <cstdio>
+#include <filesystem>
+#include <fstream>
+#include <iterator>
+#include <string>
+#include <vector>
+
+#include "doctest.h"
+#include "utils/compression.hpp"
+
+TEST_CASE("Reading gzip compressed files") {
+    std::string data;
+    for (size_t i = 0; i < 10000; ++i) {
+        data += "<scan num=\"" + std::to_string(i) + "\"/>\n";
+    }
+    auto file_name =
+        (std::filesystem::temp_directory_path() / "pastaq_test.mzXML.gz")
+            .string();
+
+    // Write the data as two concatenated gzip members.
+    size_t half = data.size() / 2;
+    std::string members[] = {data.substr(0, half), data.substr(half)};
+    for (size_t i = 0; i < 2; ++i) {
+        gzFile file = gzopen(file_name.c_str(), i == 0 ? "wb" : "ab");
+        CHECK(file != nullptr);
+        gzwrite(file, members[i].data(), members[i].size());
+        gzclose(file);
+    }
+    CHECK(Compression::is_gzip(file_name));
+
+    for (size_t buffer_size : {7, 16384, 1 << 20}) {
+        Compression::InflateStream stream(file_name, buffer_size);
+        CHECK(stream.good());
+        std::string read_data((std::istreambuf_iterator<char>(stream)),
+                              std::istreambuf_iterator<char>());
+        CHECK(read_data == data);
+    }
+    std::remove(file_name.c_str());
+
+    SUBCASE("Uncompressed files") {
+        std::ofstream(file_name) << data;
+        CHECK(!Compression::is_gzip(file_name));
+        std::remove(file_name.c_str());
+        CHECK(!Compression::is_gzip(file_name));
+    }
+}
+
+TEST_CASE("Compression codecs") {
+    std::string data;
+    for (size_t i = 0; i < 10000; ++i) {
+        data += "peak " + std::to_string(i) + "\n";
+    }
+    auto file_name =
+        (std::filesystem::temp_directory_path() / "pastaq_test.peaks")
+            .string();
+    auto file_size = [&]() {
+        return static_cast<size_t>(std::filesystem::file_size(file_name));
+    };
+
+    SUBCASE("Uncompressed") {
+        {
+            Compression::DeflateStream stream;
+            stream.open(file_name, Compression::Codec::NONE);
+            CHECK(stream.good());
+            stream << data;
+        }
+        CHECK(file_size() == Compression::header_size + data.size());
+    }
+
+    SUBCASE("Zlib") {
+        for (int level : {-1, 1, 9}) {
+            {
+                Compression::DeflateStream stream;
+                stream.open(file_name, Compression::Codec::ZLIB, level);
+                CHECK(stream.good());
+                stream << data;
+            }
+            CHECK(file_size() < data.size());
+        }
+        Compression::DeflateStream stream;
+        stream.open(file_name, Compression::Codec::ZLIB, 10);
+        CHECK(!stream.good());
+    }
+
+    SUBCASE("Legacy zlib files without header") {
+        uLongf compressed_size = compressBound(data.size());
+        std::vector<uint8_t> compressed(compressed_size);
+        compress(compressed.data(), &compressed_size,
+                 reinterpret_cast<const uint8_t *>(data.data()), data.size());
+        std::ofstream(file_name, std::ios::binary)
+            .write(reinterpret_cast<const char *>(compressed.data()),
+                   compressed_size);
+    }
+
+    Compression::InflateStream stream(file_name);
+    CHECK(stream.good());
+    std::string read_data((std::istreambuf_iterator<char>(stream)),
+                          std::istreambuf_iterator<char>());
+    CHECK(read_data == data);
+    std::remove(file_name.c_str());
+}
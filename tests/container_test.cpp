@@ -0,0 +1,179 @@
+#include <cstdio>
+#include <filesystem>
+#include <iterator>
+#include <sstream>
+#include <string>
+#include <thread>
+
+#include "doctest.h"
+#include "raw_data/raw_data_serialize.hpp"
+#include "utils/compression.hpp"
+#include "utils/container.hpp"
+#include "utils/serialization.hpp"
+
+static std::string read_all(const std::string &path) {
+    Compression::InflateStream stream;
+    if (!Container::open_input(path, stream)) {
+        return "";
+    }
+    return std::string((std::istreambuf_iterator<char>(stream)),
+                       std::istreambuf_iterator<char>());
+}
+
+static bool write_member(const std::string &path, const std::string &data,
+                         Compression::Codec::Type codec) {
+    Container::OutputFile file;
+    if (!file.open(path, codec, -1)) {
+        return false;
+    }
+    file.stream() << data;
+    return file.close();
+}
+
+TEST_CASE("Container files") {
+    auto file_name =
+        (std::filesystem::temp_directory_path() / "pastaq_test.pastaq")
+            .string();
+    CHECK(Container::Container::create(file_name));
+    Container::Container container;
+    CHECK(container.open(file_name));
+    CHECK(container.members().empty());
+
+    std::string peaks;
+    for (size_t i = 0; i < 1000; ++i) {
+        peaks += "peak " + std::to_string(i) + "\n";
+    }
+    std::string features = "features";
+    CHECK(write_member(file_name + "/peaks/a.peaks", peaks,
+                       Compression::Codec::ZLIB));
+    CHECK(write_member(file_name + "/features/a.features", features,
+                       Compression::Codec::NONE));
+
+    SUBCASE("Reading members") {
+        CHECK(container.open(container.filename()));
+        CHECK(container.filename() == file_name);
+        CHECK(container.members().size() == 2);
+        const auto *member = container.find("peaks/a.peaks");
+        CHECK(member != nullptr);
+        CHECK(member->offset % 8 == 0);
+        CHECK(member->size < peaks.size());
+        CHECK(container.find("peaks/b.peaks") == nullptr);
+        CHECK(read_all(file_name + "/peaks/a.peaks") == peaks);
+        CHECK(read_all(file_name + "/features/a.features") == features);
+
+        // Uncompressed members can be used in place.
+        member = container.find("features/a.features");
+        const uint8_t *data = container.map(*member);
+        CHECK(data != nullptr);
+        CHECK(std::string(reinterpret_cast<const char *>(data) +
+                              Compression::header_size,
+                          member->size - Compression::header_size) ==
+              features);
+
+        Compression::InflateStream stream;
+        CHECK(!Container::open_input(file_name + "/peaks/b.peaks", stream));
+    }
+
+    SUBCASE("Replacing members") {
+        Container::Container reader;
+        CHECK(reader.open(file_name));
+        CHECK(write_member(file_name + "/peaks/a.peaks", "new peaks",
+                           Compression::Codec::ZLIB));
+        CHECK(read_all(file_name + "/peaks/a.peaks") == "new peaks");
+        CHECK(container.open(file_name));
+        CHECK(container.members().size() == 2);
+
+        // Readers that opened the container before keep reading the previous
+        // contents.
+        const auto *member = reader.find("peaks/a.peaks");
+        Compression::InflateStream stream;
+        stream.open(file_name, member->offset, member->size);
+        CHECK(std::string((std::istreambuf_iterator<char>(stream)),
+                          std::istreambuf_iterator<char>()) == peaks);
+    }
+
+    SUBCASE("Concurrent writers") {
+        // Each thread writes its own members. Writes are serialized, so no
+        // member is lost or overwritten.
+        const size_t num_members = 50;
+        size_t num_written[2] = {};
+        auto write_members = [&](size_t thread) {
+            for (size_t i = 0; i < num_members; ++i) {
+                auto name = "t" + std::to_string(thread) + "/" +
+                            std::to_string(i);
+                num_written[thread] +=
+                    write_member(file_name + "/" + name, peaks + name,
+                                 Compression::Codec::ZLIB);
+            }
+        };
+        std::thread first(write_members, 0);
+        std::thread second(write_members, 1);
+        first.join();
+        second.join();
+        CHECK(num_written[0] == num_members);
+        CHECK(num_written[1] == num_members);
+
+        CHECK(container.open(file_name));
+        CHECK(container.members().size() == 2 + 2 * num_members);
+        for (size_t thread = 0; thread < 2; ++thread) {
+            for (size_t i = 0; i < num_members; ++i) {
+                auto name = "t" + std::to_string(thread) + "/" +
+                            std::to_string(i);
+                CHECK(read_all(file_name + "/" + name) == peaks + name);
+            }
+        }
+        CHECK(read_all(file_name + "/features/a.features") == features);
+    }
+
+    SUBCASE("Paths") {
+        std::string filename;
+        std::string name;
+        CHECK(Container::split_path(file_name + "/peaks/a.peaks", &filename,
+                                    &name));
+        CHECK(filename == file_name);
+        CHECK(name == "peaks/a.peaks");
+        CHECK(!Container::split_path(file_name, &filename, &name));
+        CHECK(!Container::split_path(file_name + "/", &filename, &name));
+        auto directory = std::filesystem::temp_directory_path().string();
+        CHECK(!Container::split_path(directory + "/pastaq_test.peaks",
+                                     &filename, &name));
+        // Regular files can't be used as containers.
+        CHECK(!Container::OutputFile().open(
+            directory + "/pastaq_test.peaks/a.peaks",
+            Compression::Codec::NONE, -1));
+    }
+
+    SUBCASE("Memory mapped raw data") {
+        RawData::RawData raw_data = {};
+        for (size_t i = 0; i < 3; ++i) {
+            RawData::Scan scan = {};
+            scan.retention_time = i;
+            scan.mz = {100.0 + i, 200.0 + i};
+            scan.intensity = {1.0, 2.0};
+            scan.num_points = 2;
+            raw_data.scans.push_back(scan);
+            raw_data.retention_times.push_back(scan.retention_time);
+        }
+        Container::OutputFile file;
+        CHECK(file.open(file_name + "/raw/a.ms1", Compression::Codec::NONE,
+                        -1));
+        CHECK(RawData::Serialize::write_raw_data_columnar(file.stream(),
+                                                          raw_data));
+        CHECK(file.close());
+
+        CHECK(container.open(file_name));
+        const auto *member = container.find("raw/a.ms1");
+        RawData::MappedRawData mapped;
+        CHECK(mapped.open(file_name, member->offset, member->size));
+        CHECK(mapped.size() == 3);
+        CHECK(mapped.num_points() == 6);
+        CHECK(mapped.mz(2)[1] == 202.0);
+
+        RawData::RawData range;
+        CHECK(RawData::Serialize::read_raw_data_range(
+            file_name + "/raw/a.ms1", 0.5, 1.5, 0, 1000, &range));
+        CHECK(range.scans.size() == 1);
+        CHECK(range.scans[0].mz == std::vector<double>{101.0, 201.0});
+    }
+    std::remove(file_name.c_str());
+}
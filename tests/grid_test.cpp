@@ -1,7 +1,56 @@
+#include <cmath>
+#include <cstdio>
+#include <filesystem>
+#include <sstream>
+
 #include "doctest.h"
 #include "test_utils.hpp"
 
+#include "centroid/centroid.hpp"
 #include "grid/grid.hpp"
+#include "grid/grid_serialize.hpp"
+#include "utils/serialization.hpp"
+
+// Raw data with a few Gaussian peaks of different heights.
+static RawData::RawData mock_raw_data() {
+    RawData::RawData raw_data = {};
+    raw_data.instrument_type = Instrument::ORBITRAP;
+    raw_data.min_mz = 200.0;
+    raw_data.max_mz = 202.0;
+    raw_data.min_rt = 0.0;
+    raw_data.max_rt = 100.0;
+    raw_data.resolution_ms1 = 70000;
+    raw_data.resolution_msn = 30000;
+    raw_data.reference_mz = 200;
+    raw_data.fwhm_rt = 9;
+    struct {
+        double mz;
+        double rt;
+        double height;
+    } peaks[] = {{200.5, 30.0, 1e9}, {201.0, 50.0, 1e5}, {201.5, 70.0, 1e3}};
+    double sigma_mz = RawData::fwhm_to_sigma(200.0 / 70000);
+    double sigma_rt = RawData::fwhm_to_sigma(9);
+    for (size_t i = 0; i < 100; ++i) {
+        RawData::Scan scan = {};
+        scan.retention_time = i;
+        for (double mz = 200.0; mz < 202.0; mz += 0.001) {
+            double intensity = 0;
+            for (const auto &peak : peaks) {
+                double a = (mz - peak.mz) / sigma_mz;
+                double b = (scan.retention_time - peak.rt) / sigma_rt;
+                intensity += peak.height * std::exp(-0.5 * (a * a + b * b));
+            }
+            if (intensity > 1) {
+                scan.mz.push_back(mz);
+                scan.intensity.push_back(intensity);
+            }
+        }
+        scan.num_points = scan.mz.size();
+        raw_data.scans.push_back(scan);
+        raw_data.retention_times.push_back(scan.retention_time);
+    }
+    return raw_data;
+}
 
 TEST_CASE("Gaussian splatting") {
     SUBCASE("Splat on the center of the mesh") {
@@ -43,3 +92,220 @@ TEST_CASE("Parallel and serial execution offer the same results") {
     // TODO:...
     CHECK(true);
 }
+
+TEST_CASE("Single precision grids") {
+    auto raw_data = mock_raw_data();
+    auto params = Grid::ResampleParams{};
+    params.num_samples_mz = 5;
+    params.num_samples_rt = 5;
+    params.smoothing_coef_mz = 0.4;
+    params.smoothing_coef_rt = 0.4;
+    auto grid = Grid::_resample(raw_data, params);
+    params.precision = Grid::Precision::FLOAT;
+    auto grid_float = Grid::_resample(raw_data, params);
+    CHECK(grid.precision == Grid::Precision::DOUBLE);
+    CHECK(grid_float.precision == Grid::Precision::FLOAT);
+    CHECK(grid_float.data.empty());
+    CHECK(grid_float.data_float.size() == grid.data.size());
+    CHECK(grid_float.bins_mz == grid.bins_mz);
+    CHECK(grid_float.bins_rt == grid.bins_rt);
+
+    double max_value = 0;
+    double max_error = 0;
+    for (size_t i = 0; i < grid.data.size(); ++i) {
+        CHECK(Grid::value_at(grid, i) == grid.data[i]);
+        max_value = std::max(max_value, grid.data[i]);
+        max_error = std::max(
+            max_error, std::abs(Grid::value_at(grid_float, i) - grid.data[i]));
+    }
+    CHECK(max_error <= max_value * 1e-5);
+
+    SUBCASE("Local maxima") {
+        auto local_max = Centroid::find_local_maxima(grid);
+        auto local_max_float = Centroid::find_local_maxima(grid_float);
+        CHECK(local_max.size() >= 3);
+        CHECK(local_max_float.size() == local_max.size());
+        for (size_t i = 0; i < local_max.size() && i < local_max_float.size();
+             ++i) {
+            CHECK(local_max_float[i].mz == local_max[i].mz);
+            CHECK(local_max_float[i].rt == local_max[i].rt);
+            CHECK(std::abs(local_max_float[i].value - local_max[i].value) <=
+                  local_max[i].value * 1e-5);
+        }
+    }
+
+    SUBCASE("Subset") {
+        auto subset = Grid::subset(grid_float, 200.4, 200.6, 20.0, 40.0);
+        CHECK(subset.precision == Grid::Precision::FLOAT);
+        CHECK(subset.data_float.size() == subset.n * subset.m);
+    }
+
+    SUBCASE("Serialization") {
+        for (const auto &original : {grid, grid_float}) {
+            std::stringstream stream;
+            CHECK(Grid::Serialize::write_grid(stream, original));
+            Grid::Grid read_grid;
+            CHECK(Grid::Serialize::read_grid(stream, &read_grid));
+            CHECK(read_grid.precision == original.precision);
+            CHECK(read_grid.instrument_type == original.instrument_type);
+            CHECK(read_grid.n == original.n);
+            CHECK(read_grid.m == original.m);
+            CHECK(read_grid.data == original.data);
+            CHECK(read_grid.data_float == original.data_float);
+            CHECK(read_grid.bins_mz == original.bins_mz);
+            CHECK(read_grid.bins_rt == original.bins_rt);
+        }
+
+        // Grids written without the magic number by older versions.
+        std::stringstream stream;
+        Serialization::write_uint64(stream, grid.n);
+        Serialization::write_uint64(stream, grid.m);
+        Serialization::write_uint64(stream, grid.k);
+        Serialization::write_uint64(stream, grid.t);
+        Serialization::write_uint8(stream, grid.instrument_type);
+        Serialization::write_double(stream, grid.reference_mz);
+        Serialization::write_double(stream, grid.fwhm_mz);
+        Serialization::write_double(stream, grid.fwhm_rt);
+        Serialization::write_double(stream, grid.min_mz);
+        Serialization::write_double(stream, grid.max_mz);
+        Serialization::write_double(stream, grid.min_rt);
+        Serialization::write_double(stream, grid.max_rt);
+        Serialization::write_array(stream, grid.data.data(), grid.data.size());
+        Serialization::write_array(stream, grid.bins_mz.data(), grid.n);
+        Serialization::write_array(stream, grid.bins_rt.data(), grid.m);
+        Grid::Grid read_grid;
+        CHECK(Grid::Serialize::read_grid(stream, &read_grid));
+        CHECK(read_grid.precision == Grid::Precision::DOUBLE);
+        CHECK(read_grid.n == grid.n);
+        CHECK(read_grid.data == grid.data);
+    }
+}
+
+TEST_CASE("Tiled grids") {
+    auto raw_data = mock_raw_data();
+    auto params = Grid::ResampleParams{};
+    params.num_samples_mz = 5;
+    params.num_samples_rt = 5;
+    params.smoothing_coef_mz = 0.4;
+    params.smoothing_coef_rt = 0.4;
+    auto grid = Grid::_resample(raw_data, params);
+    params.precision = Grid::Precision::FLOAT;
+    auto grid_float = Grid::_resample(raw_data, params);
+
+    SUBCASE("Serialization") {
+        for (const auto &original : {grid, grid_float}) {
+            for (auto codec :
+                 {Compression::Codec::NONE, Compression::Codec::ZLIB}) {
+                std::stringstream stream;
+                CHECK(Grid::Serialize::write_grid_tiled(stream, original, 16,
+                                                        0.0, codec, -1));
+                Grid::Grid read_grid;
+                CHECK(Grid::Serialize::read_grid(stream, &read_grid));
+                CHECK(read_grid.precision == original.precision);
+                CHECK(read_grid.n == original.n);
+                CHECK(read_grid.m == original.m);
+                CHECK(read_grid.min_mz == original.min_mz);
+                CHECK(read_grid.max_rt == original.max_rt);
+                CHECK(read_grid.data == original.data);
+                CHECK(read_grid.data_float == original.data_float);
+                CHECK(read_grid.bins_mz == original.bins_mz);
+                CHECK(read_grid.bins_rt == original.bins_rt);
+            }
+        }
+    }
+
+    SUBCASE("Empty tiles are not stored") {
+        std::stringstream dense_stream;
+        std::stringstream tiled_stream;
+        CHECK(Grid::Serialize::write_grid(dense_stream, grid));
+        CHECK(Grid::Serialize::write_grid_tiled(tiled_stream, grid, 16, 1e3,
+                                                Compression::Codec::NONE, -1));
+        CHECK(tiled_stream.str().size() < dense_stream.str().size() / 2);
+        Grid::Grid read_grid;
+        CHECK(Grid::Serialize::read_grid(tiled_stream, &read_grid));
+        CHECK(read_grid.data.size() == grid.data.size());
+        for (size_t i = 0; i < grid.data.size(); ++i) {
+            if (grid.data[i] < 1e3) {
+                CHECK(read_grid.data[i] == 0);
+            } else {
+                CHECK(read_grid.data[i] == grid.data[i]);
+            }
+        }
+    }
+
+    SUBCASE("Reading a range of the grid") {
+        auto file_name =
+            (std::filesystem::temp_directory_path() / "pastaq_test.grid")
+                .string();
+        double min_mz = 200.45;
+        double max_mz = 200.55;
+        double min_rt = 20.0;
+        double max_rt = 40.0;
+        for (const auto &original : {grid, grid_float}) {
+            // The expected region, taken from the full grid.
+            size_t i_min = 0;
+            size_t j_min = 0;
+            size_t n = 0;
+            size_t m = 0;
+            for (size_t i = 0; i < original.n; ++i) {
+                if (original.bins_mz[i] >= min_mz &&
+                    original.bins_mz[i] <= max_mz) {
+                    i_min = n == 0 ? i : i_min;
+                    ++n;
+                }
+            }
+            for (size_t j = 0; j < original.m; ++j) {
+                if (original.bins_rt[j] >= min_rt &&
+                    original.bins_rt[j] <= max_rt) {
+                    j_min = m == 0 ? j : j_min;
+                    ++m;
+                }
+            }
+            CHECK(n > 0);
+            CHECK(m > 0);
+
+            // Tiled grids with and without compressing the whole file, and
+            // dense grids.
+            for (int tile_size : {0, 16, 1000}) {
+                for (auto codec :
+                     {Compression::Codec::NONE, Compression::Codec::ZLIB}) {
+                    {
+                        Compression::DeflateStream stream;
+                        stream.open(file_name, tile_size == 0
+                                                   ? codec
+                                                   : Compression::Codec::NONE);
+                        if (tile_size == 0) {
+                            CHECK(Grid::Serialize::write_grid(stream,
+                                                              original));
+                        } else {
+                            CHECK(Grid::Serialize::write_grid_tiled(
+                                stream, original, tile_size, 0.0, codec, -1));
+                        }
+                    }
+                    Grid::Grid range;
+                    CHECK(Grid::Serialize::read_grid_range(
+                        file_name, min_mz, max_mz, min_rt, max_rt, &range));
+                    CHECK(range.precision == original.precision);
+                    CHECK(range.n == n);
+                    CHECK(range.m == m);
+                    CHECK(range.min_mz == original.bins_mz[i_min]);
+                    CHECK(range.min_rt == original.bins_rt[j_min]);
+                    CHECK(range.bins_mz.size() == n);
+                    CHECK(range.bins_rt.size() == m);
+                    bool equal = true;
+                    for (size_t j = 0; j < m && j < range.m; ++j) {
+                        for (size_t i = 0; i < n && i < range.n; ++i) {
+                            equal &= Grid::value_at(range, i + j * range.n) ==
+                                     Grid::value_at(original,
+                                                    (i + i_min) +
+                                                        (j + j_min) *
+                                                            original.n);
+                        }
+                    }
+                    CHECK(equal);
+                }
+            }
+        }
+        std::remove(file_name.c_str());
+    }
+}
@@ -0,0 +1,56 @@
+#include <cmath>
+#include <cstdint>
+#include <vector>
+
+#include "doctest.h"
+#include "utils/numpress.hpp"
+
+TEST_CASE("Decoding MS-Numpress data") {
+    std::vector<double> output;
+
+    SUBCASE("Linear prediction") {
+        // Fixed point 1000.
+        std::vector<uint8_t> data = {
+            0x40, 0x8f, 0x40, 0x00, 0x00, 0x00, 0x00, 0x00,
+            0xa0, 0x86, 0x01, 0x00, 0x94, 0x88, 0x01, 0x00,
+            0x6a, 0xf4, 0xdf, 0xbb, 0x28, 0x2b, 0x7b, 0x10,
+        };
+        CHECK(Numpress::decode_linear(data.data(), data.size(), output));
+        CHECK(output ==
+              std::vector<double>{100.0, 100.5, 101.25, 150.125, 2000.0});
+
+        // Only the fixed point and the first value.
+        CHECK(Numpress::decode_linear(data.data(), 12, output));
+        CHECK(output == std::vector<double>{100.0});
+        CHECK(Numpress::decode_linear(data.data(), 8, output));
+        CHECK(output.empty());
+
+        // Truncated data.
+        CHECK(!Numpress::decode_linear(data.data(), 10, output));
+        CHECK(!Numpress::decode_linear(data.data(), 19, output));
+    }
+
+    SUBCASE("Positive integers") {
+        std::vector<uint8_t> data = {0x87, 0xc6, 0xff, 0x30,
+                                     0x71, 0x11, 0x73};
+        CHECK(Numpress::decode_pic(data.data(), data.size(), output));
+        CHECK(output == std::vector<double>{0, 12, 255, 70000, 3});
+        CHECK(!Numpress::decode_pic(data.data(), 5, output));
+    }
+
+    SUBCASE("Short logged floats") {
+        // Fixed point 2000.
+        std::vector<uint8_t> data = {
+            0x40, 0x9f, 0x40, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+            0x00, 0x0a, 0x14, 0x52, 0x2b, 0x29, 0x57, 0xd5, 0x0a,
+        };
+        std::vector<double> expected = {0, 12, 255, 70000, 3};
+        CHECK(Numpress::decode(Numpress::SLOF, data.data(), data.size(),
+                               output));
+        CHECK(output.size() == expected.size());
+        for (size_t i = 0; i < output.size() && i < expected.size(); ++i) {
+            CHECK(std::abs(output[i] - expected[i]) <= expected[i] * 1e-3);
+        }
+        CHECK(!Numpress::decode_slof(data.data(), 7, output));
+    }
+}
@@ -0,0 +1,285 @@
+#include <cstdio>
+#include <filesystem>
+#include <fstream>
+#include <sstream>
+
+#include "doctest.h"
+#include "raw_data/raw_data_serialize.hpp"
+#include "utils/compression.hpp"
+
+static RawData::RawData make_raw_data() {
+    RawData::RawData raw_data = {};
+    raw_data.instrument_type = Instrument::ORBITRAP;
+    raw_data.min_mz = 100.0;
+    raw_data.max_mz = 1000.0;
+    raw_data.min_rt = 10.0;
+    raw_data.max_rt = 30.0;
+    raw_data.resolution_ms1 = 70000;
+    raw_data.resolution_msn = 30000;
+    raw_data.reference_mz = 200;
+    raw_data.fwhm_rt = 9;
+    raw_data.centroid = true;
+    for (size_t i = 0; i < 3; ++i) {
+        RawData::Scan scan = {};
+        scan.scan_number = i + 1;
+        scan.ms_level = i == 1 ? 2 : 1;
+        scan.retention_time = 10.0 + i * 10.0;
+        // The second scan has no points.
+        for (size_t j = 0; i != 1 && j < 5 + i; ++j) {
+            scan.mz.push_back(100.0 + i * 100.0 + j);
+            scan.intensity.push_back(j * 10.0 + i);
+        }
+        scan.num_points = scan.mz.size();
+        scan.max_intensity = 40.0 + i;
+        scan.total_intensity = 100.0 + i;
+        scan.polarity = Polarity::POSITIVE;
+        scan.precursor_information.scan_number = i;
+        scan.precursor_information.charge = 2;
+        scan.precursor_information.mz = 500.5;
+        scan.precursor_information.intensity = 1000.0;
+        scan.precursor_information.activation_method = ActivationMethod::CID;
+        scan.precursor_information.window_wideness = 2.0;
+        raw_data.scans.push_back(scan);
+        raw_data.retention_times.push_back(scan.retention_time);
+    }
+    return raw_data;
+}
+
+static void check_equal(const RawData::RawData &a, const RawData::RawData &b) {
+    CHECK(a.instrument_type == b.instrument_type);
+    CHECK(a.min_mz == b.min_mz);
+    CHECK(a.max_mz == b.max_mz);
+    CHECK(a.min_rt == b.min_rt);
+    CHECK(a.max_rt == b.max_rt);
+    CHECK(a.resolution_ms1 == b.resolution_ms1);
+    CHECK(a.resolution_msn == b.resolution_msn);
+    CHECK(a.reference_mz == b.reference_mz);
+    CHECK(a.fwhm_rt == b.fwhm_rt);
+    CHECK(a.retention_times == b.retention_times);
+    CHECK(a.scans.size() == b.scans.size());
+    for (size_t i = 0; i < a.scans.size() && i < b.scans.size(); ++i) {
+        const auto &scan_a = a.scans[i];
+        const auto &scan_b = b.scans[i];
+        CHECK(scan_a.scan_number == scan_b.scan_number);
+        CHECK(scan_a.ms_level == scan_b.ms_level);
+        CHECK(scan_a.num_points == scan_b.num_points);
+        CHECK(scan_a.retention_time == scan_b.retention_time);
+        CHECK(scan_a.mz == scan_b.mz);
+        CHECK(scan_a.intensity == scan_b.intensity);
+        CHECK(scan_a.max_intensity == scan_b.max_intensity);
+        CHECK(scan_a.total_intensity == scan_b.total_intensity);
+        CHECK(scan_a.polarity == scan_b.polarity);
+        CHECK(scan_a.precursor_information.charge ==
+              scan_b.precursor_information.charge);
+        CHECK(scan_a.precursor_information.mz ==
+              scan_b.precursor_information.mz);
+        CHECK(scan_a.precursor_information.activation_method ==
+              scan_b.precursor_information.activation_method);
+    }
+}
+
+TEST_CASE("Columnar raw data serialization") {
+    auto raw_data = make_raw_data();
+    auto file_name =
+        (std::filesystem::temp_directory_path() / "pastaq_test.ms1").string();
+    {
+        Compression::DeflateStream stream;
+        stream.open(file_name, Compression::Codec::NONE);
+        CHECK(RawData::Serialize::write_raw_data_columnar(stream, raw_data));
+    }
+    CHECK(RawData::Serialize::is_columnar_file(file_name));
+
+    SUBCASE("Stream reader") {
+        Compression::InflateStream stream(file_name);
+        RawData::RawData read_raw_data;
+        CHECK(RawData::Serialize::read_raw_data_columnar(stream,
+                                                         &read_raw_data));
+        CHECK(read_raw_data.centroid);
+        check_equal(raw_data, read_raw_data);
+    }
+
+    SUBCASE("Memory mapped reader") {
+        RawData::MappedRawData mapped;
+        CHECK(mapped.open(file_name));
+        CHECK(mapped.size() == 3);
+        CHECK(mapped.num_points() == 12);
+        CHECK(mapped.offsets()[0] == 0);
+        CHECK(mapped.offsets()[1] == 5);
+        CHECK(mapped.offsets()[2] == 5);
+        CHECK(mapped.offsets()[3] == 12);
+        CHECK(reinterpret_cast<uintptr_t>(mapped.mz()) % 8 == 0);
+        CHECK(mapped.num_points(1) == 0);
+        CHECK(mapped.metadata().scans[2].num_points == 7);
+        CHECK(mapped.metadata().scans[2].mz.empty());
+        CHECK(mapped.mz(2)[0] == 300.0);
+        CHECK(mapped.intensity(2)[6] == 62.0);
+        check_equal(raw_data, mapped.load());
+
+        // The mapping is kept alive when the object is moved.
+        RawData::MappedRawData moved = std::move(mapped);
+        CHECK(moved.mz(0)[4] == 104.0);
+    }
+
+    SUBCASE("Compressed files") {
+        {
+            Compression::DeflateStream stream;
+            stream.open(file_name, Compression::Codec::ZLIB, 1);
+            CHECK(RawData::Serialize::write_raw_data_columnar(stream,
+                                                              raw_data));
+        }
+        CHECK(RawData::Serialize::is_columnar_file(file_name));
+        Compression::InflateStream stream(file_name);
+        RawData::RawData read_raw_data;
+        CHECK(RawData::Serialize::read_raw_data_columnar(stream,
+                                                         &read_raw_data));
+        check_equal(raw_data, read_raw_data);
+
+        // Compressed files can't be mapped.
+        RawData::MappedRawData mapped;
+        CHECK(!mapped.open(file_name));
+    }
+
+    SUBCASE("Compressed blocks") {
+        {
+            Compression::DeflateStream stream;
+            stream.open(file_name, Compression::Codec::NONE);
+            CHECK(RawData::Serialize::write_raw_data_columnar(
+                stream, raw_data, Compression::Codec::ZLIB, 1));
+        }
+        Compression::InflateStream stream(file_name);
+        RawData::RawData read_raw_data;
+        CHECK(RawData::Serialize::read_raw_data_columnar(stream,
+                                                         &read_raw_data));
+        check_equal(raw_data, read_raw_data);
+        RawData::MappedRawData mapped;
+        CHECK(!mapped.open(file_name));
+    }
+
+    SUBCASE("Legacy format") {
+        std::stringstream stream;
+        CHECK(RawData::Serialize::write_raw_data(stream, raw_data));
+        RawData::RawData read_raw_data;
+        CHECK(!RawData::Serialize::read_raw_data_columnar(stream,
+                                                          &read_raw_data));
+        stream.clear();
+        stream.seekg(0);
+        CHECK(RawData::Serialize::read_raw_data(stream, &read_raw_data));
+        check_equal(raw_data, read_raw_data);
+    }
+
+    SUBCASE("Truncated files") {
+        std::string data;
+        {
+            std::ifstream stream(file_name, std::ios::binary);
+            data.assign(std::istreambuf_iterator<char>(stream),
+                        std::istreambuf_iterator<char>());
+        }
+        std::ofstream(file_name, std::ios::binary)
+            << data.substr(0, data.size() - 8);
+        RawData::MappedRawData mapped;
+        CHECK(!mapped.open(file_name));
+        Compression::InflateStream stream(file_name);
+        RawData::RawData read_raw_data;
+        CHECK(!RawData::Serialize::read_raw_data_columnar(stream,
+                                                          &read_raw_data));
+    }
+    std::remove(file_name.c_str());
+}
+
+TEST_CASE("Reading a range of the raw data") {
+    // Enough points for several blocks.
+    RawData::RawData raw_data = make_raw_data();
+    raw_data.scans.clear();
+    raw_data.retention_times.clear();
+    for (size_t i = 0; i < 100; ++i) {
+        RawData::Scan scan = {};
+        scan.scan_number = i;
+        scan.ms_level = 1;
+        scan.retention_time = 10.0 + i;
+        for (size_t j = 0; j < 2000; ++j) {
+            scan.mz.push_back(100.0 + j * 0.5);
+            scan.intensity.push_back(i * 10000.0 + j);
+            scan.max_intensity = scan.intensity.back();
+            scan.total_intensity += scan.intensity.back();
+        }
+        scan.num_points = scan.mz.size();
+        raw_data.scans.push_back(scan);
+        raw_data.retention_times.push_back(scan.retention_time);
+    }
+    raw_data.min_rt = 10.0;
+    raw_data.max_rt = 109.0;
+    auto file_name =
+        (std::filesystem::temp_directory_path() / "pastaq_test.ms1").string();
+
+    auto check_range = [&]() {
+        RawData::RawData range;
+        CHECK(RawData::Serialize::read_raw_data_range(
+            file_name, 20.5, 22.5, 200.0, 201.0, &range));
+        CHECK(range.scans.size() == 2);
+        CHECK(range.retention_times == std::vector<double>{21.0, 22.0});
+        CHECK(range.min_rt == 20.5);
+        CHECK(range.max_rt == 22.5);
+        CHECK(range.min_mz == 200.0);
+        CHECK(range.max_mz == 201.0);
+        for (size_t i = 0; i < range.scans.size(); ++i) {
+            const auto &scan = range.scans[i];
+            CHECK(scan.num_points == 3);
+            CHECK(scan.mz == std::vector<double>{200.0, 200.5, 201.0});
+            double base = (11 + i) * 10000.0;
+            CHECK(scan.intensity ==
+                  std::vector<double>{base + 200, base + 201, base + 202});
+            CHECK(scan.max_intensity == base + 202);
+            CHECK(scan.total_intensity == 3 * base + 603);
+        }
+
+        // The whole file.
+        CHECK(RawData::Serialize::read_raw_data_range(
+            file_name, 0, 1000, 0, 10000, &range));
+        check_equal(raw_data, range);
+
+        // Nothing in range.
+        CHECK(RawData::Serialize::read_raw_data_range(
+            file_name, 200, 300, 0, 10000, &range));
+        CHECK(range.scans.empty());
+    };
+
+    SUBCASE("Uncompressed") {
+        {
+            Compression::DeflateStream stream;
+            stream.open(file_name, Compression::Codec::NONE);
+            CHECK(RawData::Serialize::write_raw_data_columnar(stream,
+                                                              raw_data));
+        }
+        check_range();
+    }
+
+    SUBCASE("Compressed blocks") {
+        {
+            Compression::DeflateStream stream;
+            stream.open(file_name, Compression::Codec::NONE);
+            CHECK(RawData::Serialize::write_raw_data_columnar(
+                stream, raw_data, Compression::Codec::ZLIB, 1));
+        }
+        check_range();
+    }
+
+    SUBCASE("Compressed file") {
+        {
+            Compression::DeflateStream stream;
+            stream.open(file_name, Compression::Codec::ZLIB, 1);
+            CHECK(RawData::Serialize::write_raw_data_columnar(stream,
+                                                              raw_data));
+        }
+        check_range();
+    }
+
+    SUBCASE("Legacy format") {
+        {
+            Compression::DeflateStream stream;
+            stream.open(file_name);
+            CHECK(RawData::Serialize::write_raw_data(stream, raw_data));
+        }
+        check_range();
+    }
+    std::remove(file_name.c_str());
+}
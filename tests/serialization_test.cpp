@@ -107,3 +107,47 @@ TEST_CASE("Read/Write uint8_t values") {
         CHECK(read_value == value);
     }
 }
+
+TEST_CASE("Read/Write arrays in bulk") {
+    std::vector<double> doubles = {1.0, 2.5, -3.0, 1e300, -1e-300};
+    std::vector<uint64_t> integers = {0x8877665544332211, 0, 1, 2};
+    std::vector<char> stream_data(sizeof(double) * doubles.size() +
+                                  sizeof(uint64_t) * (integers.size() + 1));
+    MockStream<char> stream(stream_data);
+    CHECK(Serialization::write_array(stream, doubles.data(), doubles.size()));
+    CHECK(Serialization::write_vector(stream, integers));
+
+    // The bulk functions use the same format as the ones for single values.
+    for (const auto &value : doubles) {
+        double read_value;
+        CHECK(Serialization::read_double(stream, &read_value));
+        CHECK(read_value == value);
+    }
+    uint64_t size = 0;
+    CHECK(Serialization::read_uint64(stream, &size));
+    CHECK(size == integers.size());
+    for (const auto &value : integers) {
+        uint64_t read_value;
+        CHECK(Serialization::read_uint64(stream, &read_value));
+        CHECK(read_value == value);
+    }
+
+    stream.seekg(0, std::ios::beg);
+    std::vector<double> read_doubles(doubles.size());
+    CHECK(Serialization::read_array(stream, read_doubles.data(),
+                                    read_doubles.size()));
+    CHECK(read_doubles == doubles);
+    std::vector<uint64_t> read_integers;
+    CHECK(Serialization::read_vector(stream, &read_integers));
+    CHECK(read_integers == integers);
+}
+
+TEST_CASE("Read/Write strings") {
+    std::string source_data = "PASTAQ";
+    std::vector<char> stream_data(sizeof(uint64_t) + source_data.size());
+    MockStream<char> stream(stream_data);
+    CHECK(Serialization::write_string(stream, source_data));
+    std::string read_value;
+    CHECK(Serialization::read_string(stream, &read_value));
+    CHECK(read_value == source_data);
+}
@@ -1,4 +1,10 @@
+#include <atomic>
+#include <cmath>
+#include <limits>
+#include <memory>
 #include <sstream>
+#include <thread>
+#include <tuple>
 
 #include "doctest.h"
 #include "raw_data/xml_reader.hpp"
@@ -152,6 +158,763 @@ TEST_CASE("Reading scans") {
 }
 
 TEST_CASE("Reading mzidentml") {
-    // TODO:...
-    CHECK(true);
+    std::string mzidentml_data = R"(<?xml version="1.0" encoding="UTF-8"?>
+<MzIdentML id="test">
+<SequenceCollection>
+<DBSequence id="DBSeq_1" accession="P00001" searchDatabase_ref="SDB_1">
+<Seq>MKPEPTIDEK</Seq>
+<cvParam accession="MS:1001088" name="protein description" value="Protein 1"/>
+</DBSequence>
+<Peptide id="PEP_1">
+<PeptideSequence>PEPTIDEK</PeptideSequence>
+<Modification location="3" residues="M" monoisotopicMassDelta="15.9949">
+<cvParam accession="UNIMOD:35" name="Oxidation"/>
+</Modification>
+</Peptide>
+<Peptide id="PEP_2">
+<PeptideSequence>PEPTIDER</PeptideSequence>
+<SubstitutionModification originalResidue="A" replacementResidue="G" location="2" avgMassDelta="-14.02"/>
+</Peptide>
+<PeptideEvidence id="PE_1" dBSequence_ref="DBSeq_1" peptide_ref="PEP_1" isDecoy="false"/>
+<PeptideEvidence id="PE_2" dBSequence_ref="DBSeq_1" peptide_ref="PEP_2" isDecoy="true"/>
+</SequenceCollection>
+<AnalysisData>
+<SpectrumIdentificationList id="SIL_1">
+<SpectrumIdentificationResult id="SIR_1" spectrumID="scan=1">
+<SpectrumIdentificationItem id="SII_1_1" rank="2" chargeState="2" experimentalMassToCharge="500.5" calculatedMassToCharge="500.6" passThreshold="true" peptide_ref="PEP_1">
+</SpectrumIdentificationItem>
+<SpectrumIdentificationItem id="SII_1_2" rank="1" chargeState="3" experimentalMassToCharge="900.5" passThreshold="true" peptide_ref="PEP_2">
+</SpectrumIdentificationItem>
+<SpectrumIdentificationItem id="SII_1_3" rank="1" chargeState="3" experimentalMassToCharge="400.5" passThreshold="false" peptide_ref="PEP_2">
+</SpectrumIdentificationItem>
+<cvParam accession="MS:1000894" name="retention time" value="2" unitAccession="UO:0000031"/>
+</SpectrumIdentificationResult>
+<SpectrumIdentificationResult id="SIR_2" spectrumID="scan=2">
+<SpectrumIdentificationItem id="SII_2_1" rank="1" chargeState="2" experimentalMassToCharge="600.5" passThreshold="true" peptide_ref="PEP_1">
+</SpectrumIdentificationItem>
+<cvParam accession="MS:1000016" name="scan start time" value="300" unitAccession="UO:0000010"/>
+</SpectrumIdentificationResult>
+</SpectrumIdentificationList>
+</AnalysisData>
+</MzIdentML>
+)";
+    auto read = [&](bool ignore_decoy, bool require_threshold,
+                    bool max_rank_only, double min_mz, double max_mz,
+                    double min_rt, double max_rt) {
+        auto stream = std::stringstream(mzidentml_data);
+        return XmlReader::read_mzidentml(stream, ignore_decoy,
+                                         require_threshold, max_rank_only,
+                                         min_mz, max_mz, min_rt, max_rt);
+    };
+    auto match_ids = [](const IdentData::IdentData &ident_data) {
+        std::vector<std::string> ids;
+        for (const auto &spectrum_match : ident_data.spectrum_matches) {
+            ids.push_back(spectrum_match.id);
+        }
+        return ids;
+    };
+    double inf = std::numeric_limits<double>::infinity();
+
+    auto ident_data = read(true, true, false, 0.0, inf, 0.0, inf);
+    CHECK(ident_data.db_sequences.size() == 1);
+    CHECK(ident_data.db_sequences[0].accession == "P00001");
+    CHECK(ident_data.db_sequences[0].db_reference == "SDB_1");
+    CHECK(ident_data.db_sequences[0].description == "Protein 1");
+    CHECK(ident_data.peptides.size() == 2);
+    CHECK(ident_data.peptides[0].sequence == "PEPTIDEK");
+    CHECK(ident_data.peptides[0].modifications[0].location == 3);
+    CHECK(ident_data.peptides[0].modifications[0].id ==
+          std::vector<std::string>{"UNIMOD:35|Oxidation"});
+    CHECK(ident_data.peptides[1].modifications.size() == 1);
+    CHECK(ident_data.peptides[1].modifications[0].id ==
+          std::vector<std::string>{"SUBSTITUTION|A->G"});
+    CHECK(ident_data.peptide_evidence.size() == 1);
+    CHECK(match_ids(ident_data) ==
+          std::vector<std::string>{"SII_1_1", "SII_1_2", "SII_2_1"});
+    const auto &spectrum_match = ident_data.spectrum_matches[0];
+    CHECK(spectrum_match.match_id == "PEP_1");
+    CHECK(spectrum_match.charge_state == 2);
+    CHECK(spectrum_match.rank == 2);
+    CHECK(spectrum_match.theoretical_mz == 500.6);
+    CHECK(spectrum_match.retention_time == 120.0);
+    CHECK(ident_data.spectrum_matches[1].theoretical_mz == 0.0);
+
+    SUBCASE("Filters") {
+        CHECK(read(false, true, false, 0.0, inf, 0.0, inf)
+                  .peptide_evidence.size() == 2);
+        CHECK(match_ids(read(true, false, false, 0.0, inf, 0.0, inf)) ==
+              std::vector<std::string>{"SII_1_1", "SII_1_2", "SII_1_3",
+                                       "SII_2_1"});
+        CHECK(match_ids(read(true, true, true, 0.0, inf, 0.0, inf)) ==
+              std::vector<std::string>{"SII_1_2", "SII_2_1"});
+        CHECK(match_ids(read(true, true, false, 0.0, 700.0, 0.0, inf)) ==
+              std::vector<std::string>{"SII_1_1", "SII_2_1"});
+        // The maximum rank match is selected before filtering by mz.
+        CHECK(match_ids(read(true, true, true, 0.0, 700.0, 0.0, inf)) ==
+              std::vector<std::string>{"SII_2_1"});
+        CHECK(match_ids(read(true, true, false, 0.0, inf, 200.0, inf)) ==
+              std::vector<std::string>{"SII_2_1"});
+    }
+}
+
+TEST_CASE("Indexed mzML reading") {
+    // Build a small indexed mzML file with alternating MS1/MS2 spectra every
+    // 10 seconds.
+    auto spectrum = [](size_t index, size_t ms_level, double retention_time) {
+        std::stringstream ss;
+        ss << "<spectrum index=\"" << index << "\" id=\"scan=" << index + 1
+           << "\" defaultArrayLength=\"2\">\n"
+           << "<cvParam cvRef=\"MS\" accession=\"MS:1000511\" "
+              "name=\"ms level\" value=\""
+           << ms_level << "\"/>\n"
+           << "<scanList count=\"1\"><scan>\n"
+           << "<cvParam cvRef=\"MS\" accession=\"MS:1000016\" "
+              "name=\"scan start time\" value=\""
+           << retention_time << "\" unitAccession=\"UO:0000010\"/>\n"
+           << "</scan></scanList>\n"
+           << "<binaryDataArrayList count=\"2\">\n"
+           << "<binaryDataArray encodedLength=\"24\">\n"
+           << "<cvParam cvRef=\"MS\" accession=\"MS:1000523\" value=\"\"/>\n"
+           << "<cvParam cvRef=\"MS\" accession=\"MS:1000514\" value=\"\"/>\n"
+           << "<binary>AAAAAAAAWUAAAAAAAABpQA==</binary>\n"
+           << "</binaryDataArray>\n"
+           << "<binaryDataArray encodedLength=\"24\">\n"
+           << "<cvParam cvRef=\"MS\" accession=\"MS:1000523\" value=\"\"/>\n"
+           << "<cvParam cvRef=\"MS\" accession=\"MS:1000515\" value=\"\"/>\n"
+           << "<binary>AAAAAABAj0AAAAAAAECfQA==</binary>\n"
+           << "</binaryDataArray>\n"
+           << "</binaryDataArrayList>\n"
+           << "</spectrum>\n";
+        return ss.str();
+    };
+    std::string mzml_body =
+        "<?xml version=\"1.0\" encoding=\"utf-8\"?>\n"
+        "<indexedmzML xmlns=\"http://psi.hupo.org/ms/mzml\">\n"
+        "<mzML>\n<run id=\"test\">\n<spectrumList count=\"10\">\n";
+    std::vector<uint64_t> expected_offsets;
+    for (size_t i = 0; i < 10; ++i) {
+        expected_offsets.push_back(mzml_body.size());
+        mzml_body += spectrum(i, i % 2 + 1, 10.0 * (i + 1));
+    }
+    mzml_body += "</spectrumList>\n</run>\n</mzML>\n";
+    std::string mzml_index =
+        "<indexList count=\"1\">\n<index name=\"spectrum\">\n";
+    for (size_t i = 0; i < expected_offsets.size(); ++i) {
+        mzml_index += "<offset idRef=\"scan=" + std::to_string(i + 1) + "\">" +
+                      std::to_string(expected_offsets[i]) + "</offset>\n";
+    }
+    mzml_index += "</index>\n</indexList>\n<indexListOffset>" +
+                  std::to_string(mzml_body.size()) +
+                  "</indexListOffset>\n</indexedmzML>\n";
+
+    SUBCASE("Reading the embedded index") {
+        auto stream = std::stringstream(mzml_body + mzml_index);
+        auto index = XmlReader::read_mzml_index(stream);
+        CHECK(index != std::nullopt);
+        if (index) {
+            CHECK(index->offsets == expected_offsets);
+            CHECK(index->file_size == mzml_body.size() + mzml_index.size());
+        }
+    }
+
+    SUBCASE("Missing or broken index") {
+        auto stream = std::stringstream(mzml_body);
+        CHECK(XmlReader::read_mzml_index(stream) == std::nullopt);
+        auto broken_stream = std::stringstream(
+            mzml_body + "<indexList count=\"1\">\n<index name=\"spectrum\">\n"
+                        "<offset idRef=\"scan=1\">3</offset>\n"
+                        "</index>\n</indexList>\n<indexListOffset>" +
+            std::to_string(mzml_body.size()) + "</indexListOffset>\n");
+        CHECK(XmlReader::read_mzml_index(broken_stream) == std::nullopt);
+    }
+
+    SUBCASE("Building the index") {
+        auto stream = std::stringstream(mzml_body);
+        auto index = XmlReader::build_mzml_index(stream);
+        CHECK(index.offsets == expected_offsets);
+        CHECK(index.file_size == mzml_body.size());
+
+        std::stringstream index_stream;
+        CHECK(XmlReader::write_spectrum_index(index_stream, index));
+        XmlReader::SpectrumIndex read_index = {};
+        CHECK(XmlReader::read_spectrum_index(index_stream, &read_index));
+        CHECK(read_index.offsets == index.offsets);
+        CHECK(read_index.file_size == index.file_size);
+    }
+
+    SUBCASE("Reading an rt range") {
+        auto stream = std::stringstream(mzml_body + mzml_index);
+        auto index = XmlReader::read_mzml_index(stream);
+        CHECK(index != std::nullopt);
+        std::vector<std::tuple<double, double, size_t, std::vector<double>>>
+            table = {
+                {0.0, 1000.0, 1, {10.0, 30.0, 50.0, 70.0, 90.0}},
+                {25.0, 65.0, 1, {30.0, 50.0}},
+                {25.0, 65.0, 2, {40.0, 60.0}},
+                {40.0, 40.0, 2, {40.0}},
+                {95.0, 1000.0, 2, {100.0}},
+                {200.0, 1000.0, 1, {}},
+            };
+        for (const auto &[min_rt, max_rt, ms_level, expected_rt] : table) {
+            auto raw_data = XmlReader::_read_mzml_indexed(
+                stream, index.value(), 0.0, 1000.0, min_rt, max_rt,
+                Instrument::ORBITRAP, 70000, 17500, 200, Polarity::BOTH,
+                ms_level);
+            CHECK(raw_data != std::nullopt);
+            CHECK(raw_data->retention_times == expected_rt);
+            for (const auto &scan : raw_data->scans) {
+                CHECK(scan.ms_level == ms_level);
+                CHECK(scan.num_points == 2);
+            }
+        }
+    }
+
+    SUBCASE("Spectra without polarity") {
+        // The spectra have no polarity cvParam, so they are kept regardless
+        // of the polarity filter.
+        for (auto polarity : {Polarity::POSITIVE, Polarity::NEGATIVE}) {
+            auto stream = std::stringstream(mzml_body + mzml_index);
+            auto raw_data = XmlReader::_read_mzml(
+                stream, 0.0, 1000.0, 0.0, 1000.0, Instrument::ORBITRAP, 70000,
+                17500, 200, polarity, 1);
+            CHECK(raw_data != std::nullopt);
+            CHECK(raw_data->retention_times ==
+                  std::vector<double>({10.0, 30.0, 50.0, 70.0, 90.0}));
+            for (const auto &scan : raw_data->scans) {
+                CHECK(scan.polarity == Polarity::UNKNOWN);
+                CHECK(scan.num_points == 2);
+            }
+
+            auto index = XmlReader::read_mzml_index(stream);
+            CHECK(index != std::nullopt);
+            raw_data = XmlReader::_read_mzml_indexed(
+                stream, index.value(), 0.0, 1000.0, 0.0, 1000.0,
+                Instrument::ORBITRAP, 70000, 17500, 200, polarity, 2);
+            CHECK(raw_data != std::nullopt);
+            CHECK(raw_data->retention_times ==
+                  std::vector<double>({20.0, 40.0, 60.0, 80.0, 100.0}));
+        }
+    }
+}
+
+TEST_CASE("Reading multiple outputs in a single pass") {
+    // Spectra alternate between MS1 and MS2, positive and negative polarity and
+    // two FAIMS compensation voltages.
+    std::string mzml_data =
+        "<mzML>\n<run id=\"test\">\n<spectrumList count=\"8\">\n";
+    for (size_t i = 0; i < 8; ++i) {
+        std::stringstream ss;
+        ss << "<spectrum index=\"" << i << "\" defaultArrayLength=\"2\">\n"
+           << "<cvParam accession=\"MS:1000511\" value=\"" << i % 2 + 1
+           << "\"/>\n"
+           << "<cvParam accession=\""
+           << ((i / 2) % 2 == 0 ? "MS:1000130" : "MS:1000129")
+           << "\" value=\"\"/>\n"
+           << "<scanList count=\"1\"><scan>\n"
+           << "<cvParam accession=\"MS:1000016\" value=\"" << 10.0 * (i + 1)
+           << "\" unitAccession=\"UO:0000010\"/>\n"
+           << "<cvParam accession=\"MS:1001581\" value=\""
+           << (i < 4 ? -45.0 : -60.0) << "\"/>\n"
+           << "</scan></scanList>\n"
+           << "<binaryDataArrayList count=\"2\">\n"
+           << "<binaryDataArray encodedLength=\"24\">\n"
+           << "<cvParam accession=\"MS:1000523\" value=\"\"/>\n"
+           << "<cvParam accession=\"MS:1000514\" value=\"\"/>\n"
+           << "<binary>AAAAAAAAWUAAAAAAAABpQA==</binary>\n"
+           << "</binaryDataArray>\n"
+           << "<binaryDataArray encodedLength=\"24\">\n"
+           << "<cvParam accession=\"MS:1000523\" value=\"\"/>\n"
+           << "<cvParam accession=\"MS:1000515\" value=\"\"/>\n"
+           << "<binary>AAAAAABAj0AAAAAAAECfQA==</binary>\n"
+           << "</binaryDataArray>\n"
+           << "</binaryDataArrayList>\n"
+           << "</spectrum>\n";
+        mzml_data += ss.str();
+    }
+    mzml_data += "</spectrumList>\n</run>\n</mzML>\n";
+
+    SUBCASE("Split by MS level") {
+        auto stream = std::stringstream(mzml_data);
+        auto outputs = XmlReader::_read_mzml_multi(
+            stream, 0.0, 1000.0, 0.0, 1000.0, Instrument::ORBITRAP, 70000,
+            17500, 200, Polarity::BOTH,
+            {{1, 2, 3}, false, IonMobility::UNKNOWN});
+        CHECK(outputs.size() == 3);
+        if (outputs.size() == 3) {
+            CHECK(outputs[0].ms_level == 1);
+            CHECK(outputs[0].raw_data.retention_times ==
+                  std::vector<double>({10.0, 30.0, 50.0, 70.0}));
+            CHECK(outputs[1].ms_level == 2);
+            CHECK(outputs[1].raw_data.retention_times ==
+                  std::vector<double>({20.0, 40.0, 60.0, 80.0}));
+            CHECK(outputs[2].ms_level == 3);
+            CHECK(outputs[2].raw_data.scans.empty());
+        }
+
+        // Must be the same as reading each MS level separately.
+        for (size_t ms_level = 1; ms_level <= 2; ++ms_level) {
+            auto single_stream = std::stringstream(mzml_data);
+            auto raw_data = XmlReader::_read_mzml(
+                single_stream, 0.0, 1000.0, 0.0, 1000.0, Instrument::ORBITRAP,
+                70000, 17500, 200, Polarity::BOTH, ms_level);
+            CHECK(raw_data->retention_times ==
+                  outputs[ms_level - 1].raw_data.retention_times);
+        }
+    }
+
+    SUBCASE("Split by polarity and compensation voltage") {
+        auto stream = std::stringstream(mzml_data);
+        auto outputs = XmlReader::_read_mzml_multi(
+            stream, 0.0, 1000.0, 0.0, 1000.0, Instrument::ORBITRAP, 70000,
+            17500, 200, Polarity::BOTH, {{1}, true, IonMobility::FAIMS});
+        CHECK(outputs.size() == 4);
+        std::vector<std::tuple<Polarity::Type, double, std::vector<double>>>
+            expected = {
+                {Polarity::POSITIVE, -60.0, {50.0}},
+                {Polarity::POSITIVE, -45.0, {10.0}},
+                {Polarity::NEGATIVE, -60.0, {70.0}},
+                {Polarity::NEGATIVE, -45.0, {30.0}},
+            };
+        for (size_t i = 0; i < outputs.size() && i < expected.size(); ++i) {
+            const auto &[polarity, compensation_voltage, retention_times] =
+                expected[i];
+            CHECK(outputs[i].ms_level == 1);
+            CHECK(outputs[i].polarity == polarity);
+            CHECK(outputs[i].ion_mobility == IonMobility::FAIMS);
+            CHECK(outputs[i].compensation_voltage == compensation_voltage);
+            CHECK(outputs[i].raw_data.retention_times == retention_times);
+        }
+    }
+}
+
+TEST_CASE("Parallel scan decoding") {
+    // Compare the scans read with multiple threads against the sequential
+    // read, with enough scans to be split in several batches.
+    auto check_same_scans = [](const RawData::RawData &raw_data,
+                               const RawData::RawData &expected) {
+        CHECK(raw_data.scans.size() == expected.scans.size());
+        CHECK(raw_data.retention_times == expected.retention_times);
+        for (size_t i = 0;
+             i < raw_data.scans.size() && i < expected.scans.size(); ++i) {
+            const auto &scan = raw_data.scans[i];
+            const auto &expected_scan = expected.scans[i];
+            CHECK(scan.scan_number == expected_scan.scan_number);
+            CHECK(scan.mz == expected_scan.mz);
+            CHECK(scan.intensity == expected_scan.intensity);
+            CHECK(scan.precursor_information.scan_number ==
+                  expected_scan.precursor_information.scan_number);
+        }
+    };
+
+    SUBCASE("mzML") {
+        // Every MS1 spectrum is followed by two MS2 spectra without
+        // spectrumRef, which take the previous MS1 spectrum as precursor.
+        std::string mzml_data =
+            "<mzML>\n<run id=\"test\">\n<spectrumList count=\"900\">\n";
+        for (size_t i = 0; i < 900; ++i) {
+            std::stringstream ss;
+            ss << "<spectrum index=\"" << i << "\" defaultArrayLength=\"2\">\n"
+               << "<cvParam accession=\"MS:1000511\" value=\""
+               << (i % 3 == 0 ? 1 : 2) << "\"/>\n"
+               << "<scanList count=\"1\"><scan>\n"
+               << "<cvParam accession=\"MS:1000016\" value=\"" << i
+               << "\" unitAccession=\"UO:0000010\"/>\n"
+               << "</scan></scanList>\n";
+            if (i % 3 != 0) {
+                ss << "<precursorList count=\"1\"><precursor>\n"
+                   << "<cvParam accession=\"MS:1000827\" value=\"500\"/>\n"
+                   << "</precursor></precursorList>\n";
+            }
+            ss << "<binaryDataArrayList count=\"2\">\n"
+               << "<binaryDataArray encodedLength=\"24\">\n"
+               << "<cvParam accession=\"MS:1000523\" value=\"\"/>\n"
+               << "<cvParam accession=\"MS:1000514\" value=\"\"/>\n"
+               << "<binary>AAAAAAAAWUAAAAAAAABpQA==</binary>\n"
+               << "</binaryDataArray>\n"
+               << "<binaryDataArray encodedLength=\"24\">\n"
+               << "<cvParam accession=\"MS:1000523\" value=\"\"/>\n"
+               << "<cvParam accession=\"MS:1000515\" value=\"\"/>\n"
+               << "<binary>AAAAAABAj0AAAAAAAECfQA==</binary>\n"
+               << "</binaryDataArray>\n"
+               << "</binaryDataArrayList>\n"
+               << "</spectrum>\n";
+            mzml_data += ss.str();
+        }
+        mzml_data += "</spectrumList>\n</run>\n</mzML>\n";
+
+        for (const auto &[min_rt, max_rt] :
+             std::vector<std::pair<double, double>>{{0.0, 1000.0},
+                                                    {100.0, 700.0}}) {
+            auto stream = std::stringstream(mzml_data);
+            auto expected = XmlReader::_read_mzml_multi(
+                stream, 0.0, 1000.0, min_rt, max_rt, Instrument::ORBITRAP,
+                70000, 17500, 200, Polarity::BOTH,
+                {{1, 2}, false, IonMobility::UNKNOWN}, 1);
+            CHECK(expected[1].raw_data.scans.front()
+                      .precursor_information.scan_number != 0);
+            for (size_t max_threads : {2, 4}) {
+                auto parallel_stream = std::stringstream(mzml_data);
+                auto outputs = XmlReader::_read_mzml_multi(
+                    parallel_stream, 0.0, 1000.0, min_rt, max_rt,
+                    Instrument::ORBITRAP, 70000, 17500, 200, Polarity::BOTH,
+                    {{1, 2}, false, IonMobility::UNKNOWN}, max_threads);
+                CHECK(outputs.size() == expected.size());
+                for (size_t i = 0; i < outputs.size() && i < expected.size();
+                     ++i) {
+                    check_same_scans(outputs[i].raw_data, expected[i].raw_data);
+                }
+            }
+        }
+    }
+
+    SUBCASE("mzXML with nested scans") {
+        std::string mz_xml_data = "<mzXML>\n<msRun scanCount=\"900\">\n";
+        for (size_t i = 0; i < 300; ++i) {
+            std::stringstream ss;
+            ss << "<scan num=\"" << 3 * i + 1 << "\" msLevel=\"1\" "
+               << "peaksCount=\"1\" polarity=\"+\" retentionTime=\"PT" << 3 * i
+               << "S\">\n"
+               << "<peaks precision=\"32\" byteOrder=\"network\" "
+               << "pairOrder=\"m/z-int\">QsgAAER6AAA=</peaks>\n";
+            for (size_t k = 1; k <= 2; ++k) {
+                ss << "<scan num=\"" << 3 * i + k + 1 << "\" msLevel=\"2\" "
+                   << "peaksCount=\"1\" polarity=\"+\" retentionTime=\"PT"
+                   << 3 * i + k << "S\">\n"
+                   << "<precursorMz precursorIntensity=\"10\">500"
+                   << "</precursorMz>\n"
+                   << "<peaks precision=\"32\" byteOrder=\"network\" "
+                   << "pairOrder=\"m/z-int\">QsgAAER6AAA=</peaks>\n"
+                   << "</scan>\n";
+            }
+            ss << "</scan>\n";
+            mz_xml_data += ss.str();
+        }
+        mz_xml_data += "</msRun>\n</mzXML>\n";
+
+        for (size_t ms_level : {1, 2}) {
+            auto stream = std::stringstream(mz_xml_data);
+            auto expected = XmlReader::read_mzxml(
+                stream, 0.0, 1000.0, 0.0, 1000.0, Instrument::ORBITRAP, 70000,
+                17500, 200, Polarity::BOTH, ms_level, 1);
+            CHECK(expected->scans.size() == 300 * ms_level);
+            for (size_t max_threads : {2, 4}) {
+                auto parallel_stream = std::stringstream(mz_xml_data);
+                auto raw_data = XmlReader::read_mzxml(
+                    parallel_stream, 0.0, 1000.0, 0.0, 1000.0,
+                    Instrument::ORBITRAP, 70000, 17500, 200, Polarity::BOTH,
+                    ms_level, max_threads);
+                check_same_scans(raw_data.value(), expected.value());
+            }
+        }
+    }
+}
+
+TEST_CASE("Reading MS-Numpress arrays") {
+    // The mz array is numpress linear encoded and zlib compressed, and the
+    // intensity array is numpress slof encoded.
+    std::string mzml_data =
+        "<mzML>\n<run id=\"test\">\n<spectrumList count=\"1\">\n"
+        "<spectrum index=\"0\" defaultArrayLength=\"5\">\n"
+        "<cvParam accession=\"MS:1000511\" value=\"1\"/>\n"
+        "<scanList count=\"1\"><scan>\n"
+        "<cvParam accession=\"MS:1000016\" value=\"10\" "
+        "unitAccession=\"UO:0000010\"/>\n"
+        "</scan></scanList>\n"
+        "<binaryDataArrayList count=\"2\">\n"
+        "<binaryDataArray encodedLength=\"40\">\n"
+        "<cvParam accession=\"MS:1000523\" value=\"\"/>\n"
+        "<cvParam accession=\"MS:1002746\" value=\"\"/>\n"
+        "<cvParam accession=\"MS:1000514\" value=\"\"/>\n"
+        "<binary>eJxz6HdgAIEFbYwMUzoYGbK+3N+toV0tAABMLwcq</binary>\n"
+        "</binaryDataArray>\n"
+        "<binaryDataArray encodedLength=\"24\">\n"
+        "<cvParam accession=\"MS:1000523\" value=\"\"/>\n"
+        "<cvParam accession=\"MS:1002314\" value=\"\"/>\n"
+        "<cvParam accession=\"MS:1000515\" value=\"\"/>\n"
+        "<binary>QJ9AAAAAAAAAAAoUUispV9UK</binary>\n"
+        "</binaryDataArray>\n"
+        "</binaryDataArrayList>\n"
+        "</spectrum>\n"
+        "</spectrumList>\n</run>\n</mzML>\n";
+    auto stream = std::stringstream(mzml_data);
+    auto raw_data = XmlReader::_read_mzml(stream, 0.0, 3000.0, 0.0, 100.0,
+                                          Instrument::ORBITRAP, 70000, 17500,
+                                          200, Polarity::BOTH, 1);
+    CHECK(raw_data != std::nullopt);
+    if (raw_data) {
+        CHECK(raw_data->scans.size() == 1);
+        const auto &scan = raw_data->scans[0];
+        // The first point has zero intensity and is filtered out.
+        CHECK(scan.mz == std::vector<double>{100.5, 101.25, 150.125, 2000.0});
+        std::vector<double> expected_intensity = {12.0, 255.0, 70000.0, 3.0};
+        CHECK(scan.intensity.size() == expected_intensity.size());
+        for (size_t i = 0; i < scan.intensity.size(); ++i) {
+            CHECK(std::abs(scan.intensity[i] - expected_intensity[i]) <
+                  expected_intensity[i] * 1e-3);
+        }
+    }
+}
+
+TEST_CASE("Lazy scan decoding") {
+    auto check_same_scans = [](XmlReader::LazyRawData &lazy_raw_data,
+                               const RawData::RawData &expected) {
+        CHECK(lazy_raw_data.size() == expected.scans.size());
+        for (size_t i = 0;
+             i < lazy_raw_data.size() && i < expected.scans.size(); ++i) {
+            auto scan = lazy_raw_data.scan(i);
+            const auto &expected_scan = expected.scans[i];
+            CHECK(scan->scan_number == expected_scan.scan_number);
+            CHECK(scan->retention_time == expected_scan.retention_time);
+            CHECK(scan->mz == expected_scan.mz);
+            CHECK(scan->intensity == expected_scan.intensity);
+            CHECK(scan->num_points == expected_scan.num_points);
+            CHECK(scan->total_intensity == expected_scan.total_intensity);
+            CHECK(scan->precursor_information.scan_number ==
+                  expected_scan.precursor_information.scan_number);
+        }
+        CHECK(!lazy_raw_data.scan(lazy_raw_data.size()));
+        auto raw_data = lazy_raw_data.load();
+        CHECK(raw_data->scans.size() == expected.scans.size());
+        CHECK(raw_data->retention_times == expected.retention_times);
+        CHECK(raw_data->min_mz == expected.min_mz);
+        CHECK(raw_data->max_mz == expected.max_mz);
+    };
+
+    SUBCASE("mzML") {
+        // Spectra with mz 100/200 and intensities 1000/2000, alternating MS1
+        // and MS2 spectra.
+        std::string mzml_data =
+            "<mzML>\n<run id=\"test\">\n<spectrumList count=\"100\">\n";
+        for (size_t i = 0; i < 100; ++i) {
+            std::stringstream ss;
+            ss << "<spectrum index=\"" << i << "\" defaultArrayLength=\"2\">\n"
+               << "<cvParam accession=\"MS:1000511\" value=\""
+               << (i % 2 == 0 ? 1 : 2) << "\"/>\n"
+               << "<cvParam accession=\"MS:1000285\" value=\"3000\"/>\n"
+               << "<cvParam accession=\"MS:1000528\" value=\"100\"/>\n"
+               << "<cvParam accession=\"MS:1000527\" value=\"200\"/>\n"
+               << "<scanList count=\"1\"><scan>\n"
+               << "<cvParam accession=\"MS:1000016\" value=\"" << i
+               << "\" unitAccession=\"UO:0000010\"/>\n"
+               << "</scan></scanList>\n";
+            if (i % 2 != 0) {
+                ss << "<precursorList count=\"1\"><precursor>\n"
+                   << "<cvParam accession=\"MS:1000827\" value=\"500\"/>\n"
+                   << "</precursor></precursorList>\n";
+            }
+            ss << "<binaryDataArrayList count=\"2\">\n"
+               << "<binaryDataArray encodedLength=\"24\">\n"
+               << "<cvParam accession=\"MS:1000523\" value=\"\"/>\n"
+               << "<cvParam accession=\"MS:1000514\" value=\"\"/>\n"
+               << "<binary>AAAAAAAAWUAAAAAAAABpQA==</binary>\n"
+               << "</binaryDataArray>\n"
+               << "<binaryDataArray encodedLength=\"24\">\n"
+               << "<cvParam accession=\"MS:1000523\" value=\"\"/>\n"
+               << "<cvParam accession=\"MS:1000515\" value=\"\"/>\n"
+               << "<binary>AAAAAABAj0AAAAAAAECfQA==</binary>\n"
+               << "</binaryDataArray>\n"
+               << "</binaryDataArrayList>\n"
+               << "</spectrum>\n";
+            mzml_data += ss.str();
+        }
+        mzml_data += "</spectrumList>\n</run>\n</mzML>\n";
+
+        for (size_t ms_level : {1, 2}) {
+            for (double max_mz : {1000.0, 150.0}) {
+                auto stream = std::stringstream(mzml_data);
+                auto expected = XmlReader::_read_mzml(
+                    stream, 0.0, max_mz, 10.0, 80.0, Instrument::ORBITRAP,
+                    70000, 17500, 200, Polarity::BOTH, ms_level, 1);
+                // The cache can hold a single scan.
+                auto lazy_raw_data = XmlReader::_read_mzml_lazy(
+                    std::make_unique<std::stringstream>(mzml_data), 0.0,
+                    max_mz, 10.0, 80.0, Instrument::ORBITRAP, 70000, 17500,
+                    200, Polarity::BOTH, ms_level, 32);
+
+                // The metadata is read from the spectrum header.
+                const auto &metadata = lazy_raw_data.metadata();
+                CHECK(metadata.scans.size() == expected->scans.size());
+                CHECK(metadata.retention_times == expected->retention_times);
+                CHECK(metadata.min_mz == 100.0);
+                CHECK(metadata.max_mz == std::min(200.0, max_mz));
+                CHECK(metadata.scans[0].num_points == 2);
+                CHECK(metadata.scans[0].total_intensity == 3000.0);
+                CHECK(metadata.scans[0].mz.empty());
+
+                check_same_scans(lazy_raw_data, expected.value());
+                // Decoding again after the scans were evicted from the cache.
+                check_same_scans(lazy_raw_data, expected.value());
+
+                // Decoding from several threads at once.
+                std::atomic<size_t> num_errors = 0;
+                std::vector<std::thread> threads;
+                for (size_t k = 0; k < 4; ++k) {
+                    threads.emplace_back([&, k]() {
+                        for (size_t i = 0; i < lazy_raw_data.size(); ++i) {
+                            size_t j = (i + k * 7) % lazy_raw_data.size();
+                            auto scan = lazy_raw_data.scan(j);
+                            if (!scan ||
+                                scan->mz != expected->scans[j].mz) {
+                                ++num_errors;
+                            }
+                        }
+                    });
+                }
+                for (auto &thread : threads) {
+                    thread.join();
+                }
+                CHECK(num_errors == 0);
+            }
+        }
+    }
+
+    SUBCASE("mzXML with nested scans") {
+        std::string mz_xml_data = "<mzXML>\n<msRun scanCount=\"90\">\n";
+        for (size_t i = 0; i < 30; ++i) {
+            std::stringstream ss;
+            ss << "<scan num=\"" << 3 * i + 1 << "\" msLevel=\"1\" "
+               << "peaksCount=\"1\" polarity=\"+\" retentionTime=\"PT" << 3 * i
+               << "S\" lowMz=\"100\" highMz=\"100\">\n"
+               << "<peaks precision=\"32\" byteOrder=\"network\" "
+               << "pairOrder=\"m/z-int\">QsgAAER6AAA=</peaks>\n";
+            for (size_t k = 1; k <= 2; ++k) {
+                ss << "<scan num=\"" << 3 * i + k + 1 << "\" msLevel=\"2\" "
+                   << "peaksCount=\"1\" polarity=\"+\" retentionTime=\"PT"
+                   << 3 * i + k << "S\">\n"
+                   << "<precursorMz precursorIntensity=\"10\">500"
+                   << "</precursorMz>\n"
+                   << "<peaks precision=\"32\" byteOrder=\"network\" "
+                   << "pairOrder=\"m/z-int\">QsgAAER6AAA=</peaks>\n"
+                   << "</scan>\n";
+            }
+            ss << "</scan>\n";
+            mz_xml_data += ss.str();
+        }
+        mz_xml_data += "</msRun>\n</mzXML>\n";
+
+        for (size_t ms_level : {1, 2}) {
+            for (size_t max_cache_bytes : {0, 1 << 20}) {
+                auto stream = std::stringstream(mz_xml_data);
+                auto expected = XmlReader::read_mzxml(
+                    stream, 0.0, 1000.0, 0.0, 1000.0, Instrument::ORBITRAP,
+                    70000, 17500, 200, Polarity::BOTH, ms_level, 1);
+                CHECK(expected->scans.size() == 30 * ms_level);
+                auto lazy_raw_data = XmlReader::read_mzxml_lazy(
+                    std::make_unique<std::stringstream>(mz_xml_data), 0.0,
+                    1000.0, 0.0, 1000.0, Instrument::ORBITRAP, 70000, 17500,
+                    200, Polarity::BOTH, ms_level, max_cache_bytes);
+                CHECK(lazy_raw_data.metadata().scans[0].num_points == 1);
+                check_same_scans(lazy_raw_data, expected.value());
+                check_same_scans(lazy_raw_data, expected.value());
+            }
+        }
+    }
+}
+
+TEST_CASE("Streaming scans") {
+    auto check_same_scans = [](XmlReader::ScanReader &reader,
+                               const RawData::RawData &expected) {
+        std::vector<RawData::Scan> scans;
+        while (true) {
+            auto batch = reader.next_batch(7);
+            if (batch.empty()) {
+                break;
+            }
+            CHECK(batch.size() <= 7);
+            scans.insert(scans.end(), batch.begin(), batch.end());
+        }
+        CHECK(!reader.next());
+        CHECK(scans.size() == expected.scans.size());
+        for (size_t i = 0; i < scans.size() && i < expected.scans.size();
+             ++i) {
+            CHECK(scans[i].scan_number == expected.scans[i].scan_number);
+            CHECK(scans[i].retention_time == expected.scans[i].retention_time);
+            CHECK(scans[i].mz == expected.scans[i].mz);
+            CHECK(scans[i].intensity == expected.scans[i].intensity);
+            CHECK(scans[i].precursor_information.scan_number ==
+                  expected.scans[i].precursor_information.scan_number);
+        }
+    };
+
+    SUBCASE("mzML") {
+        std::string mzml_data =
+            "<mzML>\n<run id=\"test\">\n<spectrumList count=\"50\">\n";
+        for (size_t i = 0; i < 50; ++i) {
+            std::stringstream ss;
+            ss << "<spectrum index=\"" << i << "\" defaultArrayLength=\"2\">\n"
+               << "<cvParam accession=\"MS:1000511\" value=\""
+               << (i % 2 == 0 ? 1 : 2) << "\"/>\n"
+               << "<scanList count=\"1\"><scan>\n"
+               << "<cvParam accession=\"MS:1000016\" value=\"" << i
+               << "\" unitAccession=\"UO:0000010\"/>\n"
+               << "</scan></scanList>\n";
+            if (i % 2 != 0) {
+                ss << "<precursorList count=\"1\"><precursor>\n"
+                   << "<cvParam accession=\"MS:1000827\" value=\"500\"/>\n"
+                   << "</precursor></precursorList>\n";
+            }
+            ss << "<binaryDataArrayList count=\"2\">\n"
+               << "<binaryDataArray encodedLength=\"24\">\n"
+               << "<cvParam accession=\"MS:1000523\" value=\"\"/>\n"
+               << "<cvParam accession=\"MS:1000514\" value=\"\"/>\n"
+               << "<binary>AAAAAAAAWUAAAAAAAABpQA==</binary>\n"
+               << "</binaryDataArray>\n"
+               << "<binaryDataArray encodedLength=\"24\">\n"
+               << "<cvParam accession=\"MS:1000523\" value=\"\"/>\n"
+               << "<cvParam accession=\"MS:1000515\" value=\"\"/>\n"
+               << "<binary>AAAAAABAj0AAAAAAAECfQA==</binary>\n"
+               << "</binaryDataArray>\n"
+               << "</binaryDataArrayList>\n"
+               << "</spectrum>\n";
+            mzml_data += ss.str();
+        }
+        mzml_data += "</spectrumList>\n</run>\n</mzML>\n";
+
+        for (size_t ms_level : {1, 2}) {
+            auto stream = std::stringstream(mzml_data);
+            auto expected = XmlReader::_read_mzml(
+                stream, 0.0, 1000.0, 5.0, 40.0, Instrument::ORBITRAP, 70000,
+                17500, 200, Polarity::BOTH, ms_level, 1);
+            CHECK(!expected->scans.empty());
+            XmlReader::ScanReader reader(
+                std::make_unique<std::stringstream>(mzml_data), false, 0.0,
+                1000.0, 5.0, 40.0, Polarity::BOTH, ms_level);
+            check_same_scans(reader, expected.value());
+        }
+    }
+
+    SUBCASE("mzXML with nested scans") {
+        std::string mz_xml_data = "<mzXML>\n<msRun scanCount=\"30\">\n";
+        for (size_t i = 0; i < 10; ++i) {
+            std::stringstream ss;
+            ss << "<scan num=\"" << 3 * i + 1 << "\" msLevel=\"1\" "
+               << "peaksCount=\"1\" polarity=\"+\" retentionTime=\"PT" << 3 * i
+               << "S\">\n"
+               << "<peaks precision=\"32\" byteOrder=\"network\" "
+               << "pairOrder=\"m/z-int\">QsgAAER6AAA=</peaks>\n";
+            for (size_t k = 1; k <= 2; ++k) {
+                ss << "<scan num=\"" << 3 * i + k + 1 << "\" msLevel=\"2\" "
+                   << "peaksCount=\"1\" polarity=\"+\" retentionTime=\"PT"
+                   << 3 * i + k << "S\">\n"
+                   << "<peaks precision=\"32\" byteOrder=\"network\" "
+                   << "pairOrder=\"m/z-int\">QsgAAER6AAA=</peaks>\n"
+                   << "</scan>\n";
+            }
+            ss << "</scan>\n";
+            mz_xml_data += ss.str();
+        }
+        mz_xml_data += "</msRun>\n</mzXML>\n";
+
+        for (size_t ms_level : {1, 2}) {
+            auto stream = std::stringstream(mz_xml_data);
+            auto expected = XmlReader::read_mzxml(
+                stream, 0.0, 1000.0, 0.0, 1000.0, Instrument::ORBITRAP, 70000,
+                17500, 200, Polarity::BOTH, ms_level, 1);
+            CHECK(expected->scans.size() == 10 * ms_level);
+            XmlReader::ScanReader reader(
+                std::make_unique<std::stringstream>(mz_xml_data), true, 0.0,
+                1000.0, 0.0, 1000.0, Polarity::BOTH, ms_level);
+            check_same_scans(reader, expected.value());
+        }
+    }
 }
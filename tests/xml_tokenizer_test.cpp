@@ -0,0 +1,147 @@
+#include <sstream>
+#include <stdexcept>
+#include <string>
+#include <tuple>
+#include <vector>
+
+#include "doctest.h"
+#include "raw_data/xml_tokenizer.hpp"
+
+TEST_CASE("Tokenizing xml tags") {
+    SUBCASE("Tag names and attributes") {
+        XmlTokenizer::Tokenizer tokenizer(
+            R"(<testTag attr1="one two" attr2 = 'three'  attr3="">)");
+        auto tag = tokenizer.next_tag();
+        CHECK(tag);
+        if (tag) {
+            CHECK(tag->name == "testTag");
+            CHECK(!tag->closed);
+            CHECK(XmlTokenizer::attribute(tag.value(), "attr1") == "one two");
+            CHECK(XmlTokenizer::attribute(tag.value(), "attr2") == "three");
+            CHECK(XmlTokenizer::attribute(tag.value(), "attr3") == "");
+            CHECK(!XmlTokenizer::attribute(tag.value(), "attr").has_value());
+        }
+        CHECK(!tokenizer.next_tag());
+    }
+
+    SUBCASE("Closing and self-closing tags") {
+        XmlTokenizer::Tokenizer tokenizer(R"(<a><b value="1"/><c/></a>)");
+        std::vector<std::tuple<std::string, bool, bool>> expected = {
+            {"a", false, false},
+            {"b", true, true},
+            {"c", true, true},
+            {"a", true, false},
+        };
+        for (const auto &[name, closed, self_closing] : expected) {
+            auto tag = tokenizer.next_tag();
+            CHECK(tag);
+            if (tag) {
+                CHECK(tag->name == name);
+                CHECK(tag->closed == closed);
+                CHECK(tag->self_closing == self_closing);
+            }
+        }
+        CHECK(!tokenizer.next_tag());
+    }
+
+    SUBCASE("Reading data") {
+        XmlTokenizer::Tokenizer tokenizer(
+            "<binary>\n   AAAAAAAAWUA=</binary><empty> </empty>");
+        auto tag = tokenizer.next_tag();
+        CHECK(tag->name == "binary");
+        CHECK(tokenizer.read_data() == "AAAAAAAAWUA=");
+        tag = tokenizer.next_tag();
+        CHECK(tag->name == "binary");
+        CHECK(tag->closed);
+        tag = tokenizer.next_tag();
+        CHECK(!tokenizer.read_data());
+    }
+}
+
+TEST_CASE("Tokenizing blocks from a stream") {
+    // The tokens must not depend on how the input is split into blocks.
+    std::string data =
+        "<?xml version=\"1.0\"?>\n<spectrumList count=\"2\">\n"
+        "<spectrum index=\"0\">\n<cvParam accession=\"MS:1000511\" "
+        "value=\"1\"/>\n<binary>AAAAAAAAWUAAAAAAAABpQA==</binary>\n"
+        "</spectrum>\n"
+        "<spectrum index=\"1\">\n<spectrum index=\"2\"/>\n"
+        "<binary>AAAAAABAj0AAAAAAAECfQA==</binary>\n</spectrum>\n"
+        "</spectrumList>\n";
+    auto tokenize = [](XmlTokenizer::Tokenizer &tokenizer) {
+        std::vector<std::string> tokens;
+        while (auto tag = tokenizer.next_tag()) {
+            tokens.push_back(std::string(tag->name) + "|" +
+                             std::string(tag->attributes) +
+                             (tag->closed ? "|closed" : ""));
+            if (tag->name == "binary" && !tag->closed) {
+                tokens.push_back(std::string(tokenizer.read_data().value()));
+            }
+        }
+        return tokens;
+    };
+    XmlTokenizer::Tokenizer memory_tokenizer(data);
+    auto expected = tokenize(memory_tokenizer);
+    CHECK(expected.size() == 15);
+    for (size_t block_size : {1, 2, 3, 7, 16, 1024}) {
+        std::stringstream stream(data);
+        XmlTokenizer::Tokenizer tokenizer(stream, block_size);
+        CHECK(tokenize(tokenizer) == expected);
+    }
+
+    SUBCASE("Reading elements") {
+        for (size_t block_size : {1, 5, 1024}) {
+            std::stringstream stream(data);
+            XmlTokenizer::Tokenizer tokenizer(stream, block_size);
+            auto element = tokenizer.next_element("spectrum", "spectrumList");
+            CHECK(element ==
+                  "<spectrum index=\"0\">\n<cvParam accession=\"MS:1000511\" "
+                  "value=\"1\"/>\n<binary>AAAAAAAAWUAAAAAAAABpQA==</binary>\n"
+                  "</spectrum>");
+            // Nested elements are part of their parent element.
+            element = tokenizer.next_element("spectrum", "spectrumList");
+            CHECK(element ==
+                  "<spectrum index=\"1\">\n<spectrum index=\"2\"/>\n"
+                  "<binary>AAAAAABAj0AAAAAAAECfQA==</binary>\n</spectrum>");
+            CHECK(!tokenizer.next_element("spectrum", "spectrumList"));
+        }
+    }
+
+    SUBCASE("Offsets of the tokens in the input") {
+        for (size_t block_size : {1, 5, 1024}) {
+            std::stringstream stream(data);
+            XmlTokenizer::Tokenizer tokenizer(stream, block_size);
+            auto element = tokenizer.next_element("spectrum", "spectrumList");
+            CHECK(tokenizer.offset(element.value()) == data.find("<spectrum "));
+            element = tokenizer.next_element("spectrum", "spectrumList");
+            CHECK(tokenizer.offset(element.value()) ==
+                  data.find("<spectrum index=\"1\""));
+        }
+        std::stringstream stream(data);
+        XmlTokenizer::Tokenizer tokenizer(stream, 3);
+        while (auto tag = tokenizer.next_tag()) {
+            CHECK(data.substr(tokenizer.offset(tag->name), tag->name.size()) ==
+                  tag->name);
+        }
+    }
+}
+
+TEST_CASE("Accession lookup") {
+    using namespace XmlTokenizer;
+    CHECK(Accession::from_string("MS:1000016") == Accession::SCAN_START_TIME);
+    CHECK(Accession::from_string("MS:1000579") == Accession::MS1_SPECTRUM);
+    CHECK(Accession::from_string("MS:1001581") ==
+          Accession::FAIMS_COMPENSATION_VOLTAGE);
+    CHECK(Accession::from_string("MS:1000000") == Accession::UNKNOWN);
+    CHECK(Accession::from_string("MS:100001") == Accession::UNKNOWN);
+    CHECK(Accession::from_string("UO:0000031") == Accession::UNKNOWN);
+    CHECK(Accession::from_string("") == Accession::UNKNOWN);
+}
+
+TEST_CASE("Parsing numbers") {
+    CHECK(XmlTokenizer::to_double("12.5") == 12.5);
+    CHECK(XmlTokenizer::to_double(" -1e3") == -1000.0);
+    CHECK(XmlTokenizer::to_int("42") == 42);
+    CHECK_THROWS_AS(XmlTokenizer::to_int(""), std::invalid_argument);
+    CHECK_THROWS_AS(XmlTokenizer::to_double("abc"), std::invalid_argument);
+}